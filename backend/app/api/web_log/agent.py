@@ -1,50 +1,188 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_mcp_adapters.client import MultiServerMCPClient
-from langgraph.prebuilt import create_react_agent
-from langchain_core.prompts import PromptTemplate
+import asyncio
+import os
 
 from app.config import GOOGLE_API_KEY
 from .model import AgentInput, AgentResponse, MessageInfo, ToolCallInfo
 from typing import List
 
-agent = None # web log agent
-
-async def initialize_agent():
-    global agent
-    if agent is not None:
-        return
-
-    try:
-        client = MultiServerMCPClient(
-            {
-                "math": {
-                    "url": "http://localhost:8000/sse",
-                    "transport": "sse",
-                }
-            }
-        )
-        tools = await client.get_tools()
-
-    except Exception as e:
-        raise RuntimeError(f"MCP 工具加載失敗，請檢查 MCP 服務是否啟動")
-    
-    
-    model = ChatGoogleGenerativeAI(
+# MCP server 的位置與連線設定（秒）
+MCP_SERVER_NAME = "math"
+MCP_SERVER_URL = os.getenv("MCP_SERVER_URL", "http://localhost:8000/sse")
+# 多久 ping 一次 MCP server；ping 失敗視為斷線並重新連線
+MCP_KEEPALIVE_INTERVAL = float(os.getenv("MCP_KEEPALIVE_INTERVAL", 30))
+# 重新連線的等待時間從 MIN 開始每次加倍，最多 MAX
+MCP_RECONNECT_MIN_DELAY = float(os.getenv("MCP_RECONNECT_MIN_DELAY", 1))
+MCP_RECONNECT_MAX_DELAY = float(os.getenv("MCP_RECONNECT_MAX_DELAY", 30))
+# 啟動或請求等待連線完成的上限
+MCP_READY_TIMEOUT = float(os.getenv("MCP_READY_TIMEOUT", 5))
+
+PROMPT = """
+    請使用{tools}工具來檢查伺服器狀態，伺服器資訊都可以從{tools}工具中獲取。
+    log 查詢只回傳摘要與第一頁的 log 行，先依摘要回答；確實需要更多 log 行時才以 next_cursor 呼叫 filter_logs_next_page。
+"""
+
+
+def build_model():
+    # google-genai 匯入很慢（約 1 秒），只在第一次建立 agent 時載入
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(
         model="gemini-2.0-flash",
         api_key=GOOGLE_API_KEY,
     )
-    prompt = """
-        請使用{tools}工具來檢查伺服器狀態，伺服器資訊都可以從{tools}工具中獲取。
+
+
+class WebLogAgent:
     """
-    agent = create_react_agent(model, tools, prompt=prompt)
-    print("✅ Web Log Agent initialized.")
-    print(f"Available tools: {[tool.name for tool in tools]}")
+    與 MCP server 的長期連線，以及使用這個連線的 react agent。
+
+    連線由單一背景 task 持有（建立與關閉都在同一個 task）：連上後載入一次工具清單、做健康檢查、建立 agent，
+    之後定期 ping；斷線時以指數退避重新連線並重建 agent。所有請求共用同一個 session，
+    工具呼叫不會再各自建立連線。
+    """
+
+    def __init__(self, url: str = MCP_SERVER_URL, keepalive_interval: float = MCP_KEEPALIVE_INTERVAL,
+                 ready_timeout: float = MCP_READY_TIMEOUT):
+        self.url = url
+        self.keepalive_interval = keepalive_interval
+        self.ready_timeout = ready_timeout
+        self.agent = None
+        self.tools = []
+        self.connects = 0
+        self.last_error = None
+        self._model = None
+        self._loop = None
+        self._task = None
+
+    def _bind_loop(self):
+        # asyncio 的 Lock / Event 只能在建立時的 event loop 使用；換了 loop（例如重新啟動 app）時重新建立
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self._ready = asyncio.Event()
+            self._failed = asyncio.Event()
+            self._wake = asyncio.Event()
+            self._task = None
+            self.agent = None
+
+    async def start(self) -> bool:
+        """
+        啟動背景連線（只會啟動一次），等待連線與健康檢查完成。
+        連線失敗或逾時回傳 False，背景會繼續重新連線。
+        """
+        self._bind_loop()
+        async with self._lock:
+            if self._task is None or self._task.done():
+                self._failed.clear()
+                self._task = asyncio.create_task(self._run(), name="mcp-session")
+        return await self._wait_ready()
+
+    async def get_agent(self):
+        """回傳可用的 agent；尚未連線時立刻重新連線一次，仍失敗則拋出 RuntimeError"""
+        self._bind_loop()
+        if self.agent is not None and self._ready.is_set():
+            return self.agent
+
+        # 同時進來的請求都等待同一次連線嘗試，不會各自建立 session
+        self._failed.clear()
+        self._wake.set()
+        if not await self.start() or self.agent is None:
+            raise RuntimeError(f"MCP 工具加載失敗，請檢查 MCP 服務是否啟動（{self.last_error}）")
+        return self.agent
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.agent = None
+
+    async def _wait_ready(self) -> bool:
+        """等到連線完成，或這一次的連線嘗試失敗"""
+        waiters = [asyncio.ensure_future(self._ready.wait()), asyncio.ensure_future(self._failed.wait())]
+        try:
+            await asyncio.wait(waiters, timeout=self.ready_timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+        return self._ready.is_set()
+
+    async def _run(self):
+        from langchain_mcp_adapters.client import MultiServerMCPClient
+        from langchain_mcp_adapters.tools import load_mcp_tools
+        from langgraph.prebuilt import create_react_agent
+
+        client = MultiServerMCPClient({MCP_SERVER_NAME: {"url": self.url, "transport": "sse"}})
+        delay = MCP_RECONNECT_MIN_DELAY
+        while True:
+            try:
+                async with client.session(MCP_SERVER_NAME) as session:
+                    # 工具清單只在連線時載入一次；工具綁定這個 session
+                    tools = await load_mcp_tools(session, server_name=MCP_SERVER_NAME)
+                    # 健康檢查：server 有回應且有提供工具
+                    await asyncio.wait_for(session.send_ping(), self.ready_timeout)
+                    if not tools:
+                        raise RuntimeError("MCP server 沒有提供任何工具")
+
+                    if self._model is None:
+                        self._model = build_model()
+                    self.agent = create_react_agent(self._model, tools, prompt=PROMPT)
+                    self.tools = tools
+                    self.connects += 1
+                    self.last_error = None
+                    delay = MCP_RECONNECT_MIN_DELAY
+                    self._ready.set()
+                    print("✅ Web Log Agent initialized.")
+                    print(f"Available tools: {[tool.name for tool in tools]}")
+
+                    # keep-alive：ping 失敗或逾時就離開 session，重新連線
+                    while True:
+                        await asyncio.sleep(self.keepalive_interval)
+                        await asyncio.wait_for(session.send_ping(), self.keepalive_interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 連線錯誤常被 anyio 包成 ExceptionGroup，記錄實際的原因
+                while isinstance(e, ExceptionGroup) and e.exceptions:
+                    e = e.exceptions[0]
+                self.last_error = f"{type(e).__name__}: {e}"
+            finally:
+                self._ready.clear()
+                self.agent = None
+
+            print(f"MCP 連線中斷或失敗：{self.last_error}，{delay:.1f} 秒後重新連線")
+            self._failed.set()
+            # 有請求在等待時立刻重試，否則等到退避時間結束
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            self._failed.clear()
+            delay = min(delay * 2, MCP_RECONNECT_MAX_DELAY)
+
+
+web_log_agent = WebLogAgent()
+
+
+async def initialize_agent() -> bool:
+    """在 FastAPI 啟動時建立 MCP 連線與 agent；MCP 服務未啟動時不阻擋啟動，背景持續重新連線"""
+    ready = await web_log_agent.start()
+    if not ready:
+        print(f"MCP 服務尚未就緒：{web_log_agent.last_error}，將在背景重新連線")
+    return ready
+
+
+async def close_agent():
+    await web_log_agent.stop()
 
 
 async def invoke_agent_logic(user_input: AgentInput) -> AgentResponse:
-    global agent
-    if agent is None:
-        await initialize_agent()
+    agent = await web_log_agent.get_agent()
 
     result = await agent.ainvoke({"messages": user_input.input})
     messages = result["messages"]
@@ -0,0 +1,510 @@
+"""
+只保留最新狀態的 LangGraph checkpointer，後端以環境變數 CHECKPOINT_BACKEND 選擇：
+- memory（預設）：BoundedMemorySaver，存在行程記憶體，只能單一 worker，重新啟動後對話消失
+- sqlite：SQLiteSaver，存在 CHECKPOINT_DB（WAL 模式），同一台主機的多個 worker 共用，重新啟動後仍保留
+
+MemorySaver 會保留每個 thread_id 每一步的 checkpoint、每個版本的狀態（含 tool_detail 表格）
+與寫入紀錄，而且永遠不清除。兩種後端每個 thread 都只保留最新的 checkpoint，
+thread 數量（SESSION_MAX_COUNT）與閒置時間（SESSION_IDLE_TTL）也有上限。
+"""
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import Future
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Callable
+import zlib
+
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.memory import MemorySaver
+
+from app.session_store import SESSION_IDLE_TTL, SESSION_MAX_COUNT
+
+CHECKPOINT_BACKEND = os.getenv("CHECKPOINT_BACKEND", "memory")
+CHECKPOINT_DB_PATH = os.getenv(
+    "CHECKPOINT_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "checkpoints.sqlite"),
+)
+# 寫入執行緒收到第一筆寫入後再等多久（秒）才提交，讓同時間的寫入合併成一個交易；0 表示只合併已經在排隊的寫入
+CHECKPOINT_BATCH_DELAY = float(os.getenv("CHECKPOINT_BATCH_DELAY", 0))
+# 序列化後超過這個大小（bytes）才壓縮
+_COMPRESS_MIN_BYTES = 1024
+# 每隔多久（秒）清除閒置或超過數量上限的 thread
+_PRUNE_INTERVAL = 60
+
+
+class BoundedMemorySaver(MemorySaver):
+    """
+    只保留每個 thread 最新 checkpoint 的 MemorySaver，thread 數量與閒置時間都有上限。
+    不支援回溯歷史 checkpoint（本專案沒有使用）。
+    """
+
+    def __init__(self, max_threads: int = SESSION_MAX_COUNT, idle_ttl: float = SESSION_IDLE_TTL,
+                 clock: Callable[[], float] = time.monotonic):
+        super().__init__()
+        self.max_threads = max_threads
+        self.idle_ttl = idle_ttl
+        self._clock = clock
+        # thread_id -> 最後使用時間，依使用順序排列
+        self._last_used = OrderedDict()
+        # (thread_id, checkpoint_ns) -> 最新 checkpoint 的 channel_versions，用來找出過時的狀態版本
+        self._versions = {}
+        # (thread_id, checkpoint_ns) -> 有寫入紀錄的 checkpoint_id
+        self._write_ids = {}
+        self._lock = threading.RLock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get_tuple(self, config):
+        with self._lock:
+            thread_id = config["configurable"]["thread_id"]
+            if thread_id in self._last_used:
+                self._touch(thread_id)
+            return super().get_tuple(config)
+
+    def list(self, config, **kwargs):
+        # 先取出全部結果，避免產生器在鎖外讀到正在刪除的資料
+        with self._lock:
+            return iter(list(super().list(config, **kwargs)))
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with self._lock:
+            result = super().put(config, checkpoint, metadata, new_versions)
+            thread_id = result["configurable"]["thread_id"]
+            checkpoint_ns = result["configurable"]["checkpoint_ns"]
+            self._drop_superseded(thread_id, checkpoint_ns, checkpoint)
+            self._touch(thread_id)
+            self._evict()
+            return result
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        with self._lock:
+            thread_id = config["configurable"]["thread_id"]
+            checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+            checkpoint_id = config["configurable"]["checkpoint_id"]
+            # 平行分支的寫入可能在下一個 checkpoint 存好之後才到，這時已經用不到
+            latest = self._latest_id(thread_id, checkpoint_ns)
+            if latest is not None and checkpoint_id < latest:
+                return
+            super().put_writes(config, writes, task_id, task_path)
+            self._write_ids.setdefault((thread_id, checkpoint_ns), set()).add(checkpoint_id)
+
+    def delete_thread(self, thread_id: str):
+        with self._lock:
+            self._last_used.pop(thread_id, None)
+            for checkpoint_ns in self.storage.pop(thread_id, {}):
+                for checkpoint_id in self._write_ids.pop((thread_id, checkpoint_ns), ()):
+                    self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+                for channel, version in self._versions.pop((thread_id, checkpoint_ns), {}).items():
+                    self.blobs.pop((thread_id, checkpoint_ns, channel, version), None)
+
+    def _drop_superseded(self, thread_id: str, checkpoint_ns: str, checkpoint):
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        for checkpoint_id in [c for c in checkpoints if c != checkpoint["id"]]:
+            del checkpoints[checkpoint_id]
+        # checkpoint_id 依時間排序，比最新的舊就是被取代了
+        write_ids = self._write_ids.get((thread_id, checkpoint_ns), set())
+        for checkpoint_id in [c for c in write_ids if c < checkpoint["id"]]:
+            write_ids.discard(checkpoint_id)
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+
+        current = dict(checkpoint["channel_versions"])
+        for channel, version in self._versions.get((thread_id, checkpoint_ns), {}).items():
+            if current.get(channel) != version:
+                self.blobs.pop((thread_id, checkpoint_ns, channel, version), None)
+        self._versions[(thread_id, checkpoint_ns)] = current
+
+    def _latest_id(self, thread_id: str, checkpoint_ns: str):
+        checkpoints = self.storage.get(thread_id, {}).get(checkpoint_ns)
+        return max(checkpoints) if checkpoints else None
+
+    def _touch(self, thread_id: str):
+        self._last_used[thread_id] = self._clock()
+        self._last_used.move_to_end(thread_id)
+
+    def _evict(self):
+        now = self._clock()
+        while self._last_used:
+            thread_id, last_used = next(iter(self._last_used.items()))
+            if len(self._last_used) > self.max_threads:
+                self.evictions += 1
+            elif now - last_used > self.idle_ttl:
+                self.expirations += 1
+            else:
+                break
+            self.delete_thread(thread_id)
+
+    def stats(self) -> dict:
+        """thread 數、保留的 checkpoint / 狀態版本 / 寫入紀錄數量與序列化後的大小"""
+        with self._lock:
+            self._evict()
+            checkpoints = sum(len(c) for namespaces in self.storage.values() for c in namespaces.values())
+            checkpoint_bytes = sum(
+                len(saved[0][1]) + len(saved[1][1])
+                for namespaces in self.storage.values() for c in namespaces.values() for saved in c.values()
+            )
+            blob_bytes = sum(len(blob[1]) for blob in self.blobs.values())
+            writes = sum(len(w) for w in self.writes.values())
+            write_bytes = sum(len(write[2][1]) for w in self.writes.values() for write in w.values())
+            return {
+                "backend": "memory",
+                "threads": len(self._last_used),
+                "max_threads": self.max_threads,
+                "idle_ttl": self.idle_ttl,
+                "checkpoints": checkpoints,
+                "blobs": len(self.blobs),
+                "writes": writes,
+                "bytes": checkpoint_bytes + blob_bytes + write_bytes,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class SQLiteSaver(BaseCheckpointSaver):
+    """
+    存在 SQLite 的 checkpointer，多個 worker 行程可以共用同一個檔案。
+
+    - 每個 (thread_id, checkpoint_ns) 只有一列，存最新的 checkpoint（含全部狀態），
+      以 msgpack 序列化、較大時再用 zlib 壓縮
+    - 寫入交給背景執行緒，同時間排隊的寫入（不同 session、不同 worker 的請求）合併成一個交易提交；
+      put / put_writes 等到提交完成才回傳，下一輪不論由哪個 worker 處理都讀得到
+    - 讀取每個執行緒各用一個連線，WAL 模式下不會被寫入擋住
+    - 不支援回溯歷史 checkpoint（本專案沒有使用）
+    """
+
+    def __init__(self, path: str = CHECKPOINT_DB_PATH, max_threads: int = SESSION_MAX_COUNT,
+                 idle_ttl: float = SESSION_IDLE_TTL, batch_delay: float = CHECKPOINT_BATCH_DELAY):
+        super().__init__()
+        self.path = path
+        self.max_threads = max_threads
+        self.idle_ttl = idle_ttl
+        self.batch_delay = batch_delay
+        self._local = threading.local()
+        self._jobs = queue.Queue()
+        self.batches = 0
+        self.batched_jobs = 0
+        self.pruned = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        db = self._connect()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            "thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL, parent_id TEXT, "
+            "type TEXT NOT NULL, checkpoint BLOB NOT NULL, metadata_type TEXT NOT NULL, metadata BLOB NOT NULL, "
+            "updated_at REAL NOT NULL, "
+            "PRIMARY KEY (thread_id, checkpoint_ns))"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS checkpoints_updated_at ON checkpoints (updated_at)")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS writes ("
+            "thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL, "
+            "task_id TEXT NOT NULL, idx INTEGER NOT NULL, channel TEXT NOT NULL, type TEXT NOT NULL, "
+            "value BLOB NOT NULL, task_path TEXT NOT NULL, "
+            "PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx))"
+        )
+        self._writer_db = db
+        threading.Thread(target=self._write_loop, name="checkpoint-writer", daemon=True).start()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        # WAL 下 NORMAL 只在 checkpoint 時 fsync，程式當掉不會遺失已提交的資料
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def _reader(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = self._connect()
+        return db
+
+    # === 序列化 ===
+    def _dump(self, value) -> tuple:
+        type_, data = self.serde.dumps_typed(value)
+        if len(data) >= _COMPRESS_MIN_BYTES:
+            return "z:" + type_, zlib.compress(data, 1)
+        return type_, data
+
+    def _load(self, type_: str, data: bytes):
+        if type_.startswith("z:"):
+            return self.serde.loads_typed((type_[2:], zlib.decompress(data)))
+        return self.serde.loads_typed((type_, data))
+
+    # === 讀取 ===
+    def get_tuple(self, config):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        db = self._reader()
+        row = db.execute(
+            "SELECT checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata FROM checkpoints "
+            "WHERE thread_id = ? AND checkpoint_ns = ?", (thread_id, checkpoint_ns)
+        ).fetchone()
+        if row is None:
+            return None
+        checkpoint_id, parent_id, type_, checkpoint, metadata_type, metadata = row
+        requested = get_checkpoint_id(config)
+        if requested and requested != checkpoint_id:
+            return None
+
+        writes = db.execute(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                     "checkpoint_id": checkpoint_id}},
+            checkpoint=self._load(type_, checkpoint),
+            metadata=self._load(metadata_type, metadata),
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                  "checkpoint_id": parent_id}}
+                if parent_id else None
+            ),
+            pending_writes=[(task_id, channel, self._load(t, value)) for task_id, channel, t, value in writes],
+        )
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        if config is not None:
+            rows = self._reader().execute(
+                "SELECT thread_id, checkpoint_ns FROM checkpoints WHERE thread_id = ?",
+                (config["configurable"]["thread_id"],),
+            ).fetchall()
+        else:
+            rows = self._reader().execute("SELECT thread_id, checkpoint_ns FROM checkpoints").fetchall()
+        count = 0
+        for thread_id, checkpoint_ns in rows:
+            if config is not None and "checkpoint_ns" in config["configurable"] \
+                    and config["configurable"]["checkpoint_ns"] != checkpoint_ns:
+                continue
+            saved = self.get_tuple({"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns}})
+            if saved is None:
+                continue
+            if before and saved.config["configurable"]["checkpoint_id"] >= get_checkpoint_id(before):
+                continue
+            if filter and not all(saved.metadata.get(k) == v for k, v in filter.items()):
+                continue
+            if limit is not None and count >= limit:
+                break
+            count += 1
+            yield saved
+
+    # === 寫入（交給寫入執行緒，等提交完成） ===
+    def put(self, config, checkpoint, metadata, new_versions):
+        statements, result = self._put_statements(config, checkpoint, metadata)
+        self._submit(statements).result()
+        return result
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        self._submit(self._write_statements(config, writes, task_id, task_path)).result()
+
+    def delete_thread(self, thread_id: str):
+        self._submit(self._delete_statements(thread_id)).result()
+
+    # 讀取會等待磁碟，交給執行緒池，不阻塞 event loop
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        statements, result = self._put_statements(config, checkpoint, metadata)
+        await asyncio.wrap_future(self._submit(statements))
+        return result
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        await asyncio.wrap_future(self._submit(self._write_statements(config, writes, task_id, task_path)))
+
+    async def adelete_thread(self, thread_id: str):
+        await asyncio.wrap_future(self._submit(self._delete_statements(thread_id)))
+
+    def _put_statements(self, config, checkpoint, metadata) -> tuple:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        type_, data = self._dump(checkpoint)
+        metadata_type, metadata_data = self._dump(get_checkpoint_metadata(config, metadata))
+        statements = [(
+            # 多個 worker 同時處理同一個 session 時，只接受比較新的 checkpoint
+            "INSERT INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_id, type, checkpoint, "
+            "metadata_type, metadata, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (thread_id, checkpoint_ns) DO UPDATE SET checkpoint_id = excluded.checkpoint_id, "
+            "parent_id = excluded.parent_id, type = excluded.type, checkpoint = excluded.checkpoint, "
+            "metadata_type = excluded.metadata_type, metadata = excluded.metadata, updated_at = excluded.updated_at "
+            "WHERE excluded.checkpoint_id > checkpoints.checkpoint_id",
+            (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+             type_, data, metadata_type, metadata_data, time.time()),
+        ), (
+            # 被取代的 checkpoint 的寫入紀錄已經用不到
+            "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+            (thread_id, checkpoint_ns, checkpoint["id"]),
+        )]
+        result = {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                   "checkpoint_id": checkpoint["id"]}}
+        return statements, result
+
+    def _write_statements(self, config, writes, task_id: str, task_path: str) -> list:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        statements = []
+        for idx, (channel, value) in enumerate(writes):
+            idx = WRITES_IDX_MAP.get(channel, idx)
+            type_, data = self._dump(value)
+            # 特殊頻道（錯誤、中斷）覆寫，一般寫入重複時保留第一次；checkpoint 已被取代時不寫入
+            statements.append((
+                f"INSERT OR {'REPLACE' if idx < 0 else 'IGNORE'} INTO writes "
+                "(thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value, task_path) "
+                "SELECT ?, ?, ?, ?, ?, ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM checkpoints "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id > ?)",
+                (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type_, data, task_path,
+                 thread_id, checkpoint_ns, checkpoint_id),
+            ))
+        return statements
+
+    def _delete_statements(self, thread_id: str) -> list:
+        return [
+            ("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,)),
+            ("DELETE FROM writes WHERE thread_id = ?", (thread_id,)),
+        ]
+
+    def _submit(self, statements: list) -> Future:
+        future = Future()
+        self._jobs.put((statements, future))
+        return future
+
+    def _write_loop(self):
+        last_prune = 0.0
+        while True:
+            jobs = [self._jobs.get()]
+            if self.batch_delay > 0:
+                time.sleep(self.batch_delay)
+            while True:
+                try:
+                    jobs.append(self._jobs.get_nowait())
+                except queue.Empty:
+                    break
+            # 呼叫端已取消（例如 aput 被取消）的寫入略過；其餘標成執行中，之後不能再取消
+            jobs = [job for job in jobs if job[1].set_running_or_notify_cancel()]
+            if not jobs:
+                continue
+
+            prune = time.monotonic() - last_prune > _PRUNE_INTERVAL
+            try:
+                errors = self._commit(jobs, prune)
+            except Exception as e:
+                # 開始或提交交易失敗：整批都沒有寫入；寫入執行緒繼續處理之後的寫入
+                print(f"寫入 checkpoint 失敗：{e}")
+                errors = [e] * len(jobs)
+                try:
+                    if self._writer_db.in_transaction:
+                        self._writer_db.execute("ROLLBACK")
+                except sqlite3.Error as rollback_error:
+                    print(f"checkpoint 交易回復失敗：{rollback_error}")
+            if prune:
+                last_prune = time.monotonic()
+
+            self.batches += 1
+            self.batched_jobs += len(jobs)
+            for (_, future), error in zip(jobs, errors):
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+
+    def _commit(self, jobs: list, prune: bool) -> list:
+        """
+        在同一個交易內執行整批寫入，回傳每筆寫入的錯誤（成功為 None）。
+        每筆寫入各自一個 savepoint，失敗時只回復那一筆，不影響同一批的其他寫入。
+        """
+        db = self._writer_db
+        errors = []
+        db.execute("BEGIN IMMEDIATE")
+        for statements, _ in jobs:
+            db.execute("SAVEPOINT job")
+            try:
+                for sql, params in statements:
+                    db.execute(sql, params)
+            except Exception as e:
+                print(f"寫入 checkpoint 失敗：{e}")
+                db.execute("ROLLBACK TO job")
+                errors.append(e)
+            else:
+                errors.append(None)
+            db.execute("RELEASE job")
+        if prune:
+            # 清除失敗不影響這批寫入，下次再試
+            db.execute("SAVEPOINT prune")
+            try:
+                self.pruned += self._prune()
+            except Exception as e:
+                print(f"清除過期 checkpoint 失敗：{e}")
+                db.execute("ROLLBACK TO prune")
+            db.execute("RELEASE prune")
+        db.execute("COMMIT")
+        return errors
+
+    def _prune(self) -> int:
+        """刪除閒置太久與超過數量上限的 thread，回傳刪除的列數"""
+        db = self._writer_db
+        removed = db.execute("DELETE FROM checkpoints WHERE updated_at < ?",
+                             (time.time() - self.idle_ttl,)).rowcount
+        removed += db.execute(
+            "DELETE FROM checkpoints WHERE rowid IN "
+            "(SELECT rowid FROM checkpoints ORDER BY updated_at DESC LIMIT -1 OFFSET ?)", (self.max_threads,)
+        ).rowcount
+        if removed:
+            db.execute(
+                "DELETE FROM writes WHERE NOT EXISTS (SELECT 1 FROM checkpoints c "
+                "WHERE c.thread_id = writes.thread_id AND c.checkpoint_ns = writes.checkpoint_ns)"
+            )
+        return removed
+
+    def stats(self) -> dict:
+        """資料庫內的 thread / 寫入紀錄數量與大小，以及這個行程的批次寫入統計"""
+        db = self._reader()
+        threads, checkpoint_bytes = db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(checkpoint) + LENGTH(metadata)), 0) FROM checkpoints"
+        ).fetchone()
+        writes, write_bytes = db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM writes"
+        ).fetchone()
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "threads": threads,
+            "max_threads": self.max_threads,
+            "idle_ttl": self.idle_ttl,
+            "writes": writes,
+            "bytes": checkpoint_bytes + write_bytes,
+            "batches": self.batches,
+            "average_batch": self.batched_jobs / self.batches if self.batches else 0.0,
+            "pruned": self.pruned,
+        }
+
+
+def create_checkpointer(backend: str = CHECKPOINT_BACKEND):
+    if backend == "sqlite":
+        try:
+            return SQLiteSaver()
+        except sqlite3.Error as e:
+            print(f"無法開啟 checkpoint 資料庫 {CHECKPOINT_DB_PATH}，改用記憶體：{e}")
+    elif backend != "memory":
+        print(f"未知的 CHECKPOINT_BACKEND={backend}，改用記憶體")
+    return BoundedMemorySaver()
+
+
+checkpointer = create_checkpointer()
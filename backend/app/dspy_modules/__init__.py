@@ -3,7 +3,10 @@ from .log_query_extractor import LogQueryExtractor
 from .web_log_brief_response import WebLogBriefResponseGenerator
 from .web_log_detailed_response import WebLogDetailedResponseGenerator
 from .general_response import GeneralResponseGenerator
+from .turn_planner import TurnPlanner, parse_turn_plan
+from .prediction_cache import prediction_cache, prediction_cache_stats
+from .fast_router import fast_plan
+from .registry import get_module, warm_up_modules
 
+# LM 在第一次取得模組（get_module）或啟動預熱時才設定，匯入本套件不會連線或讀取金鑰
 from ._lm_config import init_dspy
-
-init_dspy()  # 只會初始化一次
\ No newline at end of file
@@ -1,6 +1,19 @@
+import os
+
 import dspy
+from dspy.clients import base_lm
 from app.config import GOOGLE_API_KEY
 
+# DSPy 預設在全域、LM 與每個模組各保留最近 10000 次呼叫的完整 prompt / 回應，
+# 另外 trace 也保留 10000 筆輸入與預測（給最佳化器用），長時間執行時佔用的記憶體一直增加；
+# 本專案沒有用到，只保留少量以便除錯（0 表示不記錄）
+HISTORY_SIZE = int(os.getenv("DSPY_HISTORY_SIZE", 20))
+
+# 模型與服務位址（預設 Gemini）；DSPY_LM_API_BASE 可指向 OpenAI 相容的服務，例如多 worker 測試用的模擬 LLM
+LM_MODEL = os.getenv("DSPY_LM_MODEL", "gemini/gemini-2.0-flash")
+LM_API_BASE = os.getenv("DSPY_LM_API_BASE") or None
+LM_API_KEY = os.getenv("DSPY_LM_API_KEY") or GOOGLE_API_KEY
+
 # 設一個 flag，避免重複初始化
 _dspy_initialized = False
 
@@ -8,13 +21,27 @@ def init_dspy():
     global _dspy_initialized
     if _dspy_initialized:
         return  # 已初始化，直接跳過
+    if dspy.settings.lm is not None:
+        # 已經由其他地方（例如 benchmark 的模擬 LLM）設定好，不覆蓋
+        limit_history()
+        _dspy_initialized = True
+        return
 
-    # 初始化 Gemini 模型
+    # 初始化模型（預設 Gemini）
+    extra = {"api_base": LM_API_BASE} if LM_API_BASE else {}
     lm = dspy.LM(
-        'gemini/gemini-2.0-flash',
-        api_key=GOOGLE_API_KEY,
+        LM_MODEL,
+        api_key=LM_API_KEY,
         max_tokens=8000,
-        temperature=1
+        temperature=1,
+        **extra
     )
     dspy.configure(lm=lm)
+    limit_history()
     _dspy_initialized = True
+
+
+def limit_history():
+    """限制 DSPy 呼叫紀錄與 trace 的數量"""
+    base_lm.MAX_HISTORY_SIZE = max(HISTORY_SIZE, 1)
+    dspy.configure(max_history_size=HISTORY_SIZE, disable_history=HISTORY_SIZE == 0, max_trace_size=HISTORY_SIZE)
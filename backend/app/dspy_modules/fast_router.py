@@ -0,0 +1,146 @@
+"""
+不呼叫 LLM 的規則式判斷：明顯是 log 查詢的訊息（含 IP、狀態碼、HTTP 方法或日期）
+直接在本機解析出意圖與查詢條件，輸出格式與 parse_turn_plan 相同。
+
+只處理有把握的情況，其餘回傳 None，交給 TurnPlanner / IntentChecker 判斷：
+- 問意思或原因（「404 是什麼意思」）屬於一般問題
+- 排除條件（「不是 404」）、日內時間區間（「下午三點到五點」）等規則無法完整表達
+"""
+from datetime import date, timedelta
+import re
+from typing import Optional
+
+# 與 graph.py ip_info_tool 相同的 IP 規則
+IP_PATTERN = re.compile(
+    r'(?:(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.){3}(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)'
+    r'|(?:[0-9a-fA-F]{1,4}:){7}[0-9a-fA-F]{1,4}'
+)
+_STATUS_CODE = re.compile(r'(?<![\d.:/])([2-5])(\d\d|xx|XX)(?![\d.:/])(?!\s*(?:名|筆|笔|次|個|个|條|条|行|秒|ms))')
+# 「前 200 名」、「top 300」是數量不是狀態碼
+_RANKING = re.compile(r'(?:前|top)\s*\d+', re.IGNORECASE)
+# 大寫的 HTTP 方法；小寫（get、post 也是一般英文單字）需接著「請求 / 方法」
+_HTTP_METHOD = re.compile(r'\b(GET|POST|PUT|DELETE|PATCH|HEAD|OPTIONS)\b')
+_HTTP_METHOD_WORD = re.compile(
+    r'\b(get|post|put|delete|patch|head|options)\s*(?=請求|请求|方法|requests?\b|methods?\b)', re.IGNORECASE
+)
+
+_MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+_LOG_DATE = re.compile(r'\b(\d{1,2})/(' + "|".join(_MONTHS) + r')/(\d{4})\b', re.IGNORECASE)
+_ISO_DATE = re.compile(r'\b(\d{4})[-/](\d{1,2})[-/](\d{1,2})\b')
+_CHINESE_DATE = re.compile(r'(?:(\d{4})年)?(\d{1,2})月(\d{1,2})[日號号]')
+_RELATIVE_DAYS = {"今天": 0, "今日": 0, "today": 0, "昨天": 1, "昨日": 1, "yesterday": 1, "前天": 2}
+
+# 出現這些詞代表一定是在問 log
+_LOG_WORDS = re.compile(
+    r"日誌|日志|紀錄|記錄|請求|请求|流量|存取|訪問|访问|狀態碼|状态码|來源|来源|呼叫|次數|次数|最多|統計|统计|錯誤|错误|"
+    r"哪些|哪個|哪个|\b(logs?|requests?|traffic|access|hits?|status|top|errors?)\b",
+    re.IGNORECASE,
+)
+# 問定義、原因或做法，是一般問題
+_GENERAL_WORDS = re.compile(
+    r"是什麼|是什么|什麼意思|什么意思|意思|代表|解釋|解释|為什麼|为什么|如何|怎麼|怎么|教我|"
+    r"\b(what is|what does|what's|meaning|explain|why|how to)\b",
+    re.IGNORECASE,
+)
+# 規則無法表達的條件：排除、日內時間、時間區間
+_UNSUPPORTED_WORDS = re.compile(
+    r"不是|不要|除了|排除|以外|之外|非\s*\d|小時|小时|分鐘|分钟|\d\s*[點点]|上午|下午|晚上|早上|凌晨|中午|之間|之间|"
+    r"[到至~]\s*(?:\d|今|昨|前|明)|從|从|以來|以来|最近|剛剛|刚刚|"
+    r"\b(not|except|exclude|excluding|without|hours?|minutes?|between|from|since|until|last|past|recent)\b|"
+    r"\d{1,2}:\d{2}",
+    re.IGNORECASE,
+)
+_IP_INFO_WORDS = re.compile(
+    r"哪裡|哪里|國家|国家|地區|地区|位置|組織|组织|資訊|信息|"
+    r"\b(whois|isp|where|country|location|owner|info|information)\b",
+    re.IGNORECASE,
+)
+_DETAILED_WORDS = re.compile(r"詳細|详细|完整|全部|所有|細節|细节|\b(detail|detailed|details|full|complete|all)\b",
+                             re.IGNORECASE)
+_BRIEF_WORDS = re.compile(r"簡單|简单|簡短|简短|摘要|概要|重點|重点|\b(brief|summary|short)\b", re.IGNORECASE)
+
+
+def fast_plan(question: str, today: date = None) -> Optional[dict]:
+    """有把握時回傳與 parse_turn_plan 相同格式的 dict，否則回傳 None"""
+    text = str(question)
+    if _GENERAL_WORDS.search(text):
+        return None
+
+    ips = IP_PATTERN.findall(text)
+    # 先拿掉 IP 與日期，避免其中的數字被當成狀態碼或時間
+    rest = IP_PATTERN.sub(" ", text)
+    if _UNSUPPORTED_WORDS.search(rest):
+        return None
+    days = _extract_days(rest, today or date.today())
+    if days is None:
+        return None
+    rest = _CHINESE_DATE.sub(" ", _ISO_DATE.sub(" ", _LOG_DATE.sub(" ", rest)))
+    rest = _RANKING.sub(" ", rest)
+    statuses = _unique(m.group(1) + m.group(2).lower() for m in _STATUS_CODE.finditer(rest))
+    methods = _unique([m for m in _HTTP_METHOD.findall(rest)] + [m.upper() for m in _HTTP_METHOD_WORD.findall(rest)])
+
+    use_ip_info = bool(ips) and bool(_IP_INFO_WORDS.search(rest))
+    if use_ip_info and len(ips) != 1:
+        return None
+
+    signals = bool(ips) + bool(statuses) + bool(methods) + bool(days)
+    # 只有一種條件時還要有 log 相關的字眼（或是查詢 IP 資訊），才確定是 log 查詢
+    if signals == 0 or (signals == 1 and not use_ip_info and not _LOG_WORDS.search(rest)):
+        return None
+
+    start_time = end_time = ""
+    if days:
+        first, last = min(days), max(days)
+        start_time = f"{first.day:02d}/{_MONTHS[first.month - 1]}/{first.year}:00:00:00"
+        end_time = f"{last.day:02d}/{_MONTHS[last.month - 1]}/{last.year}:23:59:59"
+
+    return {
+        "intent": "web_log",
+        "start_time": start_time,
+        "end_time": end_time,
+        "status_code": _status_regex(statuses),
+        "http_method": _alternation(methods),
+        "source_ip": _alternation([re.escape(ip) for ip in ips]) if ips and not use_ip_info else "",
+        "use_ip_info": use_ip_info,
+        # 沒有明確偏好時與逐步判斷的預設相同
+        "response_style": "brief" if _BRIEF_WORDS.search(text) and not _DETAILED_WORDS.search(text) else "detailed",
+    }
+
+
+def _extract_days(text: str, today: date):
+    """回傳提到的日期列表；日期無效時回傳 None"""
+    days = []
+    try:
+        for day, month, year in _LOG_DATE.findall(text):
+            days.append(date(int(year), _MONTHS.index(month.capitalize()) + 1, int(day)))
+        for year, month, day in _ISO_DATE.findall(text):
+            days.append(date(int(year), int(month), int(day)))
+        for year, month, day in _CHINESE_DATE.findall(text):
+            days.append(date(int(year) if year else today.year, int(month), int(day)))
+    except ValueError:
+        return None
+    lowered = text.lower()
+    for word, offset in _RELATIVE_DAYS.items():
+        if word in lowered:
+            days.append(today - timedelta(days=offset))
+    return days
+
+
+def _status_regex(statuses: list) -> str:
+    if not statuses:
+        return ""
+    # 4xx 只比對第一碼
+    parts = [s[0] + r"\d\d" if s.endswith("xx") else s for s in statuses]
+    return _alternation(parts)
+
+
+def _alternation(values: list) -> str:
+    if not values:
+        return ""
+    if len(values) == 1:
+        return f"^{values[0]}$"
+    return "^(" + "|".join(values) + ")$"
+
+
+def _unique(values) -> list:
+    return list(dict.fromkeys(values))
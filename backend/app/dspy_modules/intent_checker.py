@@ -1,6 +1,8 @@
 import dspy
 from dspy import InputField, OutputField
 
+from .prediction_cache import CachedPredict
+
 
 class Classification(dspy.Signature):
     """將使用者訊息分類到其中一個意圖標籤。
@@ -12,6 +14,6 @@ class Classification(dspy.Signature):
         desc="""額外描述信息，用於輔助判斷使用者意圖。例如，提示意圖的背景或上下文。""",
     )
 
-class IntentChecker(dspy.Predict):
+class IntentChecker(CachedPredict):
     def __init__(self):
         super().__init__(Classification)
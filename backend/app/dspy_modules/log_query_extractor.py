@@ -1,6 +1,9 @@
 import dspy
 from dspy import InputField, OutputField
 
+from .prediction_cache import CachedPredict
+
+
 class LogQuerySignature(dspy.Signature):
     question = InputField(desc="使用者輸入的問題")
     start_time = OutputField(desc="使用者要求的開始時間，若沒有則為空，格式 dd/Mon/yyyy:HH:MM:SS")
@@ -16,6 +19,9 @@ class LogQuerySignature(dspy.Signature):
     http_method = OutputField(desc="使用者要求的HTTP方法，若沒有則為空")
     source_ip = OutputField(desc="使用者要求的來源IP，若沒有則為空")
 
-class LogQueryExtractor(dspy.Predict):
+class LogQueryExtractor(CachedPredict):
+    # 輸出含時間範圍，相對時間的問題需依日期區分
+    time_sensitive = True
+
     def __init__(self):
         super().__init__(LogQuerySignature)
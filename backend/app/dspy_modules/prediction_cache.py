@@ -0,0 +1,267 @@
+"""
+DSPy 判斷類模組（意圖、查詢條件）的預測結果快取。
+
+同樣的問題（例如「今天的 404」、「哪個 IP 最多」）一再出現，每次都要等 LLM 回應。
+快取鍵是模組名稱、模型與正規化後的輸入；結果先放記憶體（LRU + TTL），
+再寫進 SQLite，重新啟動或多個 worker 之間也能共用。
+
+「今天」、「昨天」這類相對日期的問題，答案取決於當天日期，快取鍵會加上日期；
+「最近一小時」、「剛剛」這類日內的相對時間無法安全地重複使用，查詢條件相關的模組不快取。
+
+非同步呼叫（aforward）只在 event loop 上查記憶體，SQLite 的讀寫交給執行緒池。
+"""
+import asyncio
+from collections import defaultdict
+from datetime import date
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import dspy
+
+from app.tools.ttl_cache import TTLCache
+
+CACHE_SIZE = int(os.getenv("DSPY_CACHE_SIZE", 1024))
+CACHE_TTL = float(os.getenv("DSPY_CACHE_TTL", 86400))
+# SQLite 檔案路徑，設成空字串只使用記憶體
+CACHE_DB_PATH = os.getenv(
+    "DSPY_CACHE_DB",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "dspy_cache.sqlite"),
+)
+
+# 以當天日期為準的相對日期
+_RELATIVE_DAY = re.compile(
+    r"今天|今日|昨天|昨日|前天|明天|本週|這週|这周|上週|上周|本月|這個月|上個月|今年|去年|"
+    r"\b(today|yesterday|tomorrow|this (week|month|year)|last (week|month|year))\b",
+    re.IGNORECASE,
+)
+# 日內的相對時間，同一天內答案也會改變
+_RELATIVE_TIME = re.compile(
+    r"剛剛|剛才|現在|目前|最近|小時|分鐘|秒內|"
+    r"\b(now|just now|recent|recently|last \d*\s*(hours?|minutes?|mins?)|past \d*\s*(hours?|minutes?|mins?))\b",
+    re.IGNORECASE,
+)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """去掉前後空白、合併連續空白並轉小寫"""
+    return _WHITESPACE.sub(" ", str(question)).strip().lower()
+
+
+class PredictionCache:
+    """
+    兩層快取：記憶體 LRU + TTL，以及 SQLite（db_path 為空時不使用）。
+    每個模組分別統計記憶體命中、SQLite 命中、未命中與略過（相對時間不快取）的次數。
+    """
+
+    def __init__(self, max_size: int = CACHE_SIZE, ttl: float = CACHE_TTL, db_path: str = CACHE_DB_PATH):
+        self.ttl = ttl
+        self.memory = TTLCache(max_size, ttl)
+        # SQLite 在第一次 get / set 時才開啟，匯入模組（例如匯入 graph）不會建立檔案
+        self._db_path = db_path
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._stats = defaultdict(lambda: {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0})
+        self._stats_lock = threading.Lock()
+
+    def _database(self):
+        """回傳 SQLite 連線，第一次呼叫時開啟；未設定或開啟失敗時回傳 None（之後不再重試）"""
+        if self._db is None and self._db_path:
+            with self._db_lock:
+                if self._db is None and self._db_path:
+                    self._db = self._open_db(self._db_path)
+                    if self._db is None:
+                        self._db_path = None
+        return self._db
+
+    @staticmethod
+    def _open_db(db_path: str):
+        try:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                "key TEXT PRIMARY KEY, module TEXT NOT NULL, outputs TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            db.execute("DELETE FROM predictions WHERE expires_at <= ?", (time.time(),))
+            return db
+        except (OSError, sqlite3.Error) as e:
+            print(f"無法開啟預測快取資料庫 {db_path}，只使用記憶體快取：{e}")
+            return None
+
+    def get(self, module: str, key: str):
+        """回傳快取的輸出欄位 dict，沒有時回傳 None"""
+        outputs = self._memory_get(module, key)
+        if outputs is not None:
+            return outputs
+        return self._disk_get(module, key)
+
+    async def aget(self, module: str, key: str):
+        """與 get 相同；記憶體沒有時在執行緒池查詢 SQLite，不阻塞 event loop"""
+        outputs = self._memory_get(module, key)
+        if outputs is not None:
+            return outputs
+        if self._db_path:
+            return await asyncio.to_thread(self._disk_get, module, key)
+        return self._disk_get(module, key)
+
+    def set(self, module: str, key: str, outputs: dict):
+        self.memory.set(key, outputs)
+        self._disk_set(module, key, outputs)
+
+    async def aset(self, module: str, key: str, outputs: dict):
+        """與 set 相同；SQLite 在執行緒池寫入"""
+        self.memory.set(key, outputs)
+        if self._db_path:
+            await asyncio.to_thread(self._disk_set, module, key, outputs)
+
+    def _memory_get(self, module: str, key: str):
+        outputs = self.memory.get(key)
+        if outputs is not None:
+            self._count(module, "memory_hits")
+        return outputs
+
+    def _disk_get(self, module: str, key: str):
+        db = self._database()
+        if db is not None:
+            with self._db_lock:
+                row = db.execute(
+                    "SELECT outputs, expires_at FROM predictions WHERE key = ?", (key,)
+                ).fetchone()
+            if row is not None and row[1] > time.time():
+                outputs = json.loads(row[0])
+                # 放回記憶體，存活時間以 SQLite 內剩下的時間為準
+                self.memory.set(key, outputs, ttl=row[1] - time.time())
+                self._count(module, "disk_hits")
+                return outputs
+
+        self._count(module, "misses")
+        return None
+
+    def _disk_set(self, module: str, key: str, outputs: dict):
+        db = self._database()
+        if db is None:
+            return
+        try:
+            with self._db_lock:
+                db.execute(
+                    "INSERT OR REPLACE INTO predictions (key, module, outputs, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, module, json.dumps(outputs, ensure_ascii=False), time.time() + self.ttl),
+                )
+        except sqlite3.Error as e:
+            print(f"寫入預測快取失敗：{e}")
+
+    def bypass(self, module: str):
+        self._count(module, "bypassed")
+
+    def clear(self):
+        self.memory.clear()
+        db = self._database()
+        if db is not None:
+            with self._db_lock:
+                db.execute("DELETE FROM predictions")
+        with self._stats_lock:
+            self._stats.clear()
+
+    def _count(self, module: str, field: str):
+        with self._stats_lock:
+            self._stats[module][field] += 1
+
+    def stats(self) -> dict:
+        """各模組的命中次數與命中率"""
+        with self._stats_lock:
+            result = {}
+            for module, counts in self._stats.items():
+                lookups = counts["memory_hits"] + counts["disk_hits"] + counts["misses"]
+                hits = counts["memory_hits"] + counts["disk_hits"]
+                result[module] = dict(counts, hit_rate=hits / lookups if lookups else 0.0)
+            return result
+
+
+prediction_cache = PredictionCache()
+
+
+def prediction_cache_stats() -> dict:
+    return prediction_cache.stats()
+
+
+class CachedPredict(dspy.Predict):
+    """
+    會查詢 prediction_cache 的 dspy.Predict。
+    time_sensitive=True 的模組（輸出含時間範圍）遇到相對日期時快取鍵加上日期，遇到日內相對時間時不快取。
+    呼叫時帶入 config、demos 等額外參數，或模型沒有設定時直接呼叫 LLM。
+    """
+    time_sensitive = False
+
+    def forward(self, **kwargs):
+        key = self._cache_key(kwargs)
+        if key is None:
+            return super().forward(**kwargs)
+
+        outputs = prediction_cache.get(self._cache_module, key)
+        if outputs is not None:
+            return dspy.Prediction(**outputs)
+
+        prediction = super().forward(**kwargs)
+        self._store(key, prediction)
+        return prediction
+
+    async def aforward(self, **kwargs):
+        key = self._cache_key(kwargs)
+        if key is None:
+            return await super().aforward(**kwargs)
+
+        outputs = await prediction_cache.aget(self._cache_module, key)
+        if outputs is not None:
+            return dspy.Prediction(**outputs)
+
+        prediction = await super().aforward(**kwargs)
+        await prediction_cache.aset(self._cache_module, key, self._outputs(prediction))
+        return prediction
+
+    @property
+    def _cache_module(self) -> str:
+        return type(self).__name__
+
+    def _cache_key(self, kwargs: dict):
+        input_fields = self.signature.input_fields
+        lm = self.lm or dspy.settings.lm
+        if lm is None or set(kwargs) != set(input_fields):
+            return None
+
+        question = normalize_question(kwargs.get("question", ""))
+        resolved_date = ""
+        if self.time_sensitive:
+            if _RELATIVE_TIME.search(question):
+                prediction_cache.bypass(self._cache_module)
+                return None
+            if _RELATIVE_DAY.search(question):
+                resolved_date = date.today().isoformat()
+
+        inputs = {}
+        for name in input_fields:
+            value = kwargs[name]
+            if name == "question":
+                value = question
+            elif isinstance(value, (list, tuple, set)):
+                # 標籤列表視為集合，順序不同仍是同一個問題
+                value = sorted(str(v) for v in value)
+            else:
+                value = str(value)
+            inputs[name] = value
+
+        return json.dumps(
+            [self._cache_module, lm.model, resolved_date, inputs],
+            ensure_ascii=False, sort_keys=True,
+        )
+
+    def _outputs(self, prediction) -> dict:
+        return {name: prediction.get(name) for name in self.signature.output_fields}
+
+    def _store(self, key: str, prediction):
+        prediction_cache.set(self._cache_module, key, self._outputs(prediction))
@@ -0,0 +1,47 @@
+"""
+DSPy 模組的共用登錄表：每個模組只建立一次，所有請求共用。
+FastAPI 啟動（lifespan）時呼叫 warm_up_modules() 預先建立，第一個請求不必再等待。
+"""
+import threading
+import time
+
+from ._lm_config import init_dspy
+from .general_response import GeneralResponseGenerator
+from .intent_checker import IntentChecker
+from .log_query_extractor import LogQueryExtractor
+from .turn_planner import TurnPlanner
+from .web_log_brief_response import WebLogBriefResponseGenerator
+from .web_log_detailed_response import WebLogDetailedResponseGenerator
+
+_FACTORIES = {
+    "intent_checker": IntentChecker,
+    "turn_planner": TurnPlanner,
+    "log_query_extractor": LogQueryExtractor,
+    "general_response": GeneralResponseGenerator,
+    "web_log_brief_response": WebLogBriefResponseGenerator,
+    "web_log_detailed_response": WebLogDetailedResponseGenerator,
+}
+_modules = {}
+_lock = threading.Lock()
+
+
+def get_module(name: str):
+    """取得共用的 DSPy 模組，第一次使用時才設定 LM 並建立"""
+    module = _modules.get(name)
+    if module is None:
+        with _lock:
+            module = _modules.get(name)
+            if module is None:
+                init_dspy()
+                module = _modules[name] = _FACTORIES[name]()
+    return module
+
+
+def warm_up_modules() -> dict:
+    """建立所有模組，回傳各模組建立所花的秒數"""
+    timings = {}
+    for name in _FACTORIES:
+        started = time.perf_counter()
+        get_module(name)
+        timings[name] = time.perf_counter() - started
+    return timings
@@ -0,0 +1,64 @@
+import dspy
+from dspy import InputField, OutputField
+
+from .log_query_extractor import LogQuerySignature
+from .prediction_cache import CachedPredict
+
+INTENT_LABELS = ("web_log", "general")
+RESPONSE_STYLES = ("brief", "detailed")
+_QUERY_FIELDS = ("start_time", "end_time", "status_code", "http_method", "source_ip")
+# 模型表示「沒有」時常見的寫法
+_EMPTY_VALUES = {"", "none", "null", "n/a", "-", "無", "空"}
+
+
+class TurnPlanSignature(dspy.Signature):
+    """一次判斷使用者訊息的意圖、log 查詢條件、是否要查詢 IP 資訊，以及想要簡短或詳細的回答。"""
+    question = InputField(desc="使用者訊息")
+    intent = OutputField(desc="web_log 或 general；查詢伺服器日誌、查詢 IP 都算 web_log，只要包含標籤字串")
+    start_time = LogQuerySignature.output_fields["start_time"]
+    end_time = LogQuerySignature.output_fields["end_time"]
+    status_code = LogQuerySignature.output_fields["status_code"]
+    http_method = LogQuerySignature.output_fields["http_method"]
+    source_ip = LogQuerySignature.output_fields["source_ip"]
+    use_ip_info = OutputField(desc="使用者是否要查詢某個 IP 的資訊（地區、組織等），yes 或 no")
+    response_style = OutputField(desc="brief 或 detailed；使用者想要簡短回答或詳細回答，只要包含標籤字串")
+
+
+class TurnPlanner(CachedPredict):
+    # 輸出含時間範圍，相對時間的問題需依日期區分
+    time_sensitive = True
+
+    def __init__(self):
+        super().__init__(TurnPlanSignature)
+
+
+def parse_turn_plan(prediction) -> dict:
+    """
+    把 TurnPlanner 的輸出整理成 dict。
+    標籤缺少或不在允許的選項內時丟出 ValueError，由呼叫端改走逐步判斷的流程；缺少的查詢條件視為未指定。
+    """
+    intent = _label(getattr(prediction, "intent", None))
+    if intent not in INTENT_LABELS:
+        raise ValueError(f"無法辨識的意圖：{getattr(prediction, 'intent', None)}")
+
+    plan = {"intent": intent}
+    if intent != "web_log":
+        return plan
+
+    response_style = _label(getattr(prediction, "response_style", None))
+    if response_style not in RESPONSE_STYLES:
+        raise ValueError(f"無法辨識的回應類型：{getattr(prediction, 'response_style', None)}")
+    use_ip_info = _label(getattr(prediction, "use_ip_info", None))
+    if use_ip_info not in ("yes", "no", "true", "false"):
+        raise ValueError(f"無法辨識的 IP 查詢判斷：{getattr(prediction, 'use_ip_info', None)}")
+
+    for field in _QUERY_FIELDS:
+        value = str(getattr(prediction, field, "") or "").strip()
+        plan[field] = "" if value.lower() in _EMPTY_VALUES else value
+    plan["use_ip_info"] = use_ip_info in ("yes", "true")
+    plan["response_style"] = response_style
+    return plan
+
+
+def _label(value) -> str:
+    return str(value or "").strip().strip("'\"`").lower()
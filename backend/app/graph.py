@@ -1,33 +1,85 @@
+import os
 import re
-from app.dspy_modules import IntentChecker, LogQueryExtractor, GeneralResponseGenerator, WebLogBriefResponseGenerator, WebLogDetailedResponseGenerator
-import operator
-from typing import TypedDict, Annotated, List, Dict
-from app.tools.log_tools import filter_logs_by_time_and_status
+from app.dspy_modules import get_module, parse_turn_plan, fast_plan
+import dspy
+from dspy.streaming import StreamListener, StreamResponse
+from typing import TypedDict, Annotated, List, Dict, Optional
+from app.tools.log_tools import aquery_logs, format_query_result
+from langgraph.config import get_stream_writer
 from langgraph.graph import StateGraph, END
-from langgraph.checkpoint.memory import MemorySaver
 from datetime import datetime
 
-from app.tools.ipinfo import get_ip_info
+from app.tools.ipinfo import aget_ip_infos
+from app.checkpointer import checkpointer
+from app.session_store import append_messages
 
-# === 初始化 DSPy 模組 ===
-intent_checker = IntentChecker()
+# 流程模式（環境變數 GRAPH_MODE）：
+# fused 先用一次 LLM 呼叫同時判斷意圖、查詢條件、是否查 IP 與回應類型，解析失敗時退回逐步判斷；
+# multi_step 每個判斷各呼叫一次 LLM
+GRAPH_MODE = os.getenv("GRAPH_MODE", "fused")
+# 明顯是 log 查詢的訊息先用本機規則判斷，不呼叫 LLM（環境變數 FAST_ROUTER=off 關閉）
+FAST_ROUTER = os.getenv("FAST_ROUTER", "on") != "off"
+# 目前沒有真實資料，固定查詢範例 log 的日期（格式 14/Jul/2025）；設為空字串時使用判斷出的時間範圍
+LOG_QUERY_FIXED_DATE = os.getenv("LOG_QUERY_FIXED_DATE", "14/Jul/2025")
 
 # === 定義狀態類型 ===
 class AllState(TypedDict):
-    messages: Annotated[List[Dict[str, str]], operator.add]
+    # 只保留最近 SESSION_MESSAGE_WINDOW 則訊息
+    messages: Annotated[List[Dict[str, str]], append_messages]
     tool_output: str
     tool_detail: str
     intent: str
+    # 合併判斷的結果；None 表示這一輪走逐步判斷
+    plan: Optional[dict]
+    # 平行分支各自寫入的欄位，由 web_log_join 合併
+    ip_info: str
+    response_style: str
+
+
+# === 節點： 一次判斷意圖、查詢條件、是否查 IP 與回應類型 ===
+async def plan_turn(state: AllState) -> dict:
+    user_input = state["messages"][-1]["content"]
+    plan = route_by_rules(user_input)
+    if plan is not None:
+        return {**route_by_intent(state, plan["intent"]), "plan": plan}
+
+    try:
+        plan = parse_turn_plan(await get_module("turn_planner").acall(question=user_input))
+    except Exception as e:
+        print(f"合併判斷失敗，改用逐步判斷：{e}")
+        return {"next": "fallback", "plan": None}
+
+    print(f"合併判斷結果: {plan}")
+    return {**route_by_intent(state, plan["intent"]), "plan": plan}
 
 
 # === 節點： 進行意圖判斷 ===
-def intent_check(state: AllState) -> dict:
+async def intent_check(state: AllState) -> dict:
     user_input = state["messages"][-1]["content"]
+    plan = route_by_rules(user_input)
+    if plan is not None:
+        return {**route_by_intent(state, plan["intent"]), "plan": plan}
+
     desc = "查詢IP也算是web_log"
-    intent = intent_checker(question=user_input, intent_labels=["web_log", "general"], intent_desc=desc).intent
+    intent_checker = get_module("intent_checker")
+    intent = (await intent_checker.acall(question=user_input, intent_labels=["web_log", "general"], intent_desc=desc)).intent
     print(f"使用者意圖: {intent}")
     print(f"user_input: {user_input}")
 
+    return {**route_by_intent(state, intent), "plan": None}
+
+
+def route_by_rules(user_input: str) -> Optional[dict]:
+    """規則判斷有把握時回傳判斷結果，否則回傳 None（改由 LLM 判斷）"""
+    if not FAST_ROUTER:
+        return None
+    plan = fast_plan(user_input)
+    if plan is not None:
+        print(f"規則判斷結果: {plan}")
+    return plan
+
+
+def route_by_intent(state: AllState, intent: str) -> dict:
     # 根據意圖決定清空與否
     tool_output = [] if intent != "web_log" else state.get("tool_output", [])
     tool_detail = "" if intent != "web_log" else state.get("tool_detail", "")
@@ -43,17 +95,26 @@ def intent_check(state: AllState) -> dict:
     }
 
 # === 節點： 工具執行 ===
-def web_log_tool(state: AllState) -> dict:
-    user_input = state["messages"][-1]["content"]
-    log_query = LogQueryExtractor()
-
-    # 使用 DSPy 模型提取時間範圍和狀態碼
-    query_result = log_query(question=user_input)
-    start_time = query_result.start_time
-    end_time = query_result.end_time
-    status_code = query_result.status_code
-    http_method = query_result.http_method
-    source_ip = query_result.source_ip
+async def web_log_tool(state: AllState) -> dict:
+    plan = state.get("plan")
+    if plan:
+        # 合併判斷時已經一併提取查詢條件
+        start_time = plan["start_time"]
+        end_time = plan["end_time"]
+        status_code = plan["status_code"]
+        http_method = plan["http_method"]
+        source_ip = plan["source_ip"]
+    else:
+        user_input = state["messages"][-1]["content"]
+        log_query = get_module("log_query_extractor")
+
+        # 使用 DSPy 模型提取時間範圍和狀態碼
+        query_result = await log_query.acall(question=user_input)
+        start_time = query_result.start_time
+        end_time = query_result.end_time
+        status_code = query_result.status_code
+        http_method = query_result.http_method
+        source_ip = query_result.source_ip
 
     print(f"提取時間範圍和狀態碼: {start_time} - {end_time}, {status_code}, {http_method}, {source_ip}")
 
@@ -63,24 +124,26 @@ def web_log_tool(state: AllState) -> dict:
         start_time = start_time or default_start
         end_time = end_time or default_end
 
-    # 目前沒有真實資料，先用固定日期
-    start_time = "14/Jul/2025:00:00:00"
-    end_time = "14/Jul/2025:23:59:59"
-    
+    if LOG_QUERY_FIXED_DATE:
+        start_time = f"{LOG_QUERY_FIXED_DATE}:00:00:00"
+        end_time = f"{LOG_QUERY_FIXED_DATE}:23:59:59"
+
     print(f"最終時間範圍和狀態碼: {start_time} - {end_time}, {status_code}, {http_method}, {source_ip}")
 
 
-    # 根據提取的參數過濾日誌
-    stats, logs, structured_logs = filter_logs_by_time_and_status(
+    # 根據提取的參數過濾日誌（只保留統計與前幾筆樣本，不載入全部符合的 log）
+    # 掃描在 log 查詢專用的執行緒池執行，不阻塞其他使用者的請求
+    result = await aquery_logs(
         start_time=start_time,
         end_time=end_time,
         status_code=status_code,
         http_method=http_method,
         source_ip=source_ip
     )
+    stats, structured_logs = format_query_result(result) if result is not None else ("", {})
 
     print(stats)
-    print("過濾後的日誌數量:", len(logs))
+    print("過濾後的日誌數量:", result.total if result is not None else 0)
 
     return {
         "tool_output": stats,
@@ -95,53 +158,95 @@ def get_today_time_range():
         f"{day_str}:23:59:59"
     )
 
-def check_use_ip_info_tool(state: AllState) -> bool:
+async def check_use_ip_info_tool(state: AllState) -> bool:
+    plan = state.get("plan")
+    if plan:
+        return plan["use_ip_info"]
+
     user_input = state["messages"][-1]["content"].lower()
-    intent = intent_checker(question=user_input, intent_labels=["ip_info", "none"], intent_desc="").intent
+    intent_checker = get_module("intent_checker")
+    intent = (await intent_checker.acall(question=user_input, intent_labels=["ip_info", "none"], intent_desc="")).intent
+
+    return intent == "ip_info"
+
+# === 節點： 查詢 IP 資訊（與 log 查詢同時執行，結果在 web_log_join 合併） ===
+# 一則訊息最多查詢幾個 IP
+MAX_IP_INFO_LOOKUPS = 5
 
-    return {
-        "next": True if intent == "ip_info" else False
-    }
 
-# === 節點： 查詢 IP 資訊 ===
-def ip_info_tool(state: AllState) -> dict:
+async def ip_info_tool(state: AllState) -> dict:
+    if not await check_use_ip_info_tool(state):
+        return {"ip_info": ""}
+
     user_input = state["messages"][-1]["content"].lower()
     ip_regex = r'(?:(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.){3}(?:25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)|(?:[0-9a-fA-F]{1,4}:){7}[0-9a-fA-F]{1,4}'
-    ip_match = re.search(ip_regex, user_input)
-    ip_address = ip_match.group(0)
-    ip_info = get_ip_info(ip_address)
-    tool_output = state.get("tool_output", "")
-    tool_output += f"\nIP 資訊: {ip_info}"
-    print(f"IP 資訊: {ip_info}")
+    ip_addresses = re.findall(ip_regex, user_input)[:MAX_IP_INFO_LOOKUPS]
+    if not ip_addresses:
+        print("訊息中找不到 IP，略過 IP 資訊查詢")
+        return {"ip_info": ""}
+    # 共用連線池並行查詢，查過的 IP 直接由快取回傳
+    ip_infos = await aget_ip_infos(ip_addresses)
+    print(f"IP 資訊: {ip_infos}")
+    if len(ip_infos) == 1:
+        return {"ip_info": f"\nIP 資訊: {next(iter(ip_infos.values()))}"}
     return {
-        "tool_output": tool_output
+        "ip_info": "".join(f"\nIP 資訊（{ip}）: {info}" for ip, info in ip_infos.items())
     }
 
 
+async def generate_answer(generator, **kwargs) -> str:
+    """
+    以串流方式呼叫回答模組，answer 欄位的每個片段透過 LangGraph 的 custom stream 送出；
+    用 ainvoke 執行時沒有人接收片段，結果與直接呼叫相同。
+    """
+    writer = get_stream_writer()
+    stream = dspy.streamify(generator, stream_listeners=[StreamListener(signature_field_name="answer")],
+                            is_async_program=True)
+    answer = ""
+    async for chunk in stream(**kwargs):
+        if isinstance(chunk, StreamResponse):
+            writer({"token": chunk.chunk})
+        elif isinstance(chunk, dspy.Prediction):
+            answer = chunk.answer
+    return answer
+
+
 # === 節點： 一般回應 ===
-def general_response(state: AllState) -> AllState:
+async def general_response(state: AllState) -> AllState:
     recent_messages = state["messages"][-6:]
-    general_response_generator = GeneralResponseGenerator()
-    answer = general_response_generator(question=recent_messages).answer
+    general_response_generator = get_module("general_response")
+    answer = await generate_answer(general_response_generator, question=recent_messages)
 
     return {
         "messages": [{"role": "assistant", "content": answer}]
     }
 
 # === 節點： web log 簡答詳答判斷 ===
-def web_log_response_classification(state: AllState) -> AllState:
+async def web_log_response_classification(state: AllState) -> AllState:
     # 根據使用者的提問判斷要簡短回應還是詳細回應，使用
+    plan = state.get("plan")
+    if plan:
+        return {"response_style": plan["response_style"]}
+
     user_input = state["messages"][-1]["content"].lower()
-    intent = intent_checker(question=user_input, intent_labels=["brief", "detailed"], intent_desc="").intent
+    intent_checker = get_module("intent_checker")
+    intent = (await intent_checker.acall(question=user_input, intent_labels=["brief", "detailed"], intent_desc="")).intent
     print(f"使用者想要的回應類型: {intent}")
     
     return {
-        "next": "brief" if intent == "brief" else "detailed"
+        "response_style": "brief" if intent == "brief" else "detailed"
+    }
+
+
+# === 節點： 合併 log 查詢、IP 資訊與回應類型判斷的結果 ===
+def web_log_join(state: AllState) -> AllState:
+    return {
+        "tool_output": state.get("tool_output", "") + state.get("ip_info", "")
     }
 
 
 # === 節點： web log 工具簡短回應 ===
-def web_log_brief_response(state: AllState) -> AllState:
+async def web_log_brief_response(state: AllState) -> AllState:
     recent_messages = state["messages"][-6:]
     formatted_history = ""
     for msg in recent_messages:
@@ -150,8 +255,8 @@ def web_log_brief_response(state: AllState) -> AllState:
 
     tool_output = state.get("tool_output", "")
 
-    web_log_brief_response_generator = WebLogBriefResponseGenerator()
-    answer = web_log_brief_response_generator(chat_history=formatted_history, tool_output=tool_output).answer
+    web_log_brief_response_generator = get_module("web_log_brief_response")
+    answer = await generate_answer(web_log_brief_response_generator, chat_history=formatted_history, tool_output=tool_output)
 
     return {
         "messages": [{"role": "assistant", "content": answer}]
@@ -159,7 +264,7 @@ def web_log_brief_response(state: AllState) -> AllState:
 
 
 # === 節點： web log 工具詳細回應 ===
-def web_log_detailed_response(state: AllState) -> AllState:
+async def web_log_detailed_response(state: AllState) -> AllState:
     recent_messages = state["messages"][-6:]
     formatted_history = ""
     for msg in recent_messages:
@@ -168,8 +273,8 @@ def web_log_detailed_response(state: AllState) -> AllState:
 
     tool_output = state.get("tool_output", "")
     
-    web_log_detailed_response_generator = WebLogDetailedResponseGenerator()
-    answer = web_log_detailed_response_generator(chat_history=formatted_history, tool_output=tool_output).answer
+    web_log_detailed_response_generator = get_module("web_log_detailed_response")
+    answer = await generate_answer(web_log_detailed_response_generator, chat_history=formatted_history, tool_output=tool_output)
 
     return {
         "messages": [{"role": "assistant", "content": answer}]
@@ -177,43 +282,49 @@ def web_log_detailed_response(state: AllState) -> AllState:
 
 
 # === 定義 LangGraph 流程 ===
+# web_log 意圖時同時執行 log 查詢、IP 資訊查詢與回應類型判斷，三者只依賴使用者訊息，
+# 每一輪的等待時間是最慢的分支而不是三者相加
+WEB_LOG_BRANCHES = ["web_log_tool", "get_ip_info", "web_log_response_classification"]
+
+
+def route_after_intent(state):
+    if state["next"] == "use_web_tool":
+        return WEB_LOG_BRANCHES
+    return {"general": "general_response", "fallback": "intent_check"}[state["next"]]
+
+
 graph = StateGraph(AllState)
 
+graph.add_node("plan_turn", plan_turn)
 graph.add_node("intent_check", intent_check)
 graph.add_node("web_log_tool", web_log_tool)
 graph.add_node("get_ip_info", ip_info_tool)
-graph.add_node("check_use_ip_info_tool", check_use_ip_info_tool)
 graph.add_node("general_response", general_response)
 graph.add_node("web_log_response_classification", web_log_response_classification)
+graph.add_node("web_log_join", web_log_join)
 graph.add_node("web_log_brief_response", web_log_brief_response)
 graph.add_node("web_log_detailed_response", web_log_detailed_response)
 
-graph.set_entry_point("intent_check")
+graph.set_entry_point("plan_turn" if GRAPH_MODE == "fused" else "intent_check")
 
 graph.add_conditional_edges(
-    "intent_check",
-    lambda state: state["next"],
-    {
-        "use_web_tool": "web_log_tool",
-        "general": "general_response"
-    }
+    "plan_turn",
+    route_after_intent,
+    WEB_LOG_BRANCHES + ["general_response", "intent_check"]
 )
 
-graph.add_edge("web_log_tool", "check_use_ip_info_tool")
-
 graph.add_conditional_edges(
-    "check_use_ip_info_tool",
-    lambda state: state["next"],
-    {
-        True: "get_ip_info",
-        False: "web_log_response_classification"
-    }
+    "intent_check",
+    route_after_intent,
+    WEB_LOG_BRANCHES + ["general_response"]
 )
-graph.add_edge("get_ip_info", "web_log_response_classification")
+
+# 三個分支都完成後才進入 web_log_join
+graph.add_edge(WEB_LOG_BRANCHES, "web_log_join")
 
 graph.add_conditional_edges(
-    "web_log_response_classification",
-    lambda state: state["next"],
+    "web_log_join",
+    lambda state: state["response_style"],
     {
         "brief": "web_log_brief_response",
         "detailed": "web_log_detailed_response"
@@ -222,6 +333,5 @@ graph.add_conditional_edges(
 
 graph.add_edge("web_log_brief_response", END)
 graph.add_edge("web_log_detailed_response", END)
-
-memory = MemorySaver()
-app = graph.compile(checkpointer=memory)
+# 每個 session 只保留最新的 checkpoint，session 數量與閒置時間有上限
+app = graph.compile(checkpointer=checkpointer)
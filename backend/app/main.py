@@ -1,13 +1,57 @@
-from typing import Dict
+# 啟動分析需在其他模組之前開始記錄（STARTUP_PROFILE=1）
+from app import startup_profile
+startup_profile.install()
+
+from contextlib import asynccontextmanager
+import json
+import time
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 
 from app.api.web_log.api import router as web_log_router
-from app.graph import app as langgraph_app
 
-app = FastAPI(title="Agent App")
+
+def get_graph_app():
+    """
+    LangGraph 流程（連同 dspy、langgraph）在第一次使用時才匯入；
+    正常啟動時 lifespan 已經預先載入，這裡只是取用。
+    """
+    from app.graph import app as langgraph_app
+    return langgraph_app
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # ✅ 預熱：載入流程、建立所有 DSPy 模組，並在背景匯入 log 索引與 IP 範圍資料庫，第一個請求不必等待
+    from app.dspy_modules import warm_up_modules
+    from app.tools.ip_ranges import warm_up_ip_ranges
+    from app.tools.log_tools import warm_up_log_index
+
+    started = time.perf_counter()
+    get_graph_app()
+    startup_profile.record_phase("載入 LangGraph 流程", time.perf_counter() - started)
+    for name, seconds in warm_up_modules().items():
+        startup_profile.record_phase(f"建立 DSPy 模組 {name}", seconds)
+    warm_up_log_index()
+    warm_up_ip_ranges()
+
+    # 建立 /web-log 使用的 MCP 連線與 agent（含健康檢查）；MCP 服務未啟動時在背景重新連線
+    from app.api.web_log.agent import close_agent, initialize_agent
+
+    started = time.perf_counter()
+    await initialize_agent()
+    startup_profile.record_phase("連線 MCP 並建立 Web Log Agent", time.perf_counter() - started)
+    startup_profile.report()
+    yield
+    # 關閉 MCP 連線與 IP 資訊查詢的連線池
+    await close_agent()
+    from app.tools.ipinfo import ip_info_client
+    await ip_info_client.aclose()
+
+
+app = FastAPI(title="Agent App", lifespan=lifespan)
 
 # ✅ CORS 中介層
 origins = [
@@ -31,10 +75,9 @@ class UserInput(BaseModel):
     input: str
     session_id: str
 
-session_states: Dict[str, dict] = {}
-
 
 @app.options("/api/infer")
+@app.options("/api/infer/stream")
 async def preflight_handler(request: Request):
     return JSONResponse(
         content={"message": "CORS preflight OK"},
@@ -49,28 +92,72 @@ async def preflight_handler(request: Request):
 @app.post("/api/infer")
 async def run_graph_with_simple_input(user_input: UserInput):
     session_id = user_input.session_id
+    current_state = start_session_turn(user_input.input)
+
+    # 所有節點都是 async：LLM 呼叫與 IP 查詢不阻塞 event loop，log 掃描交給執行緒池
+    result = await get_graph_app().ainvoke(current_state, config={"thread_id": session_id})
 
-    # 初始化 session 狀態
-    if session_id not in session_states:
-        session_states[session_id] = {
-            "messages": [],
-        }
+    return finish_session_turn(result)
 
-    current_state = {
+
+@app.post("/api/infer/stream")
+async def stream_graph_with_simple_input(user_input: UserInput):
+    """
+    與 /api/infer 相同的流程，以 Server-Sent Events 逐步回傳：
+    - tool_detail：log 查詢完成後的結構化 table
+    - stats：統計資訊（含 IP 資訊）
+    - token：回答的片段（命中 LLM 快取時可能沒有，完整回答以 final 為準）
+    - final：與 /api/infer 相同格式的完整回應
+    - error：執行失敗
+    """
+    session_id = user_input.session_id
+    current_state = start_session_turn(user_input.input)
+
+    async def events():
+        result = None
+        try:
+            async for mode, chunk in get_graph_app().astream(current_state, config={"thread_id": session_id},
+                                                           stream_mode=["updates", "custom", "values"]):
+                if mode == "updates":
+                    if "web_log_tool" in chunk:
+                        yield sse_event("tool_detail", chunk["web_log_tool"]["tool_detail"])
+                    if "web_log_join" in chunk:
+                        yield sse_event("stats", chunk["web_log_join"]["tool_output"])
+                elif mode == "custom" and "token" in chunk:
+                    yield sse_event("token", chunk["token"])
+                elif mode == "values":
+                    result = chunk
+        except Exception as e:
+            print(f"串流回應時發生錯誤：{e}")
+            yield sse_event("error", str(e))
+            return
+
+        yield sse_event("final", finish_session_turn(result))
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # 避免反向代理暫存整個回應
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def start_session_turn(user_text: str) -> dict:
+    # 之前的訊息由 checkpointer 依 thread_id（session_id）載入，這裡只放這一輪的輸入；
+    # 超過上限或閒置太久的 session 由 checkpointer 淘汰
+    return {
         "messages": [
-            {"role": "user", "content": user_input.input}
+            {"role": "user", "content": user_text}
         ]
     }
 
-    result = langgraph_app.invoke(current_state, config={"thread_id": session_id})
-
-    # 更新 session 狀態（儲存完整訊息）
-    session_states[session_id]["messages"] = result["messages"]
-    if "tool_output" in result:
-        session_states[session_id]["tool_output"] = result["tool_output"]
-    if "tool_detail" in result:
-        session_states[session_id]["tool_detail"] = result["tool_detail"]
 
+def finish_session_turn(result: dict) -> dict:
+    # session 狀態（訊息已由 reducer 限制在最近幾則）已寫入 checkpoint，
     # 回傳只有最後一則訊息與其他資料
     response = {
         "message": result["messages"][-1]
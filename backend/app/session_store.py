@@ -0,0 +1,45 @@
+"""
+有上限的 session 儲存。
+
+原本 LangGraph 的 MemorySaver 會永久保留每個 session 的完整訊息與 tool_detail，
+節點實際上只讀取 messages[-6:]。這裡集中設定上限：
+- SESSION_MAX_COUNT：最多保留的 session 數，超過時淘汰最久沒用到的
+- SESSION_IDLE_TTL：閒置超過這個秒數的 session 刪除
+- SESSION_MESSAGE_WINDOW：每個 session 只保留最近幾則訊息（append_messages 作為狀態的 reducer）
+checkpoint 的部分見 app.checkpointer（需要匯入 langgraph，這個模組不需要）。
+session 的訊息只存在 checkpoint 中，選用 sqlite 後端時多個 worker 看到的是同一份對話。
+"""
+import os
+from typing import Dict, List
+
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", 1000))
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", 3600))
+# 要大於節點讀取的 6 則，保留一些前後文
+SESSION_MESSAGE_WINDOW = int(os.getenv("SESSION_MESSAGE_WINDOW", 20))
+
+
+def append_messages(existing: List[Dict[str, str]], new: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """messages 的 reducer：附加新訊息後只保留最近 SESSION_MESSAGE_WINDOW 則"""
+    messages = (existing or []) + (new or [])
+    if SESSION_MESSAGE_WINDOW > 0 and len(messages) > SESSION_MESSAGE_WINDOW:
+        return messages[-SESSION_MESSAGE_WINDOW:]
+    return messages
+
+
+def current_rss_bytes() -> int:
+    """目前行程的 RSS；沒有 /proc 時回傳最高 RSS"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def session_store_stats() -> dict:
+    """RSS 與 checkpoint（每個 session 一個 thread）的數量 / 大小"""
+    from app.checkpointer import checkpointer
+    return {
+        "rss_bytes": current_rss_bytes(),
+        "checkpoints": checkpointer.stats(),
+    }
@@ -0,0 +1,71 @@
+"""
+啟動時間分析：環境變數 STARTUP_PROFILE=1 時記錄每個模組第一次匯入的時間，
+FastAPI 啟動完成後印出最慢的模組與各預熱步驟的耗時。
+
+需在其他模組之前匯入（app/main.py 第一行），才能涵蓋所有匯入。
+"""
+import builtins
+import importlib.util
+import os
+import sys
+import time
+
+ENABLED = os.getenv("STARTUP_PROFILE") == "1"
+
+_original_import = builtins.__import__
+_process_started = time.perf_counter()
+# 模組名稱 -> (含子模組的總時間, 扣掉子模組的時間)
+_imports = {}
+# 匯入中的模組，各自累計子模組的時間
+_stack = []
+_phases = []
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level:
+        package = (globals or {}).get("__package__") or ""
+        try:
+            module_name = importlib.util.resolve_name("." * level + name, package)
+        except ImportError:
+            module_name = name
+    else:
+        module_name = name
+    if module_name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+
+    started = time.perf_counter()
+    _stack.append(0.0)
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - started
+        children = _stack.pop()
+        if _stack:
+            _stack[-1] += elapsed
+        _imports.setdefault(module_name, (elapsed, elapsed - children))
+
+
+def install():
+    """開始記錄匯入時間（STARTUP_PROFILE 未開啟時不做任何事）"""
+    if ENABLED and builtins.__import__ is _original_import:
+        builtins.__import__ = _timed_import
+
+
+def record_phase(name: str, seconds: float):
+    """記錄一個啟動步驟（例如建立 DSPy 模組）的耗時"""
+    if ENABLED:
+        _phases.append((name, seconds))
+
+
+def report(top: int = 25):
+    """印出最慢的模組與各啟動步驟"""
+    if not ENABLED:
+        return
+    builtins.__import__ = _original_import
+    print(f"⏱️ 啟動分析：行程啟動到現在 {time.perf_counter() - _process_started:.3f}s")
+    print(f"{'模組':<50} {'總計':>9} {'本身':>9}")
+    slowest = sorted(_imports.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    for module_name, (total, own) in slowest:
+        print(f"{module_name:<50} {total * 1000:8.1f}ms {own * 1000:8.1f}ms")
+    for name, seconds in _phases:
+        print(f"- {name}: {seconds * 1000:.1f}ms")
@@ -0,0 +1,314 @@
+"""
+離線的 IP 範圍資料庫：查詢來源 IP 所屬的國家 / ASN / 組織，不需要網路。
+
+ipinfo.io 一次只能查一個 IP 且要走網路，統計摘要的前 10 名 IP 與 tool_detail 的每一列
+都改用這個資料庫批次標註。支援兩種常見的離線資料（IP_RANGES_PATH 指定，逗號或 tab 分隔皆可）：
+- 沒有標題列：range_start, range_end, asn, country, org（iptoasn.com 的 ip2asn-combined.tsv）；
+  第一欄是 CIDR 時為 network, asn, country, org
+- 有標題列：network 或 start / end 欄位，加上 asn、country、org
+  （也接受 GeoLite2-ASN CSV 的 autonomous_system_number / autonomous_system_organization）
+
+載入時 IPv4 / IPv6 各轉成依起點排序、互不重疊的區間（重疊時較小的範圍優先），
+IPv4 的起訖點放在 array('I')，查詢以 bisect 二分搜尋，每個 IP 只要數微秒。
+"""
+from array import array
+from bisect import bisect_right
+import csv
+import os
+import socket
+import sys
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+IP_RANGES_PATH = os.getenv("IP_RANGES_PATH") or os.path.join(BASE_DIR, "../data/ip_ranges.tsv")
+
+_HEADER_ALIASES = {
+    "network": ("network", "cidr", "prefix"),
+    "start": ("start", "range_start", "start_ip", "ip_start", "first_ip"),
+    "end": ("end", "range_end", "end_ip", "ip_end", "last_ip"),
+    "asn": ("asn", "as_number", "autonomous_system_number"),
+    "country": ("country", "country_code", "iso_code", "country_iso_code"),
+    "org": ("org", "organization", "as_name", "as_description", "autonomous_system_organization"),
+}
+
+
+class IPRangeDB:
+    """依 IP 範圍查詢國家 / ASN / 組織；lookup 找不到時回傳 None"""
+
+    def __init__(self, ranges: Iterable[Tuple[int, int, int, Tuple[str, str, str]]] = ()):
+        """ranges：(IP 版本, 起點, 終點, (country, asn, org))"""
+        self.records: List[Tuple[str, str, str]] = []
+        record_ids: Dict[Tuple[str, str, str], int] = {}
+        # 每個版本的 (起點, 終點, 紀錄編號)
+        self._tables = {version: (_column(version), _column(version), array("I")) for version in (4, 6)}
+        # ip2asn 之類的資料已依起點排序且互不重疊，直接附加；遇到重疊或未排序時才需要攤平
+        needs_flatten = {4: False, 6: False}
+        for version, start, end, record in ranges:
+            record_id = record_ids.get(record)
+            if record_id is None:
+                record_id = record_ids[record] = len(self.records)
+                self.records.append(record)
+            starts, ends, values = self._tables[version]
+            if ends and start <= ends[-1]:
+                needs_flatten[version] = True
+            starts.append(start)
+            ends.append(end)
+            values.append(record_id)
+
+        for version, (starts, ends, values) in list(self._tables.items()):
+            if needs_flatten[version]:
+                flat = _flatten(list(zip(starts, ends, values)))
+                self._tables[version] = (
+                    _column(version, (item[0] for item in flat)),
+                    _column(version, (item[1] for item in flat)),
+                    array("I", (item[2] for item in flat)),
+                )
+
+    @classmethod
+    def load(cls, path: str) -> "IPRangeDB":
+        """讀取 CSV / TSV；無法解析的列略過，ASN 為 0（未宣告路由）的範圍不收錄"""
+        with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+            first_line = f.readline()
+            f.seek(0)
+            delimiter = "\t" if "\t" in first_line else ","
+            return cls(_read_ranges(csv.reader(f, delimiter=delimiter)))
+
+    def __len__(self) -> int:
+        return sum(len(starts) for starts, _, _ in self._tables.values())
+
+    def lookup(self, ip: str) -> Optional[dict]:
+        try:
+            version, value = _address_int(ip.strip())
+        except ValueError:
+            return None
+        starts, ends, values = self._tables[version]
+        i = bisect_right(starts, value) - 1
+        if i < 0 or value > ends[i]:
+            return None
+        country, asn, org = self.records[values[i]]
+        return {"country": country, "asn": asn, "org": org}
+
+    def lookup_many(self, ips: Iterable[str]) -> Dict[str, dict]:
+        """批次查詢（重複的只查一次），只回傳查得到的 IP"""
+        results = {}
+        for ip in ips:
+            if ip not in results:
+                results[ip] = self.lookup(ip)
+        return {ip: info for ip, info in results.items() if info is not None}
+
+    def stats(self) -> dict:
+        return {
+            "ipv4_ranges": len(self._tables[4][0]),
+            "ipv6_ranges": len(self._tables[6][0]),
+            "records": len(self.records),
+        }
+
+
+def _column(version: int, items: Iterable[int] = ()):
+    """IP 起訖點的欄位：IPv4 用 array('I')，IPv6 超過 64 bit 只能用 Python int 的 list"""
+    return array("I", items) if version == 4 else list(items)
+
+
+def _read_ranges(rows):
+    # network, start, end, asn, country, org 各在第幾欄（None 表示沒有這欄）
+    columns = None
+    for row in rows:
+        if not row or row[0].startswith("#"):
+            continue
+        if columns is None:
+            if not _is_address(row[0]):
+                columns = _header_columns(row)
+                continue
+            columns = (0, None, None, 1, 2, 3) if "/" in row[0] else (None, 0, 1, 2, 3, 4)
+
+        network, start, end, asn, country, org = (
+            row[i].strip() if i is not None and i < len(row) else "" for i in columns
+        )
+        try:
+            if network:
+                version, first, last = _network_range(network)
+            else:
+                version, first = _address_int(start)
+                last_version, last = _address_int(end)
+                if version != last_version or last < first:
+                    continue
+        except ValueError:
+            continue
+
+        asn = asn.upper().removeprefix("AS")
+        if asn == "0" or org.lower() == "not routed":
+            continue
+        country = country.upper()
+        if country in ("NONE", "-"):
+            country = ""
+        yield version, first, last, (sys.intern(country), sys.intern(f"AS{asn}") if asn else "", org)
+
+
+def _header_columns(header: list) -> tuple:
+    normalized = [name.strip().lower() for name in header]
+    columns = []
+    for aliases in _HEADER_ALIASES.values():
+        columns.append(next((normalized.index(alias) for alias in aliases if alias in normalized), None))
+    return tuple(columns)
+
+
+def _address_int(text: str) -> Tuple[int, int]:
+    """IP 字串轉成 (版本, 整數)；inet_pton 比 ipaddress 快數倍，載入與批次標註時差異明顯"""
+    version, family = (6, socket.AF_INET6) if ":" in text else (4, socket.AF_INET)
+    try:
+        return version, int.from_bytes(socket.inet_pton(family, text), "big")
+    except OSError:
+        raise ValueError(f"不是有效的 IP：{text}") from None
+
+
+def _network_range(text: str) -> Tuple[int, int, int]:
+    """CIDR 轉成 (版本, 起點, 終點)，主機位元不為 0 時視同 strict=False"""
+    address, _, prefix = text.partition("/")
+    version, value = _address_int(address)
+    bits = 32 if version == 4 else 128
+    prefix_length = int(prefix) if prefix else bits
+    if not 0 <= prefix_length <= bits:
+        raise ValueError(f"不是有效的 CIDR：{text}")
+    host_mask = (1 << (bits - prefix_length)) - 1
+    first = value & ~host_mask
+    return version, first, first | host_mask
+
+
+def _is_address(value: str) -> bool:
+    try:
+        if "/" in value:
+            _network_range(value.strip())
+        else:
+            _address_int(value.strip())
+        return True
+    except ValueError:
+        return False
+
+
+def _flatten(ranges: list) -> list:
+    """
+    把可能重疊的 (起點, 終點, 值) 轉成依起點排序、互不重疊的區間；
+    重疊的部分由較晚開始（巢狀時即較小）的範圍決定，相鄰且值相同的區間合併。
+    """
+    ranges.sort(key=lambda r: (r[0], -r[1]))
+    flat = []
+    # 目前位置所在的範圍 (終點, 值)，內層的在上面
+    stack = []
+    position = 0
+
+    def emit(start, end, value):
+        if flat and flat[-1][2] == value and flat[-1][1] + 1 == start:
+            flat[-1][1] = end
+        else:
+            flat.append([start, end, value])
+
+    def advance(until: Optional[int]):
+        """輸出 position 到 until（不含）之間由 stack 頂端決定的區間；until 為 None 時輸出到底"""
+        nonlocal position
+        while stack and (until is None or position < until):
+            top_end, top_value = stack[-1]
+            if top_end < position:
+                stack.pop()
+                continue
+            segment_end = top_end if until is None else min(top_end, until - 1)
+            emit(position, segment_end, top_value)
+            position = segment_end + 1
+            if segment_end == top_end:
+                stack.pop()
+
+    for start, end, value in ranges:
+        advance(start)
+        position = max(position, start)
+        stack.append((end, value))
+    advance(None)
+    return flat
+
+
+# 資料庫由背景執行緒載入（正常啟動時由 lifespan 預先開始），檔案變動時在背景重新載入；
+# 查詢的呼叫端（可能在 event loop 上）從不等待載入
+_db: Optional[IPRangeDB] = None
+_db_identity = None
+# 載入中持有（由背景執行緒釋放），同一時間只有一個載入
+_db_lock = threading.Lock()
+_loader: Optional[threading.Thread] = None
+# 讀取失敗的檔案版本，檔案變動前不再重試
+_failed_identity = None
+_missing_reported = False
+
+
+def get_ip_range_db() -> Optional[IPRangeDB]:
+    """
+    目前的資料庫；檔案不存在或還沒載入時回傳 None，檔案變動時先回傳舊的資料庫。
+    需要（重新）載入時只在背景開始載入，不等待，呼叫端此時略過標註即可。
+    """
+    global _missing_reported
+    try:
+        stat = os.stat(IP_RANGES_PATH)
+    except OSError:
+        if not _missing_reported:
+            print(f"找不到 IP 範圍資料庫：{IP_RANGES_PATH}，略過來源網路標註")
+            _missing_reported = True
+        return None
+
+    identity = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    if _db_identity != identity and _failed_identity != identity:
+        _start_loading(identity)
+    return _db
+
+
+def _start_loading(identity):
+    """開始背景載入；已經有載入在進行時不重複啟動"""
+    global _loader
+    if not _db_lock.acquire(blocking=False):
+        return
+    try:
+        _loader = threading.Thread(target=_load, args=(identity,), name="ip-ranges-load", daemon=True)
+        _loader.start()
+    except BaseException:
+        _db_lock.release()
+        raise
+
+
+def _load(identity):
+    global _db, _db_identity, _failed_identity, _missing_reported
+    try:
+        if _db_identity != identity:
+            db = IPRangeDB.load(IP_RANGES_PATH)
+            _db, _db_identity = db, identity
+            _missing_reported = False
+            print(f"已載入 IP 範圍資料庫：{IP_RANGES_PATH}（{db.stats()}）")
+    except (OSError, ValueError, csv.Error) as e:
+        _failed_identity = identity
+        print(f"無法讀取 IP 範圍資料庫 {IP_RANGES_PATH}：{e}")
+    finally:
+        _db_lock.release()
+
+
+def warm_up_ip_ranges():
+    """在背景載入 IP 範圍資料庫，第一個查詢不必等待"""
+    get_ip_range_db()
+
+
+def wait_for_ip_range_db(timeout: Optional[float] = None) -> Optional[IPRangeDB]:
+    """開始載入並等待完成後回傳資料庫（基準測試、命令列用；不要在 event loop 上呼叫）"""
+    get_ip_range_db()
+    loader = _loader
+    if loader is not None:
+        loader.join(timeout)
+    return _db
+
+
+def annotate_ips(ips: Iterable[str]) -> Dict[str, dict]:
+    """批次標註多個 IP：{ip: {"country", "asn", "org"}}；沒有資料庫或查不到的 IP 不會出現"""
+    db = get_ip_range_db()
+    if db is None:
+        return {}
+    return db.lookup_many(ips)
+
+
+def describe_ip_network(info: Optional[dict]) -> str:
+    """例如「TW AS3462 Data Communication Business Group」；沒有資料時回傳空字串"""
+    if not info:
+        return ""
+    return " ".join(part for part in (info["country"], info["asn"], info["org"]) if part)
@@ -1,14 +1,331 @@
-import requests
+"""
+查詢 IP 資訊（ipinfo.io）。
+
+同樣幾個來源 IP 會一再被查詢，原本每次都新開連線、沒有逾時也沒有快取。這裡改成：
+- 共用的 keep-alive 連線池（httpx），連線與整體都有逾時
+- 記憶體 LRU + TTL 快取，另有 SQLite 持久層（IPINFO_CACHE_DB，設成空字串只用記憶體）
+- 查詢失敗（逾時、HTTP 錯誤）也快取一段較短的時間，避免對故障的服務一直重試
+- 私有 / 保留位址與格式錯誤的 IP 直接回傳，不送出請求
+- 同一個 IP 同時被查詢時只送出一個請求；多個 IP 可以並行批次查詢
+- 非同步查詢只在 event loop 上查記憶體，SQLite 的讀寫交給執行緒池
+"""
+import asyncio
+import ipaddress
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+from app.tools.ttl_cache import TTLCache
+
+IPINFO_URL = os.getenv("IPINFO_URL", "https://ipinfo.io")
+IPINFO_TOKEN = os.getenv("IPINFO_TOKEN")
+IPINFO_TIMEOUT = float(os.getenv("IPINFO_TIMEOUT", 3))
+IPINFO_CACHE_SIZE = int(os.getenv("IPINFO_CACHE_SIZE", 4096))
+IPINFO_CACHE_TTL = float(os.getenv("IPINFO_CACHE_TTL", 86400))
+# 查詢失敗的結果保留多久（秒）
+IPINFO_NEGATIVE_TTL = float(os.getenv("IPINFO_NEGATIVE_TTL", 300))
+IPINFO_CACHE_DB = os.getenv(
+    "IPINFO_CACHE_DB",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "ipinfo_cache.sqlite"),
+)
+# 連線池大小，也是批次查詢同時送出的請求數上限
+IPINFO_MAX_CONNECTIONS = int(os.getenv("IPINFO_MAX_CONNECTIONS", 10))
+
+
+class IPInfoClient:
+    """
+    ipinfo.io 的查詢用戶端。lookup / alookup 回傳 ipinfo 的 JSON（去掉 readme）；
+    查詢失敗時回傳 {"ip": ..., "error": ...}，不丟出例外。
+    """
+
+    def __init__(self, base_url: str = IPINFO_URL, token: Optional[str] = IPINFO_TOKEN,
+                 timeout: float = IPINFO_TIMEOUT, cache_size: int = IPINFO_CACHE_SIZE,
+                 ttl: float = IPINFO_CACHE_TTL, negative_ttl: float = IPINFO_NEGATIVE_TTL,
+                 db_path: str = IPINFO_CACHE_DB, max_connections: int = IPINFO_MAX_CONNECTIONS):
+        self.base_url = base_url.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_connections = max_connections
+        self.memory = TTLCache(cache_size, ttl)
+        # SQLite 在第一次需要時才開啟，匯入模組不會建立檔案
+        self._db_path = db_path
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._client = None
+        self._client_lock = threading.Lock()
+        # 非同步連線池綁定建立它的 event loop
+        self._async_client = None
+        self._async_loop = None
+        # 在 event loop 結束（取消剩下的 task）時關閉連線池的 task
+        self._async_closer = None
+        self._semaphore = None
+        # ip -> 進行中的查詢
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._stats_lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "local": 0, "requests": 0, "failures": 0}
+
+    def _database(self):
+        """回傳 SQLite 連線，第一次呼叫時開啟；未設定或開啟失敗時回傳 None（之後不再重試）"""
+        if self._db is None and self._db_path:
+            with self._db_lock:
+                if self._db is None and self._db_path:
+                    self._db = self._open_db(self._db_path)
+                    if self._db is None:
+                        self._db_path = None
+        return self._db
+
+    @staticmethod
+    def _open_db(db_path: str):
+        try:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS ip_info (ip TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)")
+            db.execute("DELETE FROM ip_info WHERE expires_at <= ?", (time.time(),))
+            return db
+        except (OSError, sqlite3.Error) as e:
+            print(f"無法開啟 IP 資訊快取資料庫 {db_path}，只使用記憶體快取：{e}")
+            return None
+
+    # === 查詢 ===
+    def lookup(self, ip: str) -> dict:
+        ip = ip.strip()
+        cached = self._cached(ip)
+        if cached is not None:
+            return cached
+        try:
+            response = self._sync_client().get(self._url(ip), headers=self._headers())
+            return self._store(ip, self._parse(ip, response))
+        except Exception as e:
+            return self._store(ip, self._failure(ip, e))
+
+    async def alookup(self, ip: str) -> dict:
+        ip = ip.strip()
+        cached = self._cached_in_memory(ip)
+        if cached is not None:
+            return cached
+
+        pending = self._in_flight.get(ip)
+        if pending is not None:
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # 送出請求的呼叫端被取消；自己沒有被取消時重新查詢
+                if not pending.cancelled() or asyncio.current_task().cancelling():
+                    raise
+                return await self.alookup(ip)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[ip] = future
+        try:
+            result = await asyncio.to_thread(self._cached_on_disk, ip) if self._db_path else None
+            if result is None:
+                client, semaphore = self._async_pool()
+                try:
+                    async with semaphore:
+                        response = await client.get(self._url(ip), headers=self._headers())
+                    result = self._parse(ip, response)
+                except Exception as e:
+                    result = self._failure(ip, e)
+                self._remember(ip, result)
+                future.set_result(result)
+                if self._db_path:
+                    await asyncio.to_thread(self._persist, ip, result)
+            else:
+                future.set_result(result)
+            return result
+        finally:
+            # 被取消時也要結束 future，否則等待同一個 IP 的呼叫端會一直等下去
+            if not future.done():
+                future.cancel()
+            del self._in_flight[ip]
+
+    async def alookup_many(self, ips: Iterable[str]) -> Dict[str, dict]:
+        """並行查詢多個 IP（重複的只查一次），回傳 {ip: 資訊}，順序與輸入相同"""
+        unique = list(dict.fromkeys(ip.strip() for ip in ips))
+        results = await asyncio.gather(*(self.alookup(ip) for ip in unique))
+        return dict(zip(unique, results))
+
+    def _cached(self, ip: str) -> Optional[dict]:
+        """快取或不需要查詢（私有位址、格式錯誤）的結果；需要送出請求時回傳 None"""
+        cached = self._cached_in_memory(ip)
+        return cached if cached is not None else self._cached_on_disk(ip)
+
+    def _cached_in_memory(self, ip: str) -> Optional[dict]:
+        data = self.memory.get(ip)
+        if data is not None:
+            self._count("memory_hits")
+            return data
+
+        local = _local_result(ip)
+        if local is not None:
+            self._count("local")
+        return local
+
+    def _cached_on_disk(self, ip: str) -> Optional[dict]:
+        db = self._database()
+        if db is not None:
+            with self._db_lock:
+                row = db.execute("SELECT data, expires_at FROM ip_info WHERE ip = ?", (ip,)).fetchone()
+            if row is not None and row[1] > time.time():
+                data = json.loads(row[0])
+                self.memory.set(ip, data, ttl=row[1] - time.time())
+                self._count("disk_hits")
+                return data
+        return None
+
+    def _store(self, ip: str, data: dict) -> dict:
+        self._remember(ip, data)
+        self._persist(ip, data)
+        return data
+
+    def _remember(self, ip: str, data: dict):
+        # 失敗只放記憶體，過一段時間再重試
+        self.memory.set(ip, data, ttl=self.negative_ttl if "error" in data else None)
+
+    def _persist(self, ip: str, data: dict):
+        if "error" in data:
+            return
+        db = self._database()
+        if db is not None:
+            try:
+                with self._db_lock:
+                    db.execute("INSERT OR REPLACE INTO ip_info (ip, data, expires_at) VALUES (?, ?, ?)",
+                               (ip, json.dumps(data, ensure_ascii=False), time.time() + self.ttl))
+            except sqlite3.Error as e:
+                print(f"寫入 IP 資訊快取失敗：{e}")
+
+    def _parse(self, ip: str, response) -> dict:
+        self._count("requests")
+        if response.status_code != 200:
+            return self._failure(ip, f"HTTP {response.status_code}")
+        data = response.json()
+        data.pop("readme", None)
+        return data
+
+    def _failure(self, ip: str, error) -> dict:
+        self._count("failures")
+        print(f"查詢 IP 資訊失敗（{ip}）：{error!r}")
+        return {"ip": ip, "error": str(error) or type(error).__name__}
+
+    # === 連線池 ===
+    def _url(self, ip: str) -> str:
+        return f"{self.base_url}/{ip}/json"
+
+    def _headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.token}"} if self.token else {}
+
+    def _limits(self):
+        import httpx
+        return httpx.Limits(max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_connections, keepalive_expiry=60)
+
+    def _timeout(self):
+        import httpx
+        return httpx.Timeout(self.timeout, connect=min(self.timeout, 2.0))
+
+    def _sync_client(self):
+        # 只有查詢 IP 時才需要 httpx，延後到第一次使用時匯入
+        with self._client_lock:
+            if self._client is None:
+                import httpx
+                self._client = httpx.Client(timeout=self._timeout(), limits=self._limits())
+            return self._client
+
+    def _async_pool(self):
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            import httpx
+            self._release_async_pool()
+            client = httpx.AsyncClient(timeout=self._timeout(), limits=self._limits())
+            self._async_client = client
+            self._async_loop = loop
+            self._async_closer = loop.create_task(_close_on_cancel(client))
+            self._semaphore = asyncio.Semaphore(self.max_connections)
+        return self._async_client, self._semaphore
+
+    def _release_async_pool(self):
+        """
+        關閉綁定在其他 event loop 的連線池：取消該 loop 上的關閉 task，由它在原本的 loop 關閉連線。
+        loop 以 asyncio.run 結束時會取消剩下的 task，這時連線池已經關閉。
+        """
+        closer, loop = self._async_closer, self._async_loop
+        self._async_client = None
+        self._async_closer = None
+        if closer is not None and not closer.done() and not loop.is_closed():
+            loop.call_soon_threadsafe(closer.cancel)
+
+    async def aclose(self):
+        if self._async_client is not None and self._async_loop is asyncio.get_running_loop():
+            closer, client = self._async_closer, self._async_client
+            self._async_client = None
+            self._async_closer = None
+            closer.cancel()
+            await client.aclose()
+        else:
+            self._release_async_pool()
+        self.close()
+
+    def close(self):
+        with self._client_lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    # === 統計 ===
+    def _count(self, field: str):
+        with self._stats_lock:
+            self._stats[field] += 1
+
+    def stats(self) -> dict:
+        """各種命中次數、實際送出的請求數與失敗次數"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["local"] + stats["requests"]
+        stats["hit_rate"] = (lookups - stats["requests"]) / lookups if lookups else 0.0
+        stats["memory"] = self.memory.stats()
+        return stats
+
+
+async def _close_on_cancel(client):
+    """一直等待到被取消（換用其他 loop 或 loop 結束），再關閉連線池"""
+    try:
+        await asyncio.get_running_loop().create_future()
+    finally:
+        await client.aclose()
+
+
+def _local_result(ip: str) -> Optional[dict]:
+    """私有 / 保留位址與 ipinfo 相同回傳 bogon；格式錯誤回傳錯誤"""
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return {"ip": ip, "error": "invalid IP address"}
+    if not address.is_global:
+        return {"ip": ip, "bogon": True}
+    return None
+
+
+ip_info_client = IPInfoClient()
+
 
 # 查詢 IP 資訊
 def get_ip_info(ip_address: str) -> dict:
-    # ipinfo.io API URL
-    url = f'https://ipinfo.io/{ip_address}/json'
+    return ip_info_client.lookup(ip_address)
+
+
+async def aget_ip_info(ip_address: str) -> dict:
+    return await ip_info_client.alookup(ip_address)
+
 
-    response = requests.get(url)
+async def aget_ip_infos(ip_addresses: Iterable[str]) -> Dict[str, dict]:
+    return await ip_info_client.alookup_many(ip_addresses)
 
-    data = response.json()
-    data.pop('readme', None)
 
-    print(f"IP Info: {data}")
-    return data
+def ip_info_stats() -> dict:
+    return ip_info_client.stats()
@@ -0,0 +1,586 @@
+"""
+log 查詢引擎：FastAPI（LangGraph 的 web_log_tool 節點）與 MCP 工具共用同一套查詢。
+
+每個 log 檔在同一個行程內只有一個 LogQueryEngine（get_engine），長期保留：
+- 解析器與增量匯入狀態：時間索引、欄位快取與彙總表（LogIngestor），第一次查詢後不再從頭讀檔
+- 查詢結果快取：整個行程共用 LOG_QUERY_CACHE_SIZE 筆、LOG_QUERY_CACHE_MAX_LINES 行原始行的額度，快取鍵包含檔案路徑
+- async 查詢用的執行緒池
+兩個入口走相同的程式路徑，任何一邊的優化與已經暖好的快取另一邊都能直接使用。
+
+分頁查詢（first_page / next_page）給 MCP 工具使用：第一頁回傳統計摘要、一頁有上限的原始行
+與不透明的 cursor；cursor 記錄下一頁的 byte offset、查詢條件與時間區間對應的 byte 範圍，
+下一頁直接從該位置接續掃描。cursor 不包含檔案路徑，以 inode 記錄各個檔案：
+單檔來源在檔案被輪替（inode 改變）或截斷後即失效，多檔來源在檔案輪替改名後仍可接續。
+兩種來源共用同一套查詢、錯誤處理與分頁流程（_BaseQueryEngine），只有挑選檔案與讀取範圍的方式不同。
+
+LOG_PATH 也可以是目錄或 glob（輪替後的多個檔案，見 app.tools.log_manifest），此時使用 MultiFileQueryEngine：
+依 manifest 只開啟時間範圍重疊的檔案，每個檔案仍各自使用上述的單檔引擎與索引。
+"""
+from abc import ABC, abstractmethod
+import asyncio
+import base64
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import json
+import os
+import threading
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple, Union
+
+from app.tools.ip_ranges import annotate_ips, describe_ip_network
+from app.tools.log_index import file_identity, open_range_scan, plan_time_range
+from app.tools.log_ingest import get_ingestor
+from app.tools.log_manifest import LogManifest, is_multi_source
+from app.tools.log_parallel import scan_parallel, scan_segments_parallel, should_scan_in_parallel
+from app.tools.log_parser import LogParser, LogRecord, parse_query_time
+from app.tools.log_scan import (SUMMARY_MODE, STRUCTURED_ROW_LIMIT, LogQueryResult, QueryFilter, new_scan_result,
+                                structured_row)
+from app.tools.ttl_cache import TTLCache
+
+# 依照宣告的 log 格式預先編譯好的解析器（格式可由環境變數 LOG_FORMAT 指定）
+log_parser = LogParser()
+
+# 查詢結果快取：同一個 session 常對同一個時間區間連續追問，條件相同時直接回傳上次的結果。
+# 快取鍵包含 log 檔的路徑與 inode / 大小 / 修改時間，檔案有任何變動都不會命中舊結果
+QUERY_CACHE_SIZE = int(os.getenv("LOG_QUERY_CACHE_SIZE", 128))
+QUERY_CACHE_TTL = float(os.getenv("LOG_QUERY_CACHE_TTL", 300))
+# 所有快取結果保留的原始行（樣本與 keep_lines 的 filtered_logs）合計上限，超過時淘汰最久沒用到的結果；
+# 單一結果超過上限時不快取。快取佔用的記憶體與筆數上限無關，不會抵銷查詢結果的記憶體上限
+QUERY_CACHE_MAX_LINES = int(os.getenv("LOG_QUERY_CACHE_MAX_LINES", 100_000))
+
+
+def _retained_lines(result: LogQueryResult) -> int:
+    return len(result.sample_lines) + len(result.filtered_logs or ())
+
+
+query_cache = TTLCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL, max_weight=QUERY_CACHE_MAX_LINES, weigh=_retained_lines)
+
+# async 呼叫端（FastAPI / LangGraph 節點）的查詢交給專用的執行緒池，不阻塞 event loop；
+# 大範圍的掃描在 query 內還會再分給 process pool
+QUERY_THREADS = int(os.getenv("LOG_QUERY_THREADS", 4))
+_query_executor = ThreadPoolExecutor(max_workers=QUERY_THREADS, thread_name_prefix="log-query")
+
+# 分頁：每頁最多幾行、幾個字元（原始行合計）；單一行超過 LOG_PAGE_LINE_CHARS 時截斷
+PAGE_ROWS = int(os.getenv("LOG_PAGE_ROWS", 50))
+PAGE_CHARS = int(os.getenv("LOG_PAGE_CHARS", 16_000))
+PAGE_LINE_CHARS = int(os.getenv("LOG_PAGE_LINE_CHARS", 2_000))
+
+_CURSOR_VERSION = 2
+
+
+class _QueryConditions(NamedTuple):
+    """query 的條件：時間換算成 epoch、空字串視為未指定，同時作為結果快取鍵的一部分"""
+    start_epoch: int
+    end_epoch: int
+    status_code: Optional[str]
+    http_method: Optional[str]
+    source_ip: Optional[str]
+    exclude_2xx: bool
+    include_malformed: bool
+    keep_lines: bool
+    approximate: bool
+
+
+class _BaseQueryEngine(ABC):
+    """
+    LogQueryEngine 與 MultiFileQueryEngine 共用的查詢流程：參數檢查、錯誤處理、結果快取、逐筆產生與分頁。
+    子類別必須實作：
+    - _query：以編譯好的條件查詢（不處理錯誤）
+    - _segments：時間區間要讀的各檔案範圍 [(路徑, inode, begin, end, stop_epoch), ...]，依時間順序
+    - _paths_by_inode：目前可讀的檔案 inode → 路徑，cursor 以 inode 找回檔案
+    """
+    log_path: str
+    parser: LogParser
+
+    # === 查詢 ===
+    def query(self, start_time: str, end_time: str, status_code: str = None, http_method: str = None,
+              source_ip: str = None, keep_lines: bool = False, approximate: bool = None,
+              exclude_2xx: bool = True, include_malformed: bool = False) -> Optional[LogQueryResult]:
+        """
+        查詢時間區間內符合條件的 log，記憶體用量與符合的行數無關：
+        只保留總筆數、前 STRUCTURED_ROW_LIMIT 筆樣本與統計計數。
+        keep_lines=True 時才額外回傳全部符合的原始行（filtered_logs）。
+        approximate=True（或 LOG_SUMMARY_MODE=approx）時不使用欄位快取（它的 IP / 資源字典與暫存陣列
+        隨資料量成長），一律以時間索引逐行掃描原始 log，IP 與資源改用固定記憶體的近似計數，誤差上限放在 error_bounds；
+        LOG_SUMMARY_MODE=approx 時也不建立欄位快取（見 log_ingest.BUILD_STORE）。
+        精確模式在欄位快取可用時以 IP / 資源編號向量化計數，error_bounds 為 None。
+        exclude_2xx=False 時 2xx 也列入；include_malformed=True 時不合規格的請求行也列入（見 QueryFilter）。
+
+        相同條件（時間換算成 epoch、空字串視為未指定）且 log 檔未變動時，直接回傳快取的結果，
+        回傳的物件會被多次查詢共用，呼叫端不應修改其內容。
+        參數錯誤或讀取失敗時印出原因並回傳 None。
+        """
+        try:
+            start_epoch = parse_query_time(start_time)
+            end_epoch = parse_query_time(end_time)
+        except ValueError:
+            print("時間格式錯誤")
+            return None
+
+        # 編譯 status_code / http_method / source_ip 正規表達式
+        try:
+            query_filter = QueryFilter(status_code, http_method, source_ip, exclude_2xx, include_malformed)
+        except ValueError as e:
+            print(e)
+            return None
+
+        if approximate is None:
+            approximate = SUMMARY_MODE == "approx"
+        conditions = _QueryConditions(start_epoch, end_epoch, status_code or None, http_method or None,
+                                      source_ip or None, exclude_2xx, include_malformed, keep_lines, approximate)
+
+        try:
+            return self._query(conditions, query_filter)
+        except FileNotFoundError as e:
+            print(f"找不到 log 檔案：{e.filename or self.log_path}")
+            return None
+        except Exception as e:
+            print(f"讀取 log 時發生錯誤：{e}")
+            return None
+
+    async def aquery(self, *args, **kwargs) -> Optional[LogQueryResult]:
+        """query 的 async 版本，參數與回傳值相同"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_query_executor, partial(self.query, *args, **kwargs))
+
+    def iter_matches(self, start_time: str, end_time: str, status_code: str = None, http_method: str = None,
+                     source_ip: str = None, exclude_2xx: bool = True,
+                     include_malformed: bool = False) -> Iterator[Tuple[str, LogRecord]]:
+        """
+        依時間順序逐筆產生符合條件的 (原始行, LogRecord)，條件同 query。
+        邊讀邊產生，記憶體用量與符合的行數無關，也不經過結果快取；
+        需要處理全部符合的行（例如匯出）時使用，不必像 keep_lines=True 一次載入記憶體。
+        時間格式或條件錯誤時拋出 ValueError。
+        """
+        start_epoch, end_epoch, query_filter = _parse_query(start_time, end_time, status_code, http_method,
+                                                            source_ip, exclude_2xx, include_malformed)
+        for path, _, begin, end, stop_epoch in self._segments(start_epoch, end_epoch):
+            for line, record in open_range_scan(path, begin, end, start_epoch, end_epoch, stop_epoch,
+                                                self.parser, query_filter):
+                yield line.strip(), record
+
+    def _cached_query(self, conditions: _QueryConditions, identity: tuple, compute) -> LogQueryResult:
+        """
+        查詢結果快取：鍵包含來源路徑、條件與各檔案的 inode / 大小 / 修改時間，檔案有任何變動都不會命中舊結果；
+        所有結果保留的原始行合計不超過 QUERY_CACHE_MAX_LINES
+        """
+        cache_key = (self.log_path, *conditions, identity)
+        result = query_cache.get(cache_key)
+        if result is not None:
+            return result
+        result = compute()
+        query_cache.set(cache_key, result)
+        return result
+
+    @abstractmethod
+    def _query(self, conditions: _QueryConditions, query_filter: QueryFilter) -> LogQueryResult:
+        ...
+
+    @abstractmethod
+    def _segments(self, start_epoch: int, end_epoch: int) -> list:
+        ...
+
+    @abstractmethod
+    def _paths_by_inode(self) -> Dict[int, str]:
+        ...
+
+    # === 分頁 ===
+    def first_page(self, start_time: str, end_time: str, status_code: str = None, http_method: str = None,
+                   source_ip: str = None, exclude_2xx: bool = True, include_malformed: bool = False,
+                   page_rows: int = None) -> dict:
+        """
+        回傳：
+            {"summary": 統計摘要, "total": 符合筆數, "page": 1, "rows": [原始行, ...], "next_cursor": str 或 None}
+            參數錯誤或讀取失敗時為 {"error": 原因}
+        頁面依時間順序跨檔案接續。
+        """
+        try:
+            start_epoch, end_epoch, _ = _parse_query(start_time, end_time, status_code, http_method, source_ip,
+                                                     exclude_2xx, include_malformed)
+        except ValueError as e:
+            return {"error": str(e)}
+
+        result = self.query(start_time, end_time, status_code, http_method, source_ip, exclude_2xx=exclude_2xx,
+                            include_malformed=include_malformed)
+        if result is None:
+            return {"error": f"無法讀取 log 檔案：{self.log_path}"}
+        stats_summary, _ = format_query_result(result)
+
+        try:
+            segments = self._segments(start_epoch, end_epoch)
+            state = {
+                "v": _CURSOR_VERSION,
+                "segments": [[inode, begin, end, stop_epoch] for _, inode, begin, end, stop_epoch in segments],
+                "segment": 0, "offset": segments[0][2] if segments else 0,
+                "start_epoch": start_epoch, "end_epoch": end_epoch,
+                "filter": [status_code or None, http_method or None, source_ip or None, exclude_2xx,
+                           include_malformed],
+                "rows": page_rows or PAGE_ROWS, "page": 1, "total": result.total,
+            }
+            page = self._read_page(state, {inode: path for path, inode, _, _, _ in segments})
+        except ValueError as e:
+            return {"error": str(e)}
+        except OSError as e:
+            return {"error": f"讀取 log 時發生錯誤：{e}"}
+        return dict(summary=stats_summary, total=result.total, **page)
+
+    def next_page(self, cursor: str) -> dict:
+        """從 cursor 記錄的檔案與位置接續讀取下一頁，回傳格式同 first_page（沒有 summary）"""
+        state = _decode_cursor(cursor)
+        if state is None:
+            return {"error": "無效的 cursor"}
+        try:
+            state["page"] += 1
+            page = self._read_page(state, self._paths_by_inode())
+        except ValueError as e:
+            return {"error": str(e)}
+        except OSError as e:
+            return {"error": f"讀取 log 時發生錯誤：{e}"}
+        return dict(total=state["total"], **page)
+
+    def _read_page(self, state: dict, paths: Dict[int, str]) -> dict:
+        """
+        從 state["segment"] 的 state["offset"] 讀取一頁，讀完一個檔案的範圍就接著下一個檔案；
+        還有下一筆符合的行時才回傳 next_cursor。
+        paths 為 inode → 目前的路徑，找不到（檔案已輪替或刪除）或檔案被截斷時拋出 ValueError
+        """
+        query_filter = QueryFilter(*state["filter"])
+
+        rows = []
+        chars = 0
+        next_position = None
+        segment_no, offset = state["segment"], state["offset"]
+        while segment_no < len(state["segments"]) and next_position is None:
+            inode, _, end, stop_epoch = state["segments"][segment_no]
+            path = paths.get(inode)
+            if path is None or os.path.getsize(path) < offset:
+                raise ValueError("log 檔案已輪替、刪除或截斷，cursor 已失效，請重新查詢")
+
+            scan = open_range_scan(path, offset, end, state["start_epoch"], state["end_epoch"], stop_epoch,
+                                   self.parser, query_filter)
+            resume = offset
+            for line, _ in scan:
+                line = line.strip()[:PAGE_LINE_CHARS]
+                if rows and (len(rows) >= state["rows"] or chars + len(line) > PAGE_CHARS):
+                    # 這一行放不下：下一頁從上一個回傳的行之後開始（最後一行沒有換行時 position 會超過檔尾）
+                    next_position = (segment_no, min(resume, os.path.getsize(path)))
+                    break
+                rows.append(line)
+                chars += len(line)
+                resume = scan.position
+            else:
+                segment_no += 1
+                if segment_no < len(state["segments"]):
+                    offset = state["segments"][segment_no][1]
+
+        next_cursor = None
+        if next_position is not None:
+            next_cursor = _encode_cursor(dict(state, segment=next_position[0], offset=next_position[1]))
+        return {"page": state["page"], "rows": rows, "next_cursor": next_cursor}
+
+
+class LogQueryEngine(_BaseQueryEngine):
+    """單一 log 檔的查詢入口，透過 get_engine 取得同一個行程內共用的實例"""
+
+    def __init__(self, log_path: str, log_format: str = None):
+        self.log_path = log_path
+        self.parser = LogParser(log_format) if log_format else log_parser
+        self.ingestor = get_ingestor(log_path, self.parser.log_format)
+
+    # === 查詢 ===
+    def _query(self, conditions: _QueryConditions, query_filter: QueryFilter) -> LogQueryResult:
+        identity = file_identity(self.log_path)
+
+        def compute():
+            # 先把新追加的 log 匯入索引與欄位快取；快取可用時直接向量化過濾，
+            # 否則（例如第一次建立中）或近似模式用時間索引掃描原始文字
+            index, store = self.ingestor.snapshot()
+            if store is not None and not conditions.approximate:
+                return self._query_with_store(store, conditions.start_epoch, conditions.end_epoch, query_filter,
+                                              conditions.keep_lines)
+            return self._query_with_scan(index, conditions.start_epoch, conditions.end_epoch, query_filter,
+                                         conditions.keep_lines, conditions.approximate)
+
+        return self._cached_query(conditions, (identity["inode"], identity["size"], identity["mtime_ns"]), compute)
+
+    def _segments(self, start_epoch: int, end_epoch: int) -> list:
+        index, _ = self.ingestor.snapshot()
+        begin, end, stop_epoch = plan_time_range(self.log_path, start_epoch, end_epoch, self.parser, index)
+        return [(self.log_path, file_identity(self.log_path)["inode"], begin, end, stop_epoch)]
+
+    def _paths_by_inode(self) -> Dict[int, str]:
+        # 檔案輪替後 inode 改變，舊的 cursor 找不到檔案而失效
+        return {file_identity(self.log_path)["inode"]: self.log_path}
+
+    def _query_with_store(self, store, start_epoch, end_epoch, query_filter, keep_lines) -> LogQueryResult:
+        """以欄位快取過濾，只讀回需要回傳的原始行"""
+        if keep_lines or query_filter.ip_pattern:
+            # 需要全部符合的行，或依來源 IP 過濾（彙總表沒有 IP × 資源的維度）時逐列計算
+            rows = store.select(start_epoch, end_epoch, query_filter.status_allowed,
+                                query_filter.method_pattern, query_filter.ip_pattern)
+            total = len(rows)
+            top_ips, top_resources, status_counts = store.summary(rows)
+            sample_rows = rows[:STRUCTURED_ROW_LIMIT]
+        else:
+            # 統計摘要直接合併每分鐘彙總表，只取前幾列當樣本
+            total, top_ips, top_resources, status_counts = store.window_summary(
+                start_epoch, end_epoch, query_filter.status_allowed, query_filter.method_pattern
+            )
+            rows = None
+            sample_rows = store.select(start_epoch, end_epoch, query_filter.status_allowed,
+                                       query_filter.method_pattern, limit=STRUCTURED_ROW_LIMIT)
+
+        sample_lines = [line.strip() for line in store.read_lines(self.log_path, sample_rows)]
+        structured_body = [structured_row(self.parser.parse(line)) for line in sample_lines]
+        filtered_logs = [line.strip() for line in store.read_lines(self.log_path, rows)] if keep_lines else None
+
+        return LogQueryResult(total, top_ips, top_resources, status_counts,
+                              sample_lines, structured_body, filtered_logs)
+
+    def _query_with_scan(self, index, start_epoch, end_epoch, query_filter, keep_lines, approximate) -> LogQueryResult:
+        """
+        逐行掃描原始 log（透過時間索引只讀取區間內的 byte 範圍），
+        範圍夠大時切成多個區塊交給 process pool 平行掃描。
+        """
+        begin, end, stop_epoch = plan_time_range(self.log_path, start_epoch, end_epoch, self.parser, index)
+
+        result = None
+        if should_scan_in_parallel(begin, end):
+            try:
+                result = scan_parallel(self.log_path, begin, end, start_epoch, end_epoch, stop_epoch,
+                                       self.parser.log_format, query_filter, STRUCTURED_ROW_LIMIT, keep_lines,
+                                       approximate)
+            except (OSError, RuntimeError) as e:
+                # process pool 無法使用（例如 worker 異常結束）時退回序列掃描
+                print(f"平行掃描失敗，改用序列掃描：{e}")
+
+        if result is None:
+            result = new_scan_result(STRUCTURED_ROW_LIMIT, keep_lines, approximate)
+            for line, record in open_range_scan(self.log_path, begin, end, start_epoch, end_epoch, stop_epoch,
+                                                self.parser, query_filter):
+                result.add(line, record)
+
+        return result.to_query_result()
+
+    # === 預熱 ===
+    def warm_up(self):
+        """在背景匯入 log 的索引與欄位快取，讓第一個查詢不必從頭掃描；log 檔不存在時只印出訊息"""
+        if not os.path.exists(self.log_path):
+            print(f"找不到 log 檔案：{self.log_path}")
+            return
+        self.ingestor.refresh_in_background()
+
+
+class MultiFileQueryEngine(_BaseQueryEngine):
+    """
+    多檔 log 來源（目錄或 glob）的查詢入口，介面與 LogQueryEngine 相同。
+
+    先以 manifest 挑出時間範圍與查詢區間重疊的檔案：
+    - 只有一個檔案時直接交給該檔案的 LogQueryEngine（沿用它的欄位快取、彙總表與結果快取）
+    - 多個檔案時以各檔案的時間索引算出要讀的 byte 範圍，合計夠大時一起交給 process pool 平行掃描，
+      結果依時間順序合併，與依序掃描各檔案相同
+    查詢成本只與區間內的資料量有關，與來源有多少檔案無關（每次查詢只 stat 各檔案以更新 manifest）。
+    """
+
+    def __init__(self, source: str, log_format: str = None):
+        self.log_path = source
+        self.log_format = log_format
+        self.parser = LogParser(log_format) if log_format else log_parser
+        self.manifest = LogManifest(source, self.parser.log_format)
+
+    # === 查詢 ===
+    def _query(self, conditions: _QueryConditions, query_filter: QueryFilter) -> Optional[LogQueryResult]:
+        entries = self.manifest.refresh()
+        if not entries:
+            print(f"找不到 log 檔案：{self.log_path}")
+            return None
+        selected = self.manifest.select(conditions.start_epoch, conditions.end_epoch, entries)
+        if len(selected) == 1:
+            return get_engine(selected[0]["path"], self.log_format)._query(conditions, query_filter)
+
+        def compute():
+            segments = self._file_segments(selected, conditions.start_epoch, conditions.end_epoch)
+            return self._query_segments(segments, conditions.start_epoch, conditions.end_epoch, query_filter,
+                                        conditions.keep_lines, conditions.approximate)
+
+        identity = tuple((entry["inode"], entry["size"], entry["mtime_ns"]) for entry in selected)
+        return self._cached_query(conditions, identity, compute)
+
+    def _segments(self, start_epoch: int, end_epoch: int) -> list:
+        return self._file_segments(self.manifest.select(start_epoch, end_epoch), start_epoch, end_epoch)
+
+    def _paths_by_inode(self) -> Dict[int, str]:
+        # 輪替改名後 inode 不變，cursor 仍可接續
+        return self.manifest.paths_by_inode()
+
+    def _file_segments(self, selected: list, start_epoch: int, end_epoch: int) -> list:
+        """各檔案要讀的範圍：[(路徑, inode, begin, end, stop_epoch), ...]，依時間順序"""
+        segments = []
+        for entry in selected:
+            index, _ = get_engine(entry["path"], self.log_format).ingestor.snapshot()
+            begin, end, stop_epoch = plan_time_range(entry["path"], start_epoch, end_epoch, self.parser, index)
+            segments.append((entry["path"], entry["inode"], begin, end, stop_epoch))
+        return segments
+
+    def _query_segments(self, segments, start_epoch, end_epoch, query_filter, keep_lines, approximate) -> LogQueryResult:
+        result = None
+        if should_scan_in_parallel(0, sum(end - begin for _, _, begin, end, _ in segments)):
+            try:
+                result = scan_segments_parallel([(path, begin, end, stop) for path, _, begin, end, stop in segments],
+                                                start_epoch, end_epoch, self.parser.log_format, query_filter,
+                                                STRUCTURED_ROW_LIMIT, keep_lines, approximate)
+            except (OSError, RuntimeError) as e:
+                print(f"平行掃描失敗，改用序列掃描：{e}")
+
+        if result is None:
+            result = new_scan_result(STRUCTURED_ROW_LIMIT, keep_lines, approximate)
+            for path, _, begin, end, stop_epoch in segments:
+                for line, record in open_range_scan(path, begin, end, start_epoch, end_epoch, stop_epoch,
+                                                    self.parser, query_filter):
+                    result.add(line, record)
+
+        return result.to_query_result()
+
+    # === 預熱 ===
+    def warm_up(self):
+        """在背景更新 manifest，並預先匯入最新的檔案（通常是仍在寫入、最常被查詢的那一個）的索引與欄位快取"""
+
+        def worker():
+            try:
+                entries = [entry for entry in self.manifest.refresh() if entry["first_epoch"] is not None]
+            except Exception as e:
+                print(f"更新 log manifest 時發生錯誤：{e}")
+                return
+            if not entries:
+                print(f"找不到 log 檔案：{self.log_path}")
+                return
+            get_engine(entries[-1]["path"], self.log_format).warm_up()
+
+        threading.Thread(target=worker, name=f"log-manifest:{self.log_path}", daemon=True).start()
+
+
+def _parse_query(start_time: str, end_time: str, status_code: str, http_method: str, source_ip: str,
+                 exclude_2xx: bool, include_malformed: bool) -> Tuple[int, int, QueryFilter]:
+    """時間換算成 epoch 並編譯條件；格式錯誤時拋出 ValueError"""
+    try:
+        start_epoch = parse_query_time(start_time)
+        end_epoch = parse_query_time(end_time)
+    except ValueError as e:
+        raise ValueError(f"時間格式錯誤：{e}") from e
+    return start_epoch, end_epoch, QueryFilter(status_code, http_method, source_ip, exclude_2xx, include_malformed)
+
+
+_engines: Dict[Tuple[str, Optional[str]], Union[LogQueryEngine, MultiFileQueryEngine]] = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(log_path: str, log_format: str = None) -> Union[LogQueryEngine, MultiFileQueryEngine]:
+    """
+    每個 log 來源（與格式）在同一個行程內共用一個引擎：
+    單一檔案為 LogQueryEngine，目錄或 glob 為 MultiFileQueryEngine（介面相同）
+    """
+    key = (os.path.abspath(log_path), log_format)
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine_class = MultiFileQueryEngine if is_multi_source(log_path) else LogQueryEngine
+            engine = _engines[key] = engine_class(log_path, log_format)
+        return engine
+
+
+# === 結果格式 ===
+def format_query_result(result: LogQueryResult) -> Tuple[str, dict]:
+    """把查詢結果轉成 (統計資訊文字, 結構化 table 資料)"""
+    stats_summary = _format_stats_summary(result.top_ips, result.top_resources, result.status_counts,
+                                          result.error_bounds)
+    return stats_summary, _structured_table(result.structured_body)
+
+
+def _format_stats_summary(top_ips, top_resources, status_counts, error_bounds: dict = None) -> str:
+    """統計資訊文字"""
+    stats_summary = []
+
+    stats_summary.append("📊 前 10 名請求次數最多的 IP：")
+    # 以離線的 IP 範圍資料庫標註來源網路（沒有資料庫時不顯示）
+    networks = annotate_ips(ip for ip, _, _ in top_ips)
+    for ip, count, ip_resources in top_ips:
+        resources_str = ", ".join([f"{res} ({c}次)" for res, c in ip_resources])
+        line = f"- IP：{ip} | 請求次數：{count} | 資源：{resources_str}"
+        if ip in networks:
+            line += f" | 來源網路：{describe_ip_network(networks[ip])}"
+        stats_summary.append(line)
+
+    stats_summary.append("\n📊 前 10 名被請求最多的資源：")
+    for resource, count in top_resources:
+        stats_summary.append(f"- 資源：{resource} | 請求次數：{count}")
+
+    stats_summary.append("\n📊 各狀態碼出現次數：")
+    for status, count in status_counts:
+        stats_summary.append(f"- 狀態碼：{status} | 次數：{count}")
+
+    if error_bounds is not None:
+        stats_summary.append(
+            f"\n⚠️ 以上 IP 與資源次數為近似值（可能少算）：IP 最多少算 {error_bounds['ip']} 次、"
+            f"資源最多少算 {error_bounds['resource']} 次、各 IP 的資源最多少算 {error_bounds['ip_resource']} 次"
+        )
+
+    return "\n".join(stats_summary)
+
+
+def _structured_table(structured_body: list) -> dict:
+    """結構化資料格式（僅前 100 筆）；有 IP 範圍資料庫時多一欄來源網路"""
+    headers = [
+        {"key": "timestamp", "label": "時間"},
+        {"key": "resource", "label": "請求資源"},
+        {"key": "source_ip", "label": "來源 IP"},
+        {"key": "http_method", "label": "HTTP 方法"},
+        {"key": "status_code", "label": "狀態碼"},
+    ]
+    body = structured_body[:STRUCTURED_ROW_LIMIT]
+
+    networks = annotate_ips(row["source_ip"] for row in body)
+    if networks:
+        headers.append({"key": "ip_network", "label": "來源網路"})
+        # 查詢結果可能被快取共用，標註在複本上
+        body = [dict(row, ip_network=describe_ip_network(networks.get(row["source_ip"]))) for row in body]
+
+    return {
+        "type": "table",
+        "data": {
+            "headers": headers,
+            "body": body
+        }
+    }
+
+
+# === cursor ===
+def _encode_cursor(state: dict) -> str:
+    data = json.dumps(state, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Optional[dict]:
+    try:
+        padded = cursor.strip() + "=" * (-len(cursor.strip()) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if state.get("v") != _CURSOR_VERSION:
+            return None
+        for key in ("offset", "start_epoch", "end_epoch", "rows", "page", "total"):
+            if not isinstance(state[key], int) or state[key] < 0:
+                return None
+        # 各檔案的範圍 [[inode, begin, end, stop_epoch], ...] 與目前讀到第幾個（單檔來源只有一個）
+        segments = state["segments"]
+        if not isinstance(state["segment"], int) or not 0 <= state["segment"] < len(segments):
+            return None
+        for inode, begin, end, stop_epoch in segments:
+            if not all(isinstance(value, int) and value >= 0 for value in (inode, begin, end)):
+                return None
+            if stop_epoch is not None and not isinstance(stop_epoch, int):
+                return None
+        status_code, http_method, source_ip, exclude_2xx, include_malformed = state["filter"]
+        if not all(value is None or isinstance(value, str) for value in (status_code, http_method, source_ip)):
+            return None
+        if not isinstance(exclude_2xx, bool) or not isinstance(include_malformed, bool) or state["rows"] == 0:
+            return None
+        return state
+    except (ValueError, KeyError, TypeError, UnicodeError):
+        return None
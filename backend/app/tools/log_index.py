@@ -0,0 +1,391 @@
+"""
+Access log 的時間索引：讓時間區間查詢直接跳到對應的 byte 範圍。
+
+- 有索引時：依區塊的最小 / 最大時間精確算出要讀的 byte 範圍，
+  索引尚未涵蓋的檔尾則順序讀取
+- 沒有索引時：直接對檔案做二分搜尋找起點，掃過 end_time 一段緩衝後停止
+
+索引由 app.tools.log_ingest 依新增的 log 逐步延伸，並存成 sidecar（<log>.idx）。
+
+掃描範圍內的行有兩種方式（環境變數 LOG_SCAN_MODE）：
+- mmap（預設）：把檔案映射進記憶體，直接在 bytes 上比對格式與過濾條件，
+  只有通過全部條件的行才解碼成 str
+- text：逐行解碼成 str 後解析
+"""
+from bisect import bisect_left, bisect_right
+import json
+import mmap
+import os
+import uuid
+from typing import Iterator, List, Optional, Tuple
+
+from app.tools.log_parser import LogParser, LogRecord, _new_record
+
+INDEX_VERSION = 2
+INDEX_SUFFIX = ".idx"
+
+# 每個索引區塊大約涵蓋的 byte 數
+INDEX_STRIDE_BYTES = 1 << 20
+
+# 沒有索引時，log 時間可能因寫入順序有些微亂序，起點與終點各多掃這段時間（秒）
+SEEK_SLACK_SECONDS = 60
+
+# 二分搜尋縮到這個大小以下就改為直接順序讀取
+_PROBE_MIN_SPAN = 64 * 1024
+# 每次探測最多往後讀幾行找可解析的時間
+_PROBE_MAX_LINES = 64
+
+SCAN_MODE = os.getenv("LOG_SCAN_MODE", "mmap")
+
+# mmap 模式每次檢查是否為純 ASCII 的區段大小；bytes 與 str 正規表達式對非 ASCII 字元
+# 的 \s、\S、\d 判斷不同，含有非 ASCII 的區段改走文字解析，確保兩種模式結果完全相同
+_ASCII_CHECK_BYTES = 1 << 20
+
+
+def file_identity(path: str) -> dict:
+    """檔案版本資訊：大小、修改時間與 inode，任何一個改變都代表內容可能不同"""
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "inode": st.st_ino}
+
+
+class LogIndex:
+    """
+    稀疏時間索引。每個區塊記錄起始 offset 與區塊內的最小 / 最大時間，
+    允許 log 有些微亂序，計算出的 byte 範圍仍然精確。
+
+    coverage 記錄索引涵蓋到的檔案位置（inode / offset / fingerprint），
+    物件建立後不再修改，延伸時產生新的 LogIndex，查詢中的執行緒不受影響。
+    """
+
+    def __init__(self, coverage: dict, offsets: List[int], min_epochs: List[int], max_epochs: List[int],
+                 stride: int = INDEX_STRIDE_BYTES):
+        self.coverage = coverage
+        self.offsets = offsets
+        self.min_epochs = min_epochs
+        self.max_epochs = max_epochs
+        self.stride = stride
+
+        # 前綴最大值與後綴最小值都是單調的，可以用 bisect 找區塊
+        self._prefix_max = []
+        running = None
+        for value in max_epochs:
+            running = value if running is None else max(running, value)
+            self._prefix_max.append(running)
+
+        self._suffix_min = [0] * len(min_epochs)
+        running = None
+        for i in range(len(min_epochs) - 1, -1, -1):
+            running = min_epochs[i] if running is None else min(running, min_epochs[i])
+            self._suffix_min[i] = running
+
+    @classmethod
+    def empty(cls, coverage: dict) -> "LogIndex":
+        return cls(coverage, [], [], [])
+
+    def extended(self, line_offsets, epochs, coverage: dict) -> "LogIndex":
+        """加入新解析的行（依檔案順序），回傳新的索引"""
+        offsets = list(self.offsets)
+        min_epochs = list(self.min_epochs)
+        max_epochs = list(self.max_epochs)
+
+        for line_offset, epoch in zip(line_offsets, epochs):
+            if not offsets or line_offset - offsets[-1] >= self.stride:
+                offsets.append(line_offset)
+                min_epochs.append(epoch)
+                max_epochs.append(epoch)
+            elif epoch < min_epochs[-1]:
+                min_epochs[-1] = epoch
+            elif epoch > max_epochs[-1]:
+                max_epochs[-1] = epoch
+
+        return LogIndex(coverage, offsets, min_epochs, max_epochs, self.stride)
+
+    def byte_range(self, start_epoch: int, end_epoch: int) -> Tuple[int, Optional[int]]:
+        """
+        回傳需要讀取的 [begin, end) byte 範圍；範圍外的行保證不在查詢時間內。
+        end 為 None 表示需要一路讀到檔尾（包含索引尚未涵蓋的部分）。
+        """
+        first = bisect_left(self._prefix_max, start_epoch)
+        # 第一個「之後所有行都晚於 end_epoch」的區塊
+        last = bisect_right(self._suffix_min, end_epoch)
+
+        if first >= len(self.offsets):
+            return self.coverage["offset"], None
+        if last >= len(self.offsets):
+            return self.offsets[first], None
+        if first >= last:
+            return 0, 0
+        return self.offsets[first], self.offsets[last]
+
+    def to_dict(self) -> dict:
+        return {
+            "version": INDEX_VERSION,
+            "coverage": self.coverage,
+            "stride": self.stride,
+            "offsets": self.offsets,
+            "min_epochs": self.min_epochs,
+            "max_epochs": self.max_epochs,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> Optional["LogIndex"]:
+        if data.get("version") != INDEX_VERSION:
+            return None
+        return cls(data["coverage"], data["offsets"], data["min_epochs"], data["max_epochs"], data["stride"])
+
+
+def index_path_for(log_path: str) -> str:
+    return log_path + INDEX_SUFFIX
+
+
+def tmp_path_for(path: str) -> str:
+    """寫入 path 用的暫存路徑；每個行程、每次寫入各不相同，多個 worker 同時寫入不會互相覆寫"""
+    return f"{path}.{os.getpid()}-{uuid.uuid4().hex[:8]}.tmp"
+
+
+def save_index(log_path: str, index: LogIndex):
+    tmp_path = tmp_path_for(index_path_for(log_path))
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index.to_dict(), f)
+        os.replace(tmp_path, index_path_for(log_path))
+    except OSError:
+        _remove_quietly(tmp_path)
+        raise
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def load_index(log_path: str) -> Optional[LogIndex]:
+    """讀取 sidecar 索引；是否仍對應目前的檔案由呼叫端檢查 coverage"""
+    try:
+        with open(index_path_for(log_path), "r", encoding="utf-8") as f:
+            return LogIndex.from_dict(json.load(f))
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _first_epoch_from(f, parser: LogParser) -> Optional[int]:
+    """從目前位置往後找第一個可解析行的時間"""
+    for _ in range(_PROBE_MAX_LINES):
+        raw = f.readline()
+        if not raw:
+            return None
+        record = parser.parse(raw.decode("utf-8", errors="replace"))
+        if record is not None:
+            return record.epoch
+    return None
+
+
+def probe_offset(f, size: int, target_epoch: int, parser: LogParser) -> int:
+    """
+    在依時間排序的 log 上二分搜尋，回傳一個行首 offset，
+    其之前的行時間都早於 target_epoch。
+    """
+    lo, hi = 0, size
+    while hi - lo > _PROBE_MIN_SPAN:
+        mid = (lo + hi) // 2
+        f.seek(mid)
+        f.readline()  # 對齊到下一行開頭
+        epoch = _first_epoch_from(f, parser)
+        if epoch is None or epoch >= target_epoch:
+            hi = mid
+        else:
+            lo = mid
+
+    if lo == 0:
+        return 0
+    f.seek(lo)
+    f.readline()
+    return f.tell()
+
+
+def plan_time_range(log_path: str, start_epoch: int, end_epoch: int, parser: LogParser,
+                    index: LogIndex = None) -> Tuple[int, int, Optional[int]]:
+    """
+    算出時間區間需要讀取的 (begin, end, stop_epoch)。
+    index 需已確認對應目前的檔案；沒有索引時改用二分搜尋找起點。
+    stop_epoch 不為 None 時，讀到時間晚於它的行就可以停止。
+    """
+    with open(log_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if index is not None:
+            begin, end = index.byte_range(start_epoch, end_epoch)
+            if end is not None:
+                return begin, end, None
+        else:
+            begin = probe_offset(f, size, start_epoch - SEEK_SLACK_SECONDS, parser)
+
+    # 讀到檔尾的情況無法由索引保證終點，掃過 end_time 一段緩衝後停止
+    return begin, size, end_epoch + SEEK_SLACK_SECONDS
+
+
+class ByteRangeScan:
+    """
+    依序讀取 [begin, end) 內的行，產生時間在區間內的 (原始行, 解析結果)。
+    begin 必須是行首；從 end 之前開始的行都屬於這個範圍。
+    給了 query_filter 時只產生符合條件的行。
+    因為超過 stop_epoch 而提前結束時 stopped 會是 True。
+    position 是剛產生的那一行之後的 byte offset（下一行的行首），分頁查詢從這裡接續。
+    """
+
+    def __init__(self, log_path: str, begin: int, end: int, start_epoch: int, end_epoch: int,
+                 stop_epoch: Optional[int], parser: LogParser, query_filter=None):
+        self.log_path = log_path
+        self.begin = begin
+        self.end = end
+        self.start_epoch = start_epoch
+        self.end_epoch = end_epoch
+        self.stop_epoch = stop_epoch
+        self.parser = parser
+        self.query_filter = query_filter
+        self.stopped = False
+        self.position = begin
+
+    def __iter__(self) -> Iterator[Tuple[str, LogRecord]]:
+        parse = self.parser.parse
+        accepts = self.query_filter.accepts if self.query_filter is not None else None
+        start_epoch, end_epoch, stop_epoch, end = self.start_epoch, self.end_epoch, self.stop_epoch, self.end
+
+        with open(self.log_path, "rb") as f:
+            f.seek(self.begin)
+            offset = self.begin
+            for raw in f:
+                if offset >= end:
+                    break
+                offset += len(raw)
+
+                line = raw.decode("utf-8", errors="replace")
+                record = parse(line)
+                if record is None:
+                    continue
+
+                epoch = record.epoch
+                if stop_epoch is not None and epoch > stop_epoch:
+                    self.stopped = True
+                    break
+                if start_epoch <= epoch <= end_epoch and (accepts is None or accepts(record)):
+                    self.position = offset
+                    yield line, record
+
+
+class MmapByteRangeScan(ByteRangeScan):
+    """
+    與 ByteRangeScan 相同的範圍與結果，但把檔案 mmap 後直接在 bytes 上比對：
+    時間、狀態碼、HTTP 方法與來源 IP 都在 bytes 上判斷，
+    只有通過全部條件的行才解碼成 str 並建立 LogRecord。
+    """
+
+    def __iter__(self) -> Iterator[Tuple[str, LogRecord]]:
+        with open(self.log_path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            end = min(self.end, size)
+            if self.begin >= end:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                yield from self._scan(mm, size, end)
+
+    def _scan(self, mm, size: int, end: int) -> Iterator[Tuple[str, LogRecord]]:
+        # 範圍內最後一行的結尾（從 end 之前開始的行都要讀完）
+        limit = mm.find(b"\n", end - 1)
+        limit = size if limit < 0 else limit + 1
+
+        # 每次處理一段以換行對齊、約 _ASCII_CHECK_BYTES 大小的區段：
+        # 純 ASCII（絕大多數情況）就交給 bytes 正規表達式在 C 層級逐行比對，
+        # 含有非 ASCII 字元的區段則逐行解碼，與文字模式走相同的解析
+        pos = self.begin
+        while pos < limit:
+            segment_end = limit
+            if pos + _ASCII_CHECK_BYTES < limit:
+                cut = mm.rfind(b"\n", pos, pos + _ASCII_CHECK_BYTES)
+                if cut < 0:
+                    cut = mm.find(b"\n", pos + _ASCII_CHECK_BYTES)
+                segment_end = limit if cut < 0 else min(cut + 1, limit)
+
+            if mm[pos:segment_end].isascii():
+                yield from self._scan_ascii(mm, pos, segment_end)
+            else:
+                yield from self._scan_text(mm, pos, segment_end)
+            if self.stopped:
+                return
+            pos = segment_end
+
+    def _scan_ascii(self, mm, begin: int, end: int) -> Iterator[Tuple[str, LogRecord]]:
+        parser = self.parser
+        parse_timestamp = parser.parse_bytes_timestamp
+        time_group, method_group, resource_group, status_group, ip_group = parser.bytes_groups
+        raw_request_group = parser.bytes_raw_request_group
+        accepts_raw = self.query_filter.accepts_raw if self.query_filter is not None else None
+        start_epoch, end_epoch, stop_epoch = self.start_epoch, self.end_epoch, self.stop_epoch
+
+        for match in parser.bytes_pattern.finditer(mm, begin, end):
+            epoch = parse_timestamp(match.group(time_group))
+            if epoch is None:
+                continue
+            if stop_epoch is not None and epoch > stop_epoch:
+                self.stopped = True
+                return
+            if not start_epoch <= epoch <= end_epoch:
+                continue
+
+            status = int(match.group(status_group))
+            method, source_ip = match.group(method_group, ip_group)
+            if method is None:
+                method = b""
+            if accepts_raw is not None and not accepts_raw(status, method, source_ip):
+                continue
+
+            # 通過全部條件才解碼；比對結束在換行前，原始行連同換行一起取出
+            line_start, line_end = match.span()
+            line = mm[line_start:line_end + 1].decode("ascii")
+            self.position = line_end + 1
+            resource = match.group(resource_group if method else raw_request_group)
+            record = _new_record(LogRecord, (match.group(time_group).decode("ascii"), epoch, method.decode("ascii"),
+                                             resource.decode("ascii"), status, source_ip.decode("ascii")))
+            yield line, record
+
+    def _scan_text(self, mm, begin: int, end: int) -> Iterator[Tuple[str, LogRecord]]:
+        parse = self.parser.parse
+        accepts = self.query_filter.accepts if self.query_filter is not None else None
+        start_epoch, end_epoch, stop_epoch = self.start_epoch, self.end_epoch, self.stop_epoch
+
+        pos = begin
+        while pos < end:
+            newline = mm.find(b"\n", pos, end)
+            next_pos = end if newline < 0 else newline + 1
+            line = mm[pos:next_pos].decode("utf-8", errors="replace")
+            pos = next_pos
+
+            record = parse(line)
+            if record is None:
+                continue
+            epoch = record.epoch
+            if stop_epoch is not None and epoch > stop_epoch:
+                self.stopped = True
+                return
+            if start_epoch <= epoch <= end_epoch and (accepts is None or accepts(record)):
+                self.position = pos
+                yield line, record
+
+
+def open_range_scan(log_path: str, begin: int, end: int, start_epoch: int, end_epoch: int,
+                    stop_epoch: Optional[int], parser: LogParser, query_filter=None,
+                    mode: str = None) -> ByteRangeScan:
+    """依 LOG_SCAN_MODE（或 mode 參數）建立 mmap 或文字模式的範圍掃描"""
+    scan_class = ByteRangeScan if (mode or SCAN_MODE) == "text" else MmapByteRangeScan
+    return scan_class(log_path, begin, end, start_epoch, end_epoch, stop_epoch, parser, query_filter)
+
+
+def scan_time_range(log_path: str, start_epoch: int, end_epoch: int, parser: LogParser,
+                    index: LogIndex = None) -> Iterator[Tuple[str, LogRecord]]:
+    """
+    只讀取時間區間可能出現的 byte 範圍，依序產生 (原始行, 解析結果)，
+    只回傳 start_epoch <= epoch <= end_epoch 的行。
+    """
+    begin, end, stop_epoch = plan_time_range(log_path, start_epoch, end_epoch, parser, index)
+    return iter(open_range_scan(log_path, begin, end, start_epoch, end_epoch, stop_epoch, parser))
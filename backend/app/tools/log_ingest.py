@@ -0,0 +1,274 @@
+"""
+Access log 的增量匯入（tail-follow）。
+
+LogIngestor 記住已處理到的 inode 與 offset，每次只解析新追加的完整行，
+再把結果送進查詢層使用的時間索引（log_index）與欄位快取（log_store）。
+檔尾沒有換行的最後一行先視為寫到一半、留到下次；檔案超過 LOG_TAIL_SETTLE_SECONDS 秒沒有變動時才當成完整的一行匯入。
+之後若這一行被接著寫入（下一個 byte 不是換行），相關狀態從頭重建。
+檔案被截斷、輪替（inode 改變）或原地改寫（offset 前的內容指紋不同）時，
+相關狀態會從頭重建。
+
+在 backend 目錄手動更新索引與快取：
+    python -m app.tools.log_ingest app/data/access_log_part2.log
+"""
+from array import array
+import os
+import sys
+import threading
+import time
+import zlib
+from typing import Optional, Tuple
+
+import numpy as np
+
+from app.tools.log_index import LogIndex, load_index, save_index
+from app.tools.log_parser import LogParser
+from app.tools.log_scan import SUMMARY_MODE
+from app.tools.log_store import ARRAY_TYPECODES, COLUMNS, LogColumnStore, compact_store, load_store
+
+# 查詢前需要補進來的資料小於這個大小時，直接在查詢中同步更新；否則改在背景更新
+SYNC_REFRESH_MAX_BYTES = 64 << 20
+
+# 檔尾沒有換行的行，檔案超過這個秒數沒有變動才視為完整的一行
+TAIL_SETTLE_SECONDS = float(os.getenv("LOG_TAIL_SETTLE_SECONDS", 2))
+
+# 近似統計模式（LOG_SUMMARY_MODE=approx）只建立時間索引、不建立欄位快取：
+# 欄位快取的 IP / 資源字典與彙總表會隨不同值的數量成長，查詢改走逐行掃描與固定記憶體的近似計數
+BUILD_STORE = SUMMARY_MODE != "approx"
+
+# 判斷 offset 前內容是否被改寫時取樣的 byte 數
+_FINGERPRINT_BYTES = 256
+
+# 每次從檔案讀取的區塊大小
+_READ_CHUNK_BYTES = 4 << 20
+
+
+def _fingerprint(f, offset: int) -> int:
+    """offset 之前最後一段內容的 CRC，用來偵測檔案被原地改寫"""
+    start = max(0, offset - _FINGERPRINT_BYTES)
+    f.seek(start)
+    return zlib.crc32(f.read(offset - start))
+
+
+def _coverage_valid(coverage: Optional[dict], inode: int, size: int, f) -> bool:
+    if not coverage or coverage.get("inode") != inode:
+        return False
+    offset = coverage.get("offset", 0)
+    if offset > size:
+        return False  # 檔案被截斷
+    if coverage.get("open_line") and size > offset:
+        # 已匯入的最後一行沒有換行：之後的內容必須從換行開始，否則是那一行被接著寫入
+        f.seek(offset)
+        if f.read(1) != b"\n":
+            return False
+    return _fingerprint(f, offset) == coverage.get("fingerprint")
+
+
+class LogIngestor:
+    """
+    追蹤單一 log 檔的增量匯入狀態。
+
+    index / store 是目前已匯入資料的快照（不可變物件），查詢端直接取用即可；
+    refresh() 同一時間只會有一個執行緒在跑。
+    build_store=False 時只維護時間索引，store 一律為 None（預設依 BUILD_STORE）。
+    """
+
+    def __init__(self, log_path: str, log_format: str = None, tail_settle_seconds: float = TAIL_SETTLE_SECONDS,
+                 build_store: bool = None):
+        self.log_path = log_path
+        self.parser = LogParser(log_format) if log_format else LogParser()
+        self.tail_settle_seconds = tail_settle_seconds
+        self.build_store = BUILD_STORE if build_store is None else build_store
+        self.index: Optional[LogIndex] = load_index(log_path)
+        self.store: Optional[LogColumnStore] = load_store(log_path) if self.build_store else None
+        self._refresh_lock = threading.Lock()
+        # 上次 refresh 留下檔尾沒有換行的行時，當時檔案的 (inode, 大小, 修改時間)
+        self._held_tail = None
+
+    def pending_bytes(self) -> int:
+        """
+        目前檔案中尚未匯入的 byte 數（已失效的狀態視為需要全部重來）。
+        只剩上次留下、檔案之後沒有變動也還沒穩定的最後一行時回傳 0，不必每次查詢都重新讀取。
+        """
+        with open(self.log_path, "rb") as f:
+            st = os.fstat(f.fileno())
+            covered = [self._coverage(self.index)]
+            if self.build_store:
+                covered.append(self._coverage(self.store))
+            if not all(_coverage_valid(c, st.st_ino, st.st_size, f) for c in covered):
+                return st.st_size
+            pending = st.st_size - min(c["offset"] for c in covered)
+            if pending and self._held_tail == (st.st_ino, st.st_size, st.st_mtime_ns) and not self._settled(st):
+                return 0
+            return pending
+
+    def refresh(self) -> int:
+        """
+        匯入上次之後新增的完整行，回傳新增的筆數。
+        成本只與新增的 byte 數有關；偵測到截斷或輪替時才會從頭讀取。
+        """
+        with self._refresh_lock:
+            with open(self.log_path, "rb") as f:
+                st = os.fstat(f.fileno())
+                inode, size = st.st_ino, st.st_size
+                settled = self._settled(st)
+
+                index, store = self.index, self.store
+                if not _coverage_valid(self._coverage(index), inode, size, f):
+                    if index is not None:
+                        print(f"log 檔已輪替或被截斷，重建時間索引：{self.log_path}")
+                    index = LogIndex.empty(self._initial_coverage(inode, f))
+                if self.build_store and not _coverage_valid(self._coverage(store), inode, size, f):
+                    if store is not None:
+                        print(f"log 檔已輪替或被截斷，重建欄位快取：{self.log_path}")
+                    store = LogColumnStore.empty(self._initial_coverage(inode, f))
+
+                index_from = index.coverage["offset"]
+                # 不建立欄位快取時沒有任何一行需要寫入欄位
+                store_from = store.coverage["offset"] if store is not None else size + 1
+                begin = min(index_from, store_from)
+
+                index_offsets, index_epochs = array("q"), array("q")
+                columns = {name: array(code) for name, code in ARRAY_TYPECODES.items()}
+                if store is not None:
+                    encode_method = store.methods.encode
+                    encode_ip = store.ips.encode
+                    encode_resource = store.resources.encode
+                parse = self.parser.parse
+
+                # 只處理以換行結尾的完整行，最後寫到一半的行留到下次；
+                # 檔案已經穩定時，檔尾沒有換行的行也當成完整的一行
+                f.seek(begin)
+                offset = begin
+                remainder = b""
+                open_line = False
+                while offset + len(remainder) < size:
+                    chunk = f.read(min(_READ_CHUNK_BYTES, size - offset - len(remainder)))
+                    if not chunk:
+                        break
+                    buffer = remainder + chunk
+                    lines = buffer.split(b"\n")
+                    remainder = lines.pop()
+                    if remainder and settled and offset + len(buffer) == size:
+                        lines.append(remainder)
+                        remainder = b""
+                        open_line = True
+
+                    for raw in lines:
+                        line_offset = offset
+                        length = len(raw) + 1
+                        offset += length
+
+                        record = parse(raw.decode("utf-8", errors="replace"))
+                        if record is None:
+                            continue
+
+                        if line_offset >= index_from:
+                            index_offsets.append(line_offset)
+                            index_epochs.append(record.epoch)
+                        if line_offset >= store_from:
+                            columns["epoch"].append(record.epoch)
+                            columns["status"].append(record.status)
+                            columns["method"].append(encode_method(record.method))
+                            columns["ip"].append(encode_ip(record.source_ip))
+                            columns["resource"].append(encode_resource(record.resource))
+                            columns["offset"].append(line_offset)
+                            columns["length"].append(length)
+
+                # 沒有換行的最後一行與掃描時相同，長度多算一個 byte（之後補上的換行）
+                offset = min(offset, size)
+                coverage = {"inode": inode, "offset": offset, "fingerprint": _fingerprint(f, offset),
+                            "open_line": open_line}
+                self._held_tail = (inode, size, st.st_mtime_ns) if remainder else None
+
+            new_rows = len(columns["epoch"]) if store is not None else len(index_epochs)
+            new_blocks = len(index.offsets)
+            index = index.extended(index_offsets, index_epochs, coverage)
+            new_blocks = len(index.offsets) - new_blocks
+            if store is not None:
+                store = store.extended(
+                    {name: np.frombuffer(columns[name], dtype=dtype) if len(columns[name]) else np.empty(0, dtype)
+                     for name, dtype in COLUMNS.items()},
+                    coverage,
+                )
+
+            # 新資料累積夠多時寫入磁碟，重啟後只需要補讀之後追加的部分
+            try:
+                if store is not None and (store.needs_compaction() or (store.generation is None and len(store))):
+                    store = compact_store(self.log_path, store)
+                    save_index(self.log_path, index)
+                elif new_blocks:
+                    save_index(self.log_path, index)
+            except OSError as e:
+                print(f"無法寫入 log 索引或快取（僅保留在記憶體）：{e}")
+
+            self.index, self.store = index, store
+            return new_rows
+
+    def snapshot(self, sync_max_bytes: int = SYNC_REFRESH_MAX_BYTES) -> Tuple[Optional[LogIndex], Optional[LogColumnStore]]:
+        """
+        回傳可供查詢使用的 (index, store)。
+        待匯入的資料不多時先同步更新；太多（例如第一次建立）則改在背景更新，
+        這次查詢只拿到仍然有效的索引（或 None），由呼叫端改走文字掃描。
+        """
+        pending = self.pending_bytes()
+        if pending == 0:
+            return self.index, self.store
+        if pending <= sync_max_bytes and not self._refresh_lock.locked():
+            self.refresh()
+            return self.index, self.store
+
+        self.refresh_in_background()
+        return self._valid_index(), None
+
+    def refresh_in_background(self):
+        if self._refresh_lock.locked():
+            return
+
+        def worker():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"背景匯入 log 時發生錯誤：{e}")
+
+        threading.Thread(target=worker, name=f"log-ingest:{self.log_path}", daemon=True).start()
+
+    def _valid_index(self) -> Optional[LogIndex]:
+        index = self.index
+        if index is None:
+            return None
+        with open(self.log_path, "rb") as f:
+            st = os.fstat(f.fileno())
+            return index if _coverage_valid(index.coverage, st.st_ino, st.st_size, f) else None
+
+    def _settled(self, st) -> bool:
+        """檔案是否已經 tail_settle_seconds 秒沒有變動"""
+        return time.time() - st.st_mtime >= self.tail_settle_seconds
+
+    @staticmethod
+    def _coverage(state) -> Optional[dict]:
+        return state.coverage if state is not None else None
+
+    @staticmethod
+    def _initial_coverage(inode: int, f) -> dict:
+        return {"inode": inode, "offset": 0, "fingerprint": _fingerprint(f, 0)}
+
+
+_ingestors = {}
+_ingestors_lock = threading.Lock()
+
+
+def get_ingestor(log_path: str, log_format: str = None) -> LogIngestor:
+    """每個 log 檔共用一個 LogIngestor"""
+    key = (os.path.abspath(log_path), log_format)
+    with _ingestors_lock:
+        ingestor = _ingestors.get(key)
+        if ingestor is None:
+            ingestor = _ingestors[key] = LogIngestor(log_path, log_format)
+        return ingestor
+
+
+if __name__ == "__main__":
+    target = sys.argv[1]
+    added = get_ingestor(target).refresh()
+    print(f"已匯入 {added} 筆新資料：{target}")
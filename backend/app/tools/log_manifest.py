@@ -0,0 +1,224 @@
+"""
+多檔 log 來源（目錄或 glob，例如輪替後的 access.log、access.log.1 …）與各檔案的 manifest。
+
+manifest 記錄每個檔案的第一行 / 最後一行時間、大小、修改時間、inode 與整個檔案的 CRC32，
+存成來源目錄下的 sidecar（.log_manifest.json）。查詢時只需要 stat 每個檔案：
+- 大小 / 修改時間 / inode 都沒變的檔案直接沿用
+- 只有追加（同一個 inode、原本結尾前的內容指紋相同）時，CRC 只計算新增的部分，最後時間重新讀檔尾
+- 其他情況（新檔案、被截斷或改寫）才從頭計算
+輪替只是改名、inode 不變，沿用原本的紀錄。
+
+時間區間查詢只開啟時間範圍與 [start, end] 重疊的檔案；log 可能有些微亂序，
+判斷重疊時兩端各放寬 SEEK_SLACK_SECONDS。
+"""
+import glob
+import json
+import os
+import threading
+import zlib
+from typing import Dict, List, Optional
+
+from app.tools.log_index import INDEX_SUFFIX, SEEK_SLACK_SECONDS, _first_epoch_from, tmp_path_for
+from app.tools.log_parser import LogParser
+
+MANIFEST_VERSION = 1
+MANIFEST_NAME = ".log_manifest.json"
+
+# 壓縮檔無法以 byte offset / mmap 掃描，不列入來源
+COMPRESSED_SUFFIXES = (".gz", ".bz2", ".xz", ".zip", ".zst")
+
+# 判斷檔案是否只有追加時取樣的 byte 數（同 log_ingest）
+_FINGERPRINT_BYTES = 256
+_READ_CHUNK_BYTES = 4 << 20
+# 從檔尾往前找最後一個可解析行時，每次多讀的 byte 數與上限
+_TAIL_CHUNK_BYTES = 64 * 1024
+_TAIL_MAX_BYTES = 4 << 20
+
+
+def is_multi_source(log_path: str) -> bool:
+    """log 來源是目錄或 glob 樣式（而不是單一檔案）"""
+    return os.path.isdir(log_path) or glob.has_magic(log_path)
+
+
+def source_files(source: str) -> List[str]:
+    """來源目前包含的 log 檔（依檔名排序），排除索引 / 快取 sidecar 與壓縮檔"""
+    if os.path.isdir(source):
+        candidates = [os.path.join(source, name) for name in os.listdir(source)]
+    else:
+        candidates = glob.glob(source)
+    return sorted(path for path in candidates if _is_log_file(path))
+
+
+def _is_log_file(path: str) -> bool:
+    name = os.path.basename(path)
+    if name == MANIFEST_NAME or name.endswith((INDEX_SUFFIX, ".tmp")) or name.endswith(COMPRESSED_SUFFIXES):
+        return False
+    return os.path.isfile(path)
+
+
+def _fingerprint(f, offset: int) -> int:
+    start = max(0, offset - _FINGERPRINT_BYTES)
+    f.seek(start)
+    return zlib.crc32(f.read(offset - start))
+
+
+def _crc32(f, start: int, end: int, crc: int = 0) -> int:
+    """從 crc 接續計算 [start, end) 的 CRC32"""
+    f.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        chunk = f.read(min(_READ_CHUNK_BYTES, remaining))
+        if not chunk:
+            break
+        crc = zlib.crc32(chunk, crc)
+        remaining -= len(chunk)
+    return crc
+
+
+def _last_epoch_from(f, size: int, parser: LogParser) -> Optional[int]:
+    """從檔尾往前找最後一個可解析行的時間（最後一行沒有換行、尚未寫完時略過）"""
+    read_bytes = _TAIL_CHUNK_BYTES
+    while True:
+        start = max(0, size - read_bytes)
+        f.seek(start)
+        lines = f.read(size - start).split(b"\n")
+        if start > 0:
+            lines = lines[1:]  # 第一段可能不是完整的一行
+        for raw in reversed(lines):
+            record = parser.parse(raw.decode("utf-8", errors="replace"))
+            if record is not None:
+                return record.epoch
+        if start == 0 or read_bytes >= _TAIL_MAX_BYTES:
+            return None
+        read_bytes *= 4
+
+
+class LogManifest:
+    """
+    多檔 log 來源的 manifest。entries 依第一行時間排序，每一筆為：
+        {"path", "name", "inode", "size", "mtime_ns", "checksum", "fingerprint", "first_epoch", "last_epoch"}
+    refresh() 同一時間只會有一個執行緒在跑。
+    """
+
+    def __init__(self, source: str, log_format: str = None):
+        self.source = source
+        self.parser = LogParser(log_format) if log_format else LogParser()
+        directory = source if os.path.isdir(source) else os.path.dirname(source)
+        self.manifest_path = os.path.join(directory or ".", MANIFEST_NAME)
+        self.entries: List[dict] = []
+        self._lock = threading.Lock()
+        # 上次讀取 / 寫入的 sidecar 內容與其修改時間，沒有其他行程更新時不必重新讀取
+        self._saved: Dict[str, dict] = {}
+        self._saved_mtime_ns = None
+
+    def refresh(self) -> List[dict]:
+        """依目前的檔案更新 manifest，回傳依時間排序的 entries"""
+        with self._lock:
+            saved = self._load()
+            known = {entry["inode"]: entry for entry in self.entries}
+            # 沒有在記憶體中的檔案（例如重新啟動後）沿用 sidecar 的紀錄
+            for entry in saved.values():
+                known.setdefault(entry["inode"], entry)
+
+            entries, changed = [], False
+            for path in source_files(self.source):
+                try:
+                    st = os.stat(path)
+                    entry = self._entry_for(path, st, known.get(st.st_ino))
+                except OSError as e:
+                    # 列出檔案後才被刪除或無法讀取
+                    print(f"無法讀取 log 檔案 {path}：{e}")
+                    continue
+                changed = changed or entry is not known.get(entry["inode"]) or saved.get(entry["name"]) != entry
+                entries.append(entry)
+
+            entries.sort(key=lambda entry: (entry["first_epoch"] is None, entry["first_epoch"] or 0, entry["name"]))
+            if changed or len(entries) != len(self.entries):
+                self._save(entries, saved)
+            self.entries = entries
+            return entries
+
+    def select(self, start_epoch: int, end_epoch: int, entries: List[dict] = None) -> List[dict]:
+        """時間範圍與 [start_epoch, end_epoch] 重疊的檔案（依時間排序）"""
+        entries = self.refresh() if entries is None else entries
+        return [entry for entry in entries
+                if entry["first_epoch"] is not None
+                and entry["first_epoch"] - SEEK_SLACK_SECONDS <= end_epoch
+                and entry["last_epoch"] + SEEK_SLACK_SECONDS >= start_epoch]
+
+    def paths_by_inode(self) -> Dict[int, str]:
+        """目前來源內各檔案的 inode → 路徑（不更新 manifest，只 stat）"""
+        paths = {}
+        for path in source_files(self.source):
+            try:
+                paths[os.stat(path).st_ino] = path
+            except OSError:
+                continue
+        return paths
+
+    def _entry_for(self, path: str, st: os.stat_result, previous: Optional[dict]) -> dict:
+        name = os.path.basename(path)
+        if previous is not None and previous["size"] == st.st_size and previous["mtime_ns"] == st.st_mtime_ns:
+            # 內容沒有變動，不必開啟檔案；輪替改名時只更新路徑
+            if previous["path"] == path:
+                return previous
+            return dict(previous, path=path, name=name)
+
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            appended = (previous is not None and previous["size"] <= st.st_size
+                        and _fingerprint(f, previous["size"]) == previous["fingerprint"])
+            if appended:
+                checksum = _crc32(f, previous["size"], st.st_size, int(previous["checksum"], 16))
+                first_epoch = previous["first_epoch"]
+            else:
+                checksum = _crc32(f, 0, st.st_size)
+                f.seek(0)
+                first_epoch = _first_epoch_from(f, self.parser)
+            last_epoch = _last_epoch_from(f, st.st_size, self.parser)
+
+            return {
+                "path": path, "name": name, "inode": st.st_ino, "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                "checksum": f"{checksum:08x}", "fingerprint": _fingerprint(f, st.st_size),
+                "first_epoch": first_epoch, "last_epoch": last_epoch if first_epoch is not None else None,
+            }
+
+    def _load(self) -> Dict[str, dict]:
+        try:
+            mtime_ns = os.stat(self.manifest_path).st_mtime_ns
+            if mtime_ns == self._saved_mtime_ns:
+                return self._saved
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != MANIFEST_VERSION:
+                return {}
+            directory = os.path.dirname(self.manifest_path)
+            self._saved = {name: dict(entry, name=name, path=os.path.join(directory, name))
+                           for name, entry in data["files"].items()}
+            self._saved_mtime_ns = mtime_ns
+            return self._saved
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return {}
+
+    def _save(self, entries: List[dict], saved: Dict[str, dict]):
+        """
+        同一個目錄可能有多個來源（不同的 glob）共用 manifest：
+        保留其他仍然存在的檔案的紀錄，只更新這個來源的檔案
+        """
+        files = {name: entry for name, entry in saved.items() if os.path.isfile(entry["path"])}
+        for entry in entries:
+            files[entry["name"]] = entry
+        data = {
+            "version": MANIFEST_VERSION,
+            "files": {name: {key: value for key, value in entry.items() if key not in ("path", "name")}
+                      for name, entry in sorted(files.items())},
+        }
+        try:
+            tmp_path = tmp_path_for(self.manifest_path)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.manifest_path)
+            self._saved = files
+            self._saved_mtime_ns = os.stat(self.manifest_path).st_mtime_ns
+        except OSError as e:
+            print(f"無法寫入 log manifest（僅保留在記憶體）：{e}")
@@ -0,0 +1,140 @@
+"""
+大型 log 的多核心平行掃描。
+
+把要讀取的 byte 範圍（多檔來源時為多個檔案各自的範圍）切成以換行對齊的區塊，交給 process pool 各自掃描，
+每個 worker 回傳該區塊的 ScanResult（計數與有上限的樣本，需要時才附上全部原始行），
+再依檔案順序合併，結果與序列掃描完全相同。
+
+設定（環境變數）：
+    LOG_SCAN_WORKERS       worker 數量，預設為 CPU 核心數；設為 1 則停用平行掃描
+    LOG_SCAN_CHUNK_BYTES   每個區塊的大小，預設 32 MiB
+    LOG_SCAN_PARALLEL_MIN_BYTES  範圍小於此值時直接序列掃描，預設 64 MiB
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import os
+import threading
+from typing import List, Optional, Tuple
+
+from app.tools.log_index import open_range_scan
+from app.tools.log_parser import LogParser
+from app.tools.log_scan import QueryFilter, ScanResult, new_scan_result
+
+PARALLEL_WORKERS = int(os.getenv("LOG_SCAN_WORKERS", os.cpu_count() or 1))
+PARALLEL_CHUNK_BYTES = int(os.getenv("LOG_SCAN_CHUNK_BYTES", 32 << 20))
+PARALLEL_MIN_BYTES = int(os.getenv("LOG_SCAN_PARALLEL_MIN_BYTES", 64 << 20))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+# worker process 內依 log 格式快取的解析器
+_worker_parsers = {}
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """共用一個 process pool；使用 spawn 避免 fork 到背景匯入執行緒的鎖"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_workers = workers
+        return _pool
+
+
+def split_byte_range(log_path: str, begin: int, end: int, chunk_bytes: int) -> List[Tuple[int, int]]:
+    """把 [begin, end) 切成約 chunk_bytes 大小、邊界都落在行首的區塊"""
+    boundaries = [begin]
+    with open(log_path, "rb") as f:
+        position = begin + chunk_bytes
+        while position < end:
+            # 從前一個 byte 讀到行尾：若 position 剛好是行首，會停在 position 本身
+            f.seek(position - 1)
+            f.readline()
+            aligned = f.tell()
+            if aligned >= end:
+                break
+            if aligned > boundaries[-1]:
+                boundaries.append(aligned)
+            position = max(aligned, position) + chunk_bytes
+    boundaries.append(end)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _scan_chunk(log_path: str, begin: int, end: int, start_epoch: int, end_epoch: int,
+                stop_epoch: Optional[int], log_format: str, query_filter: QueryFilter,
+                sample_limit: int, keep_lines: bool, approximate: bool) -> Tuple[ScanResult, bool]:
+    """worker：掃描一個區塊，回傳 (結果, 是否因超過 stop_epoch 而停止)"""
+    parser = _worker_parsers.get(log_format)
+    if parser is None:
+        parser = _worker_parsers[log_format] = LogParser(log_format)
+
+    result = new_scan_result(sample_limit, keep_lines, approximate)
+    scan = open_range_scan(log_path, begin, end, start_epoch, end_epoch, stop_epoch, parser, query_filter)
+    for line, record in scan:
+        result.add(line, record)
+    return result, scan.stopped
+
+
+def scan_parallel(log_path: str, begin: int, end: int, start_epoch: int, end_epoch: int,
+                  stop_epoch: Optional[int], log_format: str, query_filter: QueryFilter,
+                  sample_limit: int, keep_lines: bool = False, approximate: bool = None,
+                  workers: int = None, chunk_bytes: int = None) -> ScanResult:
+    """
+    平行掃描 [begin, end)。區塊結果依檔案順序合併；
+    某個區塊因 stop_epoch 提前停止時，之後的區塊全部捨棄，與序列掃描的停止點一致。
+    """
+    return scan_segments_parallel([(log_path, begin, end, stop_epoch)], start_epoch, end_epoch, log_format,
+                                  query_filter, sample_limit, keep_lines, approximate, workers, chunk_bytes)
+
+
+def scan_segments_parallel(segments: List[Tuple[str, int, int, Optional[int]]], start_epoch: int, end_epoch: int,
+                           log_format: str, query_filter: QueryFilter, sample_limit: int, keep_lines: bool = False,
+                           approximate: bool = None, workers: int = None, chunk_bytes: int = None) -> ScanResult:
+    """
+    平行掃描多個檔案的範圍 segments = [(log_path, begin, end, stop_epoch), ...]（多檔來源依時間排序的檔案），
+    每個範圍各自切成區塊，全部交給同一個 process pool。結果依 segments 與檔案內的順序合併，
+    與逐一序列掃描相同；某個區塊提前停止時只捨棄同一個檔案之後的區塊。
+    """
+    workers = workers or PARALLEL_WORKERS
+    chunk_bytes = chunk_bytes or PARALLEL_CHUNK_BYTES
+
+    pool = _get_pool(workers)
+    futures = [
+        (segment_no, pool.submit(_scan_chunk, log_path, chunk_begin, chunk_end, start_epoch, end_epoch, stop_epoch,
+                                 log_format, query_filter, sample_limit, keep_lines, approximate))
+        for segment_no, (log_path, begin, end, stop_epoch) in enumerate(segments)
+        for chunk_begin, chunk_end in split_byte_range(log_path, begin, end, chunk_bytes)
+    ]
+
+    merged = new_scan_result(sample_limit, keep_lines, approximate)
+    stopped_segment = None
+    try:
+        for segment_no, future in futures:
+            if segment_no == stopped_segment:
+                future.cancel()
+                continue
+            result, stopped = future.result()
+            merged.merge(result)
+            if stopped:
+                stopped_segment = segment_no
+    except BrokenProcessPool:
+        _reset_pool(pool)
+        raise
+    return merged
+
+
+def _reset_pool(broken: ProcessPoolExecutor):
+    """worker 異常結束後丟掉壞掉的 pool，下次查詢重新建立"""
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+
+
+def should_scan_in_parallel(begin: int, end: int, workers: int = None) -> bool:
+    """範圍太小或只有一個 worker 時，序列掃描比啟動 / 傳輸成本更划算"""
+    return (workers or PARALLEL_WORKERS) > 1 and end - begin >= PARALLEL_MIN_BYTES
@@ -0,0 +1,225 @@
+from datetime import date, datetime
+import os
+import re
+from typing import NamedTuple, Optional
+
+# === 支援的 log 格式宣告（nginx log_format 風格） ===
+# combined_real_ip：nginx combined 格式，行尾再附上經過 proxy 後的真實來源 IP
+LOG_FORMATS = {
+    "combined_real_ip": (
+        '$remote_addr - $remote_user [$time_local] "$request" $status $body_bytes_sent '
+        '"$http_referer" "$http_user_agent" $real_ip'
+    ),
+    "combined": (
+        '$remote_addr - $remote_user [$time_local] "$request" $status $body_bytes_sent '
+        '"$http_referer" "$http_user_agent"'
+    ),
+    "common": '$remote_addr - $remote_user [$time_local] "$request" $status $body_bytes_sent',
+}
+
+# 可用環境變數 LOG_FORMAT 指定格式名稱或直接給完整格式字串
+DEFAULT_LOG_FORMAT = os.getenv("LOG_FORMAT", "combined_real_ip")
+
+TIME_FORMAT = "%d/%b/%Y:%H:%M:%S"
+
+_QUOTED_FIELD_PATTERN = r'[^"\\]*(?:\\.[^"\\]*)*'
+
+# 需要擷取的欄位對應的正規表達式，其餘欄位一律用通用樣式略過。
+# 不是 "METHOD path HTTP/x" 的請求（"-"、TLS 握手的 \x16\x03...、"GET /"、小寫方法）
+# 也要解析：method 群組不成立時整段引號內容放在 raw_request，解析後 method 為空字串、resource 為原始內容；
+# 是否列入查詢結果由 QueryFilter 的 include_malformed 決定（預設不列入）
+_FIELD_PATTERNS = {
+    "time_local": r"(?P<time>\d{2}/[A-Za-z]{3}/\d{4}:\d{2}:\d{2}:\d{2}) [+-]\d{4}",
+    "request": (r"(?:(?P<method>[A-Z]+) (?P<resource>[^ ]+) HTTP/[^\"]+|(?P<raw_request>"
+                + _QUOTED_FIELD_PATTERN + "))"),
+    "status": r"(?P<status>\d{3})",
+    "remote_addr": r"(?P<remote_addr>\S+)",
+    "real_ip": r"(?P<real_ip>\S+)",
+}
+_BARE_FIELD_PATTERN = r"\S+"
+
+# bytes 版本（mmap 掃描用）：每個樣式都不會跨越換行，
+# 空白的定義補上 \x1c-\x1f，讓 ASCII 行的比對結果與 str 版本的 \s / \S 完全相同
+_BYTES_QUOTED_FIELD_PATTERN = r'[^"\\\n]*(?:\\.[^"\\\n]*)*'
+_BYTES_FIELD_PATTERNS = {
+    **_FIELD_PATTERNS,
+    "request": (r"(?:(?P<method>[A-Z]+) (?P<resource>[^ \n]+) HTTP/[^\"\n]+|(?P<raw_request>"
+                + _BYTES_QUOTED_FIELD_PATTERN + "))"),
+    "remote_addr": r"(?P<remote_addr>[^\s\x1c-\x1f]+)",
+    "real_ip": r"(?P<real_ip>[^\s\x1c-\x1f]+)",
+}
+_BYTES_BARE_FIELD_PATTERN = r"[^\s\x1c-\x1f]+"
+_BYTES_TRAILING_SPACE = r"[ \t\r\x0b\x0c\x1c-\x1f]*"
+
+_VARIABLE_RE = re.compile(r"\$([a-z_]+)")
+
+_MONTHS = {
+    "Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
+    "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12,
+}
+# bytes 掃描路徑直接拿原始 bytes 查表
+_MONTHS.update({name.encode(): month for name, month in list(_MONTHS.items())})
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+class LogRecord(NamedTuple):
+    timestamp: str  # 原始時間字串 dd/Mon/yyyy:HH:MM:SS
+    epoch: int      # 換算成秒數的時間（與原本 strptime 相同，不做時區換算）
+    method: str
+    resource: str
+    status: int
+    source_ip: str
+
+
+# 略過 NamedTuple 的 Python 層 __new__，熱迴圈中直接建立 tuple
+_new_record = tuple.__new__
+
+
+def compile_log_format(log_format: str) -> re.Pattern:
+    """
+    將 log 格式宣告編譯成一個錨定整行的正規表達式。
+
+    參數：
+        log_format (str): LOG_FORMATS 的名稱，或 nginx 風格的格式字串
+
+    回傳：
+        re.Pattern: 具名群組 time / method / resource / status 以及 remote_addr 或 real_ip
+    """
+    spec = LOG_FORMATS.get(log_format, log_format)
+    pattern = re.compile("^" + _format_regex(spec, _FIELD_PATTERNS, _QUOTED_FIELD_PATTERN, _BARE_FIELD_PATTERN)
+                         + r"\s*$")
+    missing = {"time", "method", "resource", "status"} - set(pattern.groupindex)
+    if missing:
+        raise ValueError(f"log 格式缺少必要欄位：{sorted(missing)}")
+    if "real_ip" not in pattern.groupindex and "remote_addr" not in pattern.groupindex:
+        raise ValueError("log 格式缺少來源 IP 欄位（$remote_addr 或 $real_ip）")
+    return pattern
+
+
+def compile_log_format_bytes(log_format: str) -> re.Pattern:
+    """
+    compile_log_format 的 bytes 版本，以 MULTILINE 在多行的 buffer 上逐行比對，
+    比對結果不會跨越換行。只保證對純 ASCII 的行與 str 版本結果相同。
+    """
+    spec = LOG_FORMATS.get(log_format, log_format)
+    regex = ("^" + _format_regex(spec, _BYTES_FIELD_PATTERNS, _BYTES_QUOTED_FIELD_PATTERN, _BYTES_BARE_FIELD_PATTERN)
+             + _BYTES_TRAILING_SPACE + "$")
+    return re.compile(regex.encode("utf-8"), re.MULTILINE)
+
+
+def _format_regex(spec: str, field_patterns: dict, quoted_pattern: str, bare_pattern: str) -> str:
+    """把格式字串中的 $變數 換成對應的樣式，其餘文字原樣比對"""
+    parts = []
+    in_quotes = False
+    pos = 0
+    for var in _VARIABLE_RE.finditer(spec):
+        literal = spec[pos:var.start()]
+        parts.append(re.escape(literal))
+        in_quotes ^= literal.count('"') % 2 == 1
+
+        name = var.group(1)
+        if name in field_patterns:
+            parts.append(field_patterns[name])
+        else:
+            parts.append(quoted_pattern if in_quotes else bare_pattern)
+        pos = var.end()
+    parts.append(re.escape(spec[pos:]))
+    return "".join(parts)
+
+
+def parse_query_time(time_str: str) -> int:
+    """
+    解析使用者給的查詢時間（嚴格驗證，格式錯誤時丟出 ValueError），回傳秒數。
+    """
+    dt = datetime.strptime(time_str, TIME_FORMAT)
+    return (dt.toordinal() - _EPOCH_ORDINAL) * 86400 + dt.hour * 3600 + dt.minute * 60 + dt.second
+
+
+class TimestampParser:
+    """
+    dd/Mon/yyyy:HH:MM:SS → 秒數（str 或 ASCII bytes 皆可，同一個實例請只用一種）。
+
+    以月份查表取代 strptime；每分鐘的起始秒數與上一個秒數都會快取，
+    同一分鐘內只需要轉換秒數兩位數，連續多行落在同一秒時只需要一次字串比較。
+    """
+
+    def __init__(self, max_minutes: int = 65536):
+        self._max_minutes = max_minutes
+        self._minute_cache = {}
+        # (時間字串, 秒數) 放在同一個 tuple，多執行緒共用時不會讀到不一致的組合
+        self._last = (None, None)
+
+    def __call__(self, time_str: str) -> Optional[int]:
+        last = self._last
+        if time_str == last[0]:
+            return last[1]
+
+        base = self._minute_cache.get(time_str[:17])
+        if base is None:
+            base = self._minute_base(time_str)
+            if base is None:
+                return None
+
+        second = int(time_str[18:20])
+        # 與 strptime 一致：超出範圍的秒數視為無法解析
+        if second > 61:
+            return None
+
+        value = base + second
+        self._last = (time_str, value)
+        return value
+
+    def _minute_base(self, time_str: str) -> Optional[int]:
+        try:
+            day = date(int(time_str[7:11]), _MONTHS[time_str[3:6]], int(time_str[0:2])).toordinal()
+            hour = int(time_str[12:14])
+            minute = int(time_str[15:17])
+        except (KeyError, ValueError):
+            return None
+        if hour > 23 or minute > 59:
+            return None
+
+        if len(self._minute_cache) >= self._max_minutes:
+            self._minute_cache.clear()
+        base = self._minute_cache[time_str[:17]] = (day - _EPOCH_ORDINAL) * 86400 + hour * 3600 + minute * 60
+        return base
+
+
+class LogParser:
+    """
+    依照宣告的 log 格式建立的專用解析器。
+    每行只做一次預先編譯好的 match，不再額外 split 取來源 IP。
+    """
+
+    def __init__(self, log_format: str = DEFAULT_LOG_FORMAT):
+        self.log_format = LOG_FORMATS.get(log_format, log_format)
+        self.pattern = compile_log_format(self.log_format)
+        # 有行尾真實 IP 就用它，否則退回 remote_addr
+        self.ip_group = "real_ip" if "real_ip" in self.pattern.groupindex else "remote_addr"
+        self.parse_timestamp = TimestampParser()
+        self._match = self.pattern.match
+        self._groups = tuple(self.pattern.groupindex[name]
+                             for name in ("time", "method", "resource", "status", self.ip_group))
+        self._raw_request_group = self.pattern.groupindex.get("raw_request")
+
+        # 同一個格式的 bytes 版本，供 mmap 掃描直接在原始 bytes 上比對
+        self.bytes_pattern = compile_log_format_bytes(self.log_format)
+        self.parse_bytes_timestamp = TimestampParser()
+        self.bytes_groups = tuple(self.bytes_pattern.groupindex[name]
+                                  for name in ("time", "method", "resource", "status", self.ip_group))
+        self.bytes_raw_request_group = self.bytes_pattern.groupindex.get("raw_request")
+
+    def parse(self, line: str) -> Optional[LogRecord]:
+        match = self._match(line)
+        if match is None:
+            return None
+
+        timestamp_str, method, resource, status, source_ip = match.group(*self._groups)
+        epoch = self.parse_timestamp(timestamp_str)
+        if epoch is None:
+            return None
+        if method is None:
+            # 不合規格的請求：沒有方法，resource 保留引號內的原始內容
+            method, resource = "", match.group(self._raw_request_group)
+
+        return _new_record(LogRecord, (timestamp_str, epoch, method, resource, int(status), source_ip))
@@ -0,0 +1,281 @@
+"""
+Access log 的每分鐘彙總表（rollup）。
+
+以「時間區塊 × 狀態碼 × HTTP 方法」為鍵記錄筆數，並在同樣的鍵下記錄各來源 IP、
+各資源的筆數；每小時的粒度另外記錄 IP × 資源，用來算熱門 IP 各自的熱門資源。
+時間區間的統計摘要合併區間內的整點小時，頭尾不滿一小時的部分再用整分鐘補上，
+不必逐列計算。
+
+每個計數都記下第一次出現的列編號，合併後同分時依第一次出現的順序排序，
+與逐行掃描時 Counter.most_common 的結果完全相同。
+
+彙總表附屬於欄位快取（log_store）：隨匯入的新資料延伸，compact 時一起寫入磁碟。
+"""
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 時間區塊粒度（秒）
+ROLLUP_LEVELS = {"minute": 60, "hour": 3600}
+
+# 彙總表名稱 → 鍵欄位；每個表另外有 count（筆數）與 first_row（第一次出現的列編號）
+ROLLUP_TABLES = {
+    "groups": ("bucket", "status", "method"),
+    "ips": ("bucket", "status", "method", "ip"),
+    "resources": ("bucket", "status", "method", "resource"),
+    "pairs": ("bucket", "status", "method", "ip", "resource"),
+}
+# 各粒度維護的表；IP × 資源的組合很多，只在小時粒度維護
+LEVEL_TABLES = {
+    "minute": ("groups", "ips", "resources"),
+    "hour": ("groups", "ips", "resources", "pairs"),
+}
+# 查詢時依哪個欄位合併
+_SUMMARY_KEYS = {"groups": "status", "ips": "ip", "resources": "resource"}
+
+ROLLUP_FILE_PREFIX = "rollup"
+
+Table = Dict[str, np.ndarray]
+
+
+def group_counts(keys: Dict[str, np.ndarray], count: np.ndarray, first_row: np.ndarray) -> Table:
+    """
+    依 keys 分組：count 加總、first_row 取最小值。
+    結果依 keys 的順序排序（第一個鍵為主），因此可以對 bucket 做 searchsorted。
+    """
+    names = list(keys)
+    if len(count) == 0:
+        table = {name: keys[name][:0] for name in names}
+        table["count"] = count[:0].astype(np.int64)
+        table["first_row"] = first_row[:0].astype(np.int64)
+        return table
+
+    # lexsort 以最後一個鍵為主；first_row 放最前面，同一組內第一列就是最小值
+    order = np.lexsort([first_row] + [keys[name] for name in reversed(names)])
+    sorted_keys = {name: keys[name][order] for name in names}
+    change = np.zeros(len(order), dtype=bool)
+    change[0] = True
+    for values in sorted_keys.values():
+        change[1:] |= values[1:] != values[:-1]
+    starts = np.flatnonzero(change)
+
+    table = {name: values[starts] for name, values in sorted_keys.items()}
+    table["count"] = np.add.reduceat(count[order].astype(np.int64, copy=False), starts)
+    table["first_row"] = first_row[order][starts].astype(np.int64, copy=False)
+    return table
+
+
+def build_tables(columns: Dict[str, np.ndarray], rows: np.ndarray) -> Dict[str, Dict[str, Table]]:
+    """
+    由欄位資料（epoch / status / method / ip / resource）與對應的列編號建立各粒度的彙總表：
+        {粒度: {表名稱: 表}}
+    """
+    ones = np.ones(len(rows), dtype=np.int64)
+    rows = rows.astype(np.int64, copy=False)
+    levels = {}
+    for level, seconds in ROLLUP_LEVELS.items():
+        values = {
+            "bucket": columns["epoch"] // seconds,
+            "status": columns["status"],
+            "method": columns["method"],
+            "ip": columns["ip"],
+            "resource": columns["resource"],
+        }
+        levels[level] = {name: group_counts({key: values[key] for key in ROLLUP_TABLES[name]}, ones, rows)
+                         for name in LEVEL_TABLES[level]}
+    return levels
+
+
+class LogRollup:
+    """
+    各粒度彙總表的快照：chunks[粒度][表名稱] 是數個依 bucket 排序的區塊，
+    第一個區塊通常是已寫入磁碟的部分，之後是增量追加的部分。
+    物件建立後不再修改，追加資料時產生新的 LogRollup。
+    """
+
+    def __init__(self, chunks: Dict[str, Dict[str, List[Table]]]):
+        self.chunks = chunks
+        self._statuses = None
+
+    @classmethod
+    def empty(cls) -> "LogRollup":
+        return cls({level: {name: [] for name in names} for level, names in LEVEL_TABLES.items()})
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, np.ndarray], row_start: int = 0) -> "LogRollup":
+        rows = np.arange(row_start, row_start + len(columns["epoch"]), dtype=np.int64)
+        return cls.empty().extended(build_tables(columns, rows))
+
+    def extended(self, levels: Dict[str, Dict[str, Table]]) -> "LogRollup":
+        """
+        加入 build_tables 產生的新區塊。增量區塊依大小分級合併（保留第一個區塊不動）：
+        最後一個區塊的級數不小於前一個時兩者合併，像二進位計數器一樣。
+        每一列攤提只會被合併 O(log n) 次，區塊數也維持在 O(log n)，
+        追加的成本與新增的資料量有關，不隨上次 compact 後累積的總量成長。
+        """
+        chunks = {}
+        for level, names in LEVEL_TABLES.items():
+            chunks[level] = {}
+            for name in names:
+                table = levels[level][name]
+                table_chunks = list(self.chunks[level][name])
+                if len(table["count"]):
+                    table_chunks.append(table)
+                    while (len(table_chunks) > 2
+                           and _size_class(table_chunks[-1]) >= _size_class(table_chunks[-2])):
+                        table_chunks[-2:] = [_sum_by(table_chunks[-2:], ROLLUP_TABLES[name])]
+                chunks[level][name] = table_chunks
+        return LogRollup(chunks)
+
+    def merged(self) -> "LogRollup":
+        """每個表合併成單一區塊（寫入磁碟前使用）"""
+        return LogRollup({
+            level: {name: [_sum_by(tables[name], ROLLUP_TABLES[name])] if tables[name] else []
+                    for name in LEVEL_TABLES[level]}
+            for level, tables in self.chunks.items()
+        })
+
+    def statuses(self) -> np.ndarray:
+        """出現過的所有狀態碼"""
+        if self._statuses is None:
+            chunks = self.chunks["hour"]["groups"]
+            self._statuses = (np.unique(np.concatenate([t["status"] for t in chunks])) if chunks
+                              else np.empty(0, dtype=np.int16))
+        return self._statuses
+
+    def window_counts(self, start_epoch: int, end_epoch: int, allowed_statuses,
+                      method_mask: Optional[np.ndarray] = None,
+                      extra: Dict[str, Table] = None) -> Dict[str, Table]:
+        """
+        合併 [start_epoch, end_epoch] 內完整的小時與分鐘、狀態碼與 HTTP 方法符合條件的區塊，回傳：
+            {"groups": 依狀態碼, "ips": 依來源 IP, "resources": 依資源} 的 {鍵, count, first_row}
+        區間頭尾不滿一分鐘的部分不在此計算，由呼叫端整理成 extra（已過濾好的彙總表）併入。
+        """
+        ranges = plan_buckets(start_epoch, end_epoch)[0]
+        result = {}
+        for name, key in _SUMMARY_KEYS.items():
+            parts = [self._select(level, name, first_bucket, last_bucket, allowed_statuses, method_mask)
+                     for level, first_bucket, last_bucket in ranges]
+            if extra is not None:
+                parts.append(extra[name])
+            result[name] = _sum_by(parts, (key,))
+        return result
+
+    def ip_resource_counts(self, start_epoch: int, end_epoch: int, allowed_statuses,
+                           method_mask: Optional[np.ndarray], ip_ids: np.ndarray,
+                           extra: Table = None) -> Table:
+        """
+        區間內完整小時中，指定 IP 的 IP × 資源計數 {ip, resource, count, first_row}。
+        不滿一小時的部分由呼叫端逐列整理成 extra 併入（見 plan_buckets 的 row_spans）。
+        """
+        parts = []
+        for level, first_bucket, last_bucket in plan_buckets(start_epoch, end_epoch)[0]:
+            if level == "hour":
+                table = self._select(level, "pairs", first_bucket, last_bucket, allowed_statuses, method_mask)
+                mask = np.isin(table["ip"], ip_ids)
+                parts.append({name: values[mask] for name, values in table.items()})
+        if extra is not None:
+            parts.append(extra)
+        return _sum_by(parts, ("ip", "resource"))
+
+    def _select(self, level: str, name: str, first_bucket: int, last_bucket: int, allowed_statuses,
+                method_mask: Optional[np.ndarray]) -> Table:
+        """取出 [first_bucket, last_bucket] 內符合狀態碼與 HTTP 方法的列（各區塊串接）"""
+        parts = []
+        for table in self.chunks[level][name]:
+            lo = int(np.searchsorted(table["bucket"], first_bucket, side="left"))
+            hi = int(np.searchsorted(table["bucket"], last_bucket, side="right"))
+            if lo >= hi:
+                continue
+            mask = np.isin(table["status"][lo:hi], allowed_statuses)
+            if method_mask is not None:
+                mask &= method_mask[table["method"][lo:hi]]
+            parts.append({column: values[lo:hi][mask] for column, values in table.items()})
+        if not parts:
+            return {column: np.empty(0, dtype=np.int64) for column in ROLLUP_TABLES[name] + ("count", "first_row")}
+        return {column: np.concatenate([part[column] for part in parts]) for column in parts[0]}
+
+
+def _size_class(table: Table) -> int:
+    return len(table["count"]).bit_length()
+
+
+def _sum_by(parts: List[Table], keys: Tuple[str, ...]) -> Table:
+    """把多個表依 keys 合併加總"""
+    if not parts:
+        empty = np.empty(0, dtype=np.int64)
+        return group_counts({key: empty for key in keys}, empty, empty)
+    return group_counts({key: np.concatenate([part[key] for part in parts]) for key in keys},
+                        np.concatenate([part["count"] for part in parts]),
+                        np.concatenate([part["first_row"] for part in parts]))
+
+
+def plan_buckets(start_epoch: int, end_epoch: int) -> Tuple[List[Tuple[str, int, int]], List[Tuple[int, int]]]:
+    """
+    把 [start_epoch, end_epoch] 拆成：
+        完整的時間區塊 [(粒度, 第一個 bucket, 最後一個 bucket), ...]（中間用小時，頭尾補分鐘）
+        不滿一分鐘、需要逐列計算的秒數區間 [(開始, 結束), ...]
+    IP × 資源只有小時粒度，不滿一小時的部分（分鐘區塊與上述秒數區間）需逐列計算，見 row_spans。
+    """
+    def full_buckets(lo: int, hi: int, seconds: int) -> Tuple[int, int]:
+        # 完整落在 [lo, hi] 內的區塊
+        return -(-lo // seconds), (hi + 1) // seconds - 1
+
+    first_minute, last_minute = full_buckets(start_epoch, end_epoch, 60)
+    if first_minute > last_minute:
+        return [], [(start_epoch, end_epoch)]
+
+    edges = [(start_epoch, first_minute * 60 - 1), ((last_minute + 1) * 60, end_epoch)]
+    edges = [(lo, hi) for lo, hi in edges if lo <= hi]
+
+    first_hour, last_hour = full_buckets(first_minute * 60, last_minute * 60 + 59, 3600)
+    if first_hour > last_hour:
+        return [("minute", first_minute, last_minute)], edges
+
+    ranges = [("hour", first_hour, last_hour)]
+    if first_minute < first_hour * 60:
+        ranges.append(("minute", first_minute, first_hour * 60 - 1))
+    if (last_hour + 1) * 60 <= last_minute:
+        ranges.append(("minute", (last_hour + 1) * 60, last_minute))
+    return ranges, edges
+
+
+def top_counts(table: Table, key: str, k: int) -> List[Tuple[int, int]]:
+    """依筆數取前 k 名，同分時依第一次出現的列編號"""
+    order = np.lexsort((table["first_row"], -table["count"]))[:k]
+    return [(int(table[key][i]), int(table["count"][i])) for i in order]
+
+
+def row_spans(start_epoch: int, end_epoch: int) -> List[Tuple[int, int]]:
+    """[start_epoch, end_epoch] 中不在完整小時內的秒數區間"""
+    ranges, edges = plan_buckets(start_epoch, end_epoch)
+    return edges + [(first * 60, last * 60 + 59) for level, first, last in ranges if level == "minute"]
+
+
+def save_rollup(directory: str, rollup: LogRollup):
+    """寫入 compact 後的版本目錄（每個表一個區塊）"""
+    merged = rollup.merged()
+    for level, names in LEVEL_TABLES.items():
+        for name in names:
+            tables = merged.chunks[level][name]
+            for column in ROLLUP_TABLES[name] + ("count", "first_row"):
+                values = tables[0][column] if tables else np.empty(0, dtype=np.int64)
+                np.save(os.path.join(directory, f"{ROLLUP_FILE_PREFIX}-{level}-{name}-{column}.npy"), values)
+
+
+def load_rollup(directory: str) -> Optional[LogRollup]:
+    """讀取版本目錄中的彙總表；舊版本沒有寫入彙總表時回傳 None"""
+    chunks = {}
+    try:
+        for level, names in LEVEL_TABLES.items():
+            chunks[level] = {}
+            for name in names:
+                table = {}
+                for column in ROLLUP_TABLES[name] + ("count", "first_row"):
+                    path = os.path.join(directory, f"{ROLLUP_FILE_PREFIX}-{level}-{name}-{column}.npy")
+                    table[column] = np.load(path)
+                chunks[level][name] = [table] if len(table["count"]) else []
+    except (OSError, ValueError):
+        return None
+    return LogRollup(chunks)
@@ -0,0 +1,294 @@
+"""
+log 查詢條件與掃描結果的彙總，序列掃描與多 process 平行掃描共用。
+"""
+import os
+import re
+from collections import defaultdict, Counter
+from typing import List, NamedTuple, Optional, Tuple
+
+from app.tools.log_parser import LogRecord
+from app.tools.log_sketch import HeavyHitters
+
+# 回傳給前端的結構化資料筆數上限
+STRUCTURED_ROW_LIMIT = 100
+
+# 統計模式（環境變數 LOG_SUMMARY_MODE）：exact 精確計數；approx 以固定記憶體的近似計數。
+# 近似模式不使用也不建立欄位快取（它的 IP / 資源字典隨不同值的數量成長），查詢一律逐行掃描原始 log
+SUMMARY_MODE = os.getenv("LOG_SUMMARY_MODE", "exact")
+# 近似模式追蹤的 IP / 資源數量，以及每個 IP 追蹤的資源數量
+APPROX_CAPACITY = int(os.getenv("LOG_APPROX_CAPACITY", 1000))
+APPROX_RESOURCES_PER_IP = int(os.getenv("LOG_APPROX_RESOURCES_PER_IP", 16))
+
+# 永遠排除 2xx 狀態碼
+_EXCLUDE_2XX = re.compile(r"^(?!2\d\d$)")
+# 有 HTTP 方法的請求；不合規格的請求解析後方法為空字串
+_WELL_FORMED_METHOD = re.compile(r"[A-Z]")
+
+
+class QueryFilter:
+    """
+    狀態碼 / HTTP 方法 / 來源 IP 的正規表達式條件。
+    只保存原始字串，可以 pickle 傳給 worker process 後再各自編譯。
+    exclude_2xx=False 時 2xx 也可以符合（MCP 工具依單一狀態碼查詢時使用）。
+    include_malformed=True 時不是 "METHOD path HTTP/x" 的請求行（"-"、TLS 握手、"GET /"、小寫方法）也列入，
+    與原本 MCP 工具的寬鬆比對相同；預設不列入，與原本 FastAPI 的查詢結果相同。指定 http_method 時一律不符合。
+    """
+
+    def __init__(self, status_code: str = None, http_method: str = None, source_ip: str = None,
+                 exclude_2xx: bool = True, include_malformed: bool = False):
+        self.status_code = status_code
+        self.http_method = http_method
+        self.source_ip = source_ip
+        self.exclude_2xx = exclude_2xx
+        self.include_malformed = include_malformed
+        self._compile()
+
+    def _compile(self):
+        self.status_pattern = _compile_field("status_code", self.status_code)
+        self.method_pattern = _compile_field("http_method", self.http_method)
+        if self.method_pattern is None and not self.include_malformed:
+            # 以方法條件排除不合規格的請求，欄位快取與彙總表的路徑也套用同一個條件
+            self.method_pattern = _WELL_FORMED_METHOD
+        self.ip_pattern = _compile_field("source_ip", self.source_ip)
+        # 狀態碼與 HTTP 方法的種類很少，過濾結果按值快取，避免每行重跑正規表達式
+        self._status_allowed = {}
+        self._method_allowed = {}
+
+    def __getstate__(self):
+        return {"status_code": self.status_code, "http_method": self.http_method, "source_ip": self.source_ip,
+                "exclude_2xx": self.exclude_2xx, "include_malformed": self.include_malformed}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._compile()
+
+    def status_allowed(self, code_str: str) -> bool:
+        if self.exclude_2xx and not _EXCLUDE_2XX.match(code_str):
+            return False
+        return not self.status_pattern or bool(self.status_pattern.match(code_str))
+
+    def accepts(self, record: LogRecord) -> bool:
+        allowed = self._status_allowed.get(record.status)
+        if allowed is None:
+            allowed = self._status_allowed[record.status] = self.status_allowed(str(record.status))
+        if not allowed:
+            return False
+
+        if self.method_pattern:
+            allowed = self._method_allowed.get(record.method)
+            if allowed is None:
+                allowed = self._method_allowed[record.method] = bool(self.method_pattern.match(record.method))
+            if not allowed:
+                return False
+
+        if self.ip_pattern and not self.ip_pattern.match(record.source_ip):
+            return False
+        return True
+
+    def accepts_raw(self, status: int, method: bytes, source_ip: bytes) -> bool:
+        """與 accepts 相同的判斷，直接使用 bytes 欄位（只在需要時解碼）"""
+        allowed = self._status_allowed.get(status)
+        if allowed is None:
+            allowed = self._status_allowed[status] = self.status_allowed(str(status))
+        if not allowed:
+            return False
+
+        if self.method_pattern:
+            allowed = self._method_allowed.get(method)
+            if allowed is None:
+                allowed = self._method_allowed[method] = bool(self.method_pattern.match(method.decode("ascii")))
+            if not allowed:
+                return False
+
+        if self.ip_pattern and not self.ip_pattern.match(source_ip.decode("utf-8", errors="replace")):
+            return False
+        return True
+
+
+def _compile_field(field: str, pattern: str):
+    if not pattern:
+        return None
+    try:
+        return re.compile(pattern)
+    except re.error:
+        raise ValueError(f"無效的 {field} 正規表達式：{pattern}")
+
+
+def structured_row(record: LogRecord) -> dict:
+    return {
+        "timestamp": record.timestamp,
+        "resource": record.resource,
+        "source_ip": record.source_ip,
+        "http_method": record.method,
+        "status_code": record.status
+    }
+
+
+class ScanResult:
+    """
+    掃描過程中累積的結果：符合筆數、前幾筆原始行與結構化資料、各項計數。
+    記憶體只與不同 IP / 資源的數量有關，與符合的行數無關；
+    只有 keep_lines=True 時才保留全部符合的原始行。
+    多段結果依檔案順序 merge 後，與整段序列掃描的結果完全相同
+    （Counter 的插入順序即第一次出現的順序，決定 most_common 同分時的排序）。
+    """
+
+    def __init__(self, sample_limit: int = STRUCTURED_ROW_LIMIT, keep_lines: bool = False):
+        self.sample_limit = sample_limit
+        self.count = 0
+        self.sample_lines = []
+        self.structured_body = []
+        self.filtered_logs = [] if keep_lines else None
+
+        # 統計資料結構
+        self.ip_counter = Counter()
+        self.status_counter = Counter()
+        self.ip_to_resources = defaultdict(Counter)
+        self.resource_counter = Counter()
+
+    def add(self, line: str, record: LogRecord):
+        self.count += 1
+        if self.filtered_logs is not None:
+            self.filtered_logs.append(line.strip())
+
+        if len(self.structured_body) < self.sample_limit:
+            self.sample_lines.append(line.strip())
+            self.structured_body.append(structured_row(record))
+
+        real_ip = record.source_ip
+        resource = record.resource
+        self.ip_counter[real_ip] += 1
+        self.ip_to_resources[real_ip][resource] += 1
+        self.resource_counter[resource] += 1
+        self.status_counter[record.status] += 1
+
+    def merge(self, other: "ScanResult"):
+        """接上檔案中位於本段之後的另一段結果"""
+        self.count += other.count
+        if self.filtered_logs is not None:
+            self.filtered_logs.extend(other.filtered_logs)
+        room = self.sample_limit - len(self.structured_body)
+        if room > 0:
+            self.sample_lines.extend(other.sample_lines[:room])
+            self.structured_body.extend(other.structured_body[:room])
+
+        self.ip_counter.update(other.ip_counter)
+        self.status_counter.update(other.status_counter)
+        self.resource_counter.update(other.resource_counter)
+        for ip, resources in other.ip_to_resources.items():
+            self.ip_to_resources[ip].update(resources)
+
+    def summary(self, top_n: int = 10, top_resources_per_ip: int = 5):
+        """回傳 (top_ips, top_resources, status_counts)，格式與 LogColumnStore.summary 相同"""
+        top_ips = [(ip, count, self.ip_to_resources[ip].most_common(top_resources_per_ip))
+                   for ip, count in self.ip_counter.most_common(top_n)]
+        return top_ips, self.resource_counter.most_common(top_n), sorted(self.status_counter.items())
+
+    def error_bounds(self) -> Optional[dict]:
+        """近似模式的誤差上限；精確計數回傳 None"""
+        return None
+
+    def to_query_result(self) -> "LogQueryResult":
+        top_ips, top_resources, status_counts = self.summary()
+        return LogQueryResult(self.count, top_ips, top_resources, status_counts,
+                              self.sample_lines, self.structured_body, self.filtered_logs,
+                              self.error_bounds())
+
+
+class ApproxScanResult(ScanResult):
+    """
+    近似模式：IP、資源與各 IP 的資源改用 HeavyHitters，記憶體固定，與不同 IP 的數量無關。
+    狀態碼種類很少，仍然精確計數。只追蹤目前仍在 IP 摘要中的 IP 的資源；
+    IP 被移出後再出現時重新計算，少算的部分不超過 IP 摘要的誤差上限。
+    """
+
+    def __init__(self, sample_limit: int = STRUCTURED_ROW_LIMIT, keep_lines: bool = False,
+                 capacity: int = None, resources_per_ip: int = None):
+        super().__init__(sample_limit, keep_lines)
+        self.capacity = capacity or APPROX_CAPACITY
+        self.resources_per_ip = resources_per_ip or APPROX_RESOURCES_PER_IP
+        self.ip_counter = HeavyHitters(self.capacity)
+        self.resource_counter = HeavyHitters(self.capacity)
+        self.ip_to_resources = {}
+
+    def add(self, line: str, record: LogRecord):
+        self.count += 1
+        if self.filtered_logs is not None:
+            self.filtered_logs.append(line.strip())
+
+        if len(self.structured_body) < self.sample_limit:
+            self.sample_lines.append(line.strip())
+            self.structured_body.append(structured_row(record))
+
+        real_ip = record.source_ip
+        resource = record.resource
+        pruned = self.ip_counter.add(real_ip)
+        resources = self.ip_to_resources.get(real_ip)
+        if resources is None:
+            resources = self.ip_to_resources[real_ip] = HeavyHitters(self.resources_per_ip)
+        resources.add(resource)
+        if pruned:
+            self._drop_untracked_ips()
+        self.resource_counter.add(resource)
+        self.status_counter[record.status] += 1
+
+    def merge(self, other: "ApproxScanResult"):
+        self.count += other.count
+        if self.filtered_logs is not None:
+            self.filtered_logs.extend(other.filtered_logs)
+        room = self.sample_limit - len(self.structured_body)
+        if room > 0:
+            self.sample_lines.extend(other.sample_lines[:room])
+            self.structured_body.extend(other.structured_body[:room])
+
+        self.ip_counter.merge(other.ip_counter)
+        self.resource_counter.merge(other.resource_counter)
+        self.status_counter.update(other.status_counter)
+        for ip, resources in other.ip_to_resources.items():
+            mine = self.ip_to_resources.get(ip)
+            if mine is None:
+                self.ip_to_resources[ip] = resources
+            else:
+                mine.merge(resources)
+        self._drop_untracked_ips()
+
+    def summary(self, top_n: int = 10, top_resources_per_ip: int = 5):
+        top_ips = [(ip, count, self.ip_to_resources[ip].most_common(top_resources_per_ip))
+                   for ip, count in self.ip_counter.most_common(top_n)]
+        return top_ips, self.resource_counter.most_common(top_n), sorted(self.status_counter.items())
+
+    def error_bounds(self, top_n: int = 10) -> dict:
+        """
+        每個估計值可能少算的上限（真實次數落在 [估計值, 估計值 + 上限]）：
+            ip / resource：IP 與資源次數
+            ip_resource：前 top_n 名 IP 各自的資源次數（取最大值）
+        """
+        ip_resource = max((self.ip_counter.error + self.ip_to_resources[ip].error
+                           for ip, _ in self.ip_counter.most_common(top_n)), default=0)
+        return {"ip": self.ip_counter.error, "resource": self.resource_counter.error, "ip_resource": ip_resource}
+
+    def _drop_untracked_ips(self):
+        tracked = self.ip_counter.counts
+        if len(self.ip_to_resources) > len(tracked):
+            self.ip_to_resources = {ip: resources for ip, resources in self.ip_to_resources.items()
+                                    if ip in tracked}
+
+
+def new_scan_result(sample_limit: int = STRUCTURED_ROW_LIMIT, keep_lines: bool = False,
+                    approximate: bool = None) -> ScanResult:
+    """依 approximate（未指定時依 LOG_SUMMARY_MODE）建立精確或近似模式的 ScanResult"""
+    if approximate is None:
+        approximate = SUMMARY_MODE == "approx"
+    return ApproxScanResult(sample_limit, keep_lines) if approximate else ScanResult(sample_limit, keep_lines)
+
+
+class LogQueryResult(NamedTuple):
+    """一次 log 查詢的結果（記憶體有上限；filtered_logs 只有明確要求時才有）"""
+    total: int                       # 符合條件的總行數
+    top_ips: List[tuple]             # [(ip, 次數, [(資源, 次數), ...]), ...]
+    top_resources: List[Tuple[str, int]]
+    status_counts: List[Tuple[int, int]]
+    sample_lines: List[str]          # 前 STRUCTURED_ROW_LIMIT 筆原始行
+    structured_body: List[dict]      # 與 sample_lines 對應的結構化資料
+    filtered_logs: Optional[List[str]] = None  # 全部符合的原始行，keep_lines=True 才會有
+    error_bounds: Optional[dict] = None        # 近似模式的誤差上限（見 ApproxScanResult.error_bounds）
@@ -0,0 +1,67 @@
+"""
+固定記憶體的近似計數（heavy hitters）。
+
+大量掃描器或 bot 來源時，不同 IP 的數量可能多達數十萬，精確的 Counter 會跟著變大。
+HeavyHitters 只保留有限個項目，仍能找出出現次數最多的項目並給出誤差上限。
+"""
+import heapq
+from typing import Hashable, List, Tuple
+
+
+class HeavyHitters:
+    """
+    Misra-Gries 計數摘要（批次遞減版本，與 Space-Saving 有相同的保證）。
+
+    最多保留 2 × capacity 個項目；超過時把所有計數減去第 capacity + 1 大的計數，
+    並移除歸零的項目，攤提後每次 add 只需 O(1)。
+    - 估計值只會少算：真實次數落在 [估計值, 估計值 + error] 之間
+    - error ≤ total / (capacity + 1)，出現次數超過此值的項目一定會被保留
+    兩個摘要可以 merge，誤差上限相加。
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts = {}
+        self.error = 0
+        self.total = 0
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __contains__(self, item: Hashable) -> bool:
+        return item in self.counts
+
+    def add(self, item: Hashable, n: int = 1) -> bool:
+        """加入一筆；回傳是否因超過容量而移除了項目"""
+        self.total += n
+        counts = self.counts
+        count = counts.get(item)
+        if count is not None:
+            counts[item] = count + n
+            return False
+        counts[item] = n
+        if len(counts) > 2 * self.capacity:
+            self._prune()
+            return True
+        return False
+
+    def merge(self, other: "HeavyHitters") -> bool:
+        """併入另一個摘要；回傳是否移除了項目"""
+        counts = self.counts
+        for item, count in other.counts.items():
+            counts[item] = counts.get(item, 0) + count
+        self.error += other.error
+        self.total += other.total
+        if len(counts) > 2 * self.capacity:
+            self._prune()
+            return True
+        return False
+
+    def most_common(self, n: int) -> List[Tuple[Hashable, int]]:
+        """估計次數最多的前 n 個（同分時依加入順序）"""
+        return heapq.nlargest(n, self.counts.items(), key=lambda item: item[1])
+
+    def _prune(self):
+        threshold = heapq.nlargest(self.capacity + 1, self.counts.values())[-1]
+        self.error += threshold
+        self.counts = {item: count - threshold for item, count in self.counts.items() if count > threshold}
@@ -0,0 +1,433 @@
+"""
+Access log 的欄位式快取（column store）。
+
+把 log 解析後存成 NumPy 陣列（時間、狀態碼、方法代碼、IP / 資源字典編號、
+原始行的 offset 與長度），以 memory-map 方式載入。查詢時用向量化遮罩過濾，
+只有要回傳的行才回頭讀原始文字。
+
+資料分成兩段：
+    base：已寫入 <log>.cols/ 並 memory-map 的欄位
+    delta：app.tools.log_ingest 追加進來、尚未寫入磁碟的新資料
+delta 累積到一定比例時合併成新的 base 版本（compact）。delta 寫在預先配置的緩衝區（DeltaBuffer），
+每次追加的成本只與新增的列數有關，不會把已有的資料重新串接一次。
+
+另外維護每分鐘 / 每小時的彙總表（app.tools.log_rollup），時間區間的統計摘要直接合併彙總表，
+只有區間頭尾不滿一分鐘的部分才看逐列資料。
+"""
+from contextlib import contextmanager
+import json
+import mmap
+import os
+import shutil
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+import numpy as np
+
+from app.tools.log_index import tmp_path_for
+from app.tools.log_rollup import (LogRollup, build_tables, group_counts, load_rollup, plan_buckets, row_spans,
+                                 save_rollup, top_counts)
+
+STORE_VERSION = 2
+STORE_SUFFIX = ".cols"
+LOCK_NAME = ".lock"
+
+# 欄位名稱與 dtype
+COLUMNS = {
+    "epoch": np.int64,
+    "status": np.int16,
+    "method": np.uint16,
+    "ip": np.int32,
+    "resource": np.int32,
+    "offset": np.int64,
+    "length": np.int32,
+}
+# 追加資料時用的 array typecode，與上方 dtype 對應
+ARRAY_TYPECODES = {
+    "epoch": "q",
+    "status": "h",
+    "method": "H",
+    "ip": "i",
+    "resource": "i",
+    "offset": "q",
+    "length": "i",
+}
+
+# delta 超過這個列數，且超過 base 的 COMPACT_RATIO 倍時合併寫入磁碟
+COMPACT_MIN_ROWS = 200_000
+COMPACT_RATIO = 0.25
+
+# delta 緩衝區第一次配置的列數，之後不足時加倍
+DELTA_MIN_CAPACITY = 4096
+
+
+class Dictionary:
+    """字串 ↔ 整數編號。只會往後追加，舊的快照看到的編號永遠有效"""
+
+    def __init__(self, values: List[str] = None):
+        self.values = list(values or [])
+        self._ids = {value: i for i, value in enumerate(self.values)}
+
+    def encode(self, value: str) -> int:
+        value_id = self._ids.get(value)
+        if value_id is None:
+            value_id = self._ids[value] = len(self.values)
+            self.values.append(value)
+        return value_id
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, value_id: int) -> str:
+        return self.values[value_id]
+
+
+class DeltaBuffer:
+    """
+    delta 欄位的追加緩衝區。各欄位預先配置容量，不足時加倍，
+    所以每次追加（攤提後）只複製新增的列。
+
+    快照拿到的是前 rows 列的 view；之後的追加寫在這些列後面，已發出的快照看不到也不受影響。
+    只有最新的快照可以直接在緩衝區後面追加（rows 相同），其他情況由呼叫端另外複製一份。
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        self.rows = len(columns["epoch"])
+        capacity = max(DELTA_MIN_CAPACITY, 2 * self.rows)
+        self.arrays = {name: np.empty(capacity, dtype=dtype) for name, dtype in COLUMNS.items()}
+        for name in COLUMNS:
+            self.arrays[name][:self.rows] = columns[name]
+
+    def append(self, columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """追加新的列，回傳包含全部列的 view"""
+        rows = self.rows + len(columns["epoch"])
+        capacity = len(self.arrays["epoch"])
+        if rows > capacity:
+            capacity = max(rows, 2 * capacity)
+            for name, old in self.arrays.items():
+                grown = np.empty(capacity, dtype=old.dtype)
+                grown[:self.rows] = old[:self.rows]
+                self.arrays[name] = grown
+        for name in COLUMNS:
+            self.arrays[name][self.rows:rows] = columns[name]
+        self.rows = rows
+        return {name: array[:rows] for name, array in self.arrays.items()}
+
+
+class LogColumnStore:
+    """
+    已解析 log 的欄位陣列與字典。
+    物件建立後不再修改，追加資料時產生新的 LogColumnStore，查詢中的執行緒不受影響。
+    """
+
+    def __init__(self, coverage: dict, base: Dict[str, np.ndarray], delta: Dict[str, np.ndarray],
+                 methods: Dictionary, ips: Dictionary, resources: Dictionary, generation: str = None,
+                 rollup: LogRollup = None, delta_buffer: DeltaBuffer = None, sorted_flags: List[bool] = None):
+        self.coverage = coverage
+        self.base = base
+        self.delta = delta
+        self.methods = methods
+        self.ips = ips
+        self.resources = resources
+        self.generation = generation
+        self.rollup = rollup if rollup is not None else LogRollup.from_columns(base)
+        self._delta_buffer = delta_buffer
+        self._segments = [(0, base), (len(base["epoch"]), delta)]
+        # base / delta 各自的時間是否遞增；追加時由上一個快照接續判斷，不必重新檢查整段
+        self._sorted = sorted_flags or [_is_sorted(base["epoch"]), _is_sorted(delta["epoch"])]
+
+    @classmethod
+    def empty(cls, coverage: dict) -> "LogColumnStore":
+        return cls(coverage, _empty_columns(), _empty_columns(), Dictionary(), Dictionary(), Dictionary(),
+                   rollup=LogRollup.empty())
+
+    def __len__(self):
+        return len(self.base["epoch"]) + len(self.delta["epoch"])
+
+    def extended(self, columns: Dict[str, np.ndarray], coverage: dict) -> "LogColumnStore":
+        """追加新資料（字典編號需已用本物件的字典編好），回傳新的快取；成本只與新增的列數有關"""
+        base_sorted, delta_sorted = self._sorted
+        if not len(columns["epoch"]):
+            return LogColumnStore(coverage, self.base, self.delta, self.methods, self.ips, self.resources,
+                                  self.generation, self.rollup, self._delta_buffer, [base_sorted, delta_sorted])
+
+        columns = {name: columns[name].astype(dtype, copy=False) for name, dtype in COLUMNS.items()}
+        previous = self.delta["epoch"]
+        epoch = columns["epoch"]
+        delta_sorted = (delta_sorted and _is_sorted(epoch)
+                        and (not len(previous) or bool(epoch[0] >= previous[-1])))
+
+        buffer = self._delta_buffer
+        if buffer is None or buffer.rows != len(previous):
+            # 還沒有緩衝區，或這個快照之後已經有人追加過：另外複製一份，不覆寫其他快照的資料
+            buffer = DeltaBuffer(self.delta)
+        delta = buffer.append(columns)
+
+        rows = np.arange(len(self), len(self) + len(epoch), dtype=np.int64)
+        rollup = self.rollup.extended(build_tables(columns, rows))
+        return LogColumnStore(coverage, self.base, delta, self.methods, self.ips, self.resources,
+                              self.generation, rollup, buffer, [base_sorted, delta_sorted])
+
+    def needs_compaction(self) -> bool:
+        delta_rows = len(self.delta["epoch"])
+        return delta_rows >= max(COMPACT_MIN_ROWS, COMPACT_RATIO * len(self.base["epoch"]))
+
+    def select(self, start_epoch: int, end_epoch: int, status_filter: Callable[[str], bool],
+               method_pattern=None, ip_pattern=None, ip_ids: np.ndarray = None,
+               limit: int = None) -> np.ndarray:
+        """
+        回傳符合條件的列編號（依檔案順序）。
+        正規表達式只對字典中的不同值各跑一次，再轉成查表遮罩。
+        ip_ids 限定只要這些 IP 編號；limit 只取前幾列。
+        """
+        method_mask = _lookup_mask(self.methods.values, method_pattern) if method_pattern else None
+        ip_mask = _lookup_mask(self.ips.values, ip_pattern) if ip_pattern else None
+
+        parts = []
+        for (row_start, columns), is_sorted in zip(self._segments, self._sorted):
+            epoch = columns["epoch"]
+            if is_sorted:
+                lo = int(np.searchsorted(epoch, start_epoch, side="left"))
+                hi = int(np.searchsorted(epoch, end_epoch, side="right"))
+                mask = np.ones(max(hi - lo, 0), dtype=bool)
+            else:
+                lo, hi = 0, len(epoch)
+                mask = (epoch >= start_epoch) & (epoch <= end_epoch)
+            if not mask.any():
+                continue
+
+            status = columns["status"][lo:hi]
+            allowed_status = [code for code in np.unique(status) if status_filter(str(int(code)))]
+            mask &= np.isin(status, allowed_status)
+
+            if method_mask is not None:
+                mask &= method_mask[columns["method"][lo:hi]]
+            if ip_mask is not None:
+                mask &= ip_mask[columns["ip"][lo:hi]]
+            if ip_ids is not None:
+                mask &= np.isin(columns["ip"][lo:hi], ip_ids)
+
+            parts.append(row_start + lo + np.flatnonzero(mask))
+            if limit is not None and sum(len(part) for part in parts) >= limit:
+                break
+
+        rows = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+        return rows[:limit] if limit is not None else rows
+
+    def take(self, name: str, rows: np.ndarray) -> np.ndarray:
+        """依列編號（遞增）取出欄位值，跨 base / delta 兩段"""
+        base_rows = len(self.base["epoch"])
+        split = int(np.searchsorted(rows, base_rows))
+        head = self.base[name][rows[:split]]
+        if split == len(rows):
+            return head
+        return np.concatenate([head, self.delta[name][rows[split:] - base_rows]])
+
+    def summary(self, rows: np.ndarray, top_n: int = 10, top_resources_per_ip: int = 5):
+        """
+        計算統計摘要：
+            top_ips: [(ip, 次數, [(資源, 次數), ...]), ...]
+            top_resources: [(資源, 次數), ...]
+            status_counts: [(狀態碼, 次數), ...]（依狀態碼排序）
+        """
+        ip_ids = self.take("ip", rows)
+        resource_ids = self.take("resource", rows)
+
+        top_ips = []
+        for ip_id, count in top_k(ip_ids, top_n):
+            ip_resources = top_k(resource_ids[ip_ids == ip_id], top_resources_per_ip)
+            top_ips.append((self.ips[ip_id], count, [(self.resources[r], c) for r, c in ip_resources]))
+
+        top_resources = [(self.resources[r], c) for r, c in top_k(resource_ids, top_n)]
+        return top_ips, top_resources, self.status_counts(rows)
+
+    def window_summary(self, start_epoch: int, end_epoch: int, status_filter: Callable[[str], bool],
+                       method_pattern=None, top_n: int = 10, top_resources_per_ip: int = 5):
+        """
+        以彙總表計算時間區間的統計摘要，回傳 (符合筆數, top_ips, top_resources, status_counts)，
+        格式與 summary 相同。完整的小時與分鐘合併彙總表，只有區間頭尾不滿一分鐘的部分
+        （以及前幾名 IP 在不滿一小時部分的資源）才看逐列資料。
+        """
+        method_mask = _lookup_mask(self.methods.values, method_pattern) if method_pattern else None
+        allowed_statuses = [code for code in self.rollup.statuses() if status_filter(str(int(code)))]
+
+        # 完整的小時 / 分鐘合併彙總表，頭尾不滿一分鐘的部分逐列整理成額外的彙總表
+        edges = plan_buckets(start_epoch, end_epoch)[1]
+        edge_rows = np.concatenate([self.select(lo, hi, status_filter, method_pattern)
+                                    for lo, hi in edges] or [np.empty(0, dtype=np.int64)])
+        edge_rows.sort()
+        extra = build_tables({name: self.take(name, edge_rows)
+                              for name in ("epoch", "status", "method", "ip", "resource")}, edge_rows)["minute"]
+        counts = self.rollup.window_counts(start_epoch, end_epoch, allowed_statuses, method_mask, extra)
+
+        total = int(counts["groups"]["count"].sum())
+        top_ips = []
+        ip_ranking = top_counts(counts["ips"], "ip", top_n)
+        if ip_ranking:
+            # 前幾名 IP 各自的熱門資源：完整小時用 IP × 資源彙總表，其餘部分逐列計算
+            ip_ids = np.array([ip_id for ip_id, _ in ip_ranking], dtype=np.int32)
+            span_rows = np.concatenate([self.select(lo, hi, status_filter, method_pattern, ip_ids=ip_ids)
+                                        for lo, hi in row_spans(start_epoch, end_epoch)]
+                                       or [np.empty(0, dtype=np.int64)])
+            span_pairs = group_counts({"ip": self.take("ip", span_rows), "resource": self.take("resource", span_rows)},
+                                      np.ones(len(span_rows), dtype=np.int64), span_rows)
+            pairs = self.rollup.ip_resource_counts(start_epoch, end_epoch, allowed_statuses, method_mask,
+                                                   ip_ids, span_pairs)
+            for ip_id, count in ip_ranking:
+                ip_pairs = {name: values[pairs["ip"] == ip_id] for name, values in pairs.items()}
+                ip_resources = top_counts(ip_pairs, "resource", top_resources_per_ip)
+                top_ips.append((self.ips[ip_id], count, [(self.resources[r], c) for r, c in ip_resources]))
+
+        top_resources = [(self.resources[r], c) for r, c in top_counts(counts["resources"], "resource", top_n)]
+        status_counts = sorted((int(code), int(count))
+                               for code, count in zip(counts["groups"]["status"], counts["groups"]["count"]))
+        return total, top_ips, top_resources, status_counts
+
+    def status_counts(self, rows: np.ndarray) -> List[Tuple[int, int]]:
+        codes, counts = np.unique(self.take("status", rows), return_counts=True)
+        return [(int(code), int(count)) for code, count in zip(codes, counts)]
+
+    def read_lines(self, log_path: str, rows: np.ndarray) -> List[str]:
+        """依列編號從原始 log 讀回文字行"""
+        if len(rows) == 0:
+            return []
+        offsets = self.take("offset", rows)
+        lengths = self.take("length", rows)
+        with open(log_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return [mm[o:o + n].decode("utf-8", errors="replace")
+                    for o, n in zip(offsets.tolist(), lengths.tolist())]
+
+
+def top_k(ids: np.ndarray, k: int) -> List[Tuple[int, int]]:
+    """
+    依出現次數取前 k 名；次數相同時依第一次出現的順序，
+    與 Counter.most_common 的排序一致。
+    """
+    if len(ids) == 0:
+        return []
+    values, first_seen, counts = np.unique(ids, return_index=True, return_counts=True)
+    order = np.lexsort((first_seen, -counts))[:k]
+    return [(int(values[i]), int(counts[i])) for i in order]
+
+
+def _lookup_mask(values: List[str], pattern) -> np.ndarray:
+    # 先複製一份，字典在背景追加時不影響這次查詢
+    return np.fromiter((bool(pattern.match(v)) for v in list(values)), dtype=bool)
+
+
+def _is_sorted(epoch: np.ndarray) -> bool:
+    return bool(np.all(epoch[1:] >= epoch[:-1]))
+
+
+def _empty_columns() -> Dict[str, np.ndarray]:
+    return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+
+
+def store_dir_for(log_path: str) -> str:
+    return log_path + STORE_SUFFIX
+
+
+def compact_store(log_path: str, store: LogColumnStore) -> LogColumnStore:
+    """
+    把 base + delta 寫成新的版本目錄並以 memory-map 載入。
+
+    多個 worker 可能同時整理同一份 log：版本先寫在各自的暫存目錄，完成後才 rename 成
+    {inode}-{offset}；已發佈的版本目錄不會再被寫入（其他行程可能正 memory-map 著），
+    同一個版本已經由別人發佈時直接丟掉自己的暫存目錄。
+    發佈版本、更新 meta 與清除舊版本在目錄鎖內進行，避免刪掉別人剛發佈、尚未寫入 meta 的版本。
+    """
+    coverage = store.coverage
+    generation = f"{coverage['inode']}-{coverage['offset']}"
+    directory = store_dir_for(log_path)
+    os.makedirs(directory, exist_ok=True)
+    generation_dir = os.path.join(directory, generation)
+
+    staging_dir = tmp_path_for(os.path.join(directory, generation))
+    try:
+        os.makedirs(staging_dir)
+        for name, dtype in COLUMNS.items():
+            np.save(os.path.join(staging_dir, f"{name}.npy"),
+                    np.concatenate([store.base[name], store.delta[name]]).astype(dtype, copy=False))
+        save_rollup(staging_dir, store.rollup)
+    except OSError:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    meta = {
+        "version": STORE_VERSION,
+        "coverage": coverage,
+        "generation": generation,
+        "rows": len(store),
+        "methods": list(store.methods.values),
+        "ips": list(store.ips.values),
+        "resources": list(store.resources.values),
+    }
+    with _store_lock(directory):
+        try:
+            os.rename(staging_dir, generation_dir)
+        except OSError:
+            if not os.path.isdir(generation_dir):
+                shutil.rmtree(staging_dir, ignore_errors=True)
+                raise
+            # 同一個版本（相同的 inode 與 offset，內容相同）已經由其他行程發佈
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+        # meta 最後寫入，作為整個版本完成的標記
+        tmp_path = tmp_path_for(os.path.join(directory, "meta.json"))
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(directory, "meta.json"))
+
+        # 清掉舊版本（已 memory-map 的檔案在 POSIX 上刪除後仍可讀）；
+        # 其他行程還在寫的暫存目錄不動
+        for name in os.listdir(directory):
+            old_dir = os.path.join(directory, name)
+            if name != generation and not name.endswith(".tmp") and os.path.isdir(old_dir):
+                shutil.rmtree(old_dir, ignore_errors=True)
+
+    return _load_generation(directory, meta, store.methods, store.ips, store.resources)
+
+
+@contextmanager
+def _store_lock(directory: str):
+    """欄位快取目錄的跨行程鎖；沒有 fcntl 的平台只靠暫存目錄 + rename"""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(directory, LOCK_NAME), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _load_generation(directory: str, meta: dict, methods: Dictionary, ips: Dictionary,
+                     resources: Dictionary) -> LogColumnStore:
+    generation_dir = os.path.join(directory, meta["generation"])
+    # 空陣列無法 memory-map，直接讀入
+    mmap_mode = "r" if meta["rows"] else None
+    base = {name: np.load(os.path.join(generation_dir, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in COLUMNS}
+    # 較舊的版本沒有彙總表時由欄位重新計算
+    rollup = load_rollup(generation_dir)
+    return LogColumnStore(meta["coverage"], base, _empty_columns(), methods, ips, resources,
+                          meta["generation"], rollup)
+
+
+def load_store(log_path: str) -> Optional[LogColumnStore]:
+    """讀取已寫入磁碟的欄位快取；是否仍對應目前的檔案由呼叫端檢查 coverage"""
+    directory = store_dir_for(log_path)
+    try:
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != STORE_VERSION:
+            return None
+        return _load_generation(directory, meta, Dictionary(meta["methods"]), Dictionary(meta["ips"]),
+                                Dictionary(meta["resources"]))
+    except (OSError, ValueError, KeyError):
+        return None
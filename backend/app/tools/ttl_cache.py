@@ -0,0 +1,98 @@
+"""
+有容量上限（LRU）與存活時間（TTL）的記憶體快取，附命中統計，可多執行緒共用。
+"""
+from collections import OrderedDict
+import threading
+import time
+from typing import Any, Callable, Hashable, Optional
+
+# 區分「沒有快取」與「快取的值剛好是 None」
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    超過 max_size 時淘汰最久沒用到的項目；超過 ttl 秒的項目視為過期。
+    有 weigh（值 → 權重，例如佔用的行數）時另外限制權重合計不超過 max_weight，
+    超過時同樣從最久沒用到的項目開始淘汰；單一項目的權重超過 max_weight 時不快取。
+    """
+
+    def __init__(self, max_size: int = 128, ttl: float = 300, clock: Callable[[], float] = time.monotonic,
+                 max_weight: float = None, weigh: Callable[[Any], float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_weight = max_weight
+        self._weigh = weigh
+        self._clock = clock
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = self._clock()
+        with self._lock:
+            entry = self._items.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value, weight = entry
+            if expires_at <= now:
+                del self._items[key]
+                self.weight -= weight
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+        weight = self._weigh(value) if self._weigh is not None else 0
+        with self._lock:
+            self._pop(key)
+            if self.max_weight is not None and weight > self.max_weight:
+                return
+            self._items[key] = (expires_at, value, weight)
+            self.weight += weight
+            while len(self._items) > self.max_size or (self.max_weight is not None and self.weight > self.max_weight):
+                _, (_, _, evicted_weight) = self._items.popitem(last=False)
+                self.weight -= evicted_weight
+                self.evictions += 1
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.weight = 0
+
+    def _pop(self, key: Hashable):
+        entry = self._items.pop(key, None)
+        if entry is not None:
+            self.weight -= entry[2]
+
+    def __len__(self):
+        return len(self._items)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._items),
+                "max_size": self.max_size,
+                "weight": self.weight,
+                "max_weight": self.max_weight,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -0,0 +1,96 @@
+"""
+比較精確計數（ScanResult）與近似計數（ApproxScanResult）的記憶體、速度與準確度。
+近似計數只用於逐行掃描原始 log 的路徑；LogQueryEngine.query 在兩種路徑的行為見 tests/test_log_engine.py。
+
+模擬掃描器 / bot 洪水：少數熱門來源依冪次分布，其餘請求來自大量只出現一兩次的 IP。
+檢查項目：
+- 前 10 名 IP / 資源與精確結果的重疊率
+- 估計值的實際誤差是否都在回報的誤差上限內
+- 計數結構的記憶體峰值（tracemalloc）
+
+在 backend 目錄執行：
+    python -m benchmarks.bench_approx_summary --records 1000000 --flood-ips 300000
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from app.tools.log_parser import LogRecord
+from app.tools.log_scan import ApproxScanResult, ScanResult
+
+
+def generate_records(records: int, flood_ips: int, seed: int = 0):
+    rng = random.Random(seed)
+    hot_ips = [f"198.51.100.{i}" for i in range(1, 200)]
+    resources = [f"/api/v1/items/{i}" for i in range(3000)]
+    for i in range(records):
+        if rng.random() < 0.4:
+            # 洪水流量：大量不同 IP，各打隨機路徑
+            n = rng.randrange(flood_ips)
+            ip = f"10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}"
+        else:
+            ip = hot_ips[min(int(rng.paretovariate(1.1)) - 1, len(hot_ips) - 1)]
+        resource = resources[min(int(rng.paretovariate(1.05)) - 1, len(resources) - 1)]
+        yield "", LogRecord("14/Jul/2025:00:00:00", 0, "GET", resource, 404, ip)
+
+
+def measure(result, records):
+    tracemalloc.start()
+    started = time.perf_counter()
+    for line, record in records:
+        result.add(line, record)
+    seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--records", type=int, default=1_000_000)
+    arg_parser.add_argument("--flood-ips", type=int, default=300_000)
+    arg_parser.add_argument("--capacity", type=int, default=1000)
+    args = arg_parser.parse_args()
+
+    records = list(generate_records(args.records, args.flood_ips))
+
+    exact = ScanResult(sample_limit=0)
+    approx = ApproxScanResult(sample_limit=0, capacity=args.capacity)
+    exact_seconds, exact_peak = measure(exact, records)
+    approx_seconds, approx_peak = measure(approx, records)
+
+    exact_ips, exact_resources, _ = exact.summary()
+    approx_ips, approx_resources, _ = approx.summary()
+    bounds = approx.error_bounds()
+
+    print(f"不同 IP 數：{len(exact.ip_counter)}，近似模式追蹤：{len(approx.ip_counter)}")
+    print(f"精確  {exact_seconds:7.2f}s  記憶體峰值 {exact_peak / (1 << 20):8.1f} MiB")
+    print(f"近似  {approx_seconds:7.2f}s  記憶體峰值 {approx_peak / (1 << 20):8.1f} MiB")
+
+    top_ip_overlap = len({ip for ip, _, _ in exact_ips} & {ip for ip, _, _ in approx_ips})
+    top_resource_overlap = len({r for r, _ in exact_resources} & {r for r, _ in approx_resources})
+    print(f"前 10 名 IP 重疊 {top_ip_overlap}/10，前 10 名資源重疊 {top_resource_overlap}/10")
+    print(f"回報的誤差上限：{bounds}")
+
+    # 每個估計值都必須落在 [真實值 - 上限, 真實值]
+    max_ip_error = 0
+    max_ip_resource_error = 0
+    for ip, estimate, ip_resources in approx_ips:
+        error = exact.ip_counter[ip] - estimate
+        assert 0 <= error <= bounds["ip"], f"IP {ip} 誤差 {error} 超出上限"
+        max_ip_error = max(max_ip_error, error)
+        for resource, resource_estimate in ip_resources:
+            error = exact.ip_to_resources[ip][resource] - resource_estimate
+            assert 0 <= error <= bounds["ip_resource"], f"IP {ip} 的資源 {resource} 誤差 {error} 超出上限"
+            max_ip_resource_error = max(max_ip_resource_error, error)
+    max_resource_error = 0
+    for resource, estimate in approx_resources:
+        error = exact.resource_counter[resource] - estimate
+        assert 0 <= error <= bounds["resource"], f"資源 {resource} 誤差 {error} 超出上限"
+        max_resource_error = max(max_resource_error, error)
+    print(f"實際最大誤差：ip={max_ip_error} resource={max_resource_error} ip_resource={max_ip_resource_error}")
+
+
+if __name__ == "__main__":
+    main()
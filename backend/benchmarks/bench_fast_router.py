@@ -0,0 +1,132 @@
+"""
+規則式判斷（fast_plan）在記錄的問題集上的涵蓋率、與 LLM 判斷的一致率與耗時。
+
+問題集 benchmarks/data/router_queries.jsonl 每行包含 question、recorded_on（相對日期以這天為準）
+與參考判斷 plan。附帶的參考判斷是人工標註（source=manual）；設定好 GOOGLE_API_KEY 後用 --record
+以 turn_planner 重新記錄，即可比較規則與實際 LLM 的一致率。
+
+比較方式：
+- 狀態碼 / HTTP 方法 / 來源 IP 以正規表達式實際比對的結果比較，寫法不同但意思相同視為一致
+- 時間範圍、是否查 IP 資訊、回應類型直接比較
+
+在 backend 目錄執行：
+    python -m benchmarks.bench_fast_router
+    python -m benchmarks.bench_fast_router --record
+"""
+import argparse
+from collections import Counter
+from datetime import date
+import json
+import os
+import re
+import time
+
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+
+from app.dspy_modules import fast_plan, get_module, parse_turn_plan
+from app.dspy_modules.fast_router import IP_PATTERN
+
+QUERY_SET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "router_queries.jsonl")
+
+_STATUS_PROBES = [str(code) for code in range(100, 600)]
+_METHOD_PROBES = ["GET", "POST", "PUT", "DELETE", "PATCH", "HEAD", "OPTIONS"]
+_FIELDS = ["intent", "status_code", "http_method", "source_ip", "time_range", "use_ip_info", "response_style"]
+
+
+def load_queries(path: str) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def record(path: str, queries: list):
+    """用目前設定的 LLM 重新產生參考判斷"""
+    planner = get_module("turn_planner")
+    for query in queries:
+        try:
+            query["plan"] = parse_turn_plan(planner(question=query["question"]))
+            query["source"] = planner.lm.model if planner.lm else "default"
+        except Exception as e:
+            print(f"無法記錄「{query['question']}」：{e}")
+        query["recorded_on"] = date.today().isoformat()
+    with open(path, "w", encoding="utf-8") as f:
+        for query in queries:
+            f.write(json.dumps(query, ensure_ascii=False) + "\n")
+
+
+def matches(pattern: str, probes: list) -> frozenset:
+    """正規表達式在 probes 上比對到的集合；空字串代表不限制"""
+    if not pattern:
+        return frozenset(probes)
+    try:
+        compiled = re.compile(pattern)
+    except re.error:
+        return frozenset()
+    return frozenset(p for p in probes if compiled.match(p))
+
+
+def compare(question: str, rule: dict, reference: dict) -> dict:
+    """逐欄位比較，回傳 {欄位: 是否一致}"""
+    result = {"intent": rule["intent"] == reference["intent"]}
+    if reference["intent"] != "web_log" or rule["intent"] != "web_log":
+        return result
+
+    ip_probes = IP_PATTERN.findall(question) + ["192.0.2.1"]
+    result["status_code"] = matches(rule["status_code"], _STATUS_PROBES) == matches(reference["status_code"], _STATUS_PROBES)
+    result["http_method"] = (matches(rule["http_method"], _METHOD_PROBES)
+                             == matches(reference["http_method"].upper(), _METHOD_PROBES))
+    result["source_ip"] = matches(rule["source_ip"], ip_probes) == matches(reference["source_ip"], ip_probes)
+    result["time_range"] = (rule["start_time"], rule["end_time"]) == (reference["start_time"], reference["end_time"])
+    result["use_ip_info"] = rule["use_ip_info"] == reference["use_ip_info"]
+    result["response_style"] = rule["response_style"] == reference["response_style"]
+    return result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--queries", default=QUERY_SET)
+    arg_parser.add_argument("--record", action="store_true", help="以目前設定的 LLM 重新記錄參考判斷")
+    arg_parser.add_argument("--repeat", type=int, default=1000)
+    args = arg_parser.parse_args()
+
+    queries = load_queries(args.queries)
+    if args.record:
+        record(args.queries, queries)
+
+    covered = 0
+    agreement = Counter()
+    compared = Counter()
+    disagreements = []
+    for query in queries:
+        today = date.fromisoformat(query["recorded_on"])
+        rule = fast_plan(query["question"], today)
+        if rule is None:
+            continue
+        covered += 1
+        fields = compare(query["question"], rule, query["plan"])
+        for field, same in fields.items():
+            compared[field] += 1
+            agreement[field] += same
+        if not all(fields.values()):
+            disagreements.append((query["question"], [f for f, same in fields.items() if not same]))
+
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        for query in queries:
+            fast_plan(query["question"])
+    per_query = (time.perf_counter() - started) / (args.repeat * len(queries))
+
+    sources = Counter(query.get("source", "manual") for query in queries)
+    print(f"問題數 {len(queries)}（參考判斷來源：{dict(sources)}）")
+    print(f"規則涵蓋 {covered}/{len(queries)} = {covered / len(queries):.0%}")
+    for field in _FIELDS:
+        if compared[field]:
+            print(f"  {field:<15} 一致 {agreement[field]}/{compared[field]}")
+    fully = covered - len(disagreements)
+    print(f"全部欄位一致 {fully}/{covered}")
+    for question, fields in disagreements:
+        print(f"  不一致：{question} -> {fields}")
+    print(f"平均每則 {per_query * 1e6:.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
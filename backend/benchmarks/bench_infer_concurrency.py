@@ -0,0 +1,78 @@
+"""
+/api/infer 的併發負載測試：同時有 N 個 session 各自連續發問，量測每秒完成的請求數。
+
+LLM 改為本機的模擬 OpenAI 相容服務（固定延遲後回傳），呼叫仍經過 DSPy / LiteLLM 的真實 HTTP 路徑；
+log 查詢使用合成 log。若有任何節點阻塞 event loop，吞吐量不會隨 session 數增加
+（同時進來的請求是否重疊執行的檢查在 tests/test_infer_concurrency.py）。
+
+在 backend 目錄執行：
+    python -m benchmarks.bench_infer_concurrency --sessions 1 4 16 32 --latency 0.2
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+# 需在 app 之前匯入，先設定好 LiteLLM 的環境變數
+from benchmarks.simulated_llm import configure_simulated_llm
+
+from benchmarks.synthetic_log import SYNTHETIC_DAY, write_synthetic_log
+
+# 預測快取只用記憶體，不寫入 app/data；「今天」的查詢固定查合成 log 的日期
+os.environ.setdefault("DSPY_CACHE_DB", "")
+os.environ.setdefault("LOG_QUERY_FIXED_DATE", SYNTHETIC_DAY)
+import httpx
+
+from app.main import app
+from app.tools import log_tools
+
+
+async def run_session(client, session_id: str, turns: int, latencies: list):
+    for turn in range(turns):
+        started = time.perf_counter()
+        response = await client.post("/api/infer", json={"input": f"{session_id} 今天 4xx 的請求 #{turn}", "session_id": session_id})
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+
+
+async def run_level(sessions: int, turns: int):
+    latencies = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(run_session(client, f"bench-{sessions}-{i}", turns, latencies)
+                               for i in range(sessions)))
+        seconds = time.perf_counter() - started
+    latencies.sort()
+    return len(latencies) / seconds, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95)]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 16, 32])
+    arg_parser.add_argument("--turns", type=int, default=3)
+    arg_parser.add_argument("--latency", type=float, default=0.2, help="模擬 LLM 每次呼叫的延遲秒數")
+    arg_parser.add_argument("--lines", type=int, default=200_000)
+    args = arg_parser.parse_args()
+
+    configure_simulated_llm(args.latency)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "access.log")
+        write_synthetic_log(path, args.lines)
+        log_tools.LOG_PATH = path
+
+        # 先跑一次，讓索引 / 欄位快取建立完成，不計入結果
+        asyncio.run(run_level(1, 1))
+
+        baseline = None
+        print(f"{'sessions':>8} {'req/s':>8} {'p50':>8} {'p95':>8} {'scale':>7}")
+        for sessions in args.sessions:
+            throughput, p50, p95 = asyncio.run(run_level(sessions, args.turns))
+            baseline = baseline or throughput / sessions
+            print(f"{sessions:>8} {throughput:8.2f} {p50:7.2f}s {p95:7.2f}s {throughput / baseline:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
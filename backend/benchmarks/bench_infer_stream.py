@@ -0,0 +1,110 @@
+"""
+比較 /api/infer 與 /api/infer/stream 在不同回答長度下的等待時間：
+- /api/infer：整個回應完成才收到第一個 byte
+- /api/infer/stream：tool_detail、stats、第一個 token 與 final 各自的到達時間
+
+LLM 使用模擬服務（固定首 token 延遲 + 每個 token 的產生時間），伺服器以 uvicorn 實際啟動，
+確認 SSE 事件是逐步送出而不是整包回傳。同時檢查串流的 token 串起來與 final 的回答相同。
+
+在 backend 目錄執行：
+    python -m benchmarks.bench_infer_stream --answer-tokens 20 200 800
+"""
+import argparse
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+
+# 需在 app 之前匯入，先設定好 LiteLLM 的環境變數
+from benchmarks.simulated_llm import configure_simulated_llm
+
+from benchmarks.synthetic_log import SYNTHETIC_DAY, write_synthetic_log
+
+# 預測快取只用記憶體，不寫入 app/data；「今天」的查詢固定查合成 log 的日期
+os.environ.setdefault("DSPY_CACHE_DB", "")
+os.environ.setdefault("LOG_QUERY_FIXED_DATE", SYNTHETIC_DAY)
+import httpx
+import uvicorn
+
+from app.main import app
+from app.tools import log_tools
+
+
+def start_server() -> str:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+def request_once(base_url: str, session_id: str) -> float:
+    started = time.perf_counter()
+    response = httpx.post(f"{base_url}/api/infer", json={"input": f"{session_id} 今天 4xx 的請求", "session_id": session_id},
+                          timeout=120)
+    response.raise_for_status()
+    return time.perf_counter() - started
+
+
+def stream_once(base_url: str, session_id: str):
+    """回傳 (各事件第一次到達的秒數, token 串起來的文字, final 資料)"""
+    arrivals = {}
+    tokens = []
+    final = None
+    started = time.perf_counter()
+    with httpx.stream("POST", f"{base_url}/api/infer/stream",
+                      json={"input": f"{session_id} 今天 4xx 的請求", "session_id": session_id}, timeout=120) as response:
+        response.raise_for_status()
+        event = None
+        for line in response.iter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+                arrivals.setdefault(event, time.perf_counter() - started)
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+                if event == "token":
+                    tokens.append(data)
+                elif event == "final":
+                    final = data
+                elif event == "error":
+                    raise RuntimeError(data)
+    return arrivals, "".join(tokens), final
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--answer-tokens", type=int, nargs="+", default=[20, 200, 800])
+    arg_parser.add_argument("--latency", type=float, default=0.2, help="模擬 LLM 第一個 token 的延遲秒數")
+    arg_parser.add_argument("--token-delay", type=float, default=0.005, help="模擬 LLM 每個 token 的產生秒數")
+    arg_parser.add_argument("--lines", type=int, default=100_000)
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "access.log")
+        write_synthetic_log(path, args.lines)
+        log_tools.LOG_PATH = path
+        base_url = start_server()
+
+        print(f"{'tokens':>7} {'infer':>8} {'detail':>8} {'stats':>8} {'1st tok':>8} {'final':>8}")
+        for answer_tokens in args.answer_tokens:
+            configure_simulated_llm(args.latency, answer_tokens, args.token_delay)
+            # 先跑一次，讓索引 / 欄位快取與查詢快取建立完成
+            request_once(base_url, f"warm-{answer_tokens}")
+
+            infer_seconds = request_once(base_url, f"infer-{answer_tokens}")
+            arrivals, streamed, final = stream_once(base_url, f"stream-{answer_tokens}")
+            assert final is not None, "沒有收到 final 事件"
+            assert streamed == final["message"]["content"], "串流的 token 與 final 的回答不一致"
+            assert list(arrivals)[:2] == ["tool_detail", "stats"], f"事件順序錯誤：{list(arrivals)}"
+
+            print(f"{answer_tokens:>7} {infer_seconds:7.2f}s {arrivals['tool_detail']:7.2f}s "
+                  f"{arrivals['stats']:7.2f}s {arrivals['token']:7.2f}s {arrivals['final']:7.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+多 worker 的 /api/infer 吞吐量測試，並檢查對話在 worker 之間是否延續。
+
+以 uvicorn --workers N 啟動服務（真實的多行程），LLM 指向本機的模擬服務（DSPY_LM_API_BASE），
+log 使用合成資料（LOG_PATH）。每個 session 連續問 --turns 輪，請求由不同 worker 處理：
+- CHECKPOINT_BACKEND=memory：每個 worker 各有自己的記憶體，多 worker 時對話紀錄會斷掉
+- CHECKPOINT_BACKEND=sqlite：所有 worker 共用同一個 SQLite 檔，每個 session 的紀錄都完整
+
+sqlite 結束後直接讀 checkpoint 資料庫，統計紀錄不完整（少於 turns 輪）的 session 數。
+
+在 backend 目錄執行：
+    python -m benchmarks.bench_infer_workers --workers 1 2 4 --sessions 32 --turns 3
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.simulated_llm import start_simulated_llm
+from benchmarks.synthetic_log import SYNTHETIC_DAY, write_synthetic_log
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(backend: str, workers: int, env: dict, db_path: str) -> tuple:
+    port = free_port()
+    env = dict(env, CHECKPOINT_BACKEND=backend, CHECKPOINT_DB=db_path)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            if httpx.options(f"{base_url}/api/infer").status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("服務啟動逾時")
+
+
+async def run_sessions(base_url: str, sessions: int, turns: int, tag: str) -> tuple:
+    latencies = []
+    session_ids = [f"{tag}-{i}" for i in range(sessions)]
+
+    async def session(client, session_id):
+        for turn in range(turns):
+            started = time.perf_counter()
+            response = await client.post("/api/infer", json={"input": f"{session_id} 今天 4xx 的請求 #{turn}",
+                                                              "session_id": session_id})
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    # 不共用連線，請求平均分配到各個 worker
+    limits = httpx.Limits(max_keepalive_connections=0)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(session(client, session_id) for session_id in session_ids))
+        seconds = time.perf_counter() - started
+    latencies.sort()
+    return sessions * turns / seconds, latencies[len(latencies) // 2], session_ids
+
+
+def count_broken_sessions(db_path: str, session_ids: list, turns: int) -> int:
+    """檢查每個 session 的 checkpoint 是否有完整的 turns 輪（使用者 + 助理各一則）"""
+    from app.checkpointer import SQLiteSaver
+    saver = SQLiteSaver(db_path)
+    broken = 0
+    for session_id in session_ids:
+        saved = saver.get_tuple({"configurable": {"thread_id": session_id}})
+        messages = saved.checkpoint["channel_values"]["messages"] if saved else []
+        if len(messages) != 2 * turns:
+            broken += 1
+    return broken
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    arg_parser.add_argument("--sessions", type=int, default=32)
+    arg_parser.add_argument("--turns", type=int, default=3)
+    arg_parser.add_argument("--latency", type=float, default=0.1, help="模擬 LLM 每次呼叫的延遲秒數")
+    arg_parser.add_argument("--lines", type=int, default=100_000)
+    args = arg_parser.parse_args()
+
+    api_base = start_simulated_llm(args.latency)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_path = os.path.join(tmp_dir, "access.log")
+        write_synthetic_log(log_path, args.lines)
+        env = dict(os.environ, PYTHONPATH=os.getcwd(), LOG_PATH=log_path, DSPY_CACHE_DB="",
+                   LOG_QUERY_FIXED_DATE=SYNTHETIC_DAY,
+                   DSPY_LM_MODEL="openai/sim", DSPY_LM_API_BASE=api_base, DSPY_LM_API_KEY="sim",
+                   SESSION_MESSAGE_WINDOW=str(max(20, 2 * args.turns)))
+
+        print(f"CPU 核心數 {os.cpu_count()}")
+        print(f"{'backend':>8} {'workers':>8} {'req/s':>8} {'p50':>8} {'紀錄不完整':>10}")
+        for backend in ("memory", "sqlite"):
+            for workers in args.workers:
+                db_path = os.path.join(tmp_dir, f"checkpoints-{backend}-{workers}.sqlite")
+                process, base_url = start_server(backend, workers, env, db_path)
+                try:
+                    # 先跑一輪讓各 worker 建立索引與連線，不計入結果
+                    asyncio.run(run_sessions(base_url, workers * 2, 1, f"warmup-{backend}-{workers}"))
+                    throughput, p50, session_ids = asyncio.run(
+                        run_sessions(base_url, args.sessions, args.turns, f"{backend}-{workers}"))
+                finally:
+                    process.terminate()
+                    process.wait()
+                broken = count_broken_sessions(db_path, session_ids, args.turns) if backend == "sqlite" else "-"
+                print(f"{backend:>8} {workers:>8} {throughput:8.2f} {p50:7.2f}s {broken:>10}")
+
+
+if __name__ == "__main__":
+    main()
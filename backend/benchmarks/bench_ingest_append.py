@@ -0,0 +1,65 @@
+"""
+log 持續追加時每次增量匯入（LogIngestor.refresh）的耗時：
+delta 寫在預先配置的緩衝區，每次更新的成本應該只與新增的行數有關，
+不會隨著已匯入的資料（delta 的大小）增加而變慢。
+
+先匯入 --lines 行並寫入磁碟（base），之後每次追加 --append 行再更新，
+比較前幾次與最後幾次更新的耗時。delta 的總列數維持在合併寫入磁碟（compact）的門檻以下。
+
+在 backend 目錄執行：
+    python -m benchmarks.bench_ingest_append --lines 1000000 --append 500 --rounds 300
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from app.tools.log_ingest import LogIngestor
+from app.tools.log_store import COMPACT_MIN_ROWS, COMPACT_RATIO
+from benchmarks.synthetic_log import write_synthetic_log
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--lines", type=int, default=1_000_000)
+    arg_parser.add_argument("--append", type=int, default=500)
+    arg_parser.add_argument("--rounds", type=int, default=300)
+    args = arg_parser.parse_args()
+
+    compact_rows = max(COMPACT_MIN_ROWS, COMPACT_RATIO * args.lines)
+    rounds = min(args.rounds, int(compact_rows // args.append) - 1)
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        log_path = os.path.join(log_dir, "access.log")
+        tail_path = os.path.join(log_dir, "tail.log")
+        write_synthetic_log(log_path, args.lines)
+        # 追加的資料接在原本一天之後
+        write_synthetic_log(tail_path, args.append * rounds, start="15/Jul/2025:00:00:00", seed=1)
+        with open(tail_path, "rb") as f:
+            tail = f.read().splitlines(keepends=True)
+
+        ingestor = LogIngestor(log_path, build_store=True)
+        started = time.perf_counter()
+        ingestor.refresh()
+        print(f"第一次匯入 {args.lines} 行：{time.perf_counter() - started:.2f} s")
+
+        seconds = []
+        for i in range(rounds):
+            with open(log_path, "ab") as f:
+                f.writelines(tail[i * args.append:(i + 1) * args.append])
+            started = time.perf_counter()
+            added = ingestor.refresh()
+            seconds.append(time.perf_counter() - started)
+            assert added == args.append, (i, added)
+
+        store = ingestor.store
+        window = max(1, rounds // 10)
+        print(f"追加 {rounds} 次、每次 {args.append} 行（delta 最後 {len(store.delta['epoch'])} 列，"
+              f"base {len(store.base['epoch'])} 列）")
+        print(f"  前 {window} 次更新中位數 {statistics.median(seconds[:window]) * 1e3:6.2f} ms  "
+              f"最後 {window} 次 {statistics.median(seconds[-window:]) * 1e3:6.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
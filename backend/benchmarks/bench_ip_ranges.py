@@ -0,0 +1,163 @@
+"""
+離線 IP 範圍資料庫：以合成的 ip2asn 格式資料（IPv4 + IPv6）量測
+- 載入時間與 RSS 增加量
+- 單一 IP 與批次（tool_detail 100 列）的查詢耗時，並與產生資料時的答案比對
+- 有重疊 / 巢狀 CIDR 時以較小的範圍為準
+- 統計摘要與 tool_detail 的標註（合成 log，不需要網路）
+
+在 backend 目錄執行：
+    python -m benchmarks.bench_ip_ranges --ranges 500000
+"""
+import argparse
+from bisect import bisect_right
+import gc
+import ipaddress
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.synthetic_log import write_synthetic_log
+from app.session_store import current_rss_bytes
+from app.tools import ip_ranges, log_tools
+from app.tools.ip_ranges import IPRangeDB
+
+V6_BASE = 0x2001 << 112
+
+
+def write_ip_ranges(path: str, ranges: int, v6_ranges: int, seed: int = 0) -> list:
+    """
+    寫出 ip2asn 格式（range_start, range_end, asn, country, org），約 1/10 的範圍是未宣告路由（ASN 0）。
+    回傳 [(版本, 起點, 終點, 資訊或 None)]，用來驗證查詢結果。
+    """
+    rng = random.Random(seed)
+    countries = ["TW", "JP", "US", "DE", "SG", "KR", "NL", "GB"]
+    # 實際的 ip2asn 約 50 萬個範圍、7 萬多個 ASN，每個 ASN 固定一個國家與名稱
+    networks = [{"country": rng.choice(countries), "asn": f"AS{asn}", "org": f"Network {asn}"}
+                for asn in rng.sample(range(1, 400000), 75000)]
+    truth = []
+
+    def add(version, start, end):
+        truth.append((version, start, end, None if rng.random() < 0.1 else rng.choice(networks)))
+
+    bounds = sorted(rng.sample(range(1 << 24, 224 << 24), ranges - 1))
+    for start, end in zip([1 << 24] + bounds, bounds + [224 << 24]):
+        add(4, start, end - 1)
+    for i in range(v6_ranges):
+        add(6, V6_BASE + (i << 80), V6_BASE + ((i + 1) << 80) - 1)
+
+    with open(path, "w", encoding="utf-8") as f:
+        for version, start, end, info in truth:
+            first, last = ipaddress.ip_address(start), ipaddress.ip_address(end)
+            if info is None:
+                f.write(f"{first}\t{last}\t0\tNone\tNot routed\n")
+            else:
+                f.write(f"{first}\t{last}\t{info['asn'][2:]}\t{info['country']}\t{info['org']}\n")
+    return truth
+
+
+def expected(truth_index: dict, ip: str):
+    address = ipaddress.ip_address(ip)
+    starts, entries = truth_index[address.version]
+    i = bisect_right(starts, int(address)) - 1
+    if i < 0 or int(address) > entries[i][2]:
+        return None
+    return entries[i][3]
+
+
+def check_nested(db_dir: str):
+    """有標題列的 CIDR 資料，巢狀的範圍以較小的為準"""
+    path = os.path.join(db_dir, "nested.csv")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("network,autonomous_system_number,autonomous_system_organization,country\n")
+        f.write("45.0.0.0/8,100,Outer,US\n45.10.0.0/16,200,Inner,TW\n45.10.5.0/24,300,Innermost,JP\n")
+        f.write("2400:cb00::/32,13335,Cloudflare,US\n")
+    db = IPRangeDB.load(path)
+    assert db.lookup("45.1.2.3")["org"] == "Outer"
+    assert db.lookup("45.10.2.3")["org"] == "Inner"
+    assert db.lookup("45.10.5.3") == {"country": "JP", "asn": "AS300", "org": "Innermost"}
+    assert db.lookup("45.11.0.1")["org"] == "Outer"
+    assert db.lookup("2400:cb00::1")["asn"] == "AS13335"
+    assert db.lookup("46.0.0.1") is None and db.lookup("not-an-ip") is None
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--ranges", type=int, default=500_000)
+    arg_parser.add_argument("--v6-ranges", type=int, default=100_000)
+    arg_parser.add_argument("--lookups", type=int, default=200_000)
+    arg_parser.add_argument("--log-lines", type=int, default=100_000)
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        check_nested(db_dir)
+
+        path = os.path.join(db_dir, "ip_ranges.tsv")
+        truth = write_ip_ranges(path, args.ranges, args.v6_ranges)
+        truth_index = {}
+        for version in (4, 6):
+            entries = [entry for entry in truth if entry[0] == version]
+            truth_index[version] = ([entry[1] for entry in entries], entries)
+
+        gc.collect()
+        rss_before = current_rss_bytes()
+        started = time.perf_counter()
+        db = IPRangeDB.load(path)
+        load_seconds = time.perf_counter() - started
+        gc.collect()
+        db_bytes = current_rss_bytes() - rss_before
+
+        rng = random.Random(1)
+        ips = [str(ipaddress.ip_address(rng.randrange(1 << 24, 224 << 24))) for _ in range(args.lookups)]
+        ips += [str(ipaddress.ip_address(V6_BASE + rng.randrange(args.v6_ranges << 80))) for _ in range(args.lookups // 10)]
+        for ip in ips[:20000] + ips[-2000:]:
+            assert db.lookup(ip) == expected(truth_index, ip), ip
+
+        started = time.perf_counter()
+        for ip in ips:
+            db.lookup(ip)
+        lookup_seconds = (time.perf_counter() - started) / len(ips)
+
+        batch = ips[:100]
+        started = time.perf_counter()
+        for _ in range(1000):
+            db.lookup_many(batch)
+        batch_seconds = (time.perf_counter() - started) / 1000
+
+        print(f"範圍數 {db.stats()}")
+        print(f"載入         {load_seconds:8.2f} s，RSS 增加 {db_bytes / 1e6:.1f} MB")
+        print(f"單一 IP      {lookup_seconds * 1e6:8.2f} µs")
+        print(f"批次 100 個  {batch_seconds * 1e6:8.1f} µs")
+
+        # 統計摘要與 tool_detail 的標註
+        log_path = os.path.join(db_dir, "access.log")
+        write_synthetic_log(log_path, args.log_lines)
+        log_tools.LOG_PATH = log_path
+        result = log_tools.query_logs("14/Jul/2025:00:00:00", "14/Jul/2025:23:59:59")
+
+        ip_ranges.IP_RANGES_PATH = os.path.join(db_dir, "missing.tsv")
+        started = time.perf_counter()
+        plain_summary, plain_table = log_tools.format_query_result(result)
+        plain_seconds = time.perf_counter() - started
+
+        ip_ranges.IP_RANGES_PATH = path
+        ip_ranges.wait_for_ip_range_db()
+        started = time.perf_counter()
+        summary, table = log_tools.format_query_result(result)
+        annotated_seconds = time.perf_counter() - started
+
+        assert "來源網路" not in plain_summary and len(plain_table["data"]["headers"]) == 5
+        assert table["data"]["headers"][-1]["key"] == "ip_network"
+        rows = table["data"]["body"]
+        for row in rows:
+            assert row["ip_network"] == ip_ranges.describe_ip_network(expected(truth_index, row["source_ip"]))
+        # 快取共用的查詢結果沒有被修改
+        assert "ip_network" not in result.structured_body[0]
+
+        print(f"統計摘要 + tool_detail：未標註 {plain_seconds * 1e3:.2f} ms，標註 {annotated_seconds * 1e3:.2f} ms"
+              f"（{len(rows)} 列）")
+        print("\n".join(line for line in summary.splitlines()[:4]))
+
+
+if __name__ == "__main__":
+    main()
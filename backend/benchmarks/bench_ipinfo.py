@@ -0,0 +1,84 @@
+"""
+IP 資訊查詢：以本機的模擬 ipinfo 服務（固定延遲、計算請求數與連線數）比較
+- 未命中、記憶體命中與 SQLite 命中的耗時
+- 批次查詢的並行度（N 個 IP 約等於一次延遲）
+- 連線重複使用（keep-alive）
+- 逾時的耗時
+
+快取、負面快取、同一個 IP 只送出一個請求、取消與逾時的正確性檢查在 tests/test_ipinfo.py。
+
+在 backend 目錄執行：
+    python -m benchmarks.bench_ipinfo --latency 0.05
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+# 模組層級的用戶端不使用持久層，測試用的用戶端各自指定暫存的 SQLite
+os.environ["IPINFO_CACHE_DB"] = ""
+
+from app.tools.ipinfo import IPInfoClient
+from benchmarks.stub_ipinfo import SLOW_IP, StubIPInfo
+
+
+async def run(args, stub: StubIPInfo, base_url: str, db_path: str):
+    client = IPInfoClient(base_url=base_url, token=None, timeout=args.timeout, db_path=db_path)
+    ips = [f"45.{i // 250}.{i % 250}.1" for i in range(args.batch)]
+
+    # 未命中 / 記憶體命中（先查一次別的 IP，不把匯入 httpx、建立連線的時間算進去）
+    await client.alookup("47.0.0.1")
+    started = time.perf_counter()
+    await client.alookup(ips[0])
+    miss_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        await client.alookup(ips[0])
+    memory_seconds = (time.perf_counter() - started) / args.repeat
+
+    # 批次並行
+    started = time.perf_counter()
+    await client.alookup_many(ips)
+    batch_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    await client.alookup(SLOW_IP)
+    timeout_seconds = time.perf_counter() - started
+    connections = len(stub.connections)
+    stats = client.stats()
+    await client.aclose()
+
+    # 新的用戶端（例如重新啟動後）由 SQLite 取得
+    restarted = IPInfoClient(base_url=base_url, token=None, timeout=args.timeout, db_path=db_path)
+    started = time.perf_counter()
+    restarted.lookup(ips[0])
+    disk_seconds = time.perf_counter() - started
+    restarted.close()
+
+    print(f"未命中       {miss_seconds * 1e3:10.2f} ms")
+    print(f"記憶體命中   {memory_seconds * 1e6:10.1f} µs")
+    print(f"SQLite 命中  {disk_seconds * 1e6:10.1f} µs")
+    print(f"批次 {len(ips)} 個 IP {batch_seconds * 1e3:8.1f} ms（逐一查詢約 {len(ips) * args.latency * 1e3:.0f} ms）")
+    print(f"逾時         {timeout_seconds * 1e3:10.1f} ms（上限 {args.timeout * 1e3:.0f} ms）")
+    print(f"模擬服務共收到 {stub.requests} 個請求，使用 {connections} 條連線")
+    print(f"統計：{stats}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--latency", type=float, default=0.05)
+    arg_parser.add_argument("--batch", type=int, default=50)
+    arg_parser.add_argument("--repeat", type=int, default=10000)
+    arg_parser.add_argument("--timeout", type=float, default=0.5)
+    args = arg_parser.parse_args()
+
+    stub = StubIPInfo(args.latency, slow_latency=args.timeout * 4)
+    base_url = stub.start()
+    with tempfile.TemporaryDirectory() as db_dir:
+        asyncio.run(run(args, stub, base_url, os.path.join(db_dir, "ipinfo_cache.sqlite")))
+
+
+if __name__ == "__main__":
+    main()
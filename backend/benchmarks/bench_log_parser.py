@@ -0,0 +1,91 @@
+"""
+比較舊版逐行 re.search + strptime 與格式編譯解析器的吞吐量。
+
+在 backend 目錄執行：
+    python -m benchmarks.bench_log_parser --lines 500000
+"""
+import argparse
+from collections import Counter, defaultdict
+from datetime import datetime
+import os
+import re
+import tempfile
+import time
+
+from app.tools import log_tools
+from benchmarks.synthetic_log import write_synthetic_log
+
+
+def legacy_filter(path, start_time, end_time, status_code=None):
+    """原本 log_tools 的掃描迴圈（僅保留比對所需的部分）"""
+    time_format = "%d/%b/%Y:%H:%M:%S"
+    start_dt = datetime.strptime(start_time, time_format)
+    end_dt = datetime.strptime(end_time, time_format)
+    exclude_2xx = re.compile(r"^(?!2\d\d$)")
+    user_status_pattern = re.compile(status_code) if status_code else None
+
+    filtered_logs = []
+    ip_counter = Counter()
+    ip_to_resources = defaultdict(Counter)
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            match = re.search(
+                r'\[(?P<time>.*?) \+\d{4}\] '
+                r'"(?P<method>[A-Z]+) (?P<resource>[^ ]+) HTTP/[^"]+" (?P<status>\d{3})',
+                line
+            )
+            if not match:
+                continue
+            log_status = int(match.group("status"))
+            real_ip = line.strip().split()[-1]
+            try:
+                log_dt = datetime.strptime(match.group("time"), time_format)
+            except ValueError:
+                continue
+            if not (start_dt <= log_dt <= end_dt):
+                continue
+            if not exclude_2xx.match(str(log_status)):
+                continue
+            if user_status_pattern and not user_status_pattern.match(str(log_status)):
+                continue
+            filtered_logs.append(line.strip())
+            ip_counter[real_ip] += 1
+            ip_to_resources[real_ip][match.group("resource")] += 1
+    return filtered_logs
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--lines", type=int, default=500_000)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "access.log")
+        write_synthetic_log(path, args.lines)
+        log_tools.LOG_PATH = path
+        window = ("14/Jul/2025:00:00:00", "14/Jul/2025:23:59:59")
+
+        def run_legacy():
+            return legacy_filter(path, *window)
+
+        def run_current():
+            # 每次都重新解析，不計入查詢結果快取
+            log_tools.query_cache.clear()
+            return log_tools.filter_logs_by_time_and_status(*window)[1]
+
+        assert run_legacy() == run_current(), "新舊解析結果不一致"
+
+        for name, fn in (("legacy re.search + strptime", run_legacy), ("compiled LogParser", run_current)):
+            best = min(_timed(fn) for _ in range(args.repeat))
+            print(f"{name:<30} {best:8.3f}s  {args.lines / best:12,.0f} lines/s")
+
+
+def _timed(fn):
+    started = time.perf_counter()
+    fn()
+    return time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+多檔 log 來源（目錄 / glob）與 manifest 的分區裁剪：以每天一個檔案的合成 log（依輪替命名：
+access.log 為最新一天，access.log.1、access.log.2 … 越來越舊）比較
+- 建立 manifest（每個檔案的第一 / 最後時間、大小、CRC32）與之後每次查詢更新 manifest 的耗時
+- 查詢一小時：使用 manifest 只開啟重疊的檔案，與沒有 manifest 時逐一開啟每個檔案找範圍的耗時，
+  天數增加時前者應該持平
+並檢查：
+- 一小時 / 跨午夜 / 多天的查詢結果（筆數、原始行、統計摘要）與依時間順序逐行掃描全部檔案的參考結果相同
+- 跨檔案的分頁串起來等於參考結果，檔案輪替（改名、產生新的 access.log）後 cursor 仍可接續
+- 輪替後 manifest 沿用原本的紀錄（不重新計算 CRC），CRC 與整個檔案的 CRC32 相同
+- 多檔範圍交給 process pool 平行掃描的結果與序列掃描相同
+
+在 backend 目錄執行：
+    python -m benchmarks.bench_log_sources --days 7 30 --lines-per-day 20000
+"""
+import argparse
+from datetime import datetime, timedelta
+import os
+import random
+import statistics
+import tempfile
+import time
+import zlib
+
+from benchmarks.synthetic_log import write_synthetic_log
+
+FIRST_DAY = datetime(2025, 6, 1)
+TIME_FORMAT = "%d/%b/%Y:%H:%M:%S"
+
+
+def write_daily_logs(directory: str, days: int, lines_per_day: int):
+    """每天一個檔案，最新的一天是 access.log"""
+    for day in range(days):
+        start = (FIRST_DAY + timedelta(days=day)).strftime(TIME_FORMAT)
+        suffix = days - 1 - day
+        name = "access.log" if suffix == 0 else f"access.log.{suffix}"
+        write_synthetic_log(os.path.join(directory, name), lines_per_day, start=start, seed=day)
+
+
+def window(day: int, hour: int, hours: int = 1):
+    start = FIRST_DAY + timedelta(days=day, hours=hour)
+    end = start + timedelta(hours=hours) - timedelta(seconds=1)
+    return start.strftime(TIME_FORMAT), end.strftime(TIME_FORMAT)
+
+
+def reference(directory: str, start_time: str, end_time: str, status_code: int = None):
+    """依時間順序逐行掃描全部檔案：回傳 (符合的原始行, ScanResult)"""
+    from app.tools.log_parser import LogParser, parse_query_time
+    from app.tools.log_scan import QueryFilter, ScanResult
+
+    parser = LogParser()
+    query_filter = QueryFilter(f"^{status_code}$" if status_code else None)
+    start_epoch, end_epoch = parse_query_time(start_time), parse_query_time(end_time)
+    files = [os.path.join(directory, name) for name in os.listdir(directory) if name.startswith("access.log")
+             and os.path.isfile(os.path.join(directory, name)) and not name.endswith(".idx")]
+    files.sort(key=lambda path: int(path.rsplit(".", 1)[1]) if path[-1].isdigit() else 0, reverse=True)
+
+    result = ScanResult()
+    lines = []
+    for path in files:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                record = parser.parse(line)
+                if record is not None and start_epoch <= record.epoch <= end_epoch and query_filter.accepts(record):
+                    result.add(line, record)
+                    lines.append(line.strip())
+    return lines, result
+
+
+def scan_without_manifest(directory: str, start_time: str, end_time: str) -> int:
+    """沒有 manifest 時：每個檔案都要開啟、二分搜尋起點後掃描"""
+    from app.tools.log_index import open_range_scan, plan_time_range
+    from app.tools.log_parser import LogParser, parse_query_time
+    from app.tools.log_scan import QueryFilter
+
+    parser = LogParser()
+    query_filter = QueryFilter()
+    start_epoch, end_epoch = parse_query_time(start_time), parse_query_time(end_time)
+    total = 0
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not name.startswith("access.log") or not os.path.isfile(path) or name.endswith(".idx"):
+            continue
+        begin, end, stop_epoch = plan_time_range(path, start_epoch, end_epoch, parser)
+        total += sum(1 for _ in open_range_scan(path, begin, end, start_epoch, end_epoch, stop_epoch,
+                                                parser, query_filter))
+    return total
+
+
+def check_parity(engine, directory: str, start_time: str, end_time: str, label: str):
+    from app.tools.log_engine import format_query_result
+
+    expected_lines, expected = reference(directory, start_time, end_time)
+    result = engine.query(start_time, end_time, keep_lines=True)
+    assert result.total == len(expected_lines), (label, result.total, len(expected_lines))
+    assert result.filtered_logs == expected_lines, f"{label}：原始行不同"
+    assert format_query_result(result) == format_query_result(expected.to_query_result()), f"{label}：統計摘要不同"
+    files = len(engine.manifest.select(*(parse_epoch(t) for t in (start_time, end_time)), engine.manifest.entries))
+    print(f"  {label:10s} {files:2d} 個檔案  {result.total:7d} 筆一致")
+
+
+def parse_epoch(value: str) -> int:
+    from app.tools.log_parser import parse_query_time
+    return parse_query_time(value)
+
+
+def check_pages(engine, directory: str, days: int):
+    """跨午夜的分頁；讀到一半時輪替檔案，cursor 應可接續"""
+    start_time, end_time = window(days - 2, 22, 4)
+    expected, _ = reference(directory, start_time, end_time, 404)
+    page = engine.first_page(start_time, end_time, status_code="^404$", exclude_2xx=False)
+    assert page["total"] == len(expected)
+    rows = list(page["rows"])
+
+    page = engine.next_page(page["next_cursor"])
+    rows.extend(page["rows"])
+
+    # 輪替：每個檔案的編號加一，產生新的空 access.log
+    names = sorted((name for name in os.listdir(directory) if name.startswith("access.log")
+                    and os.path.isfile(os.path.join(directory, name)) and not name.endswith(".idx")),
+                   key=lambda name: int(name.rsplit(".", 1)[1]) if name[-1].isdigit() else 0, reverse=True)
+    for name in names:
+        suffix = int(name.rsplit(".", 1)[1]) if name[-1].isdigit() else 0
+        os.rename(os.path.join(directory, name), os.path.join(directory, f"access.log.{suffix + 1}"))
+    open(os.path.join(directory, "access.log"), "w").close()
+
+    pages = 2
+    while page["next_cursor"] is not None:
+        page = engine.next_page(page["next_cursor"])
+        assert "error" not in page, page
+        rows.extend(page["rows"])
+        pages += 1
+    assert rows == expected, "跨檔案分頁結果與參考結果不同"
+    print(f"  分頁：{pages} 頁、{len(rows)} 行一致（第 2 頁之後輪替檔案，cursor 仍可接續）")
+
+    started = time.perf_counter()
+    entries = engine.manifest.refresh()
+    seconds = time.perf_counter() - started
+    for entry in entries:
+        with open(entry["path"], "rb") as f:
+            assert entry["checksum"] == f"{zlib.crc32(f.read()):08x}", entry["name"]
+    print(f"  輪替後更新 manifest {seconds * 1e3:.1f} ms（沿用原本的紀錄），CRC32 與整個檔案一致")
+
+
+def check_parallel(engine, start_time: str, end_time: str):
+    """多檔範圍：process pool 平行掃描與序列掃描結果相同"""
+    from app.tools.log_index import open_range_scan
+    from app.tools.log_parallel import scan_segments_parallel
+    from app.tools.log_scan import QueryFilter, new_scan_result
+
+    start_epoch, end_epoch = parse_epoch(start_time), parse_epoch(end_time)
+    segments = engine._segments(start_epoch, end_epoch)
+    query_filter = QueryFilter()
+
+    started = time.perf_counter()
+    sequential = new_scan_result(100)
+    for path, _, begin, end, stop_epoch in segments:
+        for line, record in open_range_scan(path, begin, end, start_epoch, end_epoch, stop_epoch,
+                                            engine.parser, query_filter):
+            sequential.add(line, record)
+    sequential_seconds = time.perf_counter() - started
+
+    scan_segments_parallel([(path, begin, end, stop) for path, _, begin, end, stop in segments],
+                           start_epoch, end_epoch, engine.parser.log_format, query_filter, 100,
+                           workers=2, chunk_bytes=1 << 20)  # 啟動 worker
+    started = time.perf_counter()
+    parallel = scan_segments_parallel([(path, begin, end, stop) for path, _, begin, end, stop in segments],
+                                      start_epoch, end_epoch, engine.parser.log_format, query_filter, 100,
+                                      workers=2, chunk_bytes=1 << 20)
+    parallel_seconds = time.perf_counter() - started
+    assert parallel.to_query_result() == sequential.to_query_result(), "平行掃描結果與序列掃描不同"
+    print(f"  平行掃描 {len(segments)} 個檔案一致：序列 {sequential_seconds * 1e3:.0f} ms、"
+          f"2 個 worker {parallel_seconds * 1e3:.0f} ms（CPU 核心數 {os.cpu_count()}）")
+
+
+def run(days: int, args):
+    from app.tools.log_engine import get_engine
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_daily_logs(directory, days, args.lines_per_day)
+        engine = get_engine(directory)
+
+        started = time.perf_counter()
+        engine.manifest.refresh()
+        build_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        engine.manifest.refresh()
+        refresh_seconds = time.perf_counter() - started
+
+        rng = random.Random(days)
+        query_days = [rng.randrange(days) for _ in range(args.queries)]
+        # 每個被查詢的檔案第一次查詢時建立它的索引與欄位快取（成本與單一檔案有關，與天數無關）
+        cold = []
+        for day in sorted(set(query_days)):
+            started = time.perf_counter()
+            engine.query(*window(day, 12))
+            cold.append(time.perf_counter() - started)
+
+        with_manifest, without_manifest = [], []
+        for day in query_days:
+            hour = rng.randrange(24)
+            start_time, end_time = window(day, hour)
+            started = time.perf_counter()
+            engine.query(start_time, end_time, status_code="^404$", exclude_2xx=False)
+            with_manifest.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            scan_without_manifest(directory, start_time, end_time)
+            without_manifest.append(time.perf_counter() - started)
+
+        print(f"{days} 天（{days} 個檔案、{days * args.lines_per_day} 行）")
+        print(f"  建立 manifest {build_seconds * 1e3:.0f} ms，之後每次查詢更新 {refresh_seconds * 1e3:.2f} ms")
+        print(f"  查詢一小時：使用 manifest 中位數 {statistics.median(with_manifest) * 1e3:7.2f} ms"
+              f"（檔案第一次被查詢時 {statistics.median(cold) * 1e3:.0f} ms）  "
+              f"沒有 manifest 中位數 {statistics.median(without_manifest) * 1e3:7.2f} ms")
+
+        check_parity(engine, directory, *window(days // 2, 10), "一小時")
+        check_parity(engine, directory, *window(days // 2, 23, 2), "跨午夜")
+        check_parity(engine, directory, *window(1, 6, 72), "三天")
+        check_parallel(engine, *window(1, 6, 72))
+        check_pages(engine, directory, days)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--days", type=int, nargs="+", default=[7, 30])
+    arg_parser.add_argument("--lines-per-day", type=int, default=20_000)
+    arg_parser.add_argument("--queries", type=int, default=20)
+    args = arg_parser.parse_args()
+    for days in args.days:
+        run(days, args)
+
+
+if __name__ == "__main__":
+    main()
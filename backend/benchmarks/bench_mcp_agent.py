@@ -0,0 +1,245 @@
+"""
+/web-log/invoke 的 MCP 連線：比較
+- 原本：第一個請求才建立 MultiServerMCPClient 與 agent（沒有鎖），每次工具呼叫各自建立一個 SSE session
+- 現在：lifespan 建立一次持久的 session 與 agent（WebLogAgent），所有請求共用
+的第一個請求延遲、穩定狀態延遲，以及一批同時進來的請求建立了幾個 session。
+並檢查 MCP server 重新啟動後會自動重新連線，以及 MCP 服務晚於 FastAPI 啟動時，請求會立刻重試連線。
+
+MCP server 是 mcp/server.py（SSE，在背景執行緒執行，計算建立的 session 數），log 使用合成資料；
+LLM 以固定腳本的 chat model 取代：先呼叫一次 log 查詢工具，再依工具結果回答。
+
+在 backend 目錄執行：
+    python -m benchmarks.bench_mcp_agent --burst 32 --latency 0.05
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+
+from benchmarks.synthetic_log import write_synthetic_log
+
+START, END = "14/Jul/2025:00:00:00", "14/Jul/2025:23:59:59"
+
+
+class MCPServerThread:
+    """在背景執行緒以 uvicorn 執行 MCP server 的 SSE app，計算建立的 SSE session 數"""
+
+    def __init__(self, mcp, port: int):
+        self.mcp = mcp
+        self.port = port
+        self.sessions = 0
+        self._server = None
+        self._thread = None
+
+    def _app(self):
+        sse_app = self.mcp.sse_app()
+
+        async def counting_app(scope, receive, send):
+            if scope["type"] == "http" and scope["path"] == "/sse":
+                self.sessions += 1
+            await sse_app(scope, receive, send)
+
+        return counting_app
+
+    def start(self):
+        import uvicorn
+
+        config = uvicorn.Config(self._app(), host="127.0.0.1", port=self.port, log_level="critical",
+                                timeout_graceful_shutdown=0.5)
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+
+    def stop(self):
+        self._server.should_exit = True
+        self._thread.join()
+
+
+def scripted_model(latency: float):
+    """模擬 LLM：第一輪呼叫 log 查詢工具，收到工具結果後回答"""
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage, ToolMessage
+    from langchain_core.outputs import ChatGeneration, ChatResult
+
+    class ScriptedChatModel(BaseChatModel):
+        latency: float = 0.0
+
+        @property
+        def _llm_type(self) -> str:
+            return "scripted"
+
+        def bind_tools(self, tools, **kwargs):
+            return self
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            raise NotImplementedError
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            await asyncio.sleep(self.latency)
+            tool_results = [m for m in messages if isinstance(m, ToolMessage)]
+            if tool_results:
+                message = AIMessage(content=f"查詢完成，工具回傳 {len(str(tool_results[-1].content))} 字")
+            else:
+                message = AIMessage(content="", tool_calls=[{
+                    "name": "filter_logs_by_time_and_status", "id": f"call_{uuid.uuid4().hex}",
+                    "args": {"start_time": START, "end_time": END, "status_code": "404"},
+                }])
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+    return ScriptedChatModel(latency=latency)
+
+
+class LegacyAgent:
+    """原本的作法：第一個請求才連線建立 agent（沒有鎖），工具由 client.get_tools() 取得，每次呼叫各自建立 session"""
+
+    def __init__(self, url: str, model):
+        self.url = url
+        self.model = model
+        self.agent = None
+        self.builds = 0
+
+    async def invoke(self, text: str):
+        if self.agent is None:
+            from langchain_mcp_adapters.client import MultiServerMCPClient
+            from langgraph.prebuilt import create_react_agent
+
+            client = MultiServerMCPClient({"math": {"url": self.url, "transport": "sse"}})
+            tools = await client.get_tools()
+            self.agent = create_react_agent(self.model, tools, prompt="")
+            self.builds += 1
+        return await self.agent.ainvoke({"messages": text})
+
+
+async def timed(invoke, text: str) -> float:
+    started = time.perf_counter()
+    result = await invoke(text)
+    assert "查詢完成" in result["messages"][-1].content, result["messages"][-1]
+    return time.perf_counter() - started
+
+
+async def measure(name: str, server: MCPServerThread, invoke, args) -> dict:
+    sessions = server.sessions
+    first = await timed(invoke, "first")
+    steady = statistics.median([await timed(invoke, f"steady {i}") for i in range(args.steady)])
+    sequential_sessions = server.sessions - sessions
+
+    sessions = server.sessions
+    started = time.perf_counter()
+    await asyncio.gather(*(timed(invoke, f"burst {i}") for i in range(args.burst)))
+    burst_seconds = time.perf_counter() - started
+    print(f"{name}：第一個請求 {first * 1e3:7.1f} ms  穩定狀態 {steady * 1e3:7.1f} ms  "
+          f"{1 + args.steady} 個循序請求建立 {sequential_sessions:3d} 個 session  "
+          f"同時 {args.burst} 個請求 {burst_seconds * 1e3:7.1f} ms、建立 {server.sessions - sessions:3d} 個 session")
+    return {"first": first, "steady": steady, "burst_sessions": server.sessions - sessions}
+
+
+async def wait_for(predicate, timeout: float):
+    deadline = time.perf_counter() + timeout
+    while not predicate():
+        assert time.perf_counter() < deadline, "等待逾時"
+        await asyncio.sleep(0.05)
+
+
+async def run(args, server: MCPServerThread, url: str):
+    from app.api.web_log import agent as agent_module
+
+    model = scripted_model(args.latency)
+    agent_module.build_model = lambda: model
+
+    # 原本：冷啟動的第一批同時請求會各自建立 agent
+    legacy = LegacyAgent(url, model)
+    await measure("原本", server, legacy.invoke, args)
+    legacy.agent = None
+    sessions = server.sessions
+    await asyncio.gather(*(legacy.invoke(f"cold burst {i}") for i in range(args.burst)))
+    print(f"      冷啟動時同時 {args.burst} 個請求：建立 {legacy.builds - 1} 個 agent、{server.sessions - sessions} 個 session")
+
+    # 現在：lifespan 預先連線
+    web_log_agent = agent_module.web_log_agent
+    started = time.perf_counter()
+    assert await agent_module.initialize_agent()
+    print(f"現在：lifespan 連線與健康檢查 {(time.perf_counter() - started) * 1e3:.1f} ms，"
+          f"工具 {[tool.name for tool in web_log_agent.tools]}")
+
+    async def invoke(text: str):
+        agent = await web_log_agent.get_agent()
+        return await agent.ainvoke({"messages": text})
+
+    result = await measure("現在", server, invoke, args)
+    assert result["burst_sessions"] == 0 and web_log_agent.connects == 1
+
+    # MCP server 重新啟動：keep-alive 偵測斷線後以退避重新連線
+    server.stop()
+    await wait_for(lambda: web_log_agent.agent is None, args.keepalive * 4)
+    started = time.perf_counter()
+    try:
+        await web_log_agent.get_agent()
+        raise AssertionError("MCP server 停止時應該回傳錯誤")
+    except RuntimeError as e:
+        print(f"MCP server 停止：請求 {(time.perf_counter() - started) * 1e3:.0f} ms 後回傳錯誤（{e}）")
+    server.start()
+    started = time.perf_counter()
+    await wait_for(lambda: web_log_agent.agent is not None, args.keepalive * 4 + agent_module.MCP_RECONNECT_MAX_DELAY)
+    print(f"MCP server 重新啟動：{(time.perf_counter() - started) * 1e3:.0f} ms 後自動重新連線"
+          f"（第 {web_log_agent.connects} 次連線）")
+    await timed(invoke, "after reconnect")
+    await agent_module.close_agent()
+
+    # MCP 服務晚於 FastAPI 啟動：lifespan 不被阻擋，之後的請求立刻重試連線
+    server.stop()
+    started = time.perf_counter()
+    assert not await agent_module.initialize_agent()
+    print(f"MCP 服務未啟動：lifespan 在 {(time.perf_counter() - started) * 1e3:.0f} ms 內繼續")
+    server.start()
+    first = await timed(invoke, "late start")
+    print(f"MCP 服務啟動後的第一個請求 {first * 1e3:.1f} ms")
+    await agent_module.close_agent()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--lines", type=int, default=20_000)
+    arg_parser.add_argument("--burst", type=int, default=32)
+    arg_parser.add_argument("--steady", type=int, default=10)
+    arg_parser.add_argument("--latency", type=float, default=0.05, help="模擬 LLM 每次呼叫的延遲（秒）")
+    arg_parser.add_argument("--keepalive", type=float, default=0.5)
+    args = arg_parser.parse_args()
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    url = f"http://127.0.0.1:{port}/sse"
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        log_path = os.path.join(log_dir, "access.log")
+        write_synthetic_log(log_path, args.lines)
+        os.environ["MCP_LOG_PATH"] = log_path
+        # agent 模組在匯入時讀取設定
+        os.environ["MCP_SERVER_URL"] = url
+        os.environ["MCP_KEEPALIVE_INTERVAL"] = str(args.keepalive)
+        os.environ.setdefault("MCP_RECONNECT_MIN_DELAY", "0.2")
+        os.environ.setdefault("MCP_RECONNECT_MAX_DELAY", "2")
+
+        from benchmarks.bench_mcp_pages import load_mcp_server
+
+        # 不印出每個 MCP 請求的紀錄，以及重新連線測試中預期的連線錯誤
+        logging.getLogger("mcp").setLevel(logging.CRITICAL)
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+        server = MCPServerThread(load_mcp_server().mcp, port)
+        server.start()
+        try:
+            asyncio.run(run(args, server, url))
+        finally:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+MCP filter_logs_by_time_and_status 的分頁結果：以合成 log 比較
+- 原本一次回傳全部符合行的工具結果大小與耗時
+- 分頁後第一頁（摘要 + 一頁原始行 + cursor）與每個下一頁的大小與耗時
+並檢查全部頁面串起來與原本的結果相同、2xx 狀態碼仍可查詢、無效 / 失效的 cursor 回傳錯誤。
+
+工具經由 FastMCP 的 call_tool 呼叫，大小是實際序列化後交給 transport 的 JSON 文字。
+
+在 backend 目錄執行：
+    python -m benchmarks.bench_mcp_pages --lines 1000000
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic_log import write_synthetic_log
+from app.tools.log_parser import LogParser, parse_query_time
+
+MCP_SERVER_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mcp", "server.py")
+START, END = "14/Jul/2025:00:00:00", "14/Jul/2025:23:59:59"
+
+
+def load_mcp_server():
+    spec = importlib.util.spec_from_file_location("mcp_log_server", MCP_SERVER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def full_result(log_path: str, status_code: int) -> list:
+    """原本的工具：逐行解析，回傳全部符合的行"""
+    parser = LogParser()
+    start_epoch, end_epoch = parse_query_time(START), parse_query_time(END)
+    with open(log_path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f
+                if (record := parser.parse(line)) is not None
+                and start_epoch <= record.epoch <= end_epoch and record.status == status_code]
+
+
+async def call(server, name: str, arguments: dict):
+    """回傳 (工具結果, 序列化後的大小, 秒數)"""
+    started = time.perf_counter()
+    content = await server.mcp.call_tool(name, arguments)
+    seconds = time.perf_counter() - started
+    blocks = content[0] if isinstance(content, tuple) else content
+    text = "".join(block.text for block in blocks)
+    return json.loads(text), len(text.encode("utf-8")), seconds
+
+
+async def run(args, server, log_path: str):
+    started = time.perf_counter()
+    expected = full_result(log_path, args.status)
+    full_seconds = time.perf_counter() - started
+    full_bytes = len(json.dumps(expected, ensure_ascii=False).encode("utf-8"))
+
+    arguments = {"start_time": START, "end_time": END, "status_code": str(args.status)}
+    # 第一次呼叫會建立索引與欄位快取
+    _, _, cold_seconds = await call(server, "filter_logs_by_time_and_status", arguments)
+    page, first_bytes, first_seconds = await call(server, "filter_logs_by_time_and_status", arguments)
+    assert page["total"] == len(expected), (page["total"], len(expected))
+
+    rows = list(page["rows"])
+    page_bytes, page_seconds = [first_bytes], []
+    while page["next_cursor"] is not None and len(page_seconds) < args.max_pages:
+        page, size, seconds = await call(server, "filter_logs_next_page", {"cursor": page["next_cursor"]})
+        assert "error" not in page, page
+        rows.extend(page["rows"])
+        page_bytes.append(size)
+        page_seconds.append(seconds)
+    if page["next_cursor"] is None:
+        assert rows == expected, "分頁結果與原本的結果不同"
+    else:
+        assert rows == expected[:len(rows)]
+
+    # 2xx 仍可查詢（MCP 工具依單一狀態碼查詢，不套用主流程排除 2xx 的規則）
+    ok_page, _, _ = await call(server, "filter_logs_by_time_and_status", dict(arguments, status_code="200"))
+    assert ok_page["total"] > 0 and all('" 200 ' in row for row in ok_page["rows"])
+
+    invalid, _, _ = await call(server, "filter_logs_next_page", {"cursor": "not-a-cursor"})
+    assert "error" in invalid
+
+    print(f"符合 {len(expected)} 行")
+    print(f"原本：一次回傳全部  {full_bytes / 1e6:10.2f} MB  {full_seconds * 1e3:10.1f} ms")
+    print(f"分頁：第一頁        {first_bytes / 1e3:10.1f} KB  {first_seconds * 1e3:10.1f} ms"
+          f"（建立快取的第一次呼叫 {cold_seconds * 1e3:.0f} ms）")
+    if page_seconds:
+        ordered = sorted(page_seconds)
+        print(f"      下一頁 {len(page_seconds)} 次    最大 {max(page_bytes[1:]) / 1e3:6.1f} KB"
+              f"  中位數 {ordered[len(ordered) // 2] * 1e3:.2f} ms，最慢 {ordered[-1] * 1e3:.2f} ms")
+    return page
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--lines", type=int, default=1_000_000)
+    arg_parser.add_argument("--status", type=int, default=404)
+    arg_parser.add_argument("--max-pages", type=int, default=2000)
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        log_path = os.path.join(log_dir, "access.log")
+        write_synthetic_log(log_path, args.lines)
+        os.environ["MCP_LOG_PATH"] = log_path
+        server = load_mcp_server()
+        last_page = asyncio.run(run(args, server, log_path))
+
+        # 檔案輪替後舊的 cursor 失效
+        if last_page["next_cursor"] is None:
+            first = server.filter_logs_by_time_and_status(START, END, str(args.status))
+            last_page = first
+        if last_page["next_cursor"] is not None:
+            os.rename(log_path, log_path + ".1")
+            write_synthetic_log(log_path, 1000)
+            assert "error" in server.filter_logs_next_page(last_page["next_cursor"])
+
+
+if __name__ == "__main__":
+    main()
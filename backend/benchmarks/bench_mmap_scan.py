@@ -0,0 +1,69 @@
+"""
+比較文字模式（逐行解碼）與 mmap bytes 模式的掃描吞吐量。
+合成 log 中插入了非 ASCII、控制字元、無法解析與缺少結尾換行等特殊行；
+兩種模式結果一致的檢查在 tests/test_log_scan.py。
+
+在 backend 目錄執行：
+    python -m benchmarks.bench_mmap_scan --lines 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from app.tools.log_index import open_range_scan, plan_time_range
+from app.tools.log_parser import LogParser, parse_query_time
+from app.tools.log_scan import QueryFilter, ScanResult
+from benchmarks.synthetic_log import write_edge_case_log
+
+_QUERIES = [
+    ("14/Jul/2025:00:00:00", "14/Jul/2025:23:59:59", None, None, None),
+    ("14/Jul/2025:11:00:00", "14/Jul/2025:13:00:00", "^4", None, None),
+    ("14/Jul/2025:11:59:00", "14/Jul/2025:12:01:00", None, "^(GET|POST)$", r"^203\."),
+    ("14/Jul/2025:06:00:00", "14/Jul/2025:06:30:00", "^5", "^GET$", None),
+]
+
+
+def run_scan(path, parser, mode, start_time, end_time, status_code, http_method, source_ip):
+    start_epoch = parse_query_time(start_time)
+    end_epoch = parse_query_time(end_time)
+    query_filter = QueryFilter(status_code, http_method, source_ip)
+    begin, end, stop_epoch = plan_time_range(path, start_epoch, end_epoch, parser)
+
+    result = ScanResult(keep_lines=True)
+    scan = open_range_scan(path, begin, end, start_epoch, end_epoch, stop_epoch, parser, query_filter, mode=mode)
+    records = []
+    for line, record in scan:
+        result.add(line, record)
+        records.append(record)
+    return result, records
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--lines", type=int, default=1_000_000)
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "access.log")
+        write_edge_case_log(path, args.lines)
+        size_mb = os.path.getsize(path) / (1 << 20)
+
+        for query in _QUERIES:
+            timings = {}
+            outputs = {}
+            for mode in ("text", "mmap"):
+                # 每種模式各用一個新的解析器，避免共用快取影響計時
+                parser = LogParser()
+                started = time.perf_counter()
+                outputs[mode] = run_scan(path, parser, mode, *query)
+                timings[mode] = time.perf_counter() - started
+
+            print(f"{query[:3]} 符合 {len(outputs['text'][1])} 行")
+            for mode, seconds in timings.items():
+                print(f"  {mode:<5} {seconds:8.3f}s  {size_mb / seconds:8.1f} MiB/s")
+            print(f"  x{timings['text'] / timings['mmap']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+比較序列掃描與多 process 平行掃描（未建立欄位快取時的文字掃描路徑）的耗時；
+兩者結果一致的檢查在 tests/test_log_scan.py。
+
+在 backend 目錄執行：
+    python -m benchmarks.bench_parallel_scan --lines 2000000 --workers 1 4 8 --chunk-mb 32
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from app.tools import log_parallel
+from app.tools.log_index import open_range_scan, plan_time_range
+from app.tools.log_parser import LogParser, parse_query_time
+from app.tools.log_scan import QueryFilter, ScanResult
+from benchmarks.synthetic_log import write_synthetic_log
+
+
+def serial_scan(path, parser, start_epoch, end_epoch, query_filter):
+    begin, end, stop_epoch = plan_time_range(path, start_epoch, end_epoch, parser)
+    result = ScanResult(keep_lines=True)
+    for line, record in open_range_scan(path, begin, end, start_epoch, end_epoch, stop_epoch, parser, query_filter):
+        result.add(line, record)
+    return result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--lines", type=int, default=2_000_000)
+    arg_parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, os.cpu_count() or 1])
+    arg_parser.add_argument("--chunk-mb", type=int, default=32)
+    args = arg_parser.parse_args()
+
+    parser = LogParser()
+    query_filter = QueryFilter()
+    start_epoch = parse_query_time("14/Jul/2025:00:00:00")
+    end_epoch = parse_query_time("14/Jul/2025:23:59:59")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "access.log")
+        write_synthetic_log(path, args.lines)
+        size_mb = os.path.getsize(path) / (1 << 20)
+
+        started = time.perf_counter()
+        serial_scan(path, parser, start_epoch, end_epoch, query_filter)
+        serial_seconds = time.perf_counter() - started
+        print(f"{'serial':<12} {serial_seconds:8.3f}s  {size_mb / serial_seconds:8.1f} MiB/s")
+
+        begin, end, stop_epoch = plan_time_range(path, start_epoch, end_epoch, parser)
+        for workers in args.workers:
+            # 先跑一次讓 worker process 啟動完成，只計算穩定狀態的掃描時間
+            log_parallel.scan_parallel(path, begin, end, start_epoch, end_epoch, stop_epoch, parser.log_format,
+                                       query_filter, 100, keep_lines=True, workers=workers, chunk_bytes=args.chunk_mb << 20)
+            started = time.perf_counter()
+            log_parallel.scan_parallel(path, begin, end, start_epoch, end_epoch, stop_epoch,
+                                       parser.log_format, query_filter, 100, keep_lines=True,
+                                       workers=workers, chunk_bytes=args.chunk_mb << 20)
+            seconds = time.perf_counter() - started
+            print(f"{f'{workers} workers':<12} {seconds:8.3f}s  {size_mb / seconds:8.1f} MiB/s  "
+                  f"x{serial_seconds / seconds:.2f}")
+
+
+if __name__ == "__main__":
+    main()
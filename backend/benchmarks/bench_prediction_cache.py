@@ -0,0 +1,67 @@
+"""
+DSPy 預測快取：比較未命中（呼叫 LLM）、記憶體命中與 SQLite 命中的耗時，並檢查
+- 正規化後相同的問題（空白、大小寫、標籤順序不同）命中同一筆快取
+- 相對日期的問題快取鍵包含日期；日內相對時間（最近一小時）不快取
+
+LLM 使用模擬服務（固定延遲），SQLite 寫在暫存目錄。
+
+在 backend 目錄執行：
+    python -m benchmarks.bench_prediction_cache --latency 0.3
+"""
+import argparse
+import os
+import tempfile
+import time
+
+# 需在 app 之前匯入，先設定好 LiteLLM 的環境變數
+from benchmarks.simulated_llm import configure_simulated_llm
+
+_DB_DIR = tempfile.TemporaryDirectory()
+os.environ["DSPY_CACHE_DB"] = os.path.join(_DB_DIR.name, "dspy_cache.sqlite")
+
+from app.dspy_modules import IntentChecker, LogQueryExtractor, prediction_cache, prediction_cache_stats
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--latency", type=float, default=0.3)
+    arg_parser.add_argument("--repeat", type=int, default=1000)
+    args = arg_parser.parse_args()
+
+    configure_simulated_llm(args.latency)
+    intent_checker = IntentChecker()
+    extractor = LogQueryExtractor()
+
+    def classify(question, labels):
+        return intent_checker(question=question, intent_labels=labels, intent_desc="查詢IP也算是web_log").intent
+
+    first, miss_seconds = timed(lambda: classify("哪個 IP 最多", ["web_log", "general"]))
+    _, memory_seconds = timed(lambda: [classify("哪個 IP 最多", ["web_log", "general"]) for _ in range(args.repeat)])
+    same, _ = timed(lambda: classify("  哪個 ip   最多 ", ["general", "web_log"]))
+    assert same == first
+    prediction_cache.memory.clear()
+    _, disk_seconds = timed(lambda: classify("哪個 IP 最多", ["web_log", "general"]))
+
+    print(f"未命中     {miss_seconds * 1e3:10.2f} ms")
+    print(f"記憶體命中 {memory_seconds / args.repeat * 1e6:10.1f} µs")
+    print(f"SQLite 命中 {disk_seconds * 1e6:9.1f} µs")
+
+    # 相對日期：同一天內重複使用；日內相對時間每次都呼叫 LLM
+    extractor(question="今天的 404")
+    extractor(question="今天的 404")
+    extractor(question="最近一小時的 404")
+    extractor(question="最近一小時的 404")
+    stats = prediction_cache_stats()
+    assert stats["IntentChecker"]["misses"] == 1 and stats["IntentChecker"]["disk_hits"] == 1, stats
+    assert stats["LogQueryExtractor"]["memory_hits"] == 1 and stats["LogQueryExtractor"]["bypassed"] == 2, stats
+    print(f"各模組統計：{stats}")
+
+
+if __name__ == "__main__":
+    main()
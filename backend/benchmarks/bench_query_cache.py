@@ -0,0 +1,63 @@
+"""
+查詢結果快取：比較第一次查詢與重複查詢的耗時，並確認
+- 等價的條件（空字串 / None、不同寫法的同一時間）會命中同一筆快取
+- log 檔追加內容後舊結果失效，重新查詢的結果與清空快取後重算的結果相同
+
+在 backend 目錄執行：
+    python -m benchmarks.bench_query_cache --lines 500000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from app.tools import log_tools
+from benchmarks.synthetic_log import write_synthetic_log
+
+_APPENDED_LINE = '10.0.0.9 - - [14/Jul/2025:23:59:59 +0800] "GET /appended HTTP/1.1" 404 12 "-" "UA" 203.0.113.99\n'
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--lines", type=int, default=500_000)
+    arg_parser.add_argument("--repeat", type=int, default=20)
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "access.log")
+        write_synthetic_log(path, args.lines)
+        log_tools.LOG_PATH = path
+        window = ("14/Jul/2025:08:00:00", "14/Jul/2025:18:00:00")
+
+        first, cold_seconds = timed(lambda: log_tools.filter_logs_by_time_and_status(*window, "^4"))
+        warm_seconds = min(
+            timed(lambda: log_tools.filter_logs_by_time_and_status(*window, "^4"))[1] for _ in range(args.repeat)
+        )
+        # 空字串與 None 視為相同條件
+        same = log_tools.filter_logs_by_time_and_status(*window, "^4", "", None)
+        assert same == first, "等價查詢的結果不一致"
+        stats = log_tools.query_cache_stats()
+        assert stats["misses"] == 1 and stats["hits"] == args.repeat + 1, stats
+
+        print(f"第一次查詢 {cold_seconds * 1000:10.2f} ms")
+        print(f"重複查詢   {warm_seconds * 1000:10.2f} ms  x{cold_seconds / warm_seconds:,.0f}")
+
+        # 追加內容後檔案大小與修改時間改變，不會命中舊結果
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(_APPENDED_LINE.replace("23:59:59", "12:00:00"))
+        after_append = log_tools.filter_logs_by_time_and_status(*window, "^4")
+        assert after_append[1] != first[1], "追加內容後仍回傳舊結果"
+        log_tools.query_cache.clear()
+        assert after_append == log_tools.filter_logs_by_time_and_status(*window, "^4")
+
+        print(f"快取統計：{log_tools.query_cache_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+FastAPI（LangGraph 的 web_log_tool 節點）與 MCP 工具的查詢耗時：
+兩個入口都交給同一個 LogQueryEngine，比較先由其中一個入口查詢後，
+另一個入口的查詢是否直接沿用引擎的索引與快取。結果一致性的檢查在 tests/test_query_parity.py。
+
+LLM 不會被呼叫（查詢條件由 plan 提供），log 使用合成資料。
+
+在 backend 目錄執行：
+    python -m benchmarks.bench_query_parity --lines 300000
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic_log import write_synthetic_log
+
+START, END = "14/Jul/2025:00:00:00", "14/Jul/2025:23:59:59"
+
+
+def plan_for(status_code: int) -> dict:
+    return {"start_time": START, "end_time": END, "status_code": str(status_code),
+            "http_method": None, "source_ip": None}
+
+
+async def app_query(graph, status_code: int):
+    """回傳 (web_log_tool 的輸出, 秒數)"""
+    started = time.perf_counter()
+    output = await graph.web_log_tool({"messages": [], "plan": plan_for(status_code)})
+    return output, time.perf_counter() - started
+
+
+async def call_tool(server, name: str, arguments: dict) -> dict:
+    content = await server.mcp.call_tool(name, arguments)
+    blocks = content[0] if isinstance(content, tuple) else content
+    return json.loads("".join(block.text for block in blocks))
+
+
+async def mcp_query(server, status_code: int):
+    """回傳 (第一頁, 全部頁面的原始行, 第一頁的秒數)"""
+    started = time.perf_counter()
+    first = await call_tool(server, "filter_logs_by_time_and_status",
+                            {"start_time": START, "end_time": END, "status_code": str(status_code)})
+    seconds = time.perf_counter() - started
+    rows, page = list(first["rows"]), first
+    while page["next_cursor"] is not None:
+        page = await call_tool(server, "filter_logs_next_page", {"cursor": page["next_cursor"]})
+        rows.extend(page["rows"])
+    return first, rows, seconds
+
+
+async def run(args, graph, server):
+    for status_code in args.statuses:
+        # 交替由哪一個入口先查詢，另一個入口應直接沿用引擎的快取
+        if status_code % 2:
+            (first, rows, mcp_seconds) = await mcp_query(server, status_code)
+            (_, app_seconds) = await app_query(graph, status_code)
+            order = "MCP → FastAPI"
+        else:
+            (_, app_seconds) = await app_query(graph, status_code)
+            (first, rows, mcp_seconds) = await mcp_query(server, status_code)
+            order = "FastAPI → MCP"
+
+        print(f"狀態碼 {status_code}：{first['total']:7d} 筆（MCP {len(rows)} 行）  {order}  "
+              f"FastAPI {app_seconds * 1e3:7.1f} ms  MCP 第一頁 {mcp_seconds * 1e3:7.1f} ms")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--lines", type=int, default=300_000)
+    arg_parser.add_argument("--statuses", type=int, nargs="+", default=[404, 500, 301, 403, 503])
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        log_path = os.path.join(log_dir, "access.log")
+        write_synthetic_log(log_path, args.lines)
+        # 兩個入口指向同一個 log 檔（MCP 預設查詢 access_log_part1.log，需以 MCP_LOG_PATH 指定）
+        os.environ["LOG_PATH"] = log_path
+        os.environ["MCP_LOG_PATH"] = log_path
+
+        import app.graph as graph
+        from app.tools.log_engine import get_engine
+        from benchmarks.bench_mcp_pages import load_mcp_server
+
+        server = load_mcp_server()
+
+        started = time.perf_counter()
+        get_engine(log_path).ingestor.refresh()
+        print(f"建立索引與欄位快取 {time.perf_counter() - started:.2f} s（兩個入口共用）")
+        asyncio.run(run(args, graph, server))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+比較逐列計算（select + summary）與彙總表（window_summary）的統計摘要耗時，
+並確認兩者結果相同。
+
+在 backend 目錄執行：
+    python -m benchmarks.bench_rollup --lines 2000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from app.tools.log_ingest import LogIngestor
+from app.tools.log_parser import parse_query_time
+from app.tools.log_scan import QueryFilter
+from benchmarks.synthetic_log import write_synthetic_log
+
+_QUERIES = [
+    ("14/Jul/2025:00:00:00", "14/Jul/2025:23:59:59", None, None),
+    ("14/Jul/2025:08:30:15", "14/Jul/2025:17:45:50", "^4", None),
+    ("14/Jul/2025:10:00:00", "14/Jul/2025:11:00:00", "^5", "^(GET|POST)$"),
+]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--lines", type=int, default=2_000_000)
+    arg_parser.add_argument("--ips", type=int, default=5000)
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "access.log")
+        write_synthetic_log(path, args.lines, ip_count=args.ips)
+        ingestor = LogIngestor(path, build_store=True)
+        ingestor.refresh()
+        store = ingestor.store
+
+        for start_time, end_time, status_code, http_method in _QUERIES:
+            start_epoch, end_epoch = parse_query_time(start_time), parse_query_time(end_time)
+            query_filter = QueryFilter(status_code, http_method)
+
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                rows = store.select(start_epoch, end_epoch, query_filter.status_allowed, query_filter.method_pattern)
+                expected = (len(rows),) + store.summary(rows)
+            row_seconds = (time.perf_counter() - started) / args.repeat
+
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                actual = store.window_summary(start_epoch, end_epoch, query_filter.status_allowed,
+                                              query_filter.method_pattern)
+            rollup_seconds = (time.perf_counter() - started) / args.repeat
+
+            assert actual == expected, f"彙總表結果與逐列計算不一致：{start_time} - {end_time}"
+            print(f"{start_time} - {end_time} {status_code or ''} {http_method or ''} 符合 {expected[0]} 筆")
+            print(f"  逐列   {row_seconds * 1000:8.1f} ms")
+            print(f"  彙總表 {rollup_seconds * 1000:8.1f} ms  x{row_seconds / rollup_seconds:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+session 儲存的長時間負載（soak）測試：不斷有新的 session 進來、每個 session 問幾輪，
+定期記錄 RSS 與 checkpoint 的數量 / 大小。
+
+每種模式在獨立的行程執行：
+- bounded：BoundedMemorySaver + session 上限（--max-sessions）與訊息視窗，RSS 應在 session 數達上限後持平
+- unbounded：原本的 MemorySaver、不限 session 數，RSS 隨請求數持續成長
+
+LLM 使用模擬服務（延遲 0），log 使用合成資料。
+session 數、checkpoint 數與訊息視窗的上限檢查在 tests/test_session_store.py，這裡只記錄長時間的變化。
+
+在 backend 目錄執行：
+    python -m benchmarks.bench_session_soak --requests 4000 --max-sessions 200
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.synthetic_log import SYNTHETIC_DAY, write_synthetic_log
+
+_CHILD = r"""
+import asyncio, json, sys
+from benchmarks.simulated_llm import configure_simulated_llm
+import httpx
+import app.main
+import app.graph
+from app.session_store import current_rss_bytes, session_store_stats
+from app.tools import log_tools
+
+log_path, mode, requests, turns, concurrency, sample_every = sys.argv[1], sys.argv[2], *map(int, sys.argv[3:7])
+log_tools.LOG_PATH = log_path
+configure_simulated_llm(0.0)
+if mode == "unbounded":
+    from langgraph.checkpoint.memory import MemorySaver
+    checkpointer = MemorySaver()
+    app.graph.app = app.graph.graph.compile(checkpointer=checkpointer)
+
+def session_count():
+    if mode == "bounded":
+        return session_store_stats()["checkpoints"]["threads"]
+    return len(checkpointer.storage)
+
+def checkpoint_bytes():
+    if mode == "bounded":
+        return session_store_stats()["checkpoints"]["bytes"]
+    return (sum(len(b[1]) for b in checkpointer.blobs.values())
+            + sum(len(s[0][1]) + len(s[1][1]) for ns in checkpointer.storage.values()
+                  for c in ns.values() for s in c.values()))
+
+async def run():
+    transport = httpx.ASGITransport(app=app.main.app)
+    queue = asyncio.Queue()
+    for session in range((requests + turns - 1) // turns):
+        queue.put_nowait(session)
+    done = 0
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        async def worker():
+            nonlocal done
+            # 同一個 session 的每一輪依序送出
+            while not queue.empty():
+                session = queue.get_nowait()
+                for turn in range(turns):
+                    response = await client.post("/api/infer", json={"input": f"今天 4xx 的請求 #{turn}",
+                                                                      "session_id": f"soak-{session}"})
+                    response.raise_for_status()
+                    done += 1
+                    if done % sample_every == 0:
+                        print("SAMPLE " + json.dumps({"requests": done, "rss": current_rss_bytes(),
+                                                      "sessions": session_count(),
+                                                      "checkpoint_bytes": checkpoint_bytes()}), flush=True)
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    if mode == "bounded":
+        print("STATS " + json.dumps(session_store_stats()))
+
+asyncio.run(run())
+"""
+
+
+def run_mode(mode: str, log_path: str, args) -> tuple:
+    env = dict(os.environ, DSPY_CACHE_DB="", PYTHONPATH=os.getcwd(), SESSION_MAX_COUNT=str(args.max_sessions),
+               SESSION_MESSAGE_WINDOW=str(args.window), LOG_QUERY_FIXED_DATE=SYNTHETIC_DAY)
+    if mode == "unbounded":
+        env["SESSION_MAX_COUNT"] = str(10 ** 9)
+        env["SESSION_MESSAGE_WINDOW"] = "0"
+    output = subprocess.run(
+        [sys.executable, "-c", _CHILD, log_path, mode, str(args.requests), str(args.turns),
+         str(args.concurrency), str(args.sample_every)],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    samples = [json.loads(line[len("SAMPLE "):]) for line in output.splitlines() if line.startswith("SAMPLE ")]
+    stats = [json.loads(line[len("STATS "):]) for line in output.splitlines() if line.startswith("STATS ")]
+    return samples, stats[0] if stats else None
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--requests", type=int, default=4000)
+    arg_parser.add_argument("--turns", type=int, default=4, help="每個 session 問幾輪")
+    arg_parser.add_argument("--concurrency", type=int, default=16)
+    arg_parser.add_argument("--max-sessions", type=int, default=200)
+    arg_parser.add_argument("--window", type=int, default=20)
+    arg_parser.add_argument("--sample-every", type=int, default=500)
+    arg_parser.add_argument("--lines", type=int, default=100_000)
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_path = os.path.join(tmp_dir, "access.log")
+        write_synthetic_log(log_path, args.lines)
+        for mode in ("unbounded", "bounded"):
+            samples, stats = run_mode(mode, log_path, args)
+            print(f"\n[{mode}]")
+            print(f"{'requests':>9} {'RSS MB':>8} {'sessions':>9} {'checkpoint MB':>14}")
+            for sample in samples:
+                print(f"{sample['requests']:>9} {sample['rss'] / 2**20:8.1f} {sample['sessions']:>9} "
+                      f"{sample['checkpoint_bytes'] / 2**20:14.2f}")
+            # 前半段（session 數還在成長）之後的 RSS 變化
+            half = samples[len(samples) // 2:]
+            growth = (half[-1]["rss"] - half[0]["rss"]) / 2**20
+            print(f"後半段 RSS 變化 {growth:+.1f} MB")
+            if stats:
+                print("checkpoint 統計：" + json.dumps(stats["checkpoints"], ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
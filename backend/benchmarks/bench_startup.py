@@ -0,0 +1,87 @@
+"""
+冷啟動量測：每輪開一個新的 Python 行程，依序記錄
+- import app.main 的時間
+- FastAPI lifespan（載入流程、建立 DSPy 模組、背景匯入 log）的時間
+- 第一個與第二個 /api/infer 請求的延遲
+
+LLM 使用模擬服務（固定延遲），log 使用合成資料，結果取各輪的中位數。
+加上 --profile 會在子行程開啟 STARTUP_PROFILE=1，印出各模組的匯入時間。
+
+在 backend 目錄執行：
+    python -m benchmarks.bench_startup --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.synthetic_log import write_synthetic_log
+
+_CHILD = r"""
+import asyncio, json, os, sys, time
+started = time.perf_counter()
+from benchmarks.simulated_llm import configure_simulated_llm
+simulator_seconds = time.perf_counter() - started
+
+started = time.perf_counter()
+import app.main
+import_seconds = time.perf_counter() - started
+
+import httpx
+from app.tools import log_tools
+log_tools.LOG_PATH = sys.argv[1]
+configure_simulated_llm(float(sys.argv[2]))
+
+async def run():
+    result = {"import": import_seconds}
+    started = time.perf_counter()
+    async with app.main.app.router.lifespan_context(app.main.app):
+        result["lifespan"] = time.perf_counter() - started
+        transport = httpx.ASGITransport(app=app.main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            for name in ("first_request", "second_request"):
+                started = time.perf_counter()
+                response = await client.post("/api/infer", json={"input": f"{name} 幫我分析流量", "session_id": name})
+                response.raise_for_status()
+                result[name] = time.perf_counter() - started
+    return result
+
+print("RESULT " + json.dumps(asyncio.run(run())))
+"""
+
+
+def run_child(log_path: str, latency: float, profile: bool) -> dict:
+    env = dict(os.environ, DSPY_CACHE_DB="", PYTHONPATH=os.getcwd())
+    if profile:
+        env["STARTUP_PROFILE"] = "1"
+    output = subprocess.run([sys.executable, "-c", _CHILD, log_path, str(latency)],
+                            env=env, capture_output=True, text=True, check=True).stdout
+    if profile:
+        print("\n".join(line for line in output.splitlines() if not line.startswith("RESULT ")))
+    line = next(line for line in output.splitlines() if line.startswith("RESULT "))
+    return json.loads(line[len("RESULT "):])
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--runs", type=int, default=5)
+    arg_parser.add_argument("--latency", type=float, default=0.2, help="模擬 LLM 每次呼叫的延遲秒數")
+    arg_parser.add_argument("--lines", type=int, default=100_000)
+    arg_parser.add_argument("--profile", action="store_true")
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_path = os.path.join(tmp_dir, "access.log")
+        write_synthetic_log(log_path, args.lines)
+        runs = [run_child(log_path, args.latency, args.profile and i == 0) for i in range(args.runs)]
+
+    for name in ("import", "lifespan", "first_request", "second_request"):
+        values = [run[name] for run in runs]
+        print(f"{name:<15} 中位數 {statistics.median(values):7.3f}s  最小 {min(values):7.3f}s  最大 {max(values):7.3f}s")
+
+
+if __name__ == "__main__":
+    main()
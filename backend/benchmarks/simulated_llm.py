@@ -0,0 +1,100 @@
+"""
+benchmark 用的模擬 LLM：本機的 OpenAI 相容 chat completions 服務。
+
+DSPy / LiteLLM 仍走真實的 HTTP 路徑（包含 stream=True 的 SSE），只是回應內容固定：
+所有 signature 的輸出欄位都放進同一個回應，ChatAdapter 只取需要的欄位。
+"""
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+
+# 不向網路下載 LiteLLM 的模型價格表
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+
+from aiohttp import web
+import dspy
+
+ANSWER_FIELDS = {
+    "intent": "web_log",
+    "start_time": "",
+    "end_time": "",
+    "status_code": "^4",
+    "http_method": "",
+    "source_ip": "",
+    "use_ip_info": "no",
+    "response_style": "brief",
+}
+
+
+def format_answer(answer_tokens: int) -> str:
+    fields = dict(ANSWER_FIELDS, answer=" ".join(f"字{i}" for i in range(answer_tokens)))
+    content = "\n\n".join(f"[[ ## {name} ## ]]\n{value}" for name, value in fields.items())
+    return content + "\n\n[[ ## completed ## ]]"
+
+
+def start_simulated_llm(latency: float, answer_tokens: int = 20, token_delay: float = 0.0) -> str:
+    """
+    在背景執行緒啟動模擬服務，回傳 api_base。
+    每次呼叫先等待 latency 秒（第一個 token 的延遲）；串流呼叫（回答）之後每個 answer token 再等待 token_delay 秒，
+    非串流呼叫（意圖 / 查詢條件判斷）只有 latency。
+    """
+    content = format_answer(answer_tokens)
+    # 串流時大約每個 answer token 一個片段
+    pieces = [content[i:i + 4] for i in range(0, len(content), 4)]
+    piece_delay = token_delay * answer_tokens / len(pieces)
+
+    def chunk(delta: dict, finish_reason=None) -> bytes:
+        data = {"id": "sim", "object": "chat.completion.chunk", "created": int(time.time()), "model": "sim",
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+        return f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode()
+
+    async def completions(request):
+        body = await request.json()
+        await asyncio.sleep(latency)
+        if not body.get("stream"):
+            return web.json_response({
+                "id": "sim", "object": "chat.completion", "created": int(time.time()), "model": "sim",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await response.write(chunk({"role": "assistant", "content": ""}))
+        for piece in pieces:
+            await asyncio.sleep(piece_delay)
+            await response.write(chunk({"content": piece}))
+        await response.write(chunk({}, "stop"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+
+    ready = threading.Event()
+
+    def serve():
+        loop = asyncio.new_event_loop()
+        server = web.Application()
+        server.router.add_post("/v1/chat/completions", completions)
+        runner = web.AppRunner(server)
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", port).start())
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+    ready.wait()
+    return f"http://127.0.0.1:{port}/v1"
+
+
+def configure_simulated_llm(latency: float, answer_tokens: int = 20, token_delay: float = 0.0):
+    """啟動模擬服務並設為 DSPy 預設的 LM"""
+    api_base = start_simulated_llm(latency, answer_tokens, token_delay)
+    dspy.configure(lm=dspy.LM("openai/sim", api_base=api_base, api_key="sim", cache=False))
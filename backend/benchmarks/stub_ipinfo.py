@@ -0,0 +1,52 @@
+"""
+benchmark 與測試用的模擬 ipinfo 服務：本機的 /{ip}/json，固定延遲，並計算請求數與連線數。
+FAILING_IP 回傳 HTTP 500，SLOW_IP 以 slow_latency 回應（用來測試逾時）。
+"""
+import asyncio
+import socket
+import threading
+
+from aiohttp import web
+
+FAILING_IP = "66.6.6.6"
+SLOW_IP = "77.7.7.7"
+
+
+class StubIPInfo:
+    """模擬 ipinfo.io 的 /{ip}/json，在背景執行緒執行"""
+
+    def __init__(self, latency: float, slow_latency: float):
+        self.latency = latency
+        self.slow_latency = slow_latency
+        self.requests = 0
+        self.connections = set()
+
+    async def handle(self, request):
+        self.requests += 1
+        self.connections.add(request.transport.get_extra_info("peername"))
+        ip = request.match_info["ip"]
+        await asyncio.sleep(self.slow_latency if ip == SLOW_IP else self.latency)
+        if ip == FAILING_IP:
+            return web.json_response({"error": "internal"}, status=500)
+        return web.json_response({"ip": ip, "city": "Taipei", "country": "TW", "org": "AS0 Stub",
+                                  "readme": "https://ipinfo.io/missingauth"})
+
+    def start(self) -> str:
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        ready = threading.Event()
+
+        def serve():
+            loop = asyncio.new_event_loop()
+            server = web.Application()
+            server.router.add_get("/{ip}/json", self.handle)
+            runner = web.AppRunner(server)
+            loop.run_until_complete(runner.setup())
+            loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", port).start())
+            ready.set()
+            loop.run_forever()
+
+        threading.Thread(target=serve, daemon=True).start()
+        ready.wait()
+        return f"http://127.0.0.1:{port}"
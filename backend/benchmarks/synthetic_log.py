@@ -0,0 +1,74 @@
+"""
+產生 benchmark 用的合成 access log（combined + 行尾真實 IP 格式，時間遞增）。
+"""
+from datetime import datetime, timedelta
+import random
+
+METHODS = ["GET"] * 8 + ["POST", "PUT", "DELETE", "HEAD"]
+# 合成 log 的日期；端對端的 benchmark 以 LOG_QUERY_FIXED_DATE 固定查詢這一天
+SYNTHETIC_DAY = "14/Jul/2025"
+STATUSES = [200] * 12 + [301, 302, 304, 400, 401, 403, 404, 404, 404, 500, 502, 503]
+AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Safari/537.36",
+    "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+    "curl/8.4.0",
+    "python-requests/2.32.4",
+]
+
+
+def write_synthetic_log(path: str, lines: int, start: str = f"{SYNTHETIC_DAY}:00:00:00",
+                        span_seconds: int = 86400, ip_count: int = 5000,
+                        resource_count: int = 2000, seed: int = 0):
+    """
+    寫出 lines 行合成 log，時間平均分布在 [start, start + span_seconds) 之間。
+    IP 與資源依冪次分布抽樣，模擬少數熱門來源與熱門路徑。
+    """
+    rng = random.Random(seed)
+    start_dt = datetime.strptime(start, "%d/%b/%Y:%H:%M:%S")
+    ips = [f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+           for _ in range(ip_count)]
+    resources = [f"/api/v1/items/{i}" if i % 3 else f"/static/page_{i}.html" for i in range(resource_count)]
+
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(lines):
+            ts = start_dt + timedelta(seconds=i * span_seconds // lines)
+            ip = ips[min(int(rng.paretovariate(1.2)) - 1, ip_count - 1)]
+            resource = resources[min(int(rng.paretovariate(1.1)) - 1, resource_count - 1)]
+            f.write(
+                f'10.0.0.{i % 8 + 1} - - [{ts.strftime("%d/%b/%Y:%H:%M:%S")} +0800] '
+                f'"{rng.choice(METHODS)} {resource} HTTP/1.1" {rng.choice(STATUSES)} {rng.randint(0, 50000)} '
+                f'"-" "{rng.choice(AGENTS)}" {ip}\n'
+            )
+
+
+# 混進合成 log 的特殊行（依序插入在檔案中段與檔尾）
+_EDGE_LINES = [
+    '10.0.0.1 - - [14/Jul/2025:12:00:00 +0800] "GET /中文路徑 HTTP/1.1" 404 12 "-" "UA" 203.0.113.5\n',
+    '10.0.0.2 - - [14/Jul/2025:12:00:00 +0800] "GET /nbsp HTTP/1.1" 500 12 "-" "U A" 203.0.113.6\n',
+    '10.0.0.3 - - [14/Jul/2025:12:00:01 +0800] "POST /ctl HTTP/1.1" 403 12 "-" "UA" 203.0.113.7\x1f\n',
+    '10.0.0.4 - - [14/Jul/2025:12:00:01 +0800] "GET /x HTTP/1.1" ٤٠٤ 12 "-" "UA" 203.0.113.8\n',
+    'garbage line without a valid format\n',
+    '10.0.0.5 - - [14/Jul/2025:12:00:02 +0800] "GET /crlf HTTP/1.1" 404 12 "-" "UA" 203.0.113.9\r\n',
+    '10.0.0.6 - - [99/Jul/2025:12:00:02 +0800] "GET /bad-date HTTP/1.1" 404 12 "-" "UA" 203.0.113.10\n',
+    '\n',
+]
+# 不是 "METHOD path HTTP/x" 的請求（nginx 仍會記錄），解析後 method 為空字串、resource 為引號內的原始內容
+_MALFORMED_REQUEST_LINES = [
+    '10.0.0.8 - - [14/Jul/2025:12:00:03 +0800] "-" 400 0 "-" "-" 203.0.113.12\n',
+    '10.0.0.8 - - [14/Jul/2025:12:00:03 +0800] "\\x16\\x03\\x01\\x00\\xa5\\x01\\x00" 400 157 "-" "-" 203.0.113.12\n',
+    '10.0.0.9 - - [14/Jul/2025:12:00:04 +0800] "GET /" 400 157 "-" "-" 203.0.113.13\n',
+    '10.0.0.9 - - [14/Jul/2025:12:00:04 +0800] "get /lower HTTP/1.1" 400 157 "-" "UA" 203.0.113.13\n',
+]
+_LAST_LINE = '10.0.0.7 - - [14/Jul/2025:23:59:59 +0800] "GET /no-newline HTTP/1.1" 502 12 "-" "UA" 203.0.113.11'
+
+
+def write_edge_case_log(path: str, lines: int):
+    """合成 log 中段與檔尾插入特殊行"""
+    write_synthetic_log(path, lines)
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.readlines()
+    middle = len(content) // 2
+    content[middle:middle] = _EDGE_LINES + _MALFORMED_REQUEST_LINES
+    content.append(_LAST_LINE)
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(content)
@@ -1,73 +1,29 @@
-from datetime import datetime
-import re
-
-LOG_PATH = "./data/access_log_part1.log" 
-
-
-def filter_logs_by_time_and_status(start_time: str, end_time: str, status_code: str):
-    """
-    從固定路徑讀取 log，根據時間區間與單一 HTTP 狀態碼篩選，回傳摘要與部分結果。
-
-    參數：
-        start_time (str): 起始時間，格式 "dd/Mon/yyyy HH:MM:SS"
-        end_time (str): 結束時間，格式 "dd/Mon/yyyy HH:MM:SS"
-        status_code (str): 要篩選的 HTTP 狀態碼（例如 "404"）
-
-    回傳：
-        list of str: 摘要 + 範例 log 行
-    """
-
-    time_format = "%d/%b/%Y:%H:%M:%S"
-    
-    try:
-        start_dt = datetime.strptime(start_time, time_format)
-        end_dt = datetime.strptime(end_time, time_format)
-    except ValueError as e:
-        return [f"❗ 時間格式錯誤：{e}"]
-
-    try:
-        status_code_int = int(status_code)
-    except ValueError:
-        return [f"❗ 無效的狀態碼：{status_code}"]
-
-    filtered_logs = []
-
-    try:
-        with open(LOG_PATH, 'r', encoding='utf-8') as f:
-            for line in f:
-                match = re.search(r'\[(.*?) \+\d{4}\]\s+"[^"]+"\s+(\d{3})', line)
-                if not match:
-                    continue
-
-                timestamp_str = match.group(1)
-                log_status = int(match.group(2))
-
-                try:
-                    log_dt = datetime.strptime(timestamp_str, time_format)
-                except ValueError:
-                    continue
-
-                if start_dt <= log_dt <= end_dt and log_status == status_code_int:
-                    filtered_logs.append(line.strip())
-
-    except FileNotFoundError:
-        return [f"❗ 找不到 log 檔案：{LOG_PATH}"]
-    except Exception as e:
-        return [f"❗ 讀取 log 時發生錯誤：{e}"]
-
-    if not filtered_logs:
-        return ["🔍 在指定時間範圍內沒有找到符合條件的日誌。"]
-
-    summary = f"✅ 共找到 {len(filtered_logs)} 筆符合條件的日誌。"
-    sample_logs = filtered_logs
-    return [summary] + sample_logs
-
-
-result = filter_logs_by_time_and_status(
-    start_time="14/Jul/2025:00:00:00",
-    end_time="14/Jul/2025:23:59:59",
-    status_code="404"
-)
-
-for log in result:
-    print(log)
\ No newline at end of file
+"""
+手動測試 MCP 的 log 查詢：直接呼叫與 MCP 工具相同的查詢引擎，印出摘要與第一頁結果。
+可用 MCP_LOG_PATH 指定 log 檔（預設 ./data/access_log_part1.log，與 MCP server 相同）。
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.tools.log_engine import get_engine
+
+LOG_PATH = os.getenv("MCP_LOG_PATH") or "./data/access_log_part1.log"
+
+
+if __name__ == "__main__":
+    page = get_engine(LOG_PATH).first_page(
+        "14/Jul/2025:00:00:00",
+        "14/Jul/2025:23:59:59",
+        status_code="^404$",
+        exclude_2xx=False,
+        include_malformed=True,
+    )
+
+    if "error" in page:
+        print(page["error"])
+    else:
+        print(page["summary"])
+        for log in page["rows"]:
+            print(log)
+        print(f"共 {page['total']} 筆，next_cursor：{page['next_cursor']}")
@@ -1,80 +1,49 @@
-from server import mcp
-from datetime import datetime
-import re
+from app.tools.log_engine import get_engine
 
-@mcp.tool()
-def add(x: int, y: int) -> int:
-    """
-    返回兩個數字的和。
-    
-    參數：
-        x (int): 第一個數字
-        y (int): 第二個數字
-    
-    回傳：
-        int: x 和 y 的和
-    """
-    return x + y
-
-LOG_PATH = "../data/access_log_part1.log" 
 
-@mcp.tool()
-def filter_logs_by_time_and_status(start_time: str, end_time: str, status_code: str):
+def register_log_tools(mcp, log_path: str):
     """
-    從固定路徑讀取 log，根據時間區間與單一 HTTP 狀態碼篩選。
-
-    參數：
-        start_time (str): 起始時間，格式 "dd/Mon/yyyy:HH:MM:SS"
-        end_time (str): 結束時間，格式 "dd/Mon/yyyy:HH:MM:SS"
-        status_code (str): 要篩選的 HTTP 狀態碼，例如 "404"
-
-    回傳：
-        list of str: 符合條件的 log 行
+    在 MCP server 上註冊 log 查詢工具。
+    查詢交給與 FastAPI 相同的 LogQueryEngine（同一個行程內共用索引、欄位快取與查詢結果快取）。
     """
-
-    time_format = "%d/%b/%Y:%H:%M:%S"
-    start_dt = datetime.strptime(start_time, time_format)
-    end_dt = datetime.strptime(end_time, time_format)
-
-    try:
-        status_code = int(status_code)
-    except ValueError:
-        print(f"無效的狀態碼：{status_code}")
-        return []
-
-    filtered_logs = []
-
-    try:
-        with open(LOG_PATH, 'r', encoding='utf-8') as f:
-            for line in f:
-                match = re.search(r'\[(.*?) \+\d{4}\]\s+"[^"]+"\s+(\d{3})', line)
-                if not match:
-                    continue
-
-                timestamp_str = match.group(1)
-                log_status = int(match.group(2))
-
-                try:
-                    log_dt = datetime.strptime(timestamp_str, time_format)
-                except ValueError:
-                    continue
-
-                if start_dt <= log_dt <= end_dt and log_status == status_code:
-                    filtered_logs.append(line.strip())
-
-    except FileNotFoundError:
-        print(f"找不到 log 檔案：{LOG_PATH}")
-    except Exception as e:
-        print(f"讀取 log 時發生錯誤：{e}")
-
-    return filtered_logs
-
-
-# result = filter_logs_by_time_and_status(
-#     start_time="14/Jul/2025:00:00:00",
-#     end_time="14/Jul/2025:23:59:59",
-#     status_codes=[404]
-# )
-
-# for log in result:
-#     print(log)
\ No newline at end of file
+    engine = get_engine(log_path)
+
+    @mcp.tool()
+    def filter_logs_by_time_and_status(start_time: str, end_time: str, status_code: str):
+        """
+        從固定路徑讀取 log，根據時間區間與單一 HTTP 狀態碼篩選，回傳摘要與第一頁結果。
+        符合的行很多時不會一次全部回傳，需要更多原始行時以 next_cursor 呼叫 filter_logs_next_page。
+
+        參數：
+            start_time (str): 起始時間，格式 "dd/Mon/yyyy:HH:MM:SS"
+            end_time (str): 結束時間，格式 "dd/Mon/yyyy:HH:MM:SS"
+            status_code (str): 要篩選的 HTTP 狀態碼（例如 "404"）
+
+        回傳：
+            dict: summary（統計摘要）、total（符合筆數）、page（頁碼）、rows（這一頁的 log 行）、
+                  next_cursor（還有下一頁時的 cursor，沒有時為 null）；失敗時只有 error
+        """
+        try:
+            status_code_int = int(status_code)
+        except ValueError:
+            return {"error": f"❗ 無效的狀態碼：{status_code}"}
+
+        # 回傳大小與符合的行數無關：摘要 + 一頁有上限的原始行 + cursor；
+        # 與原本的 MCP 工具相同，不合規格的請求行也列入
+        return engine.first_page(start_time, end_time, status_code=f"^{status_code_int}$", exclude_2xx=False,
+                                 include_malformed=True)
+
+    @mcp.tool()
+    def filter_logs_next_page(cursor: str):
+        """
+        接續 filter_logs_by_time_and_status 的結果，取得下一頁 log 行。
+
+        參數：
+            cursor (str): 上一頁回傳的 next_cursor
+
+        回傳：
+            dict: total、page、rows、next_cursor（格式同第一頁，沒有 summary）；cursor 無效或已失效時只有 error
+        """
+        return engine.next_page(cursor)
+
+    return filter_logs_by_time_and_status, filter_logs_next_page
@@ -0,0 +1,7 @@
+import os
+
+# 不向網路下載 LiteLLM 的模型價格表：離線時背景重試的執行緒偶爾會與匯入 litellm 互相卡住
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+# 測試不寫入 app/data：DSPy 預測快取與 IP 資訊快取只用記憶體
+os.environ.setdefault("DSPY_CACHE_DB", "")
+os.environ.setdefault("IPINFO_CACHE_DB", "")
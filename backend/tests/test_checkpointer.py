@@ -0,0 +1,102 @@
+"""
+SQLiteSaver 的寫入執行緒：
+- 同一批合併提交的寫入中有一筆失敗時，只有那一筆失敗，其他寫入照常提交
+- 清除過期 thread 時拋出非 sqlite3 的例外，寫入執行緒不會停止，之後的寫入仍會完成
+- 已取消的寫入略過
+- aget_tuple / alist 在執行緒池讀取，不阻塞 event loop
+"""
+import asyncio
+from concurrent.futures import Future
+import sqlite3
+import threading
+
+from langgraph.checkpoint.base import empty_checkpoint
+import pytest
+
+from app.checkpointer import SQLiteSaver
+
+
+@pytest.fixture
+def saver(tmp_path):
+    return SQLiteSaver(str(tmp_path / "checkpoints.sqlite"), batch_delay=0.2)
+
+
+def _config(thread_id: str) -> dict:
+    return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+
+
+def _put(saver: SQLiteSaver, thread_id: str):
+    return saver.put(_config(thread_id), empty_checkpoint(), {}, {})
+
+
+def test_failed_job_does_not_fail_its_batch(saver):
+    good_statements, _ = saver._put_statements(_config("good"), empty_checkpoint(), {})
+    # batch_delay 內送出的寫入合併成同一批
+    bad = saver._submit([("INSERT INTO missing_table VALUES (1)", ())])
+    good = saver._submit(good_statements)
+
+    assert good.result(timeout=5) is None
+    with pytest.raises(sqlite3.Error):
+        bad.result(timeout=5)
+    assert saver.batches == 1
+    assert saver.get_tuple(_config("good")) is not None
+
+
+def test_writer_survives_unexpected_exception(saver, monkeypatch):
+    def broken_prune():
+        raise RuntimeError("prune failed")
+
+    monkeypatch.setattr(saver, "_prune", broken_prune)
+    _put(saver, "first")
+    _put(saver, "second")
+
+    assert saver.get_tuple(_config("first")) is not None
+    assert saver.get_tuple(_config("second")) is not None
+
+
+def test_writer_survives_failed_commit(saver, monkeypatch):
+    def broken_commit(jobs, prune):
+        raise RuntimeError("commit failed")
+
+    monkeypatch.setattr(saver, "_commit", broken_commit)
+    with pytest.raises(RuntimeError):
+        _put(saver, "lost")
+
+    monkeypatch.undo()
+    _put(saver, "saved")
+    assert saver.get_tuple(_config("lost")) is None
+    assert saver.get_tuple(_config("saved")) is not None
+
+
+def test_cancelled_job_is_skipped(saver):
+    cancelled = Future()
+    cancelled.cancel()
+    saver._jobs.put(([("INSERT INTO missing_table VALUES (1)", ())], cancelled))
+    _put(saver, "after")
+
+    assert saver.get_tuple(_config("after")) is not None
+    assert saver.batched_jobs == 1
+
+
+def test_async_reads_run_off_the_event_loop(saver, monkeypatch):
+    _put(saver, "thread")
+    expected = saver.get_tuple(_config("thread"))
+
+    threads = []
+    get_tuple = saver.get_tuple
+
+    def recording_get_tuple(config):
+        threads.append(threading.get_ident())
+        return get_tuple(config)
+
+    monkeypatch.setattr(saver, "get_tuple", recording_get_tuple)
+
+    async def read():
+        saved = await saver.aget_tuple(_config("thread"))
+        listed = [item async for item in saver.alist(_config("thread"))]
+        return saved, listed
+
+    saved, listed = asyncio.run(read())
+    assert saved == expected
+    assert [item.config for item in listed] == [expected.config]
+    assert threads and threading.get_ident() not in threads
@@ -0,0 +1,123 @@
+"""
+fast_plan 的規則式判斷：
+- 每種條件（IP、狀態碼、HTTP 方法、日期）解析成與 parse_turn_plan 相同格式的查詢條件
+- 數量、IP、日期中的數字不會被當成狀態碼；小寫的英文動詞需接著「請求 / 方法」才算 HTTP 方法
+- 問意思或原因、排除條件、日內時間、無效日期、只有一種條件又沒有 log 字眼時回傳 None，改由 LLM 判斷
+"""
+from datetime import date
+
+import pytest
+
+from app.dspy_modules import fast_plan
+
+TODAY = date(2025, 7, 14)
+
+
+def plan(question: str) -> dict:
+    result = fast_plan(question, today=TODAY)
+    assert result is not None, question
+    return result
+
+
+def test_plan_has_turn_plan_fields():
+    assert plan("GET 404") == {
+        "intent": "web_log",
+        "start_time": "",
+        "end_time": "",
+        "status_code": "^404$",
+        "http_method": "^GET$",
+        "source_ip": "",
+        "use_ip_info": False,
+        "response_style": "detailed",
+    }
+
+
+@pytest.mark.parametrize("question, status_code", [
+    ("404 的請求", "^404$"),
+    ("5xx 錯誤", r"^5\d\d$"),
+    ("404 和 500 的請求", "^(404|500)$"),
+    # 排名與數量不是狀態碼
+    ("前 10 名的 404 來源", "^404$"),
+    ("top 5 404 requests", "^404$"),
+    ("404 筆 GET 請求", ""),
+])
+def test_status_codes(question, status_code):
+    assert plan(question)["status_code"] == status_code
+
+
+@pytest.mark.parametrize("question, http_method", [
+    ("POST 500", "^POST$"),
+    ("GET 和 POST 的 404", "^(GET|POST)$"),
+    ("get 請求有多少", "^GET$"),
+    # 一般英文單字的 get 不算 HTTP 方法
+    ("get the 404 logs", ""),
+])
+def test_http_methods(question, http_method):
+    assert plan(question)["http_method"] == http_method
+
+
+@pytest.mark.parametrize("question, start_time, end_time", [
+    ("14/Jul/2025 的 404", "14/Jul/2025:00:00:00", "14/Jul/2025:23:59:59"),
+    ("2025-08-01 的 404", "01/Aug/2025:00:00:00", "01/Aug/2025:23:59:59"),
+    ("2025/7/14 404 請求", "14/Jul/2025:00:00:00", "14/Jul/2025:23:59:59"),
+    ("2024年7月14日 的 500", "14/Jul/2024:00:00:00", "14/Jul/2024:23:59:59"),
+    # 沒寫年份時用今年
+    ("7月14日 的 500", "14/Jul/2025:00:00:00", "14/Jul/2025:23:59:59"),
+    ("今天的 404", "14/Jul/2025:00:00:00", "14/Jul/2025:23:59:59"),
+    ("昨天的 POST", "13/Jul/2025:00:00:00", "13/Jul/2025:23:59:59"),
+    # 提到多個日期時涵蓋最早到最晚的那一天
+    ("14/Jul/2025 和 16/Jul/2025 的 404", "14/Jul/2025:00:00:00", "16/Jul/2025:23:59:59"),
+    ("404 的請求", "", ""),
+])
+def test_dates(question, start_time, end_time):
+    result = plan(question)
+    assert (result["start_time"], result["end_time"]) == (start_time, end_time)
+
+
+def test_source_ips():
+    assert plan("8.8.8.8 的請求")["source_ip"] == r"^8\.8\.8\.8$"
+    result = plan("8.8.8.8 和 1.1.1.1 的 GET")
+    assert result["source_ip"] == r"^(8\.8\.8\.8|1\.1\.1\.1)$"
+    assert result["status_code"] == ""
+    assert not result["use_ip_info"]
+
+
+def test_ip_info_lookup():
+    result = plan("8.8.8.8 在哪裡")
+    assert result["use_ip_info"]
+    # 查詢 IP 資訊時不以該 IP 篩選 log
+    assert result["source_ip"] == ""
+
+
+@pytest.mark.parametrize("question, response_style", [
+    ("簡單說 404 請求", "brief"),
+    ("給我詳細的 404 請求", "detailed"),
+    # 同時出現時以詳細為準
+    ("簡短摘要 全部 404 請求", "detailed"),
+    ("404 的請求", "detailed"),
+])
+def test_response_style(question, response_style):
+    assert plan(question)["response_style"] == response_style
+
+
+@pytest.mark.parametrize("question", [
+    # 問意思或原因
+    "404 是什麼意思",
+    "why are there so many 500 errors",
+    # 排除條件、日內時間、時間區間
+    "不是 404 的請求",
+    "下午三點到五點的 500",
+    "last 2 hours 404 requests",
+    # 無效的日期
+    "2025-02-30 的 404",
+    # 一次查詢多個 IP 的資訊
+    "8.8.8.8 和 1.1.1.1 在哪個國家",
+    # 只有一種條件又沒有 log 字眼
+    "404",
+    "前 200 名的 404",
+    # 沒有任何條件
+    "hello",
+    "你好，今天天氣如何",
+])
+def test_falls_back_to_lm(question):
+    assert fast_plan(question, today=TODAY) is None
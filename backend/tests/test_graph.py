@@ -0,0 +1,133 @@
+"""
+web_log_tool 使用判斷出的查詢條件：
+- 合併判斷（或規則式快速判斷）提取的時間範圍直接用於 log 查詢
+- LOG_QUERY_FIXED_DATE 預設固定查詢範例 log 的日期，設為空字串時才使用判斷出的時間範圍
+
+web_log 意圖的平行分支（log 查詢、IP 資訊、回應類型判斷）：
+- 三個分支同時執行，web_log_join 等三者都完成後才合併
+- 合併後的狀態與原本依序執行相同：tool_output 是統計資訊接上 IP 資訊，依判斷的回應類型產生回答
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import app.graph
+from app.dspy_modules import fast_plan
+
+
+@pytest.fixture
+def queries(monkeypatch):
+    calls = []
+
+    async def fake_query_logs(**kwargs):
+        calls.append(kwargs)
+        return None
+
+    monkeypatch.setattr(app.graph, "aquery_logs", fake_query_logs)
+    return calls
+
+
+def _state(plan: dict) -> dict:
+    return {"messages": [{"role": "user", "content": "question"}], "plan": plan}
+
+
+def test_planned_time_range_is_used(queries, monkeypatch):
+    monkeypatch.setattr(app.graph, "LOG_QUERY_FIXED_DATE", "")
+    plan = fast_plan("2025-08-01 的 404")
+    assert plan is not None
+
+    asyncio.run(app.graph.web_log_tool(_state(plan)))
+    assert queries[0]["start_time"] == plan["start_time"] == "01/Aug/2025:00:00:00"
+    assert queries[0]["end_time"] == plan["end_time"] == "01/Aug/2025:23:59:59"
+
+
+def test_fixed_date_overrides_plan(queries, monkeypatch):
+    monkeypatch.setattr(app.graph, "LOG_QUERY_FIXED_DATE", "14/Jul/2025")
+    asyncio.run(app.graph.web_log_tool(_state(fast_plan("2025-08-01 的 404"))))
+    assert queries[0]["start_time"] == "14/Jul/2025:00:00:00"
+    assert queries[0]["end_time"] == "14/Jul/2025:23:59:59"
+
+
+def test_fixed_date_defaults_to_sample_log():
+    env = {key: value for key, value in os.environ.items() if key != "LOG_QUERY_FIXED_DATE"}
+    output = subprocess.run([sys.executable, "-c", "import app.graph; print(app.graph.LOG_QUERY_FIXED_DATE)"],
+                            env=env, capture_output=True, text=True, check=True).stdout
+    assert output.strip().splitlines()[-1] == "14/Jul/2025"
+
+
+BRANCH_DELAY = 0.2
+
+
+class FakeModules:
+    """依名稱回傳假的 DSPy 模組，記錄每次 LLM 呼叫的起訖時間"""
+
+    def __init__(self):
+        self.calls = {}
+
+    def __call__(self, name: str):
+        return SimpleNamespace(name=name, acall=lambda **kwargs: self.acall(name, **kwargs))
+
+    async def acall(self, name: str, **kwargs):
+        if name == "turn_planner":
+            # 合併判斷失敗，改走逐步判斷
+            raise ValueError("planner unavailable")
+        labels = kwargs.get("intent_labels")
+        if labels == ["web_log", "general"]:
+            return SimpleNamespace(intent="web_log")
+
+        label = "extract" if name == "log_query_extractor" else labels[0]
+        started = time.perf_counter()
+        await asyncio.sleep(BRANCH_DELAY)
+        self.calls[label] = (started, time.perf_counter())
+        if name == "log_query_extractor":
+            return SimpleNamespace(start_time="", end_time="", status_code="^404$", http_method="", source_ip="")
+        return SimpleNamespace(intent=label)
+
+
+def test_web_log_branches_run_concurrently_and_join(monkeypatch):
+    modules = FakeModules()
+    answers = []
+
+    async def fake_query_logs(**kwargs):
+        return SimpleNamespace(total=1, **kwargs)
+
+    async def fake_ip_infos(ips):
+        return {ip: {"country": "TW"} for ip in ips}
+
+    async def fake_answer(generator, **kwargs):
+        answers.append((time.perf_counter(), generator, kwargs))
+        return "answer"
+
+    monkeypatch.setattr(app.graph, "FAST_ROUTER", False)
+    monkeypatch.setattr(app.graph, "get_module", modules)
+    monkeypatch.setattr(app.graph, "aquery_logs", fake_query_logs)
+    monkeypatch.setattr(app.graph, "format_query_result",
+                        lambda result: (f"stats {result.status_code}", {"type": "table"}))
+    monkeypatch.setattr(app.graph, "aget_ip_infos", fake_ip_infos)
+    monkeypatch.setattr(app.graph, "generate_answer", fake_answer)
+
+    state = asyncio.run(app.graph.app.ainvoke(
+        {"messages": [{"role": "user", "content": "8.8.8.8 的 404 請求"}]},
+        config={"thread_id": "test-web-log-branches"},
+    ))
+
+    # 三個分支的 LLM 呼叫在任何一個結束前都已經開始
+    branches = [modules.calls[label] for label in ("extract", "ip_info", "brief")]
+    assert max(start for start, _ in branches) < min(end for _, end in branches)
+
+    # web_log_join 在三個分支都完成後才合併，並依回應類型進入簡短回應
+    assert len(answers) == 1
+    answered_at, generator, kwargs = answers[0]
+    assert answered_at >= max(end for _, end in branches)
+    assert generator.name == "web_log_brief_response"
+    expected_output = "stats ^404$\nIP 資訊: {'country': 'TW'}"
+    assert kwargs["tool_output"] == expected_output
+    assert state["tool_output"] == expected_output
+    assert state["tool_detail"] == {"type": "table"}
+    assert state["response_style"] == "brief"
+    assert state["messages"][-1] == {"role": "assistant", "content": "answer"}
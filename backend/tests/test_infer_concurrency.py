@@ -0,0 +1,57 @@
+"""
+/api/infer 的併發負載：LLM 改為本機的模擬 OpenAI 相容服務（固定延遲），log 使用合成資料。
+graph 全程 async、沒有節點阻塞 event loop 時，同時進來的多個 session 應該重疊執行，
+總耗時接近單一請求，而不是隨 session 數線性增加。
+"""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from benchmarks.simulated_llm import configure_simulated_llm
+from benchmarks.synthetic_log import write_synthetic_log
+
+LATENCY = 0.2
+SESSIONS = 8
+
+
+@pytest.fixture(scope="module")
+def client_app(tmp_path_factory):
+    configure_simulated_llm(LATENCY)
+    from app.main import app
+    from app.tools import log_tools
+
+    path = str(tmp_path_factory.mktemp("infer") / "access.log")
+    write_synthetic_log(path, 20_000)
+    original, log_tools.LOG_PATH = log_tools.LOG_PATH, path
+    yield app
+    log_tools.LOG_PATH = original
+
+
+async def ask(client, session_id: str) -> dict:
+    response = await client.post("/api/infer", json={"input": f"{session_id} 今天 4xx 的請求", "session_id": session_id})
+    response.raise_for_status()
+    return response.json()
+
+
+async def run_sessions(app, prefix: str, sessions: int):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=60) as client:
+        started = time.perf_counter()
+        results = await asyncio.gather(*(ask(client, f"{prefix}-{i}") for i in range(sessions)))
+        return results, time.perf_counter() - started
+
+
+def test_concurrent_sessions_overlap(client_app):
+    # 第一次請求建立索引與欄位快取，不計入
+    asyncio.run(run_sessions(client_app, "warm", 1))
+    sequential = sum(asyncio.run(run_sessions(client_app, f"single-{i}", 1))[1] for i in range(SESSIONS))
+
+    results, seconds = asyncio.run(run_sessions(client_app, "burst", SESSIONS))
+    assert len(results) == SESSIONS
+    # 每個 session 都完成 log 查詢並回覆
+    assert all(result["message"] and "tool_output" in result for result in results)
+    # 有節點阻塞 event loop 時總耗時接近逐一執行；重疊執行時每多一個 session 至少省下半個 LLM 延遲
+    # （不直接比較倍數：單核心機器上各請求的 CPU 時間無法重疊）
+    assert seconds < sequential - (SESSIONS - 1) * LATENCY / 2, (seconds, sequential)
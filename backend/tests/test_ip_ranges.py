@@ -0,0 +1,85 @@
+"""
+IP 範圍資料庫的載入不阻塞查詢：
+- 還沒載入或檔案變動時，get_ip_range_db 只在背景開始載入，立刻回傳目前的資料庫（可能是 None）
+- 同時間只有一個載入；讀取失敗的檔案版本在檔案變動前不再重試
+"""
+import os
+import threading
+import time
+
+import pytest
+
+from app.tools import ip_ranges
+
+
+@pytest.fixture
+def ranges_path(tmp_path, monkeypatch):
+    path = tmp_path / "ip_ranges.tsv"
+    path.write_text("1.0.0.0\t1.0.0.255\t13335\tUS\tCLOUDFLARENET\n", encoding="utf-8")
+    monkeypatch.setattr(ip_ranges, "IP_RANGES_PATH", str(path))
+    monkeypatch.setattr(ip_ranges, "_db", None)
+    monkeypatch.setattr(ip_ranges, "_db_identity", None)
+    monkeypatch.setattr(ip_ranges, "_failed_identity", None)
+    return path
+
+
+@pytest.fixture
+def blocked_load(monkeypatch):
+    """讓 IPRangeDB.load 等到 release 才完成，並記錄呼叫次數"""
+    release = threading.Event()
+    calls = []
+    load = ip_ranges.IPRangeDB.load
+
+    def slow_load(path):
+        calls.append(path)
+        release.wait(5)
+        return load(path)
+
+    monkeypatch.setattr(ip_ranges.IPRangeDB, "load", slow_load)
+    yield release, calls
+    release.set()
+
+
+def test_lookup_does_not_wait_for_load(ranges_path, blocked_load):
+    release, calls = blocked_load
+
+    started = time.perf_counter()
+    results = [ip_ranges.get_ip_range_db() for _ in range(20)]
+    assert time.perf_counter() - started < 1
+    assert results == [None] * 20
+    assert ip_ranges.annotate_ips(["1.0.0.1"]) == {}
+
+    release.set()
+    db = ip_ranges.wait_for_ip_range_db(5)
+    assert len(calls) == 1
+    assert db is not None and db.lookup("1.0.0.1")["asn"] == "AS13335"
+    assert ip_ranges.get_ip_range_db() is db
+
+
+def test_changed_file_keeps_serving_old_db(ranges_path, blocked_load):
+    release, calls = blocked_load
+    release.set()
+    old = ip_ranges.wait_for_ip_range_db(5)
+
+    release.clear()
+    ranges_path.write_text("2.0.0.0\t2.0.0.255\t15169\tUS\tGOOGLE\n", encoding="utf-8")
+    os.utime(ranges_path, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+    assert ip_ranges.get_ip_range_db() is old
+
+    release.set()
+    new = ip_ranges.wait_for_ip_range_db(5)
+    assert new is not old and new.lookup("2.0.0.1")["org"] == "GOOGLE"
+    assert len(calls) == 2
+
+
+def test_failed_load_is_not_retried_until_file_changes(ranges_path, monkeypatch):
+    calls = []
+
+    def broken_load(path):
+        calls.append(path)
+        raise OSError("unreadable")
+
+    monkeypatch.setattr(ip_ranges.IPRangeDB, "load", broken_load)
+    assert ip_ranges.wait_for_ip_range_db(5) is None
+    assert ip_ranges.wait_for_ip_range_db(5) is None
+    assert len(calls) == 1
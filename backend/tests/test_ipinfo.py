@@ -0,0 +1,177 @@
+"""
+IPInfoClient（本機的模擬 ipinfo 服務）：
+- 重複查詢由記憶體 / SQLite 快取回傳，不送出請求；SQLite 在第一次查詢時才開啟
+- 同時查詢同一個 IP 只送出一個請求；送出請求的呼叫端被取消時，其他呼叫端不會一直等待
+- 失敗與逾時的結果在負面快取期間不重試，也不寫入 SQLite
+- 私有位址與格式錯誤的 IP 不送出請求
+- 換用新的 event loop 時關閉舊的連線池
+- alookup 在執行緒池讀寫 SQLite，不阻塞 event loop
+"""
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from app.tools.ipinfo import IPInfoClient
+from benchmarks.stub_ipinfo import FAILING_IP, SLOW_IP, StubIPInfo
+
+LATENCY = 0.05
+TIMEOUT = 0.3
+NEGATIVE_TTL = 0.5
+
+
+@pytest.fixture(scope="module")
+def stub():
+    stub = StubIPInfo(LATENCY, slow_latency=TIMEOUT * 4)
+    stub.base_url = stub.start()
+    return stub
+
+
+@pytest.fixture
+def client(stub, tmp_path):
+    client = IPInfoClient(base_url=stub.base_url, token=None, timeout=TIMEOUT, negative_ttl=NEGATIVE_TTL,
+                          db_path=str(tmp_path / "ipinfo_cache.sqlite"))
+    yield client
+    client.close()
+
+
+def test_repeated_lookups_are_cached(stub, client, tmp_path):
+    assert not os.path.exists(tmp_path / "ipinfo_cache.sqlite")
+
+    async def lookups():
+        first = await client.alookup("45.0.0.1")
+        before = stub.requests
+        again = [await client.alookup("45.0.0.1") for _ in range(10)]
+        return first, again, stub.requests - before
+
+    first, again, requests = asyncio.run(lookups())
+    assert first["city"] == "Taipei" and "readme" not in first
+    assert all(result == first for result in again) and requests == 0
+
+    # 新的用戶端（例如重新啟動後）由 SQLite 取得
+    restarted = IPInfoClient(base_url=stub.base_url, token=None, db_path=str(tmp_path / "ipinfo_cache.sqlite"))
+    before = stub.requests
+    assert restarted.lookup("45.0.0.1") == first
+    assert stub.requests == before and restarted.stats()["disk_hits"] == 1
+    restarted.close()
+
+
+def test_concurrent_lookups_share_one_request(stub, client):
+    async def lookups():
+        before = stub.requests
+        same = await asyncio.gather(*(client.alookup("46.0.0.1") for _ in range(20)))
+        batch = await client.alookup_many(["46.0.1.1", "46.0.1.2", "46.0.1.1"])
+        return same, batch, stub.requests - before
+
+    same, batch, requests = asyncio.run(lookups())
+    assert all(result == same[0] for result in same)
+    assert list(batch) == ["46.0.1.1", "46.0.1.2"]
+    assert requests == 3
+
+
+def test_cancelled_lookup_does_not_block_waiters(stub, client):
+    async def lookups():
+        first = asyncio.create_task(client.alookup("48.0.0.1"))
+        await asyncio.sleep(LATENCY / 5)
+        waiters = [asyncio.create_task(client.alookup("48.0.0.1")) for _ in range(3)]
+        await asyncio.sleep(0)
+        first.cancel()
+        return await asyncio.wait_for(asyncio.gather(*waiters), timeout=LATENCY * 20), first
+
+    results, first = asyncio.run(lookups())
+    assert first.cancelled()
+    assert all(result["ip"] == "48.0.0.1" and "error" not in result for result in results)
+    assert not client._in_flight
+
+
+def test_cancelled_waiter_does_not_cancel_lookup(client):
+    async def lookups():
+        first = asyncio.create_task(client.alookup("48.0.0.2"))
+        await asyncio.sleep(LATENCY / 5)
+        waiter = asyncio.create_task(client.alookup("48.0.0.2"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        return await first, waiter
+
+    result, waiter = asyncio.run(lookups())
+    assert waiter.cancelled() and result["city"] == "Taipei"
+
+
+def test_failures_are_cached_briefly(stub, client, tmp_path):
+    async def lookups():
+        before = stub.requests
+        failed = await client.alookup(FAILING_IP)
+        started = time.perf_counter()
+        timed_out = await client.alookup(SLOW_IP)
+        timeout_seconds = time.perf_counter() - started
+        await client.alookup(FAILING_IP)
+        await client.alookup(SLOW_IP)
+        cached_requests = stub.requests - before
+        await asyncio.sleep(NEGATIVE_TTL)
+        await client.alookup(FAILING_IP)
+        return failed, timed_out, timeout_seconds, cached_requests, stub.requests - before
+
+    failed, timed_out, timeout_seconds, cached_requests, requests = asyncio.run(lookups())
+    assert "error" in failed and "error" in timed_out
+    assert timeout_seconds < TIMEOUT + 0.5
+    assert cached_requests == 2
+    # 負面快取過期後重試
+    assert requests == 3
+
+    # 失敗不寫入 SQLite
+    restarted = IPInfoClient(base_url=stub.base_url, token=None, db_path=str(tmp_path / "ipinfo_cache.sqlite"))
+    before = stub.requests
+    assert "error" in restarted.lookup(FAILING_IP) and stub.requests == before + 1
+    restarted.close()
+
+
+def test_local_addresses_skip_requests(stub, client):
+    before = stub.requests
+    assert client.lookup("10.0.0.8")["bogon"]
+    assert "error" in client.lookup("not-an-ip")
+    assert stub.requests == before
+
+
+def test_new_event_loop_closes_old_pool(client):
+    async def lookup(ip):
+        await client.alookup(ip)
+        return client._async_client
+
+    first_pool = asyncio.run(lookup("49.0.0.1"))
+    second_pool = asyncio.run(lookup("49.0.0.2"))
+    assert first_pool.is_closed and second_pool is not first_pool
+
+    async def lookup_and_close(ip):
+        await client.alookup(ip)
+        pool = client._async_client
+        await client.aclose()
+        return pool
+
+    assert asyncio.run(lookup_and_close("49.0.0.3")).is_closed
+
+
+def test_async_disk_access_runs_off_the_event_loop(stub, client, monkeypatch):
+    threads = []
+    for name in ("_cached_on_disk", "_persist"):
+        method = getattr(client, name)
+
+        def recording(*args, method=method):
+            threads.append(threading.get_ident())
+            return method(*args)
+
+        monkeypatch.setattr(client, name, recording)
+
+    async def lookups():
+        first = await client.alookup("45.0.0.2")
+        client.memory.clear()
+        before = stub.requests
+        again = await client.alookup("45.0.0.2")
+        return first, again, stub.requests - before
+
+    first, again, requests = asyncio.run(lookups())
+    assert again == first and requests == 0
+    # 第一次：讀取（未命中）與寫入；第二次：讀取（命中）
+    assert len(threads) == 3 and threading.get_ident() not in threads
+    assert client.stats()["disk_hits"] == 1
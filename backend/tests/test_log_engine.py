@@ -0,0 +1,308 @@
+"""
+LogQueryEngine / MultiFileQueryEngine：
+- iter_matches 逐筆產生的行與 query(keep_lines=True) 的 filtered_logs 相同（單檔與多檔來源）
+- 條件錯誤時 iter_matches 拋出 ValueError
+- approximate=True 時即使欄位快取已建立也改走逐行掃描，以固定容量的近似計數並回傳誤差上限
+- 預設不列入不合規格的請求行，筆數與原本 FastAPI 逐行比對的結果相同（欄位快取、彙總表與逐行掃描的路徑）；
+  include_malformed=True 時列入，method 為空字串，指定 http_method 時排除
+- 單檔與多檔來源的分頁串起來與 query 的結果相同；單檔來源輪替後舊的 cursor 失效
+- 查詢結果快取：相同條件（空字串 / None、月份大小寫不同的同一時間）命中同一筆結果；
+  超過 TTL 或 log 檔追加內容後重新查詢；快取保留的原始行合計不超過 QUERY_CACHE_MAX_LINES
+"""
+from datetime import datetime
+from functools import partial
+import os
+import re
+
+import pytest
+
+from app.tools import log_engine, log_scan
+from app.tools.log_engine import get_engine
+from app.tools.log_tools import query_logs
+from app.tools.ttl_cache import TTLCache
+from benchmarks.synthetic_log import _MALFORMED_REQUEST_LINES, write_edge_case_log, write_synthetic_log
+
+START, END = "14/Jul/2025:06:00:00", "14/Jul/2025:18:00:00"
+
+# 原本 FastAPI 查詢逐行比對用的正規表達式：請求必須是 "METHOD path HTTP/x"
+_OLD_FASTAPI_RE = re.compile(r'\[(?P<time>.*?) \+\d{4}\] "(?P<method>[A-Z]+) (?P<resource>[^ ]+) HTTP/[^"]+" (?P<status>\d{3})')
+
+
+@pytest.fixture
+def single_log(tmp_path):
+    path = str(tmp_path / "access.log")
+    write_synthetic_log(path, 5000)
+    return path
+
+
+@pytest.fixture
+def rotated_logs(tmp_path):
+    # access.log.1 是前一天，access.log 是當天
+    write_synthetic_log(str(tmp_path / "access.log.1"), 3000, start="13/Jul/2025:00:00:00", seed=1)
+    write_synthetic_log(str(tmp_path / "access.log"), 3000, start="14/Jul/2025:00:00:00", seed=2)
+    return str(tmp_path)
+
+
+@pytest.mark.parametrize("status_code", [None, "^404$", "^5"])
+def test_iter_matches_matches_query(single_log, status_code):
+    engine = get_engine(single_log)
+    expected = engine.query(START, END, status_code, keep_lines=True)
+
+    matches = list(engine.iter_matches(START, END, status_code))
+    assert [line for line, _ in matches] == expected.filtered_logs
+    assert len(matches) == expected.total
+    assert all(record.status != 200 for _, record in matches)
+
+
+def test_iter_matches_across_rotated_files(rotated_logs):
+    engine = get_engine(rotated_logs)
+    start, end = "13/Jul/2025:20:00:00", "14/Jul/2025:04:00:00"
+    expected = engine.query(start, end, "^404$", keep_lines=True)
+
+    matches = list(engine.iter_matches(start, end, "^404$"))
+    assert [line for line, _ in matches] == expected.filtered_logs
+    # 跨午夜：兩個檔案都有符合的行
+    days = {line.split("[", 1)[1][:11] for line, _ in matches}
+    assert days == {"13/Jul/2025", "14/Jul/2025"}
+
+
+def test_iter_matches_is_lazy(single_log):
+    matches = get_engine(single_log).iter_matches(START, END)
+    first_line, first_record = next(matches)
+    assert first_line.startswith("10.0.0.")
+    assert first_record.epoch >= 0
+    matches.close()
+
+
+@pytest.mark.parametrize("arguments", [("bad time", END), (START, END, "[")])
+def test_iter_matches_rejects_invalid_arguments(single_log, arguments):
+    with pytest.raises(ValueError):
+        next(get_engine(single_log).iter_matches(*arguments))
+
+
+def test_query_returns_none_for_missing_file(tmp_path):
+    assert get_engine(os.path.join(str(tmp_path), "missing.log")).query(START, END) is None
+
+
+def test_engine_subclass_must_implement_hooks():
+    class PartialEngine(log_engine._BaseQueryEngine):
+        def _query(self, conditions, query_filter):
+            return None
+
+    with pytest.raises(TypeError, match="_paths_by_inode"):
+        PartialEngine()
+
+
+def assert_within_error_bounds(exact, approx):
+    assert exact.error_bounds is None and approx.error_bounds["ip"] > 0
+    assert approx.total == exact.total and approx.status_counts == exact.status_counts
+
+    exact_ips = {ip: count for ip, count, _ in exact.top_ips}
+    for ip, count, _ in approx.top_ips:
+        if ip in exact_ips:
+            assert count <= exact_ips[ip] <= count + approx.error_bounds["ip"]
+
+
+def test_approximate_query_skips_store(single_log, monkeypatch):
+    engine = get_engine(single_log)
+    exact = engine.query(START, END, approximate=False)
+    store = engine.ingestor.store
+    assert store is not None
+
+    def unused(*args, **kwargs):
+        raise AssertionError("近似模式不應使用欄位快取")
+
+    # 欄位快取的字典與暫存陣列隨資料量成長，近似模式改以時間索引逐行掃描
+    monkeypatch.setattr(store, "select", unused)
+    monkeypatch.setattr(store, "window_summary", unused)
+    monkeypatch.setattr(log_scan, "APPROX_CAPACITY", 5)
+    approx = engine.query(START, END, approximate=True)
+    assert engine.ingestor.store is store
+    assert_within_error_bounds(exact, approx)
+
+
+def test_approximate_scan_query_reports_error_bounds(single_log, monkeypatch):
+    engine = get_engine(single_log)
+    # 模擬欄位快取還在背景建立：查詢改走逐行掃描
+    monkeypatch.setattr(engine.ingestor, "snapshot", partial(engine.ingestor.snapshot, sync_max_bytes=0))
+    monkeypatch.setattr(engine.ingestor, "refresh_in_background", lambda: None)
+    monkeypatch.setattr(log_scan, "APPROX_CAPACITY", 5)
+
+    exact = engine.query(START, END, approximate=False)
+    approx = engine.query(START, END, approximate=True)
+    assert engine.ingestor.store is None
+    assert_within_error_bounds(exact, approx)
+
+
+def old_fastapi_lines(log_path: str, start_time: str, end_time: str, status_code: str) -> list:
+    """原本 FastAPI 查詢的篩選方式（排除 2xx）"""
+    time_format = "%d/%b/%Y:%H:%M:%S"
+    start_dt, end_dt = datetime.strptime(start_time, time_format), datetime.strptime(end_time, time_format)
+    lines = []
+    with open(log_path, "r", encoding="utf-8") as f:
+        for line in f:
+            match = _OLD_FASTAPI_RE.search(line)
+            if not match:
+                continue
+            try:
+                log_dt = datetime.strptime(match.group("time"), time_format)
+            except ValueError:
+                continue
+            status = str(int(match.group("status")))
+            if start_dt <= log_dt <= end_dt and not status.startswith("2") and re.match(status_code, status):
+                lines.append(line.strip())
+    return lines
+
+
+@pytest.fixture
+def edge_case_log(tmp_path):
+    path = str(tmp_path / "access.log")
+    write_edge_case_log(path, 2000)
+    return path
+
+
+@pytest.mark.parametrize("use_store", [True, False])
+@pytest.mark.parametrize("status_code", ["^400$", "^4", "^5"])
+def test_query_counts_match_old_fastapi_query(edge_case_log, monkeypatch, use_store, status_code):
+    engine = get_engine(edge_case_log)
+    if not use_store:
+        monkeypatch.setattr(engine.ingestor, "snapshot", partial(engine.ingestor.snapshot, sync_max_bytes=0))
+        monkeypatch.setattr(engine.ingestor, "refresh_in_background", lambda: None)
+    expected = old_fastapi_lines(edge_case_log, START, END, status_code)
+
+    # keep_lines 逐列過濾；沒有 keep_lines 時有欄位快取就合併彙總表
+    lines = query_logs(START, END, status_code, keep_lines=True, log_path=edge_case_log)
+    summary = query_logs(START, END, status_code, log_path=edge_case_log)
+    assert (engine.ingestor.store is not None) == use_store
+    assert lines.filtered_logs == expected
+    assert lines.total == summary.total == sum(count for _, count in summary.status_counts) == len(expected)
+    assert [line for line, _ in engine.iter_matches(START, END, status_code)] == expected
+
+
+@pytest.mark.parametrize("use_store", [True, False])
+def test_include_malformed_requests(edge_case_log, monkeypatch, use_store):
+    engine = get_engine(edge_case_log)
+    if not use_store:
+        monkeypatch.setattr(engine.ingestor, "snapshot", partial(engine.ingestor.snapshot, sync_max_bytes=0))
+        monkeypatch.setattr(engine.ingestor, "refresh_in_background", lambda: None)
+    malformed = [line.strip() for line in _MALFORMED_REQUEST_LINES]
+    window = ("14/Jul/2025:12:00:03", "14/Jul/2025:12:00:04")
+
+    strict = query_logs(*window, "^400$", keep_lines=True, log_path=edge_case_log)
+    assert not set(strict.filtered_logs) & set(malformed)
+
+    result = query_logs(*window, "^400$", keep_lines=True, log_path=edge_case_log, include_malformed=True)
+    assert result.total == strict.total + len(malformed)
+    assert [line for line in result.filtered_logs if line in malformed] == malformed
+    assert query_logs(*window, "^400$", log_path=edge_case_log, include_malformed=True).total == result.total
+    rows = [row for row in result.structured_body if row["http_method"] == ""]
+    assert [row["resource"] for row in rows] == ["-", "\\x16\\x03\\x01\\x00\\xa5\\x01\\x00", "GET /",
+                                                 "get /lower HTTP/1.1"]
+
+    filtered = query_logs(*window, "^400$", "^GET$", keep_lines=True, log_path=edge_case_log,
+                          include_malformed=True)
+    assert not set(filtered.filtered_logs) & set(malformed)
+
+
+@pytest.mark.parametrize("source", ["single_log", "rotated_logs"])
+def test_pages_concatenate_to_query(source, request):
+    engine = get_engine(request.getfixturevalue(source))
+    start, end = "13/Jul/2025:20:00:00", "14/Jul/2025:04:00:00"
+    expected = engine.query(start, end, "^404$", keep_lines=True).filtered_logs
+
+    page = engine.first_page(start, end, "^404$", page_rows=7)
+    rows = page["rows"]
+    while page["next_cursor"] is not None:
+        page = engine.next_page(page["next_cursor"])
+        rows += page["rows"]
+    assert rows == expected and page["page"] > 1
+
+
+def test_rotated_file_invalidates_cursor(single_log):
+    engine = get_engine(single_log)
+    page = engine.first_page(START, END, page_rows=5)
+    os.rename(single_log, single_log + ".1")
+    write_synthetic_log(single_log, 5000)
+    assert "error" in engine.next_page(page["next_cursor"])
+    assert engine.next_page("not-a-cursor") == {"error": "無效的 cursor"}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def query_cache(monkeypatch, clock):
+    cache = TTLCache(128, 300, clock=clock, max_weight=log_engine.QUERY_CACHE_MAX_LINES,
+                     weigh=log_engine._retained_lines)
+    monkeypatch.setattr(log_engine, "query_cache", cache)
+    return cache
+
+
+def test_query_cache_hits_equivalent_conditions(single_log, query_cache):
+    engine = get_engine(single_log)
+    first = engine.query(START, END, "^404$")
+    assert engine.query(START, END, "^404$") is first
+    # 空字串視為未指定、時間以 epoch 比較
+    assert engine.query(START.replace("Jul", "jul"), END, "^404$", "", "") is first
+    assert engine.query(START, END, "^404$", keep_lines=True) is not first
+    assert engine.query(START, END, "^404$", exclude_2xx=False) is not first
+    assert query_cache.stats()["hits"] == 2
+
+
+def test_query_cache_expires_after_ttl(single_log, query_cache, clock):
+    engine = get_engine(single_log)
+    first = engine.query(START, END)
+    clock.now = 299
+    assert engine.query(START, END) is first
+
+    clock.now = 301
+    again = engine.query(START, END)
+    assert again is not first and again == first
+    assert query_cache.stats()["expirations"] == 1
+
+
+def test_query_cache_invalidated_when_log_grows(single_log, query_cache):
+    engine = get_engine(single_log)
+    first = engine.query(START, END, "^404$", keep_lines=True)
+    line = '10.0.0.9 - - [14/Jul/2025:12:00:00 +0800] "GET /appended HTTP/1.1" 404 12 "-" "UA" 203.0.113.99\n'
+    with open(single_log, "a", encoding="utf-8") as f:
+        f.write(line)
+
+    after = engine.query(START, END, "^404$", keep_lines=True)
+    assert after.total == first.total + 1
+    assert line.strip() in after.filtered_logs
+    assert engine.query(START, END, "^404$", keep_lines=True) is after
+
+
+def test_query_cache_bounds_retained_lines(single_log, query_cache, monkeypatch):
+    engine = get_engine(single_log)
+    total = engine.query(START, END, keep_lines=True).total
+    # 上限只容得下一個 keep_lines 的結果
+    monkeypatch.setattr(query_cache, "max_weight", total + 150)
+    query_cache.clear()
+
+    lines = engine.query(START, END, keep_lines=True)
+    assert engine.query(START, END, keep_lines=True) is lines
+    assert query_cache.weight == total + len(lines.sample_lines)
+
+    # 再放入結果時從最久沒用到的開始淘汰，保留的行數不超過上限
+    engine.query(START, END, "^4", keep_lines=True)
+    engine.query(START, END, "^5")
+    assert query_cache.weight <= query_cache.max_weight
+    assert engine.query(START, END, keep_lines=True) is not lines
+
+    # 單一結果超過上限時不快取
+    monkeypatch.setattr(query_cache, "max_weight", total - 1)
+    query_cache.clear()
+    engine.query(START, END, keep_lines=True)
+    assert len(query_cache) == 0 and query_cache.weight == 0
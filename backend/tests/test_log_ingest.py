@@ -0,0 +1,229 @@
+"""
+增量匯入（LogIngestor）與欄位快取的追加：
+- 分多次追加後的欄位與一次匯入整個檔案相同
+- 已發出的快照不受之後追加的影響，從舊快照分岔追加也不會覆寫其他快照的資料
+- 檔尾沒有換行的行在檔案穩定後才匯入；之後被接著寫入時重建
+- 彙總表的增量區塊依大小分級合併，區塊數維持在對數級，結果與一次建立相同
+- 多個 worker 寫入同一個版本時不覆寫已發佈（可能正被 memory-map）的欄位檔
+- build_store=False（近似統計模式）只維護時間索引，不建立欄位快取
+"""
+import os
+import time
+
+import numpy as np
+
+from app.tools import log_rollup
+from app.tools.log_ingest import LogIngestor
+from app.tools.log_store import COLUMNS, LogColumnStore, compact_store, load_store, store_dir_for
+from benchmarks.synthetic_log import write_synthetic_log
+
+
+def _columns(start: int, rows: int) -> dict:
+    return {name: (np.arange(start, start + rows) if name == "epoch" else np.full(rows, start)).astype(dtype)
+            for name, dtype in COLUMNS.items()}
+
+
+def _all_columns(store: LogColumnStore) -> dict:
+    rows = np.arange(len(store), dtype=np.int64)
+    return {name: store.take(name, rows) for name in COLUMNS}
+
+
+def test_incremental_refresh_matches_full_ingest(tmp_path):
+    source = tmp_path / "source.log"
+    write_synthetic_log(str(source), 3000)
+    lines = source.read_bytes().splitlines(keepends=True)
+
+    log_path = tmp_path / "access.log"
+    log_path.write_bytes(b"".join(lines[:1000]))
+    ingestor = LogIngestor(str(log_path))
+    assert ingestor.refresh() == 1000
+
+    for start in range(1000, 3000, 250):
+        with open(log_path, "ab") as f:
+            f.write(b"".join(lines[start:start + 250]))
+        ingestor.refresh()
+    assert len(ingestor.store) == 3000
+
+    (tmp_path / "full.log").write_bytes(source.read_bytes())
+    full = LogIngestor(str(tmp_path / "full.log"))
+    full.refresh()
+
+    incremental, expected = _all_columns(ingestor.store), _all_columns(full.store)
+    for name in ("epoch", "status", "offset", "length"):
+        assert np.array_equal(incremental[name], expected[name]), name
+    for name, dictionary in (("ip", "ips"), ("resource", "resources"), ("method", "methods")):
+        decoded = [getattr(ingestor.store, dictionary)[i] for i in incremental[name]]
+        assert decoded == [getattr(full.store, dictionary)[i] for i in expected[name]], name
+
+
+def test_partial_last_line_waits_for_newline(tmp_path):
+    source = tmp_path / "source.log"
+    write_synthetic_log(str(source), 10)
+    data = source.read_bytes()
+
+    log_path = tmp_path / "access.log"
+    log_path.write_bytes(data[:-20])
+    ingestor = LogIngestor(str(log_path))
+    assert ingestor.refresh() == 9
+
+    log_path.write_bytes(data)
+    assert ingestor.refresh() == 1
+    assert len(ingestor.store) == 10
+
+
+def _settle(path):
+    settled = time.time() - 60
+    os.utime(path, (settled, settled))
+
+
+def test_settled_last_line_without_newline_is_ingested(tmp_path):
+    source = tmp_path / "source.log"
+    write_synthetic_log(str(source), 10)
+    data = source.read_bytes().rstrip(b"\n")
+
+    log_path = tmp_path / "access.log"
+    log_path.write_bytes(data)
+    ingestor = LogIngestor(str(log_path))
+    assert ingestor.refresh() == 9
+    # 寫到一半的行已經看過，檔案沒有變動時不必再更新
+    assert ingestor.pending_bytes() == 0
+
+    _settle(log_path)
+    assert ingestor.pending_bytes() > 0
+    assert ingestor.refresh() == 1
+    assert ingestor.pending_bytes() == 0
+
+    # 之後補上換行與新的行：接著匯入，不需要重建
+    with open(log_path, "ab") as f:
+        f.write(b"\n" + data.splitlines(keepends=True)[0])
+    _settle(log_path)
+    assert ingestor.refresh() == 1
+    assert len(ingestor.store) == 11
+
+
+def test_continued_last_line_rebuilds_store(tmp_path):
+    source = tmp_path / "source.log"
+    write_synthetic_log(str(source), 10)
+    data = source.read_bytes()
+
+    log_path = tmp_path / "access.log"
+    log_path.write_bytes(data[:-20])
+    _settle(log_path)
+    ingestor = LogIngestor(str(log_path))
+    # 寫到一半的行無法解析，但已經讀過
+    assert ingestor.refresh() == 9
+    assert ingestor.store.coverage["offset"] == len(data) - 20
+
+    # 最後一行原來是寫到一半：寫完後從頭重建，與一次匯入整個檔案相同
+    log_path.write_bytes(data)
+    assert ingestor.refresh() == 10
+    full = LogIngestor(str(source))
+    full.refresh()
+    for name in ("epoch", "offset", "length"):
+        assert np.array_equal(_all_columns(ingestor.store)[name], _all_columns(full.store)[name]), name
+
+
+def test_snapshots_are_not_affected_by_later_appends():
+    store = LogColumnStore.empty({"inode": 1, "offset": 0, "fingerprint": 0})
+    snapshots = []
+    for i in range(50):
+        store = store.extended(_columns(i * 300, 300), {"inode": 1, "offset": i + 1, "fingerprint": 0})
+        snapshots.append(store)
+
+    for i, snapshot in enumerate(snapshots):
+        assert len(snapshot) == (i + 1) * 300
+        assert np.array_equal(snapshot.delta["epoch"], np.arange((i + 1) * 300))
+    assert store._sorted == [True, True]
+
+
+def test_extending_an_older_snapshot_copies_the_buffer():
+    store = LogColumnStore.empty({"inode": 1, "offset": 0, "fingerprint": 0})
+    older = store.extended(_columns(0, 100), {"inode": 1, "offset": 1, "fingerprint": 0})
+    newer = older.extended(_columns(100, 100), {"inode": 1, "offset": 2, "fingerprint": 0})
+
+    forked = older.extended(_columns(5000, 10), {"inode": 1, "offset": 3, "fingerprint": 0})
+    assert np.array_equal(newer.delta["epoch"], np.arange(200))
+    assert np.array_equal(forked.delta["epoch"][100:], np.arange(5000, 5010))
+
+
+def test_out_of_order_append_clears_sorted_flag():
+    store = LogColumnStore.empty({"inode": 1, "offset": 0, "fingerprint": 0})
+    store = store.extended(_columns(1000, 10), {"inode": 1, "offset": 1, "fingerprint": 0})
+    store = store.extended(_columns(0, 10), {"inode": 1, "offset": 2, "fingerprint": 0})
+    assert store._sorted[1] is False
+
+    rows = store.select(0, 9, lambda status: True)
+    assert np.array_equal(store.take("epoch", rows), np.arange(10))
+
+
+def test_rollup_chunks_merge_by_size_class(monkeypatch):
+    merged_rows = []
+    sum_by = log_rollup._sum_by
+
+    def counting_sum_by(parts, keys):
+        merged_rows.append(sum(len(part["count"]) for part in parts))
+        return sum_by(parts, keys)
+
+    monkeypatch.setattr(log_rollup, "_sum_by", counting_sum_by)
+
+    appends, rows = 1024, 60
+    store = LogColumnStore.empty({"inode": 1, "offset": 0, "fingerprint": 0})
+    for i in range(appends):
+        # 每一列落在不同的分鐘，合併後的分鐘彙總表不會變小
+        columns = _columns(i * rows, rows)
+        columns["epoch"] = columns["epoch"] * 60
+        store = store.extended(columns, {"inode": 1, "offset": i + 1, "fingerprint": 0})
+        assert len(store.rollup.chunks["minute"]["groups"]) <= 2 + appends.bit_length(), i
+    # 每列攤提只被合併 O(log n) 次；全部重新加總的做法是 O(n) 次
+    tables = sum(len(names) for names in log_rollup.LEVEL_TABLES.values())
+    assert sum(merged_rows) <= tables * appends * rows * (appends.bit_length() + 1)
+
+    full = log_rollup.LogRollup.from_columns({name: store.delta[name] for name in COLUMNS})
+    statuses = np.unique(store.delta["status"])
+    for name in ("groups", "ips", "resources"):
+        expected = full.window_counts(0, appends * rows * 60, statuses)[name]
+        actual = store.rollup.window_counts(0, appends * rows * 60, statuses)[name]
+        for column in expected:
+            assert np.array_equal(actual[column], expected[column]), (name, column)
+
+
+def test_concurrent_compaction_keeps_published_generation(tmp_path):
+    log_path = tmp_path / "access.log"
+    write_synthetic_log(str(log_path), 2000)
+    first, second = LogIngestor(str(log_path)), LogIngestor(str(log_path))
+    first.refresh()
+    second.refresh()
+    assert first.store.generation == second.store.generation
+
+    directory = store_dir_for(str(log_path))
+    epoch_path = os.path.join(directory, first.store.generation, "epoch.npy")
+    published = os.stat(epoch_path).st_ino
+    mapped = first.store.base["epoch"]
+    before = np.array(mapped)
+
+    # 第二個 worker 整理出同一個版本：沿用已發佈的目錄，不重寫檔案
+    compacted = compact_store(str(log_path), second.store)
+    assert os.stat(epoch_path).st_ino == published
+    assert np.array_equal(mapped, before)
+    assert np.array_equal(compacted.base["epoch"], before)
+    assert not [name for name in os.listdir(directory) if name.endswith(".tmp")]
+    assert len(load_store(str(log_path))) == 2000
+
+
+def test_index_only_without_store(tmp_path):
+    source = tmp_path / "source.log"
+    write_synthetic_log(str(source), 3000)
+    lines = source.read_bytes().splitlines(keepends=True)
+
+    log_path = tmp_path / "access.log"
+    log_path.write_bytes(b"".join(lines[:2000]))
+    ingestor = LogIngestor(str(log_path), build_store=False)
+    assert ingestor.refresh() == 2000
+    assert ingestor.pending_bytes() == 0
+
+    with open(log_path, "ab") as f:
+        f.write(b"".join(lines[2000:]))
+    assert ingestor.snapshot()[1] is None
+    assert ingestor.pending_bytes() == 0
+    assert ingestor.index.coverage["offset"] == log_path.stat().st_size
+    assert ingestor.store is None and not os.path.exists(store_dir_for(str(log_path)))
@@ -0,0 +1,119 @@
+"""
+時間區間掃描的一致性：
+- mmap bytes 模式與文字模式（逐行解碼）的結果完全相同，包含非 ASCII、控制字元、無法解析與缺少結尾換行等特殊行
+- 多 process 平行掃描與序列掃描的結果相同（區塊切得很小，讓特殊行落在不同區塊）
+- 欄位快取的查詢結果與文字掃描相同，包含檔尾沒有換行的最後一行
+"""
+import os
+import time
+
+import pytest
+
+from app.tools import log_parallel
+from app.tools.log_engine import get_engine
+from app.tools.log_index import open_range_scan, plan_time_range
+from app.tools.log_parser import LogParser, parse_query_time
+from app.tools.log_scan import QueryFilter, ScanResult
+from benchmarks.synthetic_log import _LAST_LINE, write_edge_case_log
+
+QUERIES = [
+    ("14/Jul/2025:00:00:00", "14/Jul/2025:23:59:59", None, None, None),
+    ("14/Jul/2025:11:00:00", "14/Jul/2025:13:00:00", "^4", None, None),
+    ("14/Jul/2025:11:59:00", "14/Jul/2025:12:01:00", None, "^(GET|POST)$", r"^203\."),
+    ("14/Jul/2025:06:00:00", "14/Jul/2025:06:30:00", "^5", "^GET$", None),
+]
+
+
+@pytest.fixture(scope="module")
+def edge_log(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("scan") / "access.log")
+    write_edge_case_log(path, 20_000)
+    return path
+
+
+def serial_scan(path, mode, start_time, end_time, status_code, http_method, source_ip):
+    parser = LogParser()
+    start_epoch, end_epoch = parse_query_time(start_time), parse_query_time(end_time)
+    begin, end, stop_epoch = plan_time_range(path, start_epoch, end_epoch, parser)
+
+    result = ScanResult(keep_lines=True)
+    records = []
+    scan = open_range_scan(path, begin, end, start_epoch, end_epoch, stop_epoch, parser,
+                           QueryFilter(status_code, http_method, source_ip), mode=mode)
+    for line, record in scan:
+        result.add(line, record)
+        records.append(record)
+    return result, records
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_mmap_scan_matches_text_scan(edge_log, query):
+    text_result, text_records = serial_scan(edge_log, "text", *query)
+    mmap_result, mmap_records = serial_scan(edge_log, "mmap", *query)
+
+    assert text_records
+    assert mmap_records == text_records
+    assert mmap_result.filtered_logs == text_result.filtered_logs
+    assert mmap_result.structured_body == text_result.structured_body
+    assert mmap_result.summary() == text_result.summary()
+
+
+def test_edge_lines_are_scanned(edge_log):
+    _, records = serial_scan(edge_log, "mmap", "14/Jul/2025:12:00:00", "14/Jul/2025:12:00:02",
+                             None, None, r"^203\.0\.113\.")
+    resources = [record.resource for record in records]
+    assert "/中文路徑" in resources
+    assert "/crlf" in resources
+    assert "/bad-date" not in resources
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_parallel_scan_matches_serial_scan(edge_log, query):
+    start_time, end_time, status_code, http_method, source_ip = query
+    expected, _ = serial_scan(edge_log, "mmap", *query)
+
+    parser = LogParser()
+    start_epoch, end_epoch = parse_query_time(start_time), parse_query_time(end_time)
+    begin, end, stop_epoch = plan_time_range(edge_log, start_epoch, end_epoch, parser)
+    result = log_parallel.scan_parallel(edge_log, begin, end, start_epoch, end_epoch, stop_epoch, parser.log_format,
+                                        QueryFilter(status_code, http_method, source_ip), 100, keep_lines=True,
+                                        workers=2, chunk_bytes=64 << 10)
+
+    assert result.summary() == expected.summary()
+    assert result.filtered_logs == expected.filtered_logs
+
+
+def test_split_byte_range_aligns_to_lines(edge_log):
+    with open(edge_log, "rb") as f:
+        data = f.read()
+    chunks = log_parallel.split_byte_range(edge_log, 0, len(data), 64 << 10)
+
+    assert chunks[0][0] == 0 and chunks[-1][1] == len(data)
+    for (_, previous_end), (begin, _) in zip(chunks, chunks[1:]):
+        assert previous_end == begin
+        assert data[begin - 1:begin] == b"\n"
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_store_query_matches_text_scan(edge_log, query):
+    # 檔案已經一段時間沒有變動，沒有換行的最後一行也要匯入
+    settled = time.time() - 60
+    os.utime(edge_log, (settled, settled))
+    engine = get_engine(edge_log)
+    result = engine.query(*query, keep_lines=True)
+    assert engine.ingestor.store is not None and engine.ingestor.pending_bytes() == 0
+
+    expected, _ = serial_scan(edge_log, "text", *query)
+    assert result.filtered_logs == expected.filtered_logs
+    assert (result.top_ips, result.top_resources, result.status_counts) == expected.summary()
+
+    summary = engine.query(*query)
+    assert summary.total == expected.count
+    assert (summary.top_ips, summary.top_resources, summary.status_counts) == expected.summary()
+
+
+def test_store_query_includes_last_line_without_newline(edge_log):
+    settled = time.time() - 60
+    os.utime(edge_log, (settled, settled))
+    result = get_engine(edge_log).query("14/Jul/2025:23:59:00", "14/Jul/2025:23:59:59", "^502$", keep_lines=True)
+    assert _LAST_LINE in result.filtered_logs
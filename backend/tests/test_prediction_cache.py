@@ -0,0 +1,73 @@
+"""
+PredictionCache 的 SQLite 持久層：第一次 get / set 時才開啟（建立物件不會建立檔案），
+寫入後新的實例（例如重新啟動或另一個 worker）可以從 SQLite 讀回。
+非同步的 aget / aset 在執行緒池存取 SQLite，記憶體命中時不離開 event loop。
+"""
+import asyncio
+import threading
+
+from app.dspy_modules.prediction_cache import PredictionCache
+
+
+def test_database_is_opened_on_first_use(tmp_path):
+    db_path = tmp_path / "data" / "dspy_cache.sqlite"
+    cache = PredictionCache(db_path=str(db_path))
+    assert not db_path.exists()
+
+    assert cache.get("Intent", "key") is None
+    assert db_path.exists()
+
+
+def test_predictions_survive_a_new_instance(tmp_path):
+    db_path = str(tmp_path / "dspy_cache.sqlite")
+    PredictionCache(db_path=db_path).set("Intent", "key", {"intent": "web_log"})
+
+    cache = PredictionCache(db_path=db_path)
+    assert cache.get("Intent", "key") == {"intent": "web_log"}
+    assert cache.get("Intent", "key") == {"intent": "web_log"}
+    assert cache.stats()["Intent"]["disk_hits"] == 1
+    assert cache.stats()["Intent"]["memory_hits"] == 1
+
+
+def test_memory_only_without_db_path(tmp_path):
+    cache = PredictionCache(db_path="")
+    cache.set("Intent", "key", {"intent": "web_log"})
+    assert cache.get("Intent", "key") == {"intent": "web_log"}
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_unusable_db_path_falls_back_to_memory(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    cache = PredictionCache(db_path=str(blocker / "dspy_cache.sqlite"))
+
+    cache.set("Intent", "key", {"intent": "web_log"})
+    assert cache.get("Intent", "key") == {"intent": "web_log"}
+    assert cache._db is None
+
+
+def test_async_disk_access_runs_off_the_event_loop(tmp_path, monkeypatch):
+    cache = PredictionCache(db_path=str(tmp_path / "dspy_cache.sqlite"))
+    threads = []
+    for name in ("_disk_get", "_disk_set"):
+        method = getattr(cache, name)
+
+        def recording(*args, method=method):
+            threads.append(threading.get_ident())
+            return method(*args)
+
+        monkeypatch.setattr(cache, name, recording)
+
+    async def lookups():
+        await cache.aset("Intent", "key", {"intent": "web_log"})
+        cache.memory.clear()
+        from_disk = await cache.aget("Intent", "key")
+        disk_calls = len(threads)
+        from_memory = await cache.aget("Intent", "key")
+        return from_disk, from_memory, disk_calls
+
+    from_disk, from_memory, disk_calls = asyncio.run(lookups())
+    assert from_disk == from_memory == {"intent": "web_log"}
+    assert disk_calls == len(threads) == 2
+    assert threading.get_ident() not in threads
+    assert cache.stats()["Intent"]["disk_hits"] == 1
@@ -0,0 +1,134 @@
+"""
+FastAPI（LangGraph 的 web_log_tool 節點）與 MCP 工具查詢結果的一致性：
+兩個入口都交給同一個 LogQueryEngine，對同一份合成 log、同樣的條件應得到相同的結果。
+
+每個狀態碼檢查：
+- 兩邊的符合筆數都等於逐行解析的參考結果
+- web_log_tool 的 tool_output 與 MCP 的 summary 相同
+- tool_detail 的每一列與 MCP 頁面中對應原始行解析後的結構化資料相同
+- MCP 全部頁面串起來等於參考結果
+兩個入口輪流先查詢，後查詢的一方沿用引擎的快取時結果仍相同。
+
+不合規格的請求行（"-"、TLS 握手、"GET /"、小寫方法）仍會列入 MCP 的結果，與原本 MCP 工具的寬鬆比對相同。
+"""
+import asyncio
+from datetime import datetime
+import os
+import re
+
+import pytest
+
+from app.tools.log_parser import LogParser, parse_query_time
+from benchmarks.bench_query_parity import END, START, call_tool, plan_for
+from benchmarks.synthetic_log import _MALFORMED_REQUEST_LINES, write_edge_case_log, write_synthetic_log
+
+# 原本 MCP 工具逐行比對用的正規表達式：請求只要求是非空的引號字串
+_OLD_MCP_RE = re.compile(r'\[(.*?) \+\d{4}\]\s+"[^"]+"\s+(\d{3})')
+
+
+def reference_lines(log_path: str, status_code: int) -> list:
+    """逐行解析的參考結果"""
+    parser = LogParser()
+    start_epoch, end_epoch = parse_query_time(START), parse_query_time(END)
+    with open(log_path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f
+                if (record := parser.parse(line)) is not None
+                and start_epoch <= record.epoch <= end_epoch and record.status == status_code]
+
+
+@pytest.fixture(scope="module")
+def parity_log(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("parity") / "access.log")
+    write_synthetic_log(path, 20_000)
+    return path
+
+
+@pytest.fixture
+def entry_points(parity_log, monkeypatch):
+    import app.graph as graph
+    from app.tools import log_tools
+    from benchmarks.bench_mcp_pages import load_mcp_server
+
+    # 兩個入口指向同一個 log 檔（MCP 預設查詢 access_log_part1.log，需以 MCP_LOG_PATH 指定）
+    monkeypatch.setattr(log_tools, "LOG_PATH", parity_log)
+    monkeypatch.setenv("MCP_LOG_PATH", parity_log)
+    server = load_mcp_server()
+    assert os.path.samefile(server.LOG_PATH, parity_log)
+    return graph, server
+
+
+def old_mcp_lines(log_path: str, status_code: int) -> list:
+    """原本 MCP 工具的篩選方式"""
+    time_format = "%d/%b/%Y:%H:%M:%S"
+    start_dt, end_dt = datetime.strptime(START, time_format), datetime.strptime(END, time_format)
+    lines = []
+    with open(log_path, "r", encoding="utf-8") as f:
+        for line in f:
+            match = _OLD_MCP_RE.search(line)
+            if not match:
+                continue
+            try:
+                log_dt = datetime.strptime(match.group(1), time_format)
+            except ValueError:
+                continue
+            if start_dt <= log_dt <= end_dt and int(match.group(2)) == status_code:
+                lines.append(line.strip())
+    return lines
+
+
+async def app_query(graph, status_code: int) -> dict:
+    return await graph.web_log_tool({"messages": [], "plan": plan_for(status_code)})
+
+
+async def mcp_query(server, status_code: int):
+    """回傳 (第一頁, 全部頁面的原始行)"""
+    first = await call_tool(server, "filter_logs_by_time_and_status",
+                            {"start_time": START, "end_time": END, "status_code": str(status_code)})
+    assert "error" not in first, first
+    rows, page = list(first["rows"]), first
+    while page["next_cursor"] is not None:
+        page = await call_tool(server, "filter_logs_next_page", {"cursor": page["next_cursor"]})
+        assert "error" not in page, page
+        rows.extend(page["rows"])
+    return first, rows
+
+
+@pytest.mark.parametrize("status_code, mcp_first", [(404, True), (500, False), (301, True), (403, False)])
+def test_fastapi_and_mcp_results_match(entry_points, parity_log, status_code, mcp_first):
+    from app.tools.log_engine import get_engine
+    from app.tools.log_scan import structured_row
+
+    graph, server = entry_points
+
+    async def both():
+        if mcp_first:
+            first, rows = await mcp_query(server, status_code)
+            return await app_query(graph, status_code), first, rows
+        output = await app_query(graph, status_code)
+        return (output, *await mcp_query(server, status_code))
+
+    output, first, rows = asyncio.run(both())
+    expected = reference_lines(parity_log, status_code)
+    parser = get_engine(parity_log).parser
+
+    body = output["tool_detail"]["data"]["body"]
+    assert expected
+    assert first["total"] == len(expected)
+    assert rows == expected
+    assert output["tool_output"] == first["summary"]
+    assert 0 < len(body) <= len(expected)
+    assert body == [structured_row(parser.parse(line)) for line in rows[:len(body)]]
+
+
+def test_mcp_keeps_malformed_requests(tmp_path, monkeypatch):
+    from benchmarks.bench_mcp_pages import load_mcp_server
+
+    log_path = str(tmp_path / "access.log")
+    write_edge_case_log(log_path, 2_000)
+    monkeypatch.setenv("MCP_LOG_PATH", log_path)
+    server = load_mcp_server()
+
+    _, rows = asyncio.run(mcp_query(server, 400))
+    expected = old_mcp_lines(log_path, 400)
+    assert {line.strip() for line in _MALFORMED_REQUEST_LINES} <= set(expected)
+    assert rows == expected
@@ -0,0 +1,110 @@
+"""
+session 儲存的上限（soak）：不斷有新的 session 進來、每個 session 問幾輪之後，
+- checkpoint 的 thread 數不超過上限，每個 thread 只保留最新的 checkpoint
+- 每個 session 的訊息不超過 SESSION_MESSAGE_WINDOW 則
+- session 數達上限後，checkpoint 的大小不再隨請求數成長
+- 共用 sqlite checkpoint 的兩個 worker 輪流處理同一個 session 時，對話前文相同
+
+LLM 使用模擬服務（延遲 0），log 使用合成資料；RSS 的長時間變化見 benchmarks/bench_session_soak.py。
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from app import session_store
+from benchmarks.simulated_llm import configure_simulated_llm
+from benchmarks.synthetic_log import write_synthetic_log
+
+MAX_SESSIONS = 5
+WINDOW = 4
+TURNS = 3
+
+
+@pytest.fixture
+def bounded_app(tmp_path, monkeypatch):
+    configure_simulated_llm(0.0)
+    import app.graph
+    from app.checkpointer import BoundedMemorySaver
+    from app.main import app as asgi_app
+    from app.tools import log_tools
+
+    path = str(tmp_path / "access.log")
+    write_synthetic_log(path, 5000)
+    monkeypatch.setattr(log_tools, "LOG_PATH", path)
+
+    checkpointer = BoundedMemorySaver(max_threads=MAX_SESSIONS)
+    monkeypatch.setattr(app.graph, "app", app.graph.graph.compile(checkpointer=checkpointer))
+    monkeypatch.setattr(session_store, "SESSION_MESSAGE_WINDOW", WINDOW)
+    return asgi_app, checkpointer
+
+
+async def run_sessions(asgi_app, first: int, count: int):
+    transport = httpx.ASGITransport(app=asgi_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=60) as client:
+        for session in range(first, first + count):
+            for turn in range(TURNS):
+                response = await client.post("/api/infer", json={"input": f"今天 4xx 的請求 #{turn}",
+                                                                  "session_id": f"soak-{session}"})
+                response.raise_for_status()
+
+
+def session_messages(graph, session_id: str) -> list:
+    return graph.get_state({"configurable": {"thread_id": session_id}}).values.get("messages", [])
+
+
+def test_append_messages_keeps_window(monkeypatch):
+    monkeypatch.setattr(session_store, "SESSION_MESSAGE_WINDOW", WINDOW)
+    messages = [{"role": "user", "content": str(i)} for i in range(3)]
+    messages = session_store.append_messages(messages, [{"role": "assistant", "content": str(i)} for i in range(3)])
+    assert [m["content"] for m in messages] == ["2", "0", "1", "2"]
+    assert session_store.append_messages(None, messages[:1]) == messages[:1]
+
+
+def test_sessions_and_checkpoints_stay_bounded(bounded_app):
+    asgi_app, checkpointer = bounded_app
+
+    asyncio.run(run_sessions(asgi_app, 0, MAX_SESSIONS * 2))
+    plateau = checkpointer.stats()["bytes"]
+    asyncio.run(run_sessions(asgi_app, MAX_SESSIONS * 2, MAX_SESSIONS * 4))
+    stats = checkpointer.stats()
+    total = MAX_SESSIONS * 6
+
+    assert stats["threads"] == MAX_SESSIONS
+    assert stats["checkpoints"] == MAX_SESSIONS
+    assert stats["evictions"] == total - MAX_SESSIONS
+    # 請求數變成三倍，保留的資料量仍維持在同一個水準
+    assert stats["bytes"] < plateau * 1.5, (stats["bytes"], plateau)
+
+    import app.graph
+    for session in range(total):
+        messages = session_messages(app.graph.app, f"soak-{session}")
+        if session < total - MAX_SESSIONS:
+            assert messages == []
+        else:
+            assert 0 < len(messages) <= WINDOW
+
+
+def test_workers_share_session_history(bounded_app, tmp_path, monkeypatch):
+    import app.graph
+    from app.checkpointer import SQLiteSaver
+
+    asgi_app, _ = bounded_app
+    database = str(tmp_path / "checkpoints.sqlite")
+    # 兩個 worker 各自開啟同一個 sqlite 檔
+    workers = [app.graph.graph.compile(checkpointer=SQLiteSaver(database)) for _ in range(2)]
+
+    async def ask(worker, text: str):
+        monkeypatch.setattr(app.graph, "app", worker)
+        transport = httpx.ASGITransport(app=asgi_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=60) as client:
+            response = await client.post("/api/infer", json={"input": text, "session_id": "shared"})
+            response.raise_for_status()
+
+    for turn in range(TURNS):
+        asyncio.run(ask(workers[turn % 2], f"今天 4xx 的請求 #{turn}"))
+
+    first, second = (session_messages(worker, "shared") for worker in workers)
+    assert first == second
+    assert [m["content"] for m in first if m["role"] == "user"] == [f"今天 4xx 的請求 #{turn}"
+                                                                     for turn in range(TURNS)][-(WINDOW // 2):]
@@ -0,0 +1,119 @@
+"""
+合併判斷（TurnPlanner）的輸出解析與退回逐步判斷：
+- parse_turn_plan 正規化標籤與查詢條件；意圖、回應類型或 IP 查詢判斷缺少或無法辨識時丟出 ValueError
+- LLM 輸出不是完整的 JSON / 欄位不齊或意圖無法辨識時，plan_turn 改走 intent_check 的逐步判斷
+"""
+import asyncio
+from types import SimpleNamespace
+
+import dspy
+from dspy.utils.dummies import DummyLM
+import pytest
+
+import app.graph
+from app.dspy_modules import TurnPlanner, parse_turn_plan
+
+WEB_LOG_OUTPUT = {
+    "intent": "web_log",
+    "start_time": "14/Jul/2025:00:00:00",
+    "end_time": "14/Jul/2025:23:59:59",
+    "status_code": "^404$",
+    "http_method": "",
+    "source_ip": "",
+    "use_ip_info": "no",
+    "response_style": "brief",
+}
+
+
+def test_parse_web_log_plan():
+    plan = parse_turn_plan(dspy.Prediction(**dict(WEB_LOG_OUTPUT, intent=" 'Web_Log' ", use_ip_info="Yes",
+                                                  http_method="none", source_ip="-")))
+    assert plan == dict(WEB_LOG_OUTPUT, http_method="", source_ip="", use_ip_info=True)
+
+
+def test_parse_general_plan_ignores_other_fields():
+    assert parse_turn_plan(dspy.Prediction(intent="general")) == {"intent": "general"}
+
+
+def test_missing_query_fields_are_unspecified():
+    outputs = {name: WEB_LOG_OUTPUT[name] for name in ("intent", "use_ip_info", "response_style")}
+    plan = parse_turn_plan(dspy.Prediction(**outputs))
+    assert plan["start_time"] == plan["status_code"] == plan["source_ip"] == ""
+
+
+@pytest.mark.parametrize("outputs", [
+    # 無法辨識或缺少意圖
+    dict(WEB_LOG_OUTPUT, intent="weather"),
+    dict(WEB_LOG_OUTPUT, intent=""),
+    {name: value for name, value in WEB_LOG_OUTPUT.items() if name != "intent"},
+    # web_log 缺少或無法辨識回應類型 / IP 查詢判斷
+    dict(WEB_LOG_OUTPUT, response_style="medium"),
+    {name: value for name, value in WEB_LOG_OUTPUT.items() if name != "response_style"},
+    dict(WEB_LOG_OUTPUT, use_ip_info="maybe"),
+    {name: value for name, value in WEB_LOG_OUTPUT.items() if name != "use_ip_info"},
+])
+def test_invalid_plan_raises_value_error(outputs):
+    with pytest.raises(ValueError):
+        parse_turn_plan(dspy.Prediction(**outputs))
+
+
+@pytest.fixture
+def planner(monkeypatch):
+    """plan_turn 使用真正的 TurnPlanner（LM 換成固定輸出的 DummyLM），不經過規則判斷"""
+    turn_planner = TurnPlanner()
+    monkeypatch.setattr(app.graph, "FAST_ROUTER", False)
+    monkeypatch.setattr(app.graph, "get_module", lambda name: turn_planner)
+
+    def run(question: str, lm_outputs: dict) -> dict:
+        # ChatAdapter 解析失敗時會再以 JSONAdapter 呼叫一次
+        with dspy.context(lm=DummyLM([lm_outputs] * 2)):
+            return asyncio.run(app.graph.plan_turn({"messages": [{"role": "user", "content": question}]}))
+
+    return run
+
+
+def test_plan_turn_uses_parsed_plan(planner):
+    result = planner("plan: 今天的 404", WEB_LOG_OUTPUT)
+    assert result["next"] == "use_web_tool"
+    assert result["plan"]["status_code"] == "^404$"
+
+
+@pytest.mark.parametrize("question, lm_outputs", [
+    # 不是 JSON、也沒有任何輸出欄位
+    ("invalid json", {"answer": "not json {"}),
+    # 只有部分欄位
+    ("partial", {"intent": "web_log", "status_code": "^404$"}),
+    # 欄位齊全但意圖無法辨識
+    ("unknown intent", dict(WEB_LOG_OUTPUT, intent="weather")),
+])
+def test_plan_turn_falls_back_to_intent_check(planner, question, lm_outputs):
+    result = planner(question, lm_outputs)
+    assert result == {"next": "fallback", "plan": None}
+    assert app.graph.route_after_intent(result) == "intent_check"
+
+
+def test_graph_runs_intent_check_after_planner_failure(monkeypatch):
+    calls = []
+
+    async def planner_acall(**kwargs):
+        raise ValueError("LM response cannot be serialized to a JSON object")
+
+    async def intent_acall(**kwargs):
+        calls.append(kwargs["intent_labels"])
+        return SimpleNamespace(intent="general")
+
+    async def fake_answer(generator, **kwargs):
+        return "hello"
+
+    modules = {"turn_planner": SimpleNamespace(acall=planner_acall),
+               "intent_checker": SimpleNamespace(acall=intent_acall),
+               "general_response": SimpleNamespace()}
+    monkeypatch.setattr(app.graph, "FAST_ROUTER", False)
+    monkeypatch.setattr(app.graph, "get_module", modules.__getitem__)
+    monkeypatch.setattr(app.graph, "generate_answer", fake_answer)
+
+    state = asyncio.run(app.graph.app.ainvoke({"messages": [{"role": "user", "content": "你好"}]},
+                                              config={"thread_id": "test-planner-fallback"}))
+    assert calls == [["web_log", "general"]]
+    assert state["intent"] == "general" and state["plan"] is None
+    assert state["messages"][-1] == {"role": "assistant", "content": "hello"}
@@ -0,0 +1,162 @@
+"""
+WebLogAgent 的 MCP 長期連線（MCP client 換成假的 client.session，不需要真的 MCP server）：
+- 連線失敗時在 ready_timeout 內回報失敗；連線卡住時最多等 ready_timeout
+- 同時進來的 get_agent() 共用同一次連線嘗試，只建立一個 session
+- keep-alive ping 失敗時重新連線並重建 agent
+- 換了 event loop（重新啟動 app）時重新連線
+"""
+import asyncio
+import sys
+import time
+from contextlib import asynccontextmanager
+from types import ModuleType, SimpleNamespace
+
+import pytest
+
+import app.api.web_log.agent as agent_module
+from app.api.web_log.agent import WebLogAgent
+
+CONNECT_LATENCY = 0.05
+
+
+class FakeSession:
+    def __init__(self, server: "FakeServer"):
+        self.server = server
+
+    async def send_ping(self):
+        self.server.pings += 1
+        if self.server.failing_pings:
+            self.server.failing_pings -= 1
+            raise ConnectionError("ping failed")
+
+
+class FakeServer:
+    """假的 MultiServerMCPClient：記錄開啟的 session 數，可以讓連線失敗、卡住或讓 ping 失敗"""
+
+    def __init__(self):
+        self.up = True
+        self.hang = False
+        self.failing_pings = 0
+        self.sessions = 0
+        self.pings = 0
+
+    def client(self, connections):
+        assert agent_module.MCP_SERVER_NAME in connections
+        return self
+
+    @asynccontextmanager
+    async def session(self, name):
+        self.sessions += 1
+        await asyncio.sleep(CONNECT_LATENCY)
+        if self.hang:
+            await asyncio.sleep(3600)
+        if not self.up:
+            raise ConnectionError("connection refused")
+        yield FakeSession(self)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = FakeServer()
+
+    async def load_mcp_tools(session, server_name):
+        return [SimpleNamespace(name="filter_logs")]
+
+    client_module = ModuleType("langchain_mcp_adapters.client")
+    client_module.MultiServerMCPClient = server.client
+    tools_module = ModuleType("langchain_mcp_adapters.tools")
+    tools_module.load_mcp_tools = load_mcp_tools
+    prebuilt_module = ModuleType("langgraph.prebuilt")
+    prebuilt_module.create_react_agent = lambda model, tools, prompt: SimpleNamespace(model=model, tools=tools)
+
+    monkeypatch.setitem(sys.modules, "langchain_mcp_adapters", ModuleType("langchain_mcp_adapters"))
+    monkeypatch.setitem(sys.modules, "langchain_mcp_adapters.client", client_module)
+    monkeypatch.setitem(sys.modules, "langchain_mcp_adapters.tools", tools_module)
+    monkeypatch.setitem(sys.modules, "langgraph.prebuilt", prebuilt_module)
+    monkeypatch.setattr(agent_module, "build_model", lambda: "model")
+    monkeypatch.setattr(agent_module, "MCP_RECONNECT_MIN_DELAY", 0.01)
+    monkeypatch.setattr(agent_module, "MCP_RECONNECT_MAX_DELAY", 0.05)
+    return server
+
+
+async def wait_until(predicate, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached"
+        await asyncio.sleep(0.01)
+
+
+def test_failed_connection_reports_failure_within_ready_timeout(server):
+    server.up = False
+    web_log_agent = WebLogAgent(ready_timeout=1.0)
+
+    async def run():
+        started = time.monotonic()
+        assert not await web_log_agent.start()
+        # 連線失敗時不必等到 ready_timeout
+        assert time.monotonic() - started < web_log_agent.ready_timeout
+
+        started = time.monotonic()
+        with pytest.raises(RuntimeError, match="ConnectionError: connection refused"):
+            await web_log_agent.get_agent()
+        assert time.monotonic() - started < web_log_agent.ready_timeout
+        await web_log_agent.stop()
+
+    asyncio.run(run())
+    assert web_log_agent.connects == 0
+
+
+def test_hanging_connection_waits_at_most_ready_timeout(server):
+    server.hang = True
+    web_log_agent = WebLogAgent(ready_timeout=0.2)
+
+    async def run():
+        started = time.monotonic()
+        assert not await web_log_agent.start()
+        elapsed = time.monotonic() - started
+        await web_log_agent.stop()
+        return elapsed
+
+    assert 0.2 <= asyncio.run(run()) < 1.0
+
+
+def test_concurrent_get_agent_opens_one_session(server):
+    web_log_agent = WebLogAgent(ready_timeout=1.0)
+
+    async def run():
+        agents = await asyncio.gather(*(web_log_agent.get_agent() for _ in range(20)))
+        await web_log_agent.stop()
+        return agents
+
+    agents = asyncio.run(run())
+    assert all(agent is agents[0] for agent in agents)
+    assert [tool.name for tool in agents[0].tools] == ["filter_logs"]
+    assert server.sessions == 1
+    assert web_log_agent.connects == 1
+
+
+def test_failed_keepalive_ping_reconnects(server):
+    web_log_agent = WebLogAgent(keepalive_interval=0.05, ready_timeout=1.0)
+
+    async def run():
+        first = await web_log_agent.get_agent()
+        # 下一次 keep-alive ping 失敗
+        server.failing_pings = 1
+        await wait_until(lambda: web_log_agent.connects == 2)
+        second = await web_log_agent.get_agent()
+        await web_log_agent.stop()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert server.sessions == 2
+    assert second is not first
+    assert web_log_agent.last_error is None
+
+
+def test_reconnects_on_new_event_loop(server):
+    web_log_agent = WebLogAgent(ready_timeout=1.0)
+
+    # 每次 asyncio.run 都是新的 event loop；前一個 loop 結束時背景 task 已被取消
+    assert asyncio.run(web_log_agent.start())
+    assert asyncio.run(web_log_agent.get_agent()) is not None
+    assert server.sessions == 2